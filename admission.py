@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Admission control for the BoilerStat dashboard API.
+
+Every gunicorn worker admits /api requests through:
+
+    rate limit      optional per-client token bucket (API_RATE_LIMIT_PER_MINUTE,
+                    API_RATE_LIMIT_BURST); over the limit is 429 with Retry-After
+    route gates     per-route concurrency limits (API_ROUTE_LIMITS, e.g.
+                    "/api/export=1,/api/fleet/ranking=2") inside a worker-wide
+                    limit on requests doing database work (API_MAX_CONCURRENT).
+                    A request over a limit waits in a bounded queue
+                    (API_QUEUE_DEPTH, at most API_QUEUE_TIMEOUT seconds); a full
+                    queue or an expired wait is an immediate 503 with Retry-After
+    ingest priority the routes with a limit in API_ROUTE_LIMITS are the heavy
+                    reads: while a live listener reports a write backlog older
+                    than INGEST_PRIORITY_LAG_SECONDS (listener_shards heartbeats)
+                    they are refused with 503, so ingest and aggregation keep
+                    the database
+
+Limits are per worker process: a deployment holds at most GUNICORN_WORKERS x
+API_MAX_CONCURRENT dashboard statements in flight. Each statement is also
+bounded by a statement_timeout budget (API_STATEMENT_TIMEOUT_MS in app.py).
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+
+from sharding import LISTENER_STALE_HEARTBEATS
+
+# Requests doing database work at once in one worker (0 = unlimited)
+API_MAX_CONCURRENT = int(os.getenv("API_MAX_CONCURRENT", "4"))
+# Tighter per-route limits; these routes are the ones shed while ingest is behind
+API_ROUTE_LIMITS = os.getenv(
+    "API_ROUTE_LIMITS",
+    "/api/export=1,/api/fleet/ranking=2,/api/fleet/compare=2,/api/utilization=2,/api/cycles=2")
+# Requests that may wait for a slot per gate, and for how long, before a 503
+API_QUEUE_DEPTH = int(os.getenv("API_QUEUE_DEPTH", "8"))
+API_QUEUE_TIMEOUT = float(os.getenv("API_QUEUE_TIMEOUT", "2"))
+# Per-client requests per minute (0 = no rate limit) and the burst allowed on top
+API_RATE_LIMIT_PER_MINUTE = float(os.getenv("API_RATE_LIMIT_PER_MINUTE", "0"))
+API_RATE_LIMIT_BURST = int(os.getenv("API_RATE_LIMIT_BURST", "30"))
+# Identify clients by the first X-Forwarded-For address (only behind a trusted proxy)
+API_TRUST_FORWARDED = os.getenv("API_TRUST_FORWARDED", "false").lower() == "true"
+# Shed heavy reads while a listener's oldest unwritten reading is older than this (0 = off)
+INGEST_PRIORITY_LAG_SECONDS = float(os.getenv("INGEST_PRIORITY_LAG_SECONDS", "10"))
+# How long a listener_shards reading of the ingest backlog is reused
+INGEST_PRIORITY_CHECK_SECONDS = 5
+# Routes never gated or rate limited (none of them query the database)
+ADMISSION_EXEMPT = ('/api/health', '/api/admission', '/api/live')
+# Rate limit buckets kept per worker before idle clients are forgotten
+MAX_RATE_LIMIT_CLIENTS = 10000
+
+
+def parse_route_limits(text):
+    """{route rule: limit} from "rule=limit,rule=limit"."""
+    limits = {}
+    for item in text.split(','):
+        if item.strip():
+            rule, _, limit = item.partition('=')
+            limits[rule.strip()] = int(limit)
+    return limits
+
+
+class Rejected(Exception):
+    """A request refused by admission control: HTTP status, message and Retry-After seconds."""
+
+    def __init__(self, status, message, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Gate:
+    """Concurrency limit with a bounded FIFO-ish wait queue."""
+
+    def __init__(self, name, limit, queue_depth=API_QUEUE_DEPTH):
+        self.name = name
+        self.limit = limit
+        self.queue_depth = queue_depth
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def acquire(self, deadline):
+        """Take a slot, waiting until the monotonic deadline; raises Rejected."""
+        with self._cond:
+            # Newcomers queue behind waiters instead of taking a freed slot first
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                self.admitted += 1
+                return
+            if self.waiting >= self.queue_depth:
+                self.rejected += 1
+                raise Rejected(503, f"{self.name} is busy ({self.active} running, queue full)", 1)
+            self.waiting += 1
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        raise Rejected(503, f"{self.name} is busy (waited {API_QUEUE_TIMEOUT:g}s)", 2)
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.active += 1
+            self.admitted += 1
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def status(self):
+        with self._cond:
+            return {'limit': self.limit, 'active': self.active, 'waiting': self.waiting,
+                    'admitted': self.admitted, 'rejected': self.rejected, 'timed_out': self.timed_out}
+
+
+class RateLimiter:
+    """Per-client token buckets: per_minute tokens a minute, up to burst saved."""
+
+    def __init__(self, per_minute=API_RATE_LIMIT_PER_MINUTE, burst=API_RATE_LIMIT_BURST):
+        self.rate = per_minute / 60
+        self.burst = max(burst, 1)
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self.limited = 0
+
+    def check(self, client):
+        """Spend a token of client's bucket; raises Rejected when it is empty."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[client] = (tokens, now)
+                self.limited += 1
+                raise Rejected(429, "Rate limit exceeded", max(1, round((1 - tokens) / self.rate)))
+            self._buckets[client] = (tokens - 1, now)
+            if len(self._buckets) > MAX_RATE_LIMIT_CLIENTS:
+                # Clients idle long enough to have refilled their bucket have nothing to remember
+                full = self.burst / self.rate
+                self._buckets = {key: value for key, value in self._buckets.items() if now - value[1] < full}
+
+
+class IngestPriority:
+    """Whether ingest is behind, from the listeners' heartbeats (cached briefly)."""
+
+    def __init__(self, storage, max_lag=INGEST_PRIORITY_LAG_SECONDS):
+        self.storage = storage
+        self.max_lag = max_lag
+        self._lock = threading.Lock()
+        self._checked = None
+        self._reason = None
+        self.shed = 0
+
+    def behind(self):
+        """Why heavy reads should wait (a message), or None."""
+        if not self.max_lag:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            if self._checked is not None and now - self._checked < INGEST_PRIORITY_CHECK_SECONDS:
+                return self._reason
+            self._checked = now
+        reason = None
+        try:
+            utcnow = datetime.utcnow()
+            for listener in self.storage.listener_statuses():
+                # Rows of stopped listeners are ignored; the heartbeat is what reports lag
+                age = (utcnow - listener['heartbeat_at']).total_seconds()
+                if age <= LISTENER_STALE_HEARTBEATS * listener['heartbeat_seconds'] and (listener['lag_seconds'] or 0) > self.max_lag:
+                    reason = (f"ingest is behind (listener {listener['listener']} has "
+                              f"{listener['queued']} readings waiting {listener['lag_seconds']:.0f}s)")
+                    break
+        except Exception as e:
+            print(f"Ingest priority check failed: {e}")
+        with self._lock:
+            self._reason = reason
+        return reason
+
+
+class Permit:
+    """Slots held by one admitted request; release() is idempotent."""
+
+    def __init__(self, gates):
+        self._gates = gates
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            gates, self._gates = self._gates, []
+        for gate in reversed(gates):
+            gate.release()
+
+
+class Admission:
+    """Per-worker admission control; admit() a request before it touches the database."""
+
+    def __init__(self, storage, max_concurrent=API_MAX_CONCURRENT, route_limits=API_ROUTE_LIMITS,
+                 queue_timeout=API_QUEUE_TIMEOUT, rate_limit=API_RATE_LIMIT_PER_MINUTE):
+        self.queue_timeout = queue_timeout
+        self.worker = Gate('API', max_concurrent) if max_concurrent else None
+        self.routes = {rule: Gate(rule, limit) for rule, limit in parse_route_limits(route_limits).items()}
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.ingest = IngestPriority(storage)
+
+    def admit(self, rule, client):
+        """A Permit for a request to route rule from client; raises Rejected."""
+        if rule is None or not rule.startswith('/api/') or rule in ADMISSION_EXEMPT:
+            return Permit([])
+        if self.rate_limiter:
+            self.rate_limiter.check(client)
+        route = self.routes.get(rule)
+        if route is not None:
+            reason = self.ingest.behind()
+            if reason:
+                self.ingest.shed += 1
+                raise Rejected(503, f"{rule} is paused while {reason}", INGEST_PRIORITY_CHECK_SECONDS)
+        deadline = time.monotonic() + self.queue_timeout
+        held = []
+        try:
+            # Route gate first, so a queue of heavy requests does not hold worker slots
+            for gate in (route, self.worker):
+                if gate is not None:
+                    gate.acquire(deadline)
+                    held.append(gate)
+        except Rejected:
+            Permit(held).release()
+            raise
+        return Permit(held)
+
+    def status(self):
+        return {
+            'worker': self.worker.status() if self.worker else None,
+            'routes': {rule: gate.status() for rule, gate in self.routes.items()},
+            'queue_timeout_seconds': self.queue_timeout,
+            'rate_limit_per_minute': self.rate_limiter.rate * 60 if self.rate_limiter else None,
+            'rate_limited': self.rate_limiter.limited if self.rate_limiter else 0,
+            'ingest_priority_lag_seconds': self.ingest.max_lag or None,
+            'ingest_behind': self.ingest.behind(),
+            'shed_for_ingest': self.ingest.shed,
+            'pid': os.getpid(),
+        }
+
+
+def client_key(remote_addr, forwarded_for):
+    """Rate limit key of a request: its address, or the proxy-reported one when trusted."""
+    if API_TRUST_FORWARDED and forwarded_for:
+        return forwarded_for.split(',')[0].strip()
+    return remote_addr or 'unknown'
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Streaming anomaly detection for BoilerStat.
+
+The logger feeds every production reading to an AnomalyDetector as it is
+ingested. Each device keeps a small fixed amount of state per channel
+(0 = burner, i = zone i): the current state and when it started (run
+length) and an exponentially weighted transition rate. A heartbeat timer
+checks when each device was last heard from. Nothing is read from the
+database per reading.
+
+Alerts (raised once when a condition starts, resolved when it ends):
+
+    burner_stuck_on       burner on for more than BURNER_STUCK_HOURS
+    long_zone_call        a zone calling for more than ZONE_CALL_ALERT_HOURS
+    burner_without_call   burner on with no zone calling for BURNER_NO_CALL_SECONDS
+    relay_chatter         a channel switching more than RELAY_CHATTER_PER_MINUTE
+                          (EWMA over RELAY_CHATTER_WINDOW_SECONDS)
+    device_silent         no reading for HEARTBEAT_TIMEOUT_SECONDS
+
+Run-length alerts resolve when the channel changes state rather than when
+a timer expires, so alerts still open from before a restart resolve
+correctly without the old run start.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+BURNER_STUCK_HOURS = float(os.getenv("BURNER_STUCK_HOURS", "6"))
+ZONE_CALL_ALERT_HOURS = float(os.getenv("ZONE_CALL_ALERT_HOURS", "6"))
+BURNER_NO_CALL_SECONDS = float(os.getenv("BURNER_NO_CALL_SECONDS", "120"))
+RELAY_CHATTER_PER_MINUTE = float(os.getenv("RELAY_CHATTER_PER_MINUTE", "4"))
+RELAY_CHATTER_WINDOW_SECONDS = float(os.getenv("RELAY_CHATTER_WINDOW_SECONDS", "300"))
+HEARTBEAT_TIMEOUT_SECONDS = float(os.getenv("HEARTBEAT_TIMEOUT_SECONDS", "60"))
+HEARTBEAT_CHECK_SECONDS = 5
+
+SEVERITY = {
+    'burner_stuck_on': 'critical',
+    'burner_without_call': 'critical',
+    'long_zone_call': 'warning',
+    'relay_chatter': 'warning',
+    'device_silent': 'warning',
+}
+
+# raised=False marks the end of a previously raised alert; channel is None for device-level alerts
+Alert = namedtuple('Alert', ['device_id', 'kind', 'channel', 'raised', 'timestamp', 'message'])
+
+
+def _channel_label(channel):
+    return 'Burner' if channel == 0 else f'Zone {channel}'
+
+
+class DeviceState:
+    """Rolling state of one device; update cost is O(channels) per reading."""
+
+    __slots__ = ('device_id', 'last_timestamp', 'last_seen', 'states', 'since', 'rates',
+                 'no_call_since', 'active')
+
+    def __init__(self, device_id):
+        self.device_id = device_id
+        self.last_timestamp = None     # reading time of the latest reading
+        self.last_seen = None          # time.monotonic() of the latest arrival
+        self.states = []               # per channel: 0/1
+        self.since = []                # per channel: reading time the current state started
+        self.rates = []                # per channel: EWMA of state changes per second
+        self.no_call_since = None
+        self.active = set()            # (kind, channel) of open alerts
+
+
+class AnomalyDetector:
+    """Applies the alert rules to each device's reading stream.
+
+    on_alert(alert) is called for every raised and resolved Alert, outside
+    the detector's lock, from the feeding thread or the heartbeat thread.
+    """
+
+    def __init__(self, on_alert):
+        self.on_alert = on_alert
+        self._devices = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _device(self, device_id):
+        device = self._devices.get(device_id)
+        if device is None:
+            device = self._devices[device_id] = DeviceState(device_id)
+        return device
+
+    def restore(self, alerts):
+        """Mark (device_id, kind, channel) alerts still open in the database as active."""
+        with self._lock:
+            for device_id, kind, channel in alerts:
+                device = self._device(device_id)
+                device.active.add((kind, channel))
+                if kind == 'device_silent':
+                    # Resolved by the device's next reading
+                    device.last_seen = time.monotonic()
+
+    def _raise(self, events, device, kind, channel, timestamp, message):
+        if (kind, channel) not in device.active:
+            device.active.add((kind, channel))
+            events.append(Alert(device.device_id, kind, channel, True, timestamp, message))
+
+    def _resolve(self, events, device, kind, channel, timestamp):
+        if (kind, channel) in device.active:
+            device.active.discard((kind, channel))
+            events.append(Alert(device.device_id, kind, channel, False, timestamp, None))
+
+    def feed(self, device_id, timestamp, burner, zones):
+        """Process one production reading (timestamp: naive UTC datetime)."""
+        events = []
+        with self._lock:
+            device = self._device(device_id)
+            device.last_seen = time.monotonic()
+            self._resolve(events, device, 'device_silent', None, timestamp)
+            # Late readings cannot change run lengths that have already moved on
+            if device.last_timestamp is None or timestamp > device.last_timestamp:
+                self._check(events, device, timestamp, burner, zones)
+        for alert in events:
+            self.on_alert(alert)
+
+    def _check(self, events, device, timestamp, burner, zones):
+        elapsed = (timestamp - device.last_timestamp).total_seconds() if device.last_timestamp else 0.0
+        decay = math.exp(-elapsed / RELAY_CHATTER_WINDOW_SECONDS)
+        device.last_timestamp = timestamp
+
+        for channel, value in enumerate([1 if burner else 0, *zones]):
+            if channel == len(device.states):
+                device.states.append(value)
+                device.since.append(timestamp)
+                device.rates.append(0.0)
+                continue
+            rate = device.rates[channel] * decay
+            if value != device.states[channel]:
+                device.states[channel] = value
+                device.since[channel] = timestamp
+                rate += 1.0 / RELAY_CHATTER_WINDOW_SECONDS
+            device.rates[channel] = rate
+
+            per_minute = rate * 60
+            if per_minute > RELAY_CHATTER_PER_MINUTE:
+                self._raise(events, device, 'relay_chatter', channel, timestamp,
+                            f"{_channel_label(channel)} is switching {per_minute:.1f} times per minute")
+            elif per_minute < RELAY_CHATTER_PER_MINUTE / 2:
+                self._resolve(events, device, 'relay_chatter', channel, timestamp)
+
+            kind, limit_hours = (('burner_stuck_on', BURNER_STUCK_HOURS) if channel == 0
+                                 else ('long_zone_call', ZONE_CALL_ALERT_HOURS))
+            if not value:
+                self._resolve(events, device, kind, channel, timestamp)
+            elif (timestamp - device.since[channel]).total_seconds() > limit_hours * 3600:
+                self._raise(events, device, kind, channel, timestamp,
+                            f"{_channel_label(channel)} has been on for more than {limit_hours:g} hours")
+
+        if burner and not any(zones):
+            if device.no_call_since is None:
+                device.no_call_since = timestamp
+            elif (timestamp - device.no_call_since).total_seconds() > BURNER_NO_CALL_SECONDS:
+                self._raise(events, device, 'burner_without_call', 0, timestamp,
+                            f"Burner running with no zone calling for more than "
+                            f"{BURNER_NO_CALL_SECONDS:.0f} seconds")
+        else:
+            device.no_call_since = None
+            self._resolve(events, device, 'burner_without_call', 0, timestamp)
+
+    def check_heartbeats(self):
+        """Raise device_silent for devices not heard from within HEARTBEAT_TIMEOUT_SECONDS."""
+        events = []
+        now = time.monotonic()
+        timestamp = datetime.utcnow().replace(microsecond=0)
+        with self._lock:
+            for device in self._devices.values():
+                if device.last_seen is not None and now - device.last_seen > HEARTBEAT_TIMEOUT_SECONDS:
+                    self._raise(events, device, 'device_silent', None, timestamp,
+                                f"No readings for more than {HEARTBEAT_TIMEOUT_SECONDS:.0f} seconds")
+        for alert in events:
+            self.on_alert(alert)
+
+    def _run(self):
+        while not self._stopping.wait(HEARTBEAT_CHECK_SECONDS):
+            try:
+                self.check_heartbeats()
+            except Exception as e:
+                print(f"Heartbeat check failed: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="heartbeat", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    @property
+    def device_count(self):
+        with self._lock:
+            return len(self._devices)
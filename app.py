@@ -4,19 +4,40 @@ Flask web application for BoilerStat monitoring dashboard.
 Provides REST API endpoints for current status and utilization trends.
 """
 
-from flask import Flask, jsonify, send_from_directory, request, Response
+from flask import Flask, Blueprint, current_app, g, jsonify, send_from_directory, request, Response
 from flask_cors import CORS
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import os
+import sys
+import csv
+import io
 import json
+import struct
 import time
 import threading
-from datetime import datetime, timedelta
-import paho.mqtt.client as mqtt
+import zlib
+from array import array
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
 
-app = Flask(__name__, static_folder='build')
-CORS(app)  # Enable CORS for React development
+from admission import Admission, Rejected, client_key
+from change_feed import ChangeFeedListener, AGGREGATES_CHANNEL
+from data_coverage import AGGREGATED, MINUTE, RAW, complement, minute_count, minute_floor, subtract, to_dicts
+from fleet_control import COMMAND_RETRIES, COMMAND_TIMEOUT_SECONDS, MAX_FLEET_COMMAND_DEVICES, summarize
+from latency import LatencyHistogram
+from mqtt_state import MqttState, reading_to_status
+from profiling import (PROFILE_DIR, PROFILE_MAX_SECONDS, PROFILE_SIGNAL_SECONDS, TimedCursor, finish_timing,
+                       start_capture, start_timing, timings)
+from profiles import (PROFILE_DEFAULT_DAYS, PROFILE_MAX_DAYS, PROFILE_TIMEZONES, WEEKDAYS,
+                      build_heatmap, build_profile, profile_since)
+from readings import Reading, ReadingBatch
+from sharding import shard_report
+from storage import DEFAULT_DEVICE_ID, describe_backend, get_backend
+from totals import (BURNER_FIRING_RATE_KW, BURNER_FUEL_PER_HOUR, RANKING_METRICS, Totals, fleet_ranking,
+                    fleet_summary)
+
+api = Blueprint('api', __name__)
 
 # PostgreSQL configuration
 POSTGRES_HOST = os.getenv("POSTGRES_HOST", "localhost")
@@ -24,16 +45,258 @@ POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
 POSTGRES_DB = os.getenv("POSTGRES_DB")
 POSTGRES_USER = os.getenv("POSTGRES_USER")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
-MQTT_BROKER = os.getenv("MQTT_BROKER", "192.168.1.245")
-MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
-MQTT_CONTROL_TOPIC = os.getenv("MQTT_CONTROL_TOPIC", "boilerstat/control")
-MQTT_DATA_TOPIC = os.getenv("MQTT_DATA_TOPIC", "boilerstat/reading")
+# Serve /api/debug/timings and /api/debug/profile (per worker process)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+# Upper bound on serving a cached utilization result if no change feed event arrives
+UTILIZATION_CACHE_MAX_AGE = int(os.getenv("UTILIZATION_CACHE_MAX_AGE", "60"))
+# Query budgets: server-side statement_timeout of dashboard statements (0 = none).
+# Export streams through a cursor; its budget applies to each batch fetched
+API_STATEMENT_TIMEOUT_MS = int(os.getenv("API_STATEMENT_TIMEOUT_MS", "5000"))
+API_EXPORT_STATEMENT_TIMEOUT_MS = int(os.getenv("API_EXPORT_STATEMENT_TIMEOUT_MS", "60000"))
+# Default window of /api/fleet/ranking and /api/fleet/compare (one week), and its limits
+FLEET_DEFAULT_HOURS = 168
+FLEET_MAX_HOURS = 24 * 366
+# Longest hours= window of /api/coverage and /api/totals (start/end may span more for totals)
+COVERAGE_MAX_HOURS = 720
+TOTALS_MAX_HOURS = 24 * 366 * 10
+MAX_FLEET_COMPARE_DEVICES = int(os.getenv("MAX_FLEET_COMPARE_DEVICES", "50"))
+
+# Response formats for /api/utilization, selectable with ?format= or the Accept header
+COLUMNAR_MIMETYPE = 'application/vnd.boilerstat.columnar+json'
+BINARY_MIMETYPE = 'application/vnd.boilerstat.columnar'
+BINARY_MAGIC = b'BSC1'
+NAN = float('nan')
+
+# Datasets available from /api/export. Each query takes start/end (and device
+# where the table has a device_id) and is streamed through a named cursor;
+# {minutes} is the minute aggregate source of the storage layout (export_query).
+EXPORT_QUERIES = {
+    'readings': '''
+        SELECT id, device_id, timestamp, boiler, zone_mask, zone_count, is_demo, received_at
+        FROM boiler_readings
+        WHERE timestamp >= %(start)s AND timestamp < %(end)s
+          AND (%(device)s::text IS NULL OR device_id = %(device)s)
+        ORDER BY timestamp
+    ''',
+    'minutes': '''
+        SELECT device_id, minute_timestamp, boiler_utilization, zone_utilization, sample_count, is_demo
+        FROM {minutes}
+        WHERE minute_timestamp >= %(start)s AND minute_timestamp < %(end)s
+          AND (%(device)s::text IS NULL OR device_id = %(device)s)
+        ORDER BY minute_timestamp, device_id
+    ''',
+    'hourly': '''
+        WITH hours AS (
+            SELECT device_id, date_trunc('hour', minute_timestamp) AS hour_timestamp,
+                   round((sum(boiler_utilization * sample_count) / sum(sample_count))::numeric, 2)
+                       AS boiler_utilization,
+                   sum(sample_count) AS sample_count,
+                   count(*) AS minute_count
+            FROM {minutes}
+            WHERE minute_timestamp >= %(start)s AND minute_timestamp < %(end)s
+              AND (%(device)s::text IS NULL OR device_id = %(device)s)
+            GROUP BY 1, 2
+        ),
+        zones AS (
+            SELECT device_id, hour_timestamp,
+                   array_agg(utilization ORDER BY zone) AS zone_utilization
+            FROM (
+                SELECT m.device_id, date_trunc('hour', m.minute_timestamp) AS hour_timestamp, z.zone,
+                       round((sum(z.utilization * m.sample_count) / sum(m.sample_count))::numeric, 2)
+                           AS utilization
+                FROM {minutes} m
+                CROSS JOIN LATERAL unnest(m.zone_utilization) WITH ORDINALITY AS z(utilization, zone)
+                WHERE m.minute_timestamp >= %(start)s AND m.minute_timestamp < %(end)s
+                  AND (%(device)s::text IS NULL OR m.device_id = %(device)s)
+                GROUP BY 1, 2, 3
+            ) per_zone
+            GROUP BY 1, 2
+        )
+        SELECT h.device_id, h.hour_timestamp, h.boiler_utilization,
+               coalesce(z.zone_utilization, '{{}}') AS zone_utilization,
+               h.sample_count, h.minute_count
+        FROM hours h
+        LEFT JOIN zones z USING (device_id, hour_timestamp)
+        ORDER BY h.hour_timestamp, h.device_id
+    ''',
+    'cycles': '''
+        SELECT device_id, burner_on, started_at, ended_at, duration_seconds, sample_count,
+               trigger_zones, short_cycle, interrupted
+        FROM burner_cycles
+        WHERE started_at >= %(start)s AND started_at < %(end)s
+          AND (%(device)s::text IS NULL OR device_id = %(device)s)
+        ORDER BY started_at
+    ''',
+}
+# /api/cycles queries: hourly statistics and recent runs (hours, device, device[, limit])
+CYCLE_HOURLY_QUERY = '''
+    SELECT device_id, hour_timestamp, cycle_count, short_cycle_count, on_seconds,
+           mean_on_seconds, p95_on_seconds, mean_off_seconds
+    FROM burner_cycle_hourly
+    WHERE hour_timestamp >= date_trunc('hour', NOW() - make_interval(hours => %s))
+      AND (%s::text IS NULL OR device_id = %s)
+    ORDER BY device_id, hour_timestamp
+'''
+RECENT_CYCLES_QUERY = '''
+    SELECT device_id, burner_on, started_at, ended_at, duration_seconds,
+           trigger_zones, short_cycle
+    FROM burner_cycles
+    WHERE started_at >= NOW() - make_interval(hours => %s)
+      AND NOT interrupted
+      AND (%s::text IS NULL OR device_id = %s)
+    ORDER BY started_at DESC
+    LIMIT %s
+'''
+# Minute aggregate source per MINUTE_LAYOUT; the hour layout unnests hourly_utilization rows
+# format=columnar readings: the Reading columns, written as ReadingBatch documents
+EXPORT_COLUMNAR_READINGS_QUERY = '''
+    SELECT device_id, timestamp, boiler, zone_mask, zone_count, is_demo, seq, sent_at, logged_at
+    FROM boiler_readings
+    WHERE timestamp >= %(start)s AND timestamp < %(end)s
+      AND (%(device)s::text IS NULL OR device_id = %(device)s)
+    ORDER BY timestamp
+'''
+
+EXPORT_MINUTE_SOURCES = {
+    'minute': 'minute_utilization',
+    'hour': 'hourly_utilization_minutes(%(start)s, %(end)s)',
+}
+# Rows fetched per round trip by the export cursor, and rows per response chunk
+EXPORT_ITERSIZE = 5000
+EXPORT_CHUNK_ROWS = 1000
+
+
+class UtilizationCache:
+    """Caches /api/utilization query results until the next minute is aggregated.
+
+    Entries are cleared by change feed notifications on the aggregates
+    channel, with max_age as a fallback if the listener is disconnected.
+    """
+
+    def __init__(self, max_age=UTILIZATION_CACHE_MAX_AGE):
+        self.max_age = max_age
+        self._entries = {}
+        self._lock = threading.Lock()
+        # Incremented by clear(); a result computed across a clear() is not stored
+        self._generation = 0
+
+    def get(self, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            generation = self._generation
+        if entry and now - entry[0] < self.max_age:
+            return entry[1]
+        value = compute()
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (now, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+
+def create_app(mqtt_subscriber=True):
+    """Create the dashboard application.
 
-# Global variables for ESP32 mode control
-current_mode = "unknown"
-mqtt_client = None
+    mqtt_subscriber=True runs the MQTT state subscriber inside this process
+    (development server). Production workers pass False and read the state
+    written by the single subscriber started in gunicorn.conf.py.
+    """
+    app = Flask(__name__, static_folder='build')
+    CORS(app)  # Enable CORS for React development
+    app.register_blueprint(api)
+    app.before_request(start_request_timing)
+    app.before_request(admit_request)
+    app.after_request(finish_request_timing)
+    app.after_request(release_admission)
+    app.teardown_request(release_admission_on_error)
 
-def get_db_connection():
+    state = MqttState(subscribe=mqtt_subscriber)
+    state.start()
+    app.extensions['mqtt_state'] = state
+    app.extensions['storage'] = get_backend(statement_timeout_ms=API_STATEMENT_TIMEOUT_MS)
+    app.extensions['admission'] = Admission(app.extensions['storage'])
+
+    # Drop cached utilization as soon as the aggregator writes a new minute
+    cache = UtilizationCache()
+    if app.extensions['storage'].name == 'postgres':
+        listener = ChangeFeedListener(get_db_connection, channels=(AGGREGATES_CHANNEL,),
+                                      on_reconnect=cache.clear)
+        listener.start(lambda event: cache.clear())
+    app.extensions['utilization_cache'] = cache
+    return app
+
+
+def start_request_timing():
+    g.request_timing = start_timing()
+
+
+def finish_request_timing(response):
+    """Record the route's database and Python time and report it in a Server-Timing header."""
+    started = g.pop('request_timing', None)
+    if started is not None:
+        rule = request.url_rule.rule if request.url_rule is not None else '(unmatched)'
+        timing = finish_timing(f"{request.method} {rule}", started)
+        response.headers['Server-Timing'] = (f"db;dur={timing.db * 1000:.1f}, "
+                                             f"app;dur={timing.python * 1000:.1f}")
+    return response
+
+
+def admit_request():
+    """Apply rate limits, concurrency limits and ingest priority (admission.py) before the route runs."""
+    rule = request.url_rule.rule if request.url_rule is not None else None
+    try:
+        g.admission_permit = current_app.extensions['admission'].admit(
+            rule, client_key(request.remote_addr, request.headers.get('X-Forwarded-For')))
+    except Rejected as e:
+        return jsonify({'error': str(e)}), e.status, {'Retry-After': str(e.retry_after)}
+    return None
+
+
+def release_admission(response):
+    """Free the request's admission slots; a streamed response holds them until it is closed."""
+    permit = g.pop('admission_permit', None)
+    if permit is not None:
+        if response.is_streamed:
+            response.call_on_close(permit.release)
+        else:
+            permit.release()
+    return response
+
+
+def release_admission_on_error(exc):
+    # after_request does not run when the route raised
+    permit = g.pop('admission_permit', None)
+    if permit is not None:
+        permit.release()
+
+
+def get_mqtt_state():
+    """Get the MQTT-backed state for the current application."""
+    return current_app.extensions['mqtt_state']
+
+
+def get_utilization_cache():
+    """Get the utilization result cache for the current application."""
+    return current_app.extensions['utilization_cache']
+
+
+def get_storage():
+    """Get the storage backend for the current application."""
+    return current_app.extensions['storage']
+
+
+def requires_postgres():
+    """Error response for routes that need the PostgreSQL backend, or None."""
+    if get_storage().name != 'postgres':
+        return jsonify({'error': 'This endpoint requires the PostgreSQL storage backend'}), 501
+    return None
+
+def get_db_connection(statement_timeout_ms=API_STATEMENT_TIMEOUT_MS):
     """Get PostgreSQL database connection."""
     conn = psycopg2.connect(
         host=POSTGRES_HOST,
@@ -41,103 +304,730 @@ def get_db_connection():
         database=POSTGRES_DB,
         user=POSTGRES_USER,
         password=POSTGRES_PASSWORD,
-        cursor_factory=RealDictCursor
+        options=f"-c statement_timeout={statement_timeout_ms}" if statement_timeout_ms else None
     )
     return conn
 
-@app.route('/api/status')
+@api.route('/api/status')
 def get_current_status():
     """Get the current status of burner and all zones from latest reading."""
+    # Serve the reading the MQTT subscriber already holds when we have one
+    reading = get_mqtt_state().latest_reading
+    if reading:
+        return jsonify(reading)
+
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         # Get the most recent reading
-        cursor.execute('''
-            SELECT timestamp, boiler as burner, zone_1, zone_2, zone_3, zone_4, zone_5, zone_6
-            FROM boiler_readings
-            ORDER BY timestamp DESC
-            LIMIT 1
-        ''')
-        
-        row = cursor.fetchone()
-        conn.close()
-        
+        row = get_storage().latest_reading()
         if row:
-            return jsonify({
-                'timestamp': row['timestamp'],
-                'burner': row['burner'],
-                'zone_1': row['zone_1'],
-                'zone_2': row['zone_2'],
-                'zone_3': row['zone_3'],
-                'zone_4': row['zone_4'],
-                'zone_5': row['zone_5'],
-                'zone_6': row['zone_6']
-            })
+            return jsonify(Reading(*row).to_status())
         else:
             return jsonify({'error': 'No data available'}), 404
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/utilization')
+@api.route('/api/live')
+def get_live_utilization():
+    """Rolling utilization over the last 1, 5 and 15 minutes (ROLLING_WINDOWS), per device.
+
+    Counted from the MQTT feed by the API's subscriber and published every
+    ROLLING_PUBLISH_SECONDS (see rolling.py); no database access. Query
+    parameter: device (default all devices). Each window has its sample
+    count and the sample-weighted percent of each channel (null without
+    samples); ``age_seconds`` is how old the published windows are.
+    """
+    live = get_mqtt_state().rolling_utilization
+    if not live:
+        return jsonify({'error': 'Live utilization is not available (MQTT subscriber not running)'}), 503
+    devices = live['devices']
+    device_id = request.args.get('device')
+    if device_id is not None:
+        if device_id not in devices:
+            return jsonify({'error': f'No recent readings from device {device_id}'}), 404
+        devices = {device_id: devices[device_id]}
+    as_of = datetime.fromisoformat(live['as_of'])
+    return jsonify({
+        **live,
+        'devices': devices,
+        'age_seconds': round((datetime.now(as_of.tzinfo) - as_of).total_seconds(), 1),
+    })
+
+@api.route('/api/utilization')
 def get_utilization_data():
-    """Get utilization trend data for the last 1 hour."""
+    """Get utilization trend data for the last 1 hour.
+
+    ``device`` selects the device (default: DEFAULT_DEVICE_ID); zone series
+    are zone_1..zone_N for however many zones the device reports.
+    Returns a JSON array of per-minute objects by default. ``format=columnar``
+    (or Accept: application/vnd.boilerstat.columnar+json) returns one array per
+    series plus a shared timestamp vector; ``format=binary`` returns the same
+    columns as packed little-endian floats (see encode_columnar_binary).
+    """
+    response_format = request.args.get('format')
+    if response_format is None:
+        best = request.accept_mimetypes.best_match(
+            ['application/json', COLUMNAR_MIMETYPE, BINARY_MIMETYPE], default='application/json')
+        response_format = {COLUMNAR_MIMETYPE: 'columnar', BINARY_MIMETYPE: 'binary'}.get(best, 'json')
+    if response_format not in ('json', 'columnar', 'binary'):
+        return jsonify({'error': 'Invalid format. Use "json", "columnar" or "binary"'}), 400
+
+    device_id = request.args.get('device', DEFAULT_DEVICE_ID)
+
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get utilization data from the last 1 hour
-        cursor.execute('''
-            SELECT 
-                minute_timestamp,
-                boiler_utilization as burner_utilization,
-                zone_1_utilization,
-                zone_2_utilization,
-                zone_3_utilization,
-                zone_4_utilization,
-                zone_5_utilization,
-                zone_6_utilization
-            FROM minute_utilization
-            WHERE minute_timestamp >= NOW() - INTERVAL '1 hour'
-            ORDER BY minute_timestamp ASC
-        ''')
+        cache = get_utilization_cache()
+        if response_format != 'json':
+            timestamps, series = cache.get(
+                ('columns', device_id),
+                lambda: get_storage().utilization_columns(utilization_since(), device_id))
+            if response_format == 'binary':
+                return Response(encode_columnar_binary(timestamps, series), mimetype=BINARY_MIMETYPE)
+            return Response(json.dumps({'timestamps': timestamps, 'series': series}),
+                            mimetype=COLUMNAR_MIMETYPE)
+
+        return jsonify(cache.get(
+            ('rows', device_id), lambda: get_storage().utilization_rows(utilization_since(), device_id)))
         
-        rows = cursor.fetchall()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def parse_utc(value):
+    """Naive UTC datetime from an ISO timestamp; offsets (and a trailing Z) are converted."""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def request_window(default_hours, max_hours):
+    """(start, end, hours) minute bounds of the request's window, naive UTC.
+
+    start/end are ISO timestamps; without start the window is hours long
+    (clamped to 0..max_hours, None in the result when start is given)
+    ending at end, which defaults to the end of the current minute. Raises
+    ValueError or OverflowError for values that are not a usable window.
+    """
+    if 'end' in request.args:
+        end = minute_floor(parse_utc(request.args['end']))
+    else:
+        end = minute_floor(datetime.utcnow()) + MINUTE
+    if 'start' in request.args:
+        return minute_floor(parse_utc(request.args['start'])), end, None
+    hours = min(max(int(request.args.get('hours', default_hours)), 0), max_hours)
+    return end - timedelta(hours=hours), end, hours
+
+def utilization_since():
+    """Start of the /api/utilization window (the last hour, naive UTC)."""
+    return datetime.utcnow() - timedelta(hours=1)
+
+def encode_columnar_binary(timestamps, series):
+    """Pack columns into the binary chart format.
+
+    Layout (little-endian):
+        4 bytes   magic b'BSC1'
+        uint32    header length H
+        H bytes   JSON header {"count": N, "series": [names...]}, space-padded
+                  so the arrays below start on an 8-byte boundary
+        float64[N] timestamps (epoch milliseconds)
+        float32[N] one block per series, in header order; NaN where a minute
+                  has no value for the series (fewer zones reported)
+
+    A browser can wrap each block in a Float64Array/Float32Array without copying.
+    """
+    names = list(series)
+    header = json.dumps({'count': len(timestamps), 'series': names}).encode()
+    header += b' ' * (-(len(BINARY_MAGIC) + 4 + len(header)) % 8)
+
+    columns = [array('d', timestamps)] + [
+        array('f', [NAN if v is None else v for v in series[name]]) for name in names]
+    if sys.byteorder == 'big':
+        for column in columns:
+            column.byteswap()
+
+    parts = [BINARY_MAGIC, struct.pack('<I', len(header)), header]
+    parts.extend(column.tobytes() for column in columns)
+    return b''.join(parts)
+
+@api.route('/api/profile')
+def get_profile():
+    """Average utilization by local hour of day over the last ``days`` days.
+
+    Query parameters: device (default DEFAULT_DEVICE_ID), days (default
+    PROFILE_DEFAULT_DAYS, max PROFILE_MAX_DAYS, today included) and tz (one of
+    PROFILE_TIMEZONES, default the first). Each channel (burner, zone_1..N)
+    has 24 sample-weighted utilization values and their sample counts; hours
+    without production data are null. Served from the precomputed
+    utilization_profile buckets (see profiles.py).
+    """
+    return profile_response(by_weekday=False)
+
+@api.route('/api/heatmap')
+def get_heatmap():
+    """Average utilization by local weekday and hour over the last ``days`` days.
+
+    Same parameters as /api/profile; each channel has 7x24 utilization and
+    sample count matrices, Monday first.
+    """
+    return profile_response(by_weekday=True)
+
+def profile_response(by_weekday):
+    try:
+        days = min(int(request.args.get('days', PROFILE_DEFAULT_DAYS)), PROFILE_MAX_DAYS)
+    except ValueError:
+        return jsonify({'error': 'days must be an integer'}), 400
+    if days < 1:
+        return jsonify({'error': 'days must be at least 1'}), 400
+    tz = request.args.get('tz', PROFILE_TIMEZONES[0])
+    if tz not in PROFILE_TIMEZONES:
+        return jsonify({'error': f'Invalid tz. Profiles are maintained for: {", ".join(PROFILE_TIMEZONES)}'}), 400
+    device_id = request.args.get('device', DEFAULT_DEVICE_ID)
+    # The window moves at local midnight, so the start date is part of the cache key
+    since = profile_since(tz, days)
+
+    def compute():
+        rows = get_storage().utilization_profile(device_id, tz, since, by_weekday)
+        result = {'device_id': device_id, 'timezone': tz, 'days': days, 'since': since.isoformat()}
+        if by_weekday:
+            result['weekdays'] = list(WEEKDAYS)
+            result['channels'] = build_heatmap(rows)
+        else:
+            result['channels'] = build_profile(rows)
+        return result
+
+    try:
+        key = ('heatmap' if by_weekday else 'profile', device_id, tz, since)
+        return jsonify(get_utilization_cache().get(key, compute))
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/coverage')
+def get_coverage():
+    """Where one device has data, from the data coverage index.
+
+    Query parameters: device (default DEFAULT_DEVICE_ID) and either hours
+    (window ending now, default 24, max 720) or start/end (UTC ISO). Returns
+    interval lists: ``raw`` (minutes with raw readings, kept for the raw
+    retention period), ``aggregated`` (minutes with a minute aggregate),
+    ``missing`` (no aggregate: gaps in the chart) and ``unaggregated`` (raw
+    data waiting for backfill). Cost grows with the number of gaps, not
+    with the number of readings.
+    """
+    device_id = request.args.get('device', DEFAULT_DEVICE_ID)
+    try:
+        start, end, _ = request_window(24, COVERAGE_MAX_HOURS)
+    except (ValueError, OverflowError):
+        return jsonify({'error': 'hours must be an integer and start/end ISO timestamps'}), 400
+    if end <= start:
+        return jsonify({'error': 'end must be after start'}), 400
+
+    try:
+        intervals = get_storage().coverage(device_id, start, end)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    aggregated = intervals[AGGREGATED]
+    return jsonify({
+        'device_id': device_id,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'coverage_percent': round(minute_count(aggregated) * 100 / minute_count([(start, end)]), 2),
+        'raw': to_dicts(intervals[RAW]),
+        'aggregated': to_dicts(aggregated),
+        'missing': to_dicts(complement(aggregated, start, end)),
+        'unaggregated': to_dicts(subtract(intervals[RAW], aggregated)),
+    })
+
+@api.route('/api/totals')
+def get_totals():
+    """Burner and zone totals for one device over any range, from the running totals.
+
+    Query parameters: device (default DEFAULT_DEVICE_ID), either hours
+    (window ending now, default 24) or start/end (UTC ISO), and optional
+    firing_rate_kw / fuel_per_hour overriding BURNER_FIRING_RATE_KW and
+    BURNER_FUEL_PER_HOUR. Returns per-channel on_hours, time- and
+    sample-weighted utilization and, when a rate is set, energy (kWh) and
+    fuel estimates from burner on-time. Production minutes only; cost does
+    not grow with the range.
+    """
+    device_id = request.args.get('device', DEFAULT_DEVICE_ID)
+    try:
+        start, end, _ = request_window(24, TOTALS_MAX_HOURS)
+        firing_rate_kw = float(request.args.get('firing_rate_kw', BURNER_FIRING_RATE_KW))
+        fuel_per_hour = float(request.args.get('fuel_per_hour', BURNER_FUEL_PER_HOUR))
+    except (ValueError, OverflowError):
+        return jsonify({'error': 'hours must be an integer, start/end ISO timestamps and rates numbers'}), 400
+    if end <= start:
+        return jsonify({'error': 'end must be after start'}), 400
+
+    try:
+        totals = get_storage().utilization_totals(device_id, start, end)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify({
+        'device_id': device_id,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        **totals.to_dict(minute_count([(start, end)]), firing_rate_kw=firing_rate_kw, fuel_per_hour=fuel_per_hour),
+    })
+
+@api.route('/api/fleet/ranking')
+def get_fleet_ranking():
+    """Top devices or zones of the fleet by utilization over a window.
+
+    Query parameters: hours (window ending now, default FLEET_DEFAULT_HOURS)
+    or start/end (UTC ISO); by (burner, zone_N, or zones to rank every zone
+    of every device; default burner); metric (utilization_percent or
+    on_hours); limit (default 10); order (desc or asc) and min_coverage
+    (percent of the window a device must have aggregated, default 0).
+    Served from the cached fleet_totals(): one query for the whole fleet.
+    """
+    window, error = fleet_window()
+    if error:
+        return error
+    start, end, fleet = window
+    by = request.args.get('by', 'burner')
+    metric = request.args.get('metric', RANKING_METRICS[0])
+    order = request.args.get('order', 'desc')
+    if metric not in RANKING_METRICS:
+        return jsonify({'error': f'Invalid metric. Use one of: {", ".join(RANKING_METRICS)}'}), 400
+    if order not in ('asc', 'desc'):
+        return jsonify({'error': 'order must be asc or desc'}), 400
+    if by not in ('burner', 'zones') and not (by.startswith('zone_') and by[5:].isdigit()):
+        return jsonify({'error': 'by must be burner, zones or zone_N'}), 400
+    try:
+        limit = int(request.args.get('limit', 10))
+        min_coverage = float(request.args.get('min_coverage', 0))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer and min_coverage a number'}), 400
+
+    return jsonify({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'by': by,
+        'metric': metric,
+        'order': order,
+        'devices': len(fleet),
+        'ranking': fleet_ranking(fleet, minute_count([(start, end)]), by=by, metric=metric, limit=max(limit, 0),
+                                 ascending=order == 'asc', min_coverage=min_coverage),
+    })
+
+@api.route('/api/fleet/compare')
+def get_fleet_compare():
+    """Side-by-side totals of selected devices, with the fleet as a whole for reference.
+
+    Query parameters: devices (comma-separated, at most
+    MAX_FLEET_COMPARE_DEVICES) and the window parameters of
+    /api/fleet/ranking. Each device gets the /api/totals fields; devices
+    without production data in the window get zero minutes.
+    """
+    device_ids = [d for d in request.args.get('devices', '').split(',') if d]
+    if not device_ids:
+        return jsonify({'error': 'devices is required (comma-separated device ids)'}), 400
+    if len(device_ids) > MAX_FLEET_COMPARE_DEVICES:
+        return jsonify({'error': f'At most {MAX_FLEET_COMPARE_DEVICES} devices can be compared'}), 400
+    window, error = fleet_window()
+    if error:
+        return error
+    start, end, fleet = window
+    range_minutes = minute_count([(start, end)])
+
+    return jsonify({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'devices': {device_id: fleet.get(device_id, Totals()).to_dict(range_minutes) for device_id in device_ids},
+        'fleet': fleet_summary(fleet, range_minutes),
+    })
+
+def fleet_window():
+    """((start, end, {device_id: Totals}), None) for the request's window, or (None, error response).
+
+    Per-device totals of the whole fleet are cached per window until the
+    next minute is aggregated (or UTILIZATION_CACHE_MAX_AGE); a window ending
+    now is keyed by its length, so it moves at most max_age behind.
+    """
+    try:
+        start, end, hours = request_window(FLEET_DEFAULT_HOURS, FLEET_MAX_HOURS)
+    except (ValueError, OverflowError):
+        return None, (jsonify({'error': 'hours must be an integer and start/end ISO timestamps'}), 400)
+    if end <= start:
+        return None, (jsonify({'error': 'end must be after start'}), 400)
+    if hours is None:
+        key = ('fleet', start, end)
+    else:
+        key = ('fleet', hours, end if 'end' in request.args else None)
+
+    try:
+        cache = get_utilization_cache()
+        # The first request for a window fixes it; later hits within max_age share it
+        return cache.get(key, lambda: (start, end, get_storage().fleet_totals(start, end))), None
+    except Exception as e:
+        return None, (jsonify({'error': str(e)}), 500)
+
+@api.route('/api/cycles')
+def get_cycle_data():
+    """Get burner cycle statistics and recent cycles.
+
+    Query parameters: hours (lookback, default 24, max 720), device (optional
+    device_id filter), limit (number of recent cycles, default 100, max 1000).
+    """
+    try:
+        hours = min(int(request.args.get('hours', 24)), 720)
+        limit = min(int(request.args.get('limit', 100)), 1000)
+    except ValueError:
+        return jsonify({'error': 'hours and limit must be integers'}), 400
+    device = request.args.get('device')
+    unsupported = requires_postgres()
+    if unsupported:
+        return unsupported
+
+    try:
+        conn = get_db_connection()
+        # Cycle rows go out as they are, one JSON object each
+        cursor = TimedCursor(conn.cursor(cursor_factory=RealDictCursor))
+
+        cursor.execute(CYCLE_HOURLY_QUERY, (hours, device, device))
+        hourly = cursor.fetchall()
+
+        cursor.execute(RECENT_CYCLES_QUERY, (hours, device, device, limit))
+        cycles = cursor.fetchall()
         conn.close()
-        
-        # Convert to format suitable for charting
-        data = []
-        for row in rows:
-            data.append({
-                'timestamp': row['minute_timestamp'],
-                'burner': row['burner_utilization'],
-                'zone_1': row['zone_1_utilization'],
-                'zone_2': row['zone_2_utilization'],
-                'zone_3': row['zone_3_utilization'],
-                'zone_4': row['zone_4_utilization'],
-                'zone_5': row['zone_5_utilization'],
-                'zone_6': row['zone_6_utilization']
-            })
-        
-        return jsonify(data)
-        
+
+        return jsonify({'hourly': hourly, 'cycles': cycles})
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/latency')
+def get_latency():
+    """Ingest-to-dashboard latency histograms (seconds).
+
+    ``api`` is measured live by the API's MQTT subscriber: device_to_api
+    latency, per-device clock skew and sequence gaps. ``database`` is built
+    from the stage timestamps stored with the latest ``samples`` readings and
+    minute aggregates (default 1000, max 10000): device_to_logger,
+    logger_to_db and minute_to_aggregate (end of minute until written).
+    """
+    try:
+        samples = min(int(request.args.get('samples', 1000)), 10000)
+    except ValueError:
+        return jsonify({'error': 'samples must be an integer'}), 400
+
+    try:
+        storage = get_storage()
+        device_to_logger = LatencyHistogram()
+        logger_to_db = LatencyHistogram()
+        for sent_at, logged_at, received_at in storage.latency_samples(samples):
+            device_to_logger.observe(max((logged_at - sent_at).total_seconds(), 0.0))
+            if received_at is not None:
+                logger_to_db.observe(max((received_at - logged_at).total_seconds(), 0.0))
+
+        minute_to_aggregate = LatencyHistogram()
+        for minute_timestamp, aggregated_at in storage.aggregation_samples(samples):
+            if aggregated_at is not None:
+                minute_end = minute_timestamp + timedelta(minutes=1)
+                minute_to_aggregate.observe(max((aggregated_at - minute_end).total_seconds(), 0.0))
+
+        return jsonify({
+            'api': get_mqtt_state().latency_summary,
+            'database': {
+                'samples': samples,
+                'stages': {
+                    'device_to_logger': device_to_logger.to_dict(),
+                    'logger_to_db': logger_to_db.to_dict(),
+                    'minute_to_aggregate': minute_to_aggregate.to_dict(),
+                },
+            },
+        })
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/listeners')
+def get_listeners():
+    """Heartbeats of the MQTT listener processes and shard health.
+
+    One entry per listener in listener_shards: sharding mode and shard,
+    message counters, write backlog (``queued``, ``lag_seconds``) and
+    receive-to-commit p95. ``healthy`` is false when a listener stopped
+    heartbeating, a hash shard has no live listener or is served twice, or
+    live listeners would store readings twice; ``problems`` says which.
+    """
+    try:
+        report = shard_report(get_storage().listener_statuses(), datetime.utcnow())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    for listener in report['listeners']:
+        listener['started_at'] = listener['started_at'].isoformat()
+        listener['heartbeat_at'] = listener['heartbeat_at'].isoformat()
+    return jsonify(report)
+
+@api.route('/api/admission')
+def get_admission():
+    """Admission control state of this worker process.
+
+    Per gate (the worker-wide limit and each API_ROUTE_LIMITS route): limit,
+    running and queued requests, and admitted / rejected (queue full) /
+    timed_out counts; rate limited requests and heavy reads shed while
+    ingest is behind. Exempt from admission control itself.
+    """
+    return jsonify(current_app.extensions['admission'].status())
+
+@api.route('/api/debug/timings')
+def get_debug_timings():
+    """Per-route wall, database and Python time of this worker process since start.
+
+    Only served with PROFILING_ENABLED=true. ?reset=true clears the table
+    after returning it.
+    """
+    if not PROFILING_ENABLED:
+        return jsonify({'error': 'Profiling is disabled (PROFILING_ENABLED=false)'}), 404
+    snapshot = timings.snapshot()
+    if request.args.get('reset', 'false').lower() == 'true':
+        timings.clear()
+    return jsonify(snapshot)
+
+@api.route('/api/debug/profile', methods=['POST'])
+def start_debug_profile():
+    """Sample every thread of this worker process for ``seconds`` (default 30, max PROFILE_MAX_SECONDS).
+
+    Only served with PROFILING_ENABLED=true. Returns 202 at once with the
+    folded-stack file that is written to PROFILE_DIR when sampling ends
+    (plus a -timings.json snapshot), or 409 while a capture is running.
+    """
+    if not PROFILING_ENABLED:
+        return jsonify({'error': 'Profiling is disabled (PROFILING_ENABLED=false)'}), 404
+    try:
+        seconds = float(request.args.get('seconds', PROFILE_SIGNAL_SECONDS))
+    except ValueError:
+        return jsonify({'error': 'seconds must be a number'}), 400
+    if seconds <= 0:
+        return jsonify({'error': 'seconds must be positive'}), 400
+    seconds = min(seconds, PROFILE_MAX_SECONDS)
+    try:
+        path = start_capture('api', seconds)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({'pid': os.getpid(), 'seconds': seconds, 'directory': PROFILE_DIR, 'file': path}), 202
+
+def export_query(dataset, layout):
+    """SQL of an /api/export dataset for a storage MINUTE_LAYOUT."""
+    return EXPORT_QUERIES[dataset].format(minutes=EXPORT_MINUTE_SOURCES[layout])
+
+@api.route('/api/export')
+def export_data():
+    """Stream a dataset for an arbitrary time range as CSV or NDJSON.
+
+    Query parameters: dataset (readings, minutes, hourly or cycles; default
+    readings), start and end (ISO timestamps in UTC; default the last hour),
+    device (optional, readings and cycles only), format (csv, ndjson, or
+    columnar for readings: NDJSON lines of ReadingBatch.to_dict() column
+    lists, EXPORT_CHUNK_ROWS readings each) and compress=gzip. Rows are read
+    through a server-side cursor and written out in chunks, so memory use does
+    not depend on the size of the range.
+    """
+    dataset = request.args.get('dataset', 'readings')
+    response_format = request.args.get('format', 'csv')
+    compress = request.args.get('compress')
+    if dataset not in EXPORT_QUERIES:
+        return jsonify({'error': f'Invalid dataset. Use one of: {", ".join(EXPORT_QUERIES)}'}), 400
+    if response_format not in ('csv', 'ndjson', 'columnar'):
+        return jsonify({'error': 'Invalid format. Use "csv", "ndjson" or "columnar"'}), 400
+    if response_format == 'columnar' and dataset != 'readings':
+        return jsonify({'error': 'format=columnar is only available for dataset=readings'}), 400
+    if compress not in (None, 'gzip'):
+        return jsonify({'error': 'Invalid compress. Use "gzip"'}), 400
+
+    try:
+        end = parse_utc(request.args['end']) if 'end' in request.args else datetime.utcnow()
+        start = parse_utc(request.args['start']) if 'start' in request.args else end - timedelta(hours=1)
+    except (ValueError, OverflowError):
+        return jsonify({'error': 'start and end must be ISO 8601 timestamps'}), 400
+    params = {'start': start, 'end': end, 'device': request.args.get('device')}
+    unsupported = requires_postgres()
+    if unsupported:
+        return unsupported
+
+    conn = None
+    try:
+        conn = get_db_connection(API_EXPORT_STATEMENT_TIMEOUT_MS)
+        # Named (server-side) cursor: rows arrive EXPORT_ITERSIZE at a time
+        cursor = conn.cursor(name='boilerstat_export')
+        cursor.itersize = EXPORT_ITERSIZE
+        if response_format == 'columnar':
+            cursor.execute(EXPORT_COLUMNAR_READINGS_QUERY, params)
+        else:
+            cursor.execute(export_query(dataset, get_storage().layout), params)
     except Exception as e:
+        # Most often statement_timeout cancelling a large export; closing rolls the transaction back
+        if conn is not None:
+            conn.close()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/health')
+    if response_format == 'columnar':
+        body = stream_export_batches(conn, cursor)
+    else:
+        body = stream_export_rows(conn, cursor, response_format)
+    if compress == 'gzip':
+        body = gzip_stream(body)
+
+    extension = 'csv' if response_format == 'csv' else 'ndjson'
+    filename = f"boilerstat-{dataset}-{start:%Y%m%dT%H%M}-{end:%Y%m%dT%H%M}.{extension}"
+    mimetype = 'text/csv' if response_format == 'csv' else 'application/x-ndjson'
+    if compress == 'gzip':
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    return Response(body, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+def _export_json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+def stream_export_rows(conn, cursor, response_format):
+    """Yield the cursor's rows as CSV or NDJSON text, EXPORT_CHUNK_ROWS at a time."""
+    try:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        columns = None
+        pending = 0
+        for row in cursor:
+            if columns is None:
+                # Column names are only known once the first batch has been fetched
+                columns = [col[0] for col in cursor.description]
+                if response_format == 'csv':
+                    writer.writerow(columns)
+            if response_format == 'csv':
+                writer.writerow(row)
+            else:
+                buffer.write(json.dumps(dict(zip(columns, row)), default=_export_json_default))
+                buffer.write('\n')
+            pending += 1
+            if pending >= EXPORT_CHUNK_ROWS:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        if columns is None and response_format == 'csv' and cursor.description:
+            # Empty range: still emit the header row
+            writer.writerow([col[0] for col in cursor.description])
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        conn.close()
+
+def stream_export_batches(conn, cursor):
+    """Yield the cursor's readings as NDJSON, one ReadingBatch.to_dict() line per EXPORT_CHUNK_ROWS rows."""
+    try:
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+            if not rows:
+                break
+            yield json.dumps(ReadingBatch.from_rows(rows).to_dict()) + '\n'
+    finally:
+        conn.close()
+
+def gzip_stream(chunks):
+    """Gzip-compress a stream of text chunks on the fly."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+def message_to_dict(seq, device_id, received_at, payload):
+    """/api/messages entry: the raw payload plus the fields the message window shows."""
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        return {'seq': seq, 'device_id': device_id, 'payload': payload.decode(errors='replace'),
+                'received_at': datetime.utcfromtimestamp(received_at).isoformat()}
+    status = reading_to_status(data)
+    zone_keys = sorted((key for key in status if key.startswith('zone_')), key=lambda k: int(k[5:]))
+    return {
+        'seq': seq,
+        'device_id': device_id,
+        'received_at': datetime.utcfromtimestamp(received_at).isoformat(),
+        'timestamp': status['timestamp'],
+        'burner': status['burner'],
+        'zones': [status[key] for key in zone_keys],
+        'mode': 'demo' if data.get('is_demo', False) else 'production',
+        'payload': data,
+    }
+
+@api.route('/api/messages')
+def get_messages():
+    """Recent raw MQTT messages from the API subscriber's ring buffer.
+
+    Without ``since`` the newest ``limit`` messages are returned (default 50,
+    max 1000). With ``since`` (the ``cursor`` of the previous response) only
+    newer messages are returned, oldest first; ``more`` is true when the
+    limit cut them short. ``truncated`` means messages after ``since`` were
+    already overwritten, ``reset`` that the buffer restarted and ``since``
+    was ignored. ``device`` filters by device_id.
+    """
+    try:
+        since = int(request.args['since']) if 'since' in request.args else None
+        limit = max(1, min(int(request.args.get('limit', 50)), 1000))
+    except ValueError:
+        return jsonify({'error': 'since and limit must be integers'}), 400
+    device_id = request.args.get('device')
+
+    buffer = get_mqtt_state().messages
+    messages, latest, truncated = buffer.read(since or 0, device_id)
+    reset = since is not None and since > latest
+    if reset:
+        messages, latest, truncated = buffer.read(0, device_id)
+
+    more = False
+    if since is None or reset:
+        messages = messages[-limit:]
+        truncated = False
+        cursor = latest
+    else:
+        more = len(messages) > limit
+        messages = messages[:limit]
+        cursor = messages[-1][0] if more else latest
+
+    return jsonify({
+        'messages': [message_to_dict(*message) for message in messages],
+        'cursor': cursor,
+        'more': more,
+        'truncated': truncated,
+        'reset': reset,
+    })
+
+@api.route('/api/health')
 def health_check():
     """Health check endpoint."""
     return jsonify({'status': 'healthy', 'timestamp': datetime.utcnow().isoformat()})
 
-@app.route('/api/mode', methods=['GET'])
+@api.route('/api/mode', methods=['GET'])
 def get_mode():
-    """Get current ESP32 operating mode."""
-    return jsonify({'mode': current_mode})
+    """Get current ESP32 operating mode.
 
-@app.route('/api/mode', methods=['POST'])
+    ``mode`` is the mode of the latest reading from any device; ``devices``
+    maps each device to the mode of its latest reading or acknowledged
+    command. ``device`` returns a single device's mode.
+    """
+    state = get_mqtt_state()
+    device_id = request.args.get('device')
+    if device_id is not None:
+        return jsonify({'device_id': device_id, 'mode': state.device_modes.get(device_id, 'unknown')})
+    return jsonify({'mode': state.mode, 'devices': state.device_modes})
+
+@api.route('/api/mode', methods=['POST'])
 def set_mode():
-    """Set ESP32 operating mode via MQTT."""
+    """Set ESP32 operating mode via MQTT.
+
+    Without ``devices`` the command is broadcast on the global control topic
+    and not confirmed. With ``devices`` (a list of device IDs, or "all" for
+    every device seen) it is sent to each device's own topic concurrently and
+    the response reports every device's acknowledgement; ``timeout`` (seconds
+    per attempt) and ``retries`` override the defaults.
+    """
     try:
         data = request.get_json()
         if not data or 'mode' not in data:
@@ -149,14 +1039,16 @@ def set_mode():
             
         # Send MQTT control message
         demo_mode = (mode == 'demo')
+        if 'devices' in data:
+            return set_fleet_mode(data, mode, demo_mode)
         control_message = {
             "demo_mode": demo_mode,
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
         
-        if mqtt_client and mqtt_client.is_connected():
-            result = mqtt_client.publish(MQTT_CONTROL_TOPIC, json.dumps(control_message))
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+        state = get_mqtt_state()
+        if state.is_connected():
+            if state.publish_control(control_message):
                 return jsonify({'success': True, 'mode': mode, 'message': 'Mode change command sent'})
             else:
                 return jsonify({'error': 'Failed to send MQTT command'}), 500
@@ -166,75 +1058,81 @@ def set_mode():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-# Removed Live ESP32 Stream functionality
-
-def init_mqtt():
-    """Initialize MQTT client for mode control and message monitoring."""
-    global mqtt_client, current_mode
-    
-    def on_connect(client, userdata, flags, rc):
-        if rc == 0:
-            print("✅ Connected to MQTT broker for web interface")
-            client.subscribe(MQTT_DATA_TOPIC)
-        else:
-            print(f"❌ Failed to connect to MQTT broker. Return code: {rc}")
-            
-    def on_message(client, userdata, msg):
-        global current_mode
-        if msg.topic == MQTT_DATA_TOPIC:
-            try:
-                data = json.loads(msg.payload.decode())
-                is_demo = data.get('is_demo', False)
-                
-                # Update current mode based on ESP32 flag
-                current_mode = "demo" if is_demo else "production"
-                
-            except Exception as e:
-                print(f"Error processing MQTT message: {e}")
-    
-    mqtt_client = mqtt.Client()
-    mqtt_client.on_connect = on_connect
-    mqtt_client.on_message = on_message
-    
+def set_fleet_mode(data, mode, demo_mode):
+    """Device-addressed mode change with per-device acknowledgements."""
+    state = get_mqtt_state()
+    devices = data['devices']
+    if devices == 'all':
+        devices = sorted(state.device_modes)
+    if not isinstance(devices, list) or not devices or not all(isinstance(d, str) and d for d in devices):
+        return jsonify({'error': 'devices must be "all" or a non-empty list of device IDs'}), 400
+    if len(devices) > MAX_FLEET_COMMAND_DEVICES:
+        return jsonify({'error': f'At most {MAX_FLEET_COMMAND_DEVICES} devices per command'}), 400
     try:
-        mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        mqtt_client.loop_start()
-        return True
-    except Exception as e:
-        print(f"Failed to connect to MQTT broker: {e}")
-        return False
+        timeout = min(float(data.get('timeout', COMMAND_TIMEOUT_SECONDS)), 30.0)
+        retries = max(0, min(int(data.get('retries', COMMAND_RETRIES)), 5))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'timeout and retries must be numbers'}), 400
+    if timeout <= 0:
+        return jsonify({'error': 'timeout must be positive'}), 400
+    if not state.is_connected():
+        return jsonify({'error': 'MQTT client not connected'}), 500
+
+    results = state.fleet.set_mode(devices, demo_mode, timeout=timeout, retries=retries)
+    return jsonify({
+        'success': all(r.status == 'acked' for r in results.values()),
+        'mode': mode,
+        'summary': summarize(results),
+        'devices': {device_id: {'status': r.status, 'attempts': r.attempts, 'latency_ms': r.latency_ms,
+                                'command_id': r.command_id}
+                    for device_id, r in results.items()},
+    })
+
+# Removed Live ESP32 Stream functionality
 
 # Serve React App
-@app.route('/')
+@api.route('/')
 def serve_react_app():
-    return send_from_directory(app.static_folder, 'index.html')
+    return send_from_directory(current_app.static_folder, 'index.html')
 
-@app.route('/<path:path>')
+@api.route('/<path:path>')
 def static_proxy(path):
     # Serve static files from React build
-    return send_from_directory(app.static_folder, path)
+    return send_from_directory(current_app.static_folder, path)
 
 if __name__ == '__main__':
-    # Check PostgreSQL database connection
+    # Check database connection
     try:
-        conn = get_db_connection()
-        conn.close()
-        print(f"Connected to PostgreSQL database: {POSTGRES_DB}@{POSTGRES_HOST}:{POSTGRES_PORT}")
-    except psycopg2.Error as e:
+        storage = get_backend()
+        storage.check()
+        print(f"Connected to {describe_backend(storage)}")
+    except Exception as e:
         print(f"Database connection error: {e}")
-        print("Please ensure PostgreSQL is running and credentials are correct.")
+        print("Please ensure the database is available and credentials are correct.")
         exit(1)
     
     print(f"Starting BoilerStat Web Dashboard...")
-    print(f"Database: {POSTGRES_DB}@{POSTGRES_HOST}:{POSTGRES_PORT}")
+    print(f"Database: {describe_backend(storage)}")
     print(f"API endpoints available at:")
     print(f"  - http://localhost:5000/api/status")
+    print(f"  - http://localhost:5000/api/live")
     print(f"  - http://localhost:5000/api/utilization") 
+    print(f"  - http://localhost:5000/api/profile")
+    print(f"  - http://localhost:5000/api/heatmap")
+    print(f"  - http://localhost:5000/api/cycles")
+    print(f"  - http://localhost:5000/api/totals")
+    print(f"  - http://localhost:5000/api/fleet/ranking")
+    print(f"  - http://localhost:5000/api/fleet/compare?devices=<id>,<id>")
+    print(f"  - http://localhost:5000/api/admission")
+    print(f"  - http://localhost:5000/api/latency")
+    print(f"  - http://localhost:5000/api/listeners")
+    print(f"  - http://localhost:5000/api/export")
     print(f"  - http://localhost:5000/api/health")
     print(f"  - http://localhost:5000/api/mode (GET/POST)")
+    print("Development server only; use gunicorn -c gunicorn.conf.py in production")
     
-    # Initialize MQTT connection
-    init_mqtt()
+    # Development server: run the MQTT subscriber in this process
+    app = create_app(mqtt_subscriber=True)
     
     app.run(host=os.getenv("FLASK_HOST", "0.0.0.0"), 
             port=int(os.getenv("FLASK_PORT", "5000")), 
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+PostgreSQL LISTEN/NOTIFY change feed for BoilerStat.
+
+Triggers in postgres-db/init/02-change-feed.sql issue a NOTIFY for every new
+raw reading and every finished minute aggregation. ChangeFeedListener
+consumes them so monitors and the API react immediately instead of polling.
+"""
+
+import json
+import select
+import threading
+from collections import namedtuple
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+READINGS_CHANNEL = "boilerstat_readings"
+AGGREGATES_CHANNEL = "boilerstat_aggregates"
+
+ChangeEvent = namedtuple('ChangeEvent', ['channel', 'payload'])
+
+
+class ChangeFeedListener:
+    """Listens on one or more NOTIFY channels over a dedicated connection.
+
+    connect is a zero-argument callable returning a new psycopg2 connection,
+    normally the calling module's get_db_connection. If the connection drops,
+    the listener reconnects and calls on_reconnect, because notifications sent
+    while it was disconnected are lost and callers may need to resynchronize.
+    """
+
+    def __init__(self, connect, channels=(READINGS_CHANNEL, AGGREGATES_CHANNEL),
+                 on_reconnect=None, reconnect_delay=5):
+        self.connect = connect
+        self.channels = tuple(channels)
+        self.on_reconnect = on_reconnect
+        self.reconnect_delay = reconnect_delay
+        self._conn = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _open(self):
+        conn = self.connect()
+        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        cursor = conn.cursor()
+        for channel in self.channels:
+            cursor.execute(f'LISTEN "{channel}"')
+        self._conn = conn
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except psycopg2.Error:
+                pass
+            self._conn = None
+
+    def events(self, timeout=1.0):
+        """Yield ChangeEvents until stop() is called.
+
+        Payloads are decoded from JSON when possible. The timeout only bounds
+        how long each wait blocks, so stop() is noticed promptly.
+        """
+        reconnecting = False
+        while not self._stopping.is_set():
+            try:
+                if self._conn is None:
+                    self._open()
+                    if reconnecting and self.on_reconnect:
+                        self.on_reconnect()
+                    reconnecting = False
+
+                if select.select([self._conn], [], [], timeout) == ([], [], []):
+                    continue
+                self._conn.poll()
+                while self._conn.notifies:
+                    notify = self._conn.notifies.pop(0)
+                    try:
+                        payload = json.loads(notify.payload)
+                    except ValueError:
+                        payload = notify.payload
+                    yield ChangeEvent(notify.channel, payload)
+
+            except (psycopg2.Error, OSError) as e:
+                print(f"Change feed connection error: {e}; reconnecting in {self.reconnect_delay}s")
+                self._close()
+                reconnecting = True
+                self._stopping.wait(self.reconnect_delay)
+        self._close()
+
+    def start(self, callback):
+        """Deliver events to callback(event) from a background daemon thread."""
+        def run():
+            for event in self.events():
+                try:
+                    callback(event)
+                except Exception as e:
+                    print(f"Error handling change feed event: {e}")
+
+        self._thread = threading.Thread(target=run, name="change-feed", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Burner cycle analytics for BoilerStat.
+
+Detects burner on/off transitions in the raw reading stream and maintains
+per-cycle records (burner_cycles) and hourly cycle statistics
+(burner_cycle_hourly). Each run only reads readings newer than the stored
+watermark, so the cost is linear in new readings rather than a rescan.
+Only production readings are analysed; demo data is random per sample.
+
+Reading ids are handed out when a row is inserted, not when its transaction
+commits. With several listeners writing at once, a lower id can become
+visible after a higher one. A run therefore stops at the first reading
+stored less than CYCLE_SETTLE_SECONDS ago, so the watermark never passes a
+reading whose transaction may still be open. This holds as long as insert
+transactions take less than half of CYCLE_SETTLE_SECONDS.
+"""
+
+import logging
+import os
+from collections import namedtuple
+from datetime import timedelta
+
+from profiling import TimedCursor
+from zones import zones_from_mask
+
+SHORT_CYCLE_SECONDS = int(os.getenv("SHORT_CYCLE_SECONDS", "300"))
+MAX_READING_GAP_SECONDS = int(os.getenv("MAX_READING_GAP_SECONDS", "60"))
+CYCLE_BATCH_SIZE = int(os.getenv("CYCLE_BATCH_SIZE", "5000"))
+# Readings stored (received_at) more recently than this are left for the next run
+CYCLE_SETTLE_SECONDS = int(os.getenv("CYCLE_SETTLE_SECONDS", "60"))
+WATERMARK_STAGE = "burner_cycles"
+
+logger = logging.getLogger('cycle_analytics')
+
+CompletedRun = namedtuple('CompletedRun', [
+    'device_id', 'burner_on', 'started_at', 'ended_at', 'sample_count',
+    'trigger_zones', 'interrupted',
+])
+
+
+class CycleDetector:
+    """Tracks the current burner run of one device.
+
+    feed() is O(1) per reading and returns the runs that the reading closed:
+    none, one on a state change, or one interrupted run on a reading gap.
+    """
+
+    __slots__ = ('device_id', 'burner_on', 'started_at', 'last_timestamp',
+                 'sample_count', 'trigger_zones', 'start_observed')
+
+    def __init__(self, device_id, burner_on=None, started_at=None, last_timestamp=None,
+                 sample_count=0, trigger_zones=(), start_observed=False):
+        self.device_id = device_id
+        self.burner_on = burner_on
+        self.started_at = started_at
+        self.last_timestamp = last_timestamp
+        self.sample_count = sample_count
+        self.trigger_zones = tuple(trigger_zones)
+        self.start_observed = start_observed
+
+    def _start(self, timestamp, burner_on, zones, observed):
+        self.burner_on = burner_on
+        self.started_at = timestamp
+        self.last_timestamp = timestamp
+        self.sample_count = 1
+        self.trigger_zones = tuple(i + 1 for i, z in enumerate(zones) if z) if burner_on else ()
+        self.start_observed = observed
+
+    def _close(self, ended_at, interrupted):
+        return CompletedRun(self.device_id, self.burner_on, self.started_at, ended_at,
+                            self.sample_count, self.trigger_zones,
+                            interrupted or not self.start_observed)
+
+    def feed(self, timestamp, burner, zones):
+        burner_on = bool(burner)
+        if self.burner_on is None:
+            # First reading ever seen for this device: run start is unknown
+            self._start(timestamp, burner_on, zones, observed=False)
+            return []
+
+        if (timestamp - self.last_timestamp).total_seconds() > MAX_READING_GAP_SECONDS:
+            # Missing data: we cannot tell when the run really ended
+            closed = self._close(self.last_timestamp, interrupted=True)
+            self._start(timestamp, burner_on, zones, observed=False)
+            return [closed]
+
+        if burner_on != self.burner_on:
+            closed = self._close(timestamp, interrupted=False)
+            self._start(timestamp, burner_on, zones, observed=True)
+            return [closed]
+
+        self.last_timestamp = timestamp
+        self.sample_count += 1
+        return []
+
+
+class CycleAnalytics:
+    """Incremental cycle detection stage run by the aggregator."""
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    def _load(self, cursor):
+        cursor.execute('SELECT last_reading_id FROM analytics_watermark WHERE stage = %s',
+                       (WATERMARK_STAGE,))
+        row = cursor.fetchone()
+        watermark = row[0] if row else 0
+
+        cursor.execute('''
+            SELECT device_id, burner_on, started_at, last_timestamp, sample_count,
+                   trigger_zones, start_observed
+            FROM burner_cycle_state
+        ''')
+        detectors = {row[0]: CycleDetector(*row) for row in cursor.fetchall()}
+        return watermark, detectors
+
+    def _save(self, cursor, watermark, detectors, runs):
+        from psycopg2.extras import execute_values
+
+        if runs:
+            execute_values(cursor, '''
+                INSERT INTO burner_cycles
+                (device_id, burner_on, started_at, ended_at, duration_seconds, sample_count,
+                 trigger_zones, short_cycle, interrupted)
+                VALUES %s
+            ''', [(
+                run.device_id, run.burner_on, run.started_at, run.ended_at,
+                (run.ended_at - run.started_at).total_seconds(), run.sample_count,
+                list(run.trigger_zones),
+                run.burner_on and not run.interrupted
+                    and (run.ended_at - run.started_at).total_seconds() < SHORT_CYCLE_SECONDS,
+                run.interrupted,
+            ) for run in runs])
+
+        execute_values(cursor, '''
+            INSERT INTO burner_cycle_state
+            (device_id, burner_on, started_at, last_timestamp, sample_count, trigger_zones, start_observed)
+            VALUES %s
+            ON CONFLICT (device_id) DO UPDATE SET
+                burner_on = EXCLUDED.burner_on,
+                started_at = EXCLUDED.started_at,
+                last_timestamp = EXCLUDED.last_timestamp,
+                sample_count = EXCLUDED.sample_count,
+                trigger_zones = EXCLUDED.trigger_zones,
+                start_observed = EXCLUDED.start_observed
+        ''', [(d.device_id, d.burner_on, d.started_at, d.last_timestamp, d.sample_count,
+               list(d.trigger_zones), d.start_observed) for d in detectors.values()])
+
+        cursor.execute('''
+            INSERT INTO analytics_watermark (stage, last_reading_id) VALUES (%s, %s)
+            ON CONFLICT (stage) DO UPDATE SET last_reading_id = EXCLUDED.last_reading_id
+        ''', (WATERMARK_STAGE, watermark))
+
+    def _update_hourly(self, cursor, hours):
+        """Recompute statistics for the (device, hour) buckets that gained runs."""
+        for device_id, hour in sorted(hours):
+            cursor.execute('''
+                INSERT INTO burner_cycle_hourly
+                (device_id, hour_timestamp, cycle_count, short_cycle_count, on_seconds,
+                 mean_on_seconds, p95_on_seconds, mean_off_seconds, updated_at)
+                SELECT
+                    device_id,
+                    %s,
+                    count(*) FILTER (WHERE burner_on),
+                    count(*) FILTER (WHERE short_cycle),
+                    coalesce(sum(duration_seconds) FILTER (WHERE burner_on), 0),
+                    avg(duration_seconds) FILTER (WHERE burner_on),
+                    percentile_cont(0.95) WITHIN GROUP (ORDER BY duration_seconds) FILTER (WHERE burner_on),
+                    avg(duration_seconds) FILTER (WHERE NOT burner_on),
+                    NOW()
+                FROM burner_cycles
+                WHERE device_id = %s AND started_at >= %s AND started_at < %s AND NOT interrupted
+                GROUP BY device_id
+                ON CONFLICT (device_id, hour_timestamp) DO UPDATE SET
+                    cycle_count = EXCLUDED.cycle_count,
+                    short_cycle_count = EXCLUDED.short_cycle_count,
+                    on_seconds = EXCLUDED.on_seconds,
+                    mean_on_seconds = EXCLUDED.mean_on_seconds,
+                    p95_on_seconds = EXCLUDED.p95_on_seconds,
+                    mean_off_seconds = EXCLUDED.mean_off_seconds,
+                    updated_at = EXCLUDED.updated_at
+            ''', (hour, device_id, hour, hour + timedelta(hours=1)))
+
+    def run(self):
+        """Process settled readings newer than the watermark, one batch per transaction."""
+        total_readings = 0
+        total_runs = 0
+        conn = self.db_manager.get_connection()
+        try:
+            while True:
+                cursor = TimedCursor(conn.cursor())
+                watermark, detectors = self._load(cursor)
+
+                # received_at defaults to NOW(), the start of the inserting transaction
+                cursor.execute('''
+                    SELECT id, device_id, timestamp, boiler,
+                           zone_mask, zone_count,
+                           coalesce(received_at < LOCALTIMESTAMP - %s * interval '1 second', true)
+                    FROM boiler_readings
+                    WHERE id > %s AND is_demo = 0
+                    ORDER BY id
+                    LIMIT %s
+                ''', (CYCLE_SETTLE_SECONDS, watermark, CYCLE_BATCH_SIZE))
+                rows = cursor.fetchall()
+                fetched = len(rows)
+                # Stop at the first unsettled reading: a lower id may still be uncommitted
+                settled = next((i for i, row in enumerate(rows) if not row[-1]), fetched)
+                rows = rows[:settled]
+                if not rows:
+                    conn.rollback()
+                    break
+
+                runs = []
+                for reading_id, device_id, timestamp, burner, mask, zone_count, _ in rows:
+                    detector = detectors.get(device_id)
+                    if detector is None:
+                        detector = detectors[device_id] = CycleDetector(device_id)
+                    # Late readings cannot change a run that is already recorded
+                    if detector.last_timestamp is not None and timestamp < detector.last_timestamp:
+                        continue
+                    runs.extend(detector.feed(timestamp, burner, zones_from_mask(mask, zone_count)))
+
+                self._save(cursor, rows[-1][0], detectors, runs)
+                self._update_hourly(cursor, {
+                    (run.device_id, run.started_at.replace(minute=0, second=0, microsecond=0))
+                    for run in runs if not run.interrupted
+                })
+                conn.commit()
+
+                total_readings += len(rows)
+                total_runs += len(runs)
+                if fetched < CYCLE_BATCH_SIZE or settled < fetched:
+                    break
+        finally:
+            conn.close()
+
+        if total_readings:
+            logger.info(f"Cycle analytics: processed {total_readings} readings, recorded {total_runs} runs")
+        return total_runs
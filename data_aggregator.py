@@ -2,18 +2,24 @@
 """
 Data Aggregation Service for BoilerStat
 Processes raw sensor data into minute-level utilization percentages using APScheduler.
+
+APScheduler and psycopg2 are imported when first needed, after the database
+check has passed.
 """
 
-import psycopg2
-from psycopg2.extras import RealDictCursor
 import os
 import logging
 from datetime import datetime, timedelta, timezone
-from apscheduler.schedulers.blocking import BlockingScheduler
-from apscheduler.triggers.cron import CronTrigger
 import signal
 import sys
 
+from cycle_analytics import CycleAnalytics
+from hour_slots import PER_HOUR
+from profiles import PROFILE_TIMEZONES
+from profiling import PROFILE_DIR, PROFILE_SIGNAL, install_signal_handler, measure
+from startup import database_probe, format_result, run_probes
+from storage import POSTGRES_CONNECT_TIMEOUT, describe_backend, get_backend
+
 # PostgreSQL configuration from environment variables with defaults
 POSTGRES_HOST = os.getenv("POSTGRES_HOST", "localhost")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
@@ -22,6 +28,8 @@ POSTGRES_USER = os.getenv("POSTGRES_USER")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
 RAW_DATA_RETENTION_HOURS = int(os.getenv("RAW_DATA_RETENTION_HOURS", "3"))
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Jobs slower than this are logged with their database/Python time split
+SLOW_JOB_SECONDS = float(os.getenv("SLOW_JOB_SECONDS", "20"))
 
 # Configure logging
 logging.basicConfig(
@@ -39,28 +47,37 @@ class DatabaseManager:
     
     def get_connection(self):
         """Get PostgreSQL database connection."""
+        import psycopg2
+
         return psycopg2.connect(
             host=POSTGRES_HOST,
             port=POSTGRES_PORT,
             database=POSTGRES_DB,
             user=POSTGRES_USER,
-            password=POSTGRES_PASSWORD
+            password=POSTGRES_PASSWORD,
+            connect_timeout=POSTGRES_CONNECT_TIMEOUT
         )
 
 class DataAggregator:
     """Main aggregation service class."""
     
     def __init__(self):
+        from apscheduler.schedulers.blocking import BlockingScheduler
+
         self.db_manager = DatabaseManager()
+        self.storage = get_backend()
+        self.cycle_analytics = CycleAnalytics(self.db_manager)
         self.scheduler = BlockingScheduler()
         self.setup_scheduler()
         self.setup_signal_handlers()
     
     def setup_scheduler(self):
         """Configure APScheduler jobs."""
+        from apscheduler.triggers.cron import CronTrigger
+
         # Run aggregation every minute at :00 seconds
         self.scheduler.add_job(
-            func=self.aggregate_minute_data,
+            func=self.timed_job('minute_aggregation', self.aggregate_minute_data),
             trigger=CronTrigger(second=0),
             id='minute_aggregation',
             name='Minute Data Aggregation'
@@ -68,7 +85,7 @@ class DataAggregator:
         
         # Clean up old raw data every hour at :05 minutes
         self.scheduler.add_job(
-            func=self.cleanup_raw_data,
+            func=self.timed_job('raw_data_cleanup', self.cleanup_raw_data),
             trigger=CronTrigger(minute=5),
             id='raw_data_cleanup',
             name='Raw Data Cleanup'
@@ -76,16 +93,38 @@ class DataAggregator:
         
         # Backfill missing aggregated data every 5 minutes at :02, :07, :12, etc.
         self.scheduler.add_job(
-            func=self.backfill_missing_aggregations,
+            func=self.timed_job('backfill_aggregation', self.backfill_missing_aggregations),
             trigger=CronTrigger(minute='2,7,12,17,22,27,32,37,42,47,52,57'),
             id='backfill_aggregation',
             name='Backfill Missing Aggregations'
         )
+        
+        # Detect burner cycles in new raw readings every minute at :30 seconds
+        # (cycle analytics uses PostgreSQL-specific SQL)
+        if self.storage.name == 'postgres':
+            self.scheduler.add_job(
+                func=self.timed_job('cycle_analytics', self.update_cycle_analytics),
+                trigger=CronTrigger(second=30),
+                id='cycle_analytics',
+                name='Burner Cycle Analytics'
+            )
     
+    def timed_job(self, name, func):
+        """Wrap a job so each run is recorded in profiling.timings under name."""
+        def run():
+            with measure(name) as timing:
+                func()
+            if timing.elapsed >= SLOW_JOB_SECONDS:
+                logger.warning(f"Slow job {name}: {timing.describe()}")
+            else:
+                logger.debug(f"Job {name}: {timing.describe()}")
+        return run
+
     def setup_signal_handlers(self):
-        """Setup graceful shutdown handlers."""
+        """Setup graceful shutdown handlers and the on-demand profiler (PROFILE_SIGNAL)."""
         signal.signal(signal.SIGINT, self.shutdown)
         signal.signal(signal.SIGTERM, self.shutdown)
+        install_signal_handler('aggregator', logger.info)
     
     def shutdown(self, signum, frame):
         """Gracefully shutdown the scheduler."""
@@ -93,6 +132,39 @@ class DataAggregator:
         self.scheduler.shutdown()
         sys.exit(0)
     
+    def _aggregate(self, minute_start, minute_end, label):
+        """Aggregate every device's raw data in [minute_start, minute_end).
+
+        The database counts samples and per-zone on samples, applying the
+        production data priority (demo samples are used only for a device
+        with no production samples in the minute). Returns the number of
+        devices aggregated.
+        """
+        counts = self.storage.aggregate_minute(minute_start, minute_end)
+        if not counts:
+            logger.debug(f"No data found for minute {minute_start}")
+            return 0
+
+        for device in counts:
+            if device.is_demo:
+                logger.info(f"{label}: Using {device.sample_count} demo samples for {device.device_id} "
+                            f"(no production data available)")
+            else:
+                logger.info(f"{label}: Using {device.sample_count} production samples for {device.device_id}")
+
+            # Calculate utilization percentages from the filtered samples
+            boiler_utilization = (device.boiler_on / device.sample_count) * 100
+            zone_utilizations = [(count / device.sample_count) * 100 for count in device.zone_on]
+
+            # Insert aggregated data (upsert for idempotency)
+            self.storage.upsert_minute(device.device_id, minute_start, boiler_utilization,
+                                       zone_utilizations, device.sample_count, device.is_demo)
+
+            logger.info(f"{label}: Aggregated {device.sample_count} samples for {device.device_id} "
+                        f"at {minute_start}: Boiler: {boiler_utilization:.1f}%, "
+                        f"Zones: {[f'{u:.1f}%' for u in zone_utilizations]}")
+        return len(counts)
+
     def aggregate_minute_data(self):
         """Aggregate raw data for the previous complete minute."""
         try:
@@ -103,80 +175,7 @@ class DataAggregator:
             minute_end = (previous_minute + timedelta(minutes=1)).strftime('%Y-%m-%d %H:%M:00')
             
             logger.info(f"Aggregating data for minute: {minute_start}")
-            
-            conn = self.db_manager.get_connection()
-            cursor = conn.cursor()
-            
-            # Query raw data for this minute with production priority logic
-            cursor.execute('''
-                SELECT boiler, zone_1, zone_2, zone_3, zone_4, zone_5, zone_6, is_demo
-                FROM boiler_readings
-                WHERE timestamp >= %s AND timestamp < %s
-                ORDER BY timestamp
-            ''', (minute_start, minute_end))
-            
-            rows = cursor.fetchall()
-            
-            if not rows:
-                logger.debug(f"No data found for minute {minute_start}")
-                conn.close()
-                return
-            
-            # Apply production data priority logic
-            production_rows = [row for row in rows if row[7] == 0]  # is_demo = 0 means production
-            demo_rows = [row for row in rows if row[7] == 1]  # is_demo = 1 means demo
-            
-            if production_rows:
-                # Use only production data if available
-                filtered_rows = production_rows
-                is_demo_utilization = 0
-                logger.info(f"Using {len(production_rows)} production samples (ignoring {len(demo_rows)} demo samples)")
-            else:
-                # Use demo data only if no production data exists
-                filtered_rows = demo_rows
-                is_demo_utilization = 1
-                logger.info(f"Using {len(demo_rows)} demo samples (no production data available)")
-            
-            # Calculate utilization percentages from filtered data
-            sample_count = len(filtered_rows)
-            boiler_on_count = sum(1 for row in filtered_rows if row[0] == 1)
-            zone_on_counts = [sum(1 for row in filtered_rows if row[i] == 1) for i in range(1, 7)]
-            
-            boiler_utilization = (boiler_on_count / sample_count) * 100
-            zone_utilizations = [(count / sample_count) * 100 for count in zone_on_counts]
-            
-            # Insert aggregated data (use ON CONFLICT for idempotency)
-            cursor.execute('''
-                INSERT INTO minute_utilization
-                (minute_timestamp, boiler_utilization, zone_1_utilization, zone_2_utilization,
-                 zone_3_utilization, zone_4_utilization, zone_5_utilization, zone_6_utilization,
-                 sample_count, is_demo)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (minute_timestamp)
-                DO UPDATE SET
-                    boiler_utilization = EXCLUDED.boiler_utilization,
-                    zone_1_utilization = EXCLUDED.zone_1_utilization,
-                    zone_2_utilization = EXCLUDED.zone_2_utilization,
-                    zone_3_utilization = EXCLUDED.zone_3_utilization,
-                    zone_4_utilization = EXCLUDED.zone_4_utilization,
-                    zone_5_utilization = EXCLUDED.zone_5_utilization,
-                    zone_6_utilization = EXCLUDED.zone_6_utilization,
-                    sample_count = EXCLUDED.sample_count,
-                    is_demo = EXCLUDED.is_demo
-            ''', (
-                minute_start,
-                boiler_utilization,
-                *zone_utilizations,
-                sample_count,
-                is_demo_utilization
-            ))
-            
-            conn.commit()
-            conn.close()
-            
-            logger.info(f"Aggregated {sample_count} samples for {minute_start}: "
-                       f"Boiler: {boiler_utilization:.1f}%, "
-                       f"Zones: {[f'{u:.1f}%' for u in zone_utilizations]}")
+            self._aggregate(minute_start, minute_end, "Aggregate")
             
         except Exception as e:
             logger.error(f"Error aggregating minute data: {e}")
@@ -186,81 +185,7 @@ class DataAggregator:
         try:
             minute_start = minute_timestamp_str
             minute_end = (datetime.fromisoformat(minute_start) + timedelta(minutes=1)).strftime('%Y-%m-%d %H:%M:%S')
-            
-            conn = self.db_manager.get_connection()
-            cursor = conn.cursor()
-            
-            # Query raw data for this specific minute with production priority logic
-            cursor.execute('''
-                SELECT boiler, zone_1, zone_2, zone_3, zone_4, zone_5, zone_6, is_demo
-                FROM boiler_readings
-                WHERE timestamp >= %s AND timestamp < %s
-                ORDER BY timestamp
-            ''', (minute_start, minute_end))
-            
-            rows = cursor.fetchall()
-            
-            if not rows:
-                logger.debug(f"No data found for minute {minute_start}")
-                conn.close()
-                return False
-            
-            # Apply production data priority logic
-            production_rows = [row for row in rows if row[7] == 0]  # is_demo = 0 means production
-            demo_rows = [row for row in rows if row[7] == 1]  # is_demo = 1 means demo
-            
-            if production_rows:
-                # Use only production data if available
-                filtered_rows = production_rows
-                is_demo_utilization = 0
-                logger.info(f"Backfill: Using {len(production_rows)} production samples (ignoring {len(demo_rows)} demo samples)")
-            else:
-                # Use demo data only if no production data exists
-                filtered_rows = demo_rows
-                is_demo_utilization = 1
-                logger.info(f"Backfill: Using {len(demo_rows)} demo samples (no production data available)")
-            
-            # Calculate utilization percentages from filtered data
-            sample_count = len(filtered_rows)
-            boiler_on_count = sum(1 for row in filtered_rows if row[0] == 1)
-            zone_on_counts = [sum(1 for row in filtered_rows if row[i] == 1) for i in range(1, 7)]
-            
-            boiler_utilization = (boiler_on_count / sample_count) * 100
-            zone_utilizations = [(count / sample_count) * 100 for count in zone_on_counts]
-            
-            # Insert aggregated data
-            cursor.execute('''
-                INSERT INTO minute_utilization
-                (minute_timestamp, boiler_utilization, zone_1_utilization, zone_2_utilization,
-                 zone_3_utilization, zone_4_utilization, zone_5_utilization, zone_6_utilization,
-                 sample_count, is_demo)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (minute_timestamp)
-                DO UPDATE SET
-                    boiler_utilization = EXCLUDED.boiler_utilization,
-                    zone_1_utilization = EXCLUDED.zone_1_utilization,
-                    zone_2_utilization = EXCLUDED.zone_2_utilization,
-                    zone_3_utilization = EXCLUDED.zone_3_utilization,
-                    zone_4_utilization = EXCLUDED.zone_4_utilization,
-                    zone_5_utilization = EXCLUDED.zone_5_utilization,
-                    zone_6_utilization = EXCLUDED.zone_6_utilization,
-                    sample_count = EXCLUDED.sample_count,
-                    is_demo = EXCLUDED.is_demo
-            ''', (
-                minute_start,
-                boiler_utilization,
-                *zone_utilizations,
-                sample_count,
-                is_demo_utilization
-            ))
-            
-            conn.commit()
-            conn.close()
-            
-            logger.info(f"Backfilled {sample_count} samples for {minute_start}: "
-                       f"Boiler: {boiler_utilization:.1f}%, "
-                       f"Zones: {[f'{u:.1f}%' for u in zone_utilizations]}")
-            return True
+            return self._aggregate(minute_start, minute_end, "Backfill") > 0
             
         except Exception as e:
             logger.error(f"Error aggregating specific minute {minute_timestamp_str}: {e}")
@@ -273,21 +198,8 @@ class DataAggregator:
             lookback_time = datetime.now(timezone.utc) - timedelta(hours=24)
             lookback_str = lookback_time.strftime('%Y-%m-%d %H:%M:00')
             
-            conn = self.db_manager.get_connection()
-            cursor = conn.cursor()
-            
-            # Find distinct minutes in raw data that don't have aggregated data
-            cursor.execute('''
-                SELECT DISTINCT substring(r.timestamp::text, 1, 16) || ':00' as minute_mark
-                FROM boiler_readings r
-                LEFT JOIN minute_utilization m ON substring(r.timestamp::text, 1, 16) || ':00' = m.minute_timestamp
-                WHERE r.timestamp >= %s 
-                  AND m.minute_timestamp IS NULL
-                ORDER BY minute_mark
-            ''', (lookback_str,))
-            
-            missing_minutes = cursor.fetchall()
-            conn.close()
+            # Minutes some device has raw data for but no aggregate, from the coverage index
+            missing_minutes = self.storage.unaggregated_minutes(lookback_str)
             
             if not missing_minutes:
                 logger.debug("No missing aggregations found")
@@ -296,7 +208,7 @@ class DataAggregator:
             logger.info(f"Found {len(missing_minutes)} missing aggregations, processing...")
             
             processed_count = 0
-            for (minute_mark,) in missing_minutes:
+            for minute_mark in missing_minutes:
                 if self.aggregate_specific_minute(minute_mark):
                     processed_count += 1
             
@@ -305,34 +217,80 @@ class DataAggregator:
         except Exception as e:
             logger.error(f"Error during backfill: {e}")
     
+    def ensure_layout(self):
+        """With MINUTE_LAYOUT=hour, pack existing per-minute aggregates into hour rows once.
+
+        Runs before the profile and coverage rebuilds, which read the layout in use.
+        """
+        try:
+            if self.storage.layout == PER_HOUR and not self.storage.has_hour_rows():
+                logger.info("Packing minute_utilization rows into hourly_utilization...")
+                rows = self.storage.pack_minute_rows()
+                logger.info(f"Hour-packed minute aggregates: {rows} hour rows")
+        except Exception as e:
+            logger.error(f"Error packing minute aggregates: {e}")
+
+    def ensure_coverage(self):
+        """Build the data coverage index from existing readings and aggregates if it is empty.
+
+        After this, inserts, upserts and retention cleanup keep it current.
+        """
+        try:
+            if not self.storage.has_coverage():
+                logger.info("Building data coverage index from readings and minute aggregates...")
+                intervals = self.storage.rebuild_coverage()
+                logger.info(f"Data coverage index: {intervals} intervals")
+        except Exception as e:
+            logger.error(f"Error building data coverage index: {e}")
+
+    def update_cycle_analytics(self):
+        """Record burner cycles and hourly cycle statistics from new raw readings."""
+        try:
+            self.cycle_analytics.run()
+        except Exception as e:
+            logger.error(f"Error updating cycle analytics: {e}")
+    
+    def ensure_profiles(self):
+        """Build utilization profile buckets for time zones that have none yet.
+
+        After this, upsert_minute keeps every time zone's buckets current.
+        """
+        try:
+            for tz in PROFILE_TIMEZONES:
+                if not self.storage.has_profile(tz):
+                    logger.info(f"Building utilization profile for {tz} from minute aggregates...")
+                    buckets = self.storage.rebuild_profile(tz)
+                    logger.info(f"Utilization profile for {tz}: {buckets} buckets")
+        except Exception as e:
+            logger.error(f"Error building utilization profiles: {e}")
+    
+    def ensure_totals(self):
+        """Build the running utilization totals if there are none yet.
+
+        After this, upsert_minute keeps them current.
+        """
+        try:
+            if not self.storage.has_totals():
+                logger.info("Building running utilization totals from minute aggregates...")
+                rows = self.storage.rebuild_totals()
+                logger.info(f"Running utilization totals: {rows} rows")
+        except Exception as e:
+            logger.error(f"Error building utilization totals: {e}")
+
     def cleanup_raw_data(self):
         """Remove raw data older than retention period."""
         try:
             cutoff_time = datetime.now(timezone.utc) - timedelta(hours=RAW_DATA_RETENTION_HOURS)
             cutoff_str = cutoff_time.strftime('%Y-%m-%d %H:%M:%S')
             
-            conn = self.db_manager.get_connection()
-            cursor = conn.cursor()
-            
-            # Count records to be deleted
-            cursor.execute('''
-                SELECT COUNT(*) FROM boiler_readings WHERE timestamp < %s
-            ''', (cutoff_str,))
-            count_to_delete = cursor.fetchone()[0]
+            # Delete old records
+            deleted_count = self.storage.delete_readings_before(cutoff_str)
             
-            if count_to_delete > 0:
-                # Delete old records
-                cursor.execute('''
-                    DELETE FROM boiler_readings WHERE timestamp < %s
-                ''', (cutoff_str,))
-                
-                conn.commit()
-                logger.info(f"Deleted {count_to_delete} raw records older than {cutoff_str}")
+            if deleted_count > 0:
+                logger.info(f"Deleted {deleted_count} raw records older than {cutoff_str}")
             else:
                 logger.debug("No old raw data to cleanup")
             
-            conn.close()
-            
         except Exception as e:
             logger.error(f"Error cleaning up raw data: {e}")
     
@@ -340,6 +298,13 @@ class DataAggregator:
         """Start the aggregation service."""
         logger.info("Starting Data Aggregation Service")
         logger.info(f"Raw data retention: {RAW_DATA_RETENTION_HOURS} hours")
+        logger.info(f"Utilization profile time zones: {', '.join(PROFILE_TIMEZONES)}")
+        logger.info(f"Minute aggregate layout: {self.storage.layout}")
+        logger.info(f"Profiling: send {PROFILE_SIGNAL.name} to PID {os.getpid()} to write a profile to {PROFILE_DIR}")
+        self.timed_job('ensure_layout', self.ensure_layout)()
+        self.timed_job('ensure_profiles', self.ensure_profiles)()
+        self.timed_job('ensure_totals', self.ensure_totals)()
+        self.timed_job('ensure_coverage', self.ensure_coverage)()
         logger.info("Scheduled jobs:")
         for job in self.scheduler.get_jobs():
             logger.info(f"  - {job.name}: {job.trigger}")
@@ -355,15 +320,13 @@ def main():
     """Main function to start the aggregation service."""
     
     # Verify database connection
-    try:
-        db_manager = DatabaseManager()
-        conn = db_manager.get_connection()
-        conn.close()
-        logger.info(f"Connected to PostgreSQL database: {POSTGRES_DB}@{POSTGRES_HOST}:{POSTGRES_PORT}")
-    except psycopg2.Error as e:
-        logger.error(f"Database connection error: {e}")
-        logger.error("Please ensure PostgreSQL is running and credentials are correct.")
+    storage = get_backend()
+    database, = run_probes({'database': database_probe(storage)})
+    if not database.ok:
+        logger.error(f"Database connection error: {database.error}")
+        logger.error("Please ensure the database is available and credentials are correct.")
         sys.exit(1)
+    logger.info(f"Connected to {describe_backend(storage)} ({format_result(database)})")
     
     # Start the aggregation service
     aggregator = DataAggregator()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Data coverage intervals for BoilerStat.
+
+data_coverage keeps, per device, the minutes that have raw readings ("raw")
+and the minutes that have a minute aggregate ("aggregated") as merged
+[start, end) intervals of whole minutes. The storage backend extends them in
+the same transaction as every reading insert and minute upsert, and trims
+the raw intervals when old readings are deleted, so one row stands for a
+whole unbroken stretch of data.
+
+Gaps are then found by interval arithmetic on a handful of rows:
+
+    missing        window minus aggregated: where the chart has no data
+    unaggregated   raw minus aggregated: the backfill work list
+
+Both cost O(number of intervals), i.e. O(gaps), however many readings the
+window holds. Intervals are naive UTC datetimes, end exclusive.
+"""
+
+from datetime import datetime, timedelta
+
+RAW = 'raw'
+AGGREGATED = 'aggregated'
+MINUTE = timedelta(minutes=1)
+
+
+def minute_floor(value):
+    """Start of the minute containing a datetime or 'YYYY-MM-DD HH:MM:SS' string."""
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(value)
+    return value.replace(second=0, microsecond=0)
+
+
+def minute_runs(minutes):
+    """Merged intervals covering an iterable of minute starts (any order, duplicates allowed)."""
+    runs = []
+    for minute in sorted(set(minutes)):
+        if runs and runs[-1][1] == minute:
+            runs[-1][1] = minute + MINUTE
+        else:
+            runs.append([minute, minute + MINUTE])
+    return [tuple(run) for run in runs]
+
+
+def merge(intervals):
+    """Sorted intervals with overlapping and adjacent ones joined."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(interval) for interval in merged]
+
+
+def clip(intervals, start, end):
+    """Parts of intervals inside [start, end)."""
+    return [(max(s, start), min(e, end)) for s, e in intervals if s < end and e > start]
+
+
+def subtract(intervals, holes):
+    """Parts of intervals not covered by holes; both sorted and merged."""
+    result = []
+    holes = list(holes)
+    h = 0
+    for start, end in intervals:
+        while h < len(holes) and holes[h][1] <= start:
+            h += 1
+        i = h
+        while start < end:
+            if i == len(holes) or holes[i][0] >= end:
+                result.append((start, end))
+                break
+            if holes[i][0] > start:
+                result.append((start, holes[i][0]))
+            start = max(start, holes[i][1])
+            i += 1
+    return result
+
+
+def complement(intervals, start, end):
+    """Parts of [start, end) not covered by intervals."""
+    return subtract([(start, end)], clip(intervals, start, end))
+
+
+def minutes_in(intervals):
+    """Every minute start inside the intervals, in order."""
+    for start, end in intervals:
+        minute = start
+        while minute < end:
+            yield minute
+            minute += MINUTE
+
+
+def minute_count(intervals):
+    return sum(int((end - start) / MINUTE) for start, end in intervals)
+
+
+def to_dicts(intervals):
+    """JSON-friendly [{'start', 'end', 'minutes'}] for the API."""
+    return [{'start': start.isoformat(), 'end': end.isoformat(), 'minutes': int((end - start) / MINUTE)}
+            for start, end in intervals]
@@ -32,6 +32,16 @@
                            (1ULL<<ZONE_4_PIN) | (1ULL<<ZONE_5_PIN) | \
                            (1ULL<<ZONE_6_PIN))
 
+// Fleet control: commands addressed to this device and their acknowledgements
+#ifndef DEVICE_ID
+#define DEVICE_ID "default"
+#endif
+#ifndef MQTT_ACK_TOPIC
+#define MQTT_ACK_TOPIC "boilerstat/ack"
+#endif
+#define DEVICE_CONTROL_TOPIC MQTT_CONTROL_TOPIC "/" DEVICE_ID
+#define DEVICE_ACK_TOPIC MQTT_ACK_TOPIC "/" DEVICE_ID
+
 // Debounce Configuration
 
 // Demo Mode Configuration
@@ -321,6 +331,9 @@ static void mqtt_event_handler(void *handler_args, esp_event_base_t base, int32_
         // Subscribe to control topic for mode switching
         int msg_id = esp_mqtt_client_subscribe(mqtt_client, MQTT_CONTROL_TOPIC, 0);
         ESP_LOGI(TAG, "Subscribed to %s, msg_id=%d", MQTT_CONTROL_TOPIC, msg_id);
+        // Commands addressed to this device only (QoS 1: the server retries until acknowledged)
+        msg_id = esp_mqtt_client_subscribe(mqtt_client, DEVICE_CONTROL_TOPIC, 1);
+        ESP_LOGI(TAG, "Subscribed to %s, msg_id=%d", DEVICE_CONTROL_TOPIC, msg_id);
         break;
     case MQTT_EVENT_DISCONNECTED:
         ESP_LOGI(TAG, "MQTT_EVENT_DISCONNECTED");
@@ -338,7 +351,10 @@ static void mqtt_event_handler(void *handler_args, esp_event_base_t base, int32_
     case MQTT_EVENT_DATA:
         ESP_LOGI(TAG, "MQTT_EVENT_DATA on topic %.*s", event->topic_len, event->topic);
         // Check if this is a control message
-        if (strncmp(event->topic, MQTT_CONTROL_TOPIC, event->topic_len) == 0) {
+        if ((event->topic_len == strlen(MQTT_CONTROL_TOPIC) &&
+             strncmp(event->topic, MQTT_CONTROL_TOPIC, event->topic_len) == 0) ||
+            (event->topic_len == strlen(DEVICE_CONTROL_TOPIC) &&
+             strncmp(event->topic, DEVICE_CONTROL_TOPIC, event->topic_len) == 0)) {
             process_mqtt_control_message(event->data, event->data_len);
         }
         break;
@@ -446,6 +462,7 @@ static cJSON* generate_sensor_reading(void)
     cJSON *zone_6 = cJSON_CreateNumber(zone_vals[5]);
     cJSON *is_demo_flag = cJSON_CreateBool(demo_mode);
     
+    cJSON_AddStringToObject(json, "device_id", DEVICE_ID);
     cJSON_AddItemToObject(json, "timestamp", timestamp);
     cJSON_AddItemToObject(json, "burner", burner);
     cJSON_AddItemToObject(json, "zone_1", zone_1);
@@ -674,7 +691,8 @@ static void process_mqtt_control_message(const char *data, int data_len)
     
     // Look for demo_mode field
     cJSON *demo_mode_item = cJSON_GetObjectItem(json, "demo_mode");
-    if (demo_mode_item != NULL && cJSON_IsBool(demo_mode_item)) {
+    bool applied = demo_mode_item != NULL && cJSON_IsBool(demo_mode_item);
+    if (applied) {
         bool new_demo_mode = cJSON_IsTrue(demo_mode_item);
         
         if (new_demo_mode != demo_mode) {
@@ -693,6 +711,23 @@ static void process_mqtt_control_message(const char *data, int data_len)
         ESP_LOGW(TAG, "Control message missing or invalid 'demo_mode' field");
     }
     
+    // Acknowledge commands that carry a command_id (repeats of a retried command are acked again)
+    cJSON *command_id = cJSON_GetObjectItem(json, "command_id");
+    if (command_id != NULL && cJSON_IsString(command_id)) {
+        cJSON *ack = cJSON_CreateObject();
+        cJSON_AddStringToObject(ack, "command_id", command_id->valuestring);
+        cJSON_AddStringToObject(ack, "device_id", DEVICE_ID);
+        cJSON_AddStringToObject(ack, "status", applied ? "ok" : "error");
+        cJSON_AddBoolToObject(ack, "demo_mode", demo_mode);
+        char *ack_string = cJSON_PrintUnformatted(ack);
+        if (ack_string != NULL) {
+            int msg_id = esp_mqtt_client_publish(mqtt_client, DEVICE_ACK_TOPIC, ack_string, 0, 1, 0);
+            ESP_LOGI(TAG, "Acknowledged command %s, msg_id=%d", command_id->valuestring, msg_id);
+            free(ack_string);
+        }
+        cJSON_Delete(ack);
+    }
+    
     cJSON_Delete(json);
 }
 
@@ -22,6 +22,19 @@
 // Configuration loaded from config.h
 // All configuration constants defined in config.h
 
+// Fleet control: mode commands (broadcast and addressed to this device) and their acknowledgements
+#ifndef DEVICE_ID
+#define DEVICE_ID "default"
+#endif
+#ifndef MQTT_CONTROL_TOPIC
+#define MQTT_CONTROL_TOPIC "boilerstat/control"
+#endif
+#ifndef MQTT_ACK_TOPIC
+#define MQTT_ACK_TOPIC "boilerstat/ack"
+#endif
+#define DEVICE_CONTROL_TOPIC MQTT_CONTROL_TOPIC "/" DEVICE_ID
+#define DEVICE_ACK_TOPIC MQTT_ACK_TOPIC "/" DEVICE_ID
+
 // Global Objects
 WiFiClient wifiClient;
 PubSubClient mqttClient(wifiClient);
@@ -33,6 +46,7 @@ unsigned long lastPublish = 0;
 int publishCount = 1;
 bool wifiConnected = false;
 bool mqttConnected = false;
+bool demoMode = false;
 
 void setup() {
   Serial.begin(115200);
@@ -158,6 +172,9 @@ void connectToMQTT() {
       Serial.println(" connected!");
       Serial.print("Client ID: ");
       Serial.println(MQTT_CLIENT_ID);
+      // Commands addressed to this device at QoS 1, as the production firmware subscribes to them
+      mqttClient.subscribe(MQTT_CONTROL_TOPIC);
+      mqttClient.subscribe(DEVICE_CONTROL_TOPIC, 1);
     } else {
       Serial.print(".");
       attempts++;
@@ -174,8 +191,38 @@ void connectToMQTT() {
 }
 
 void mqttCallback(char* topic, byte* payload, unsigned int length) {
-  // Callback for received MQTT messages (not used in this simulator)
-  // But required by PubSubClient
+  // Mode commands: broadcasts and commands addressed to this device
+  if (strcmp(topic, MQTT_CONTROL_TOPIC) != 0 && strcmp(topic, DEVICE_CONTROL_TOPIC) != 0) {
+    return;
+  }
+  StaticJsonDocument<256> command;
+  if (deserializeJson(command, payload, length)) {
+    Serial.println("Invalid JSON in control message");
+    return;
+  }
+  
+  bool applied = command["demo_mode"].is<bool>();
+  if (applied && command["demo_mode"].as<bool>() != demoMode) {
+    demoMode = command["demo_mode"].as<bool>();
+    Serial.printf("Mode changed to: %s\n", demoMode ? "DEMO" : "PRODUCTION");
+  } else if (!applied) {
+    Serial.println("Control message missing or invalid 'demo_mode' field");
+  }
+  
+  // Acknowledge commands that carry a command_id (repeats of a retried command are acked again)
+  const char* commandId = command["command_id"];
+  if (commandId != nullptr) {
+    StaticJsonDocument<256> ack;
+    ack["command_id"] = commandId;
+    ack["device_id"] = DEVICE_ID;
+    ack["status"] = applied ? "ok" : "error";
+    ack["demo_mode"] = demoMode;
+    // Serialized before publishing: commandId points into the client's buffer, which publish() reuses
+    String ackString;
+    serializeJson(ack, ackString);
+    mqttClient.publish(DEVICE_ACK_TOPIC, ackString.c_str());
+    Serial.printf("Acknowledged: %s\n", ackString.c_str());
+  }
 }
 
 // NTP Setup
@@ -207,6 +254,7 @@ void publishSensorData() {
   // Generate sensor readings with targeted utilization rates
   DynamicJsonDocument doc(256);
   
+  doc["device_id"] = DEVICE_ID;
   doc["timestamp"] = getFormattedTime();
   
   // Target utilization rates: Zone N = N * 10% (Zone 1=10%, Zone 2=20%, etc.)
@@ -258,6 +306,7 @@ void publishSensorData() {
   doc["zone_4"] = zones[3];
   doc["zone_5"] = zones[4];
   doc["zone_6"] = zones[5];
+  doc["is_demo"] = demoMode;
   
   // Convert to JSON string
   String jsonString;
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Device-addressed control commands with acknowledgements for BoilerStat fleets.
+
+Each device subscribes to its own control topic, MQTT_CONTROL_TOPIC/<device_id>
+(as well as the global MQTT_CONTROL_TOPIC used for broadcasts), and answers
+every command that carries a "command_id" on MQTT_ACK_TOPIC/<device_id>:
+
+    command  {"command_id": "3f0c...", "demo_mode": true, "timestamp": "..."}
+    ack      {"command_id": "3f0c...", "device_id": "boiler-7", "status": "ok",
+              "demo_mode": true}
+
+A FleetCommander publishes a command to every target device at once, then
+waits on a single condition for the acknowledgements. A device that has not
+acknowledged within the timeout gets the same command (same command_id, so
+a late ack still counts) up to `retries` more times. One call therefore
+takes about timeout x (retries + 1) at worst, however many devices it
+addresses.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime
+
+MQTT_CONTROL_TOPIC = os.getenv("MQTT_CONTROL_TOPIC", "boilerstat/control")
+MQTT_ACK_TOPIC = os.getenv("MQTT_ACK_TOPIC", "boilerstat/ack")
+COMMAND_TIMEOUT_SECONDS = float(os.getenv("COMMAND_TIMEOUT_SECONDS", "5"))
+COMMAND_RETRIES = int(os.getenv("COMMAND_RETRIES", "2"))
+# Upper bound on devices addressed by one command
+MAX_FLEET_COMMAND_DEVICES = int(os.getenv("MAX_FLEET_COMMAND_DEVICES", "1000"))
+
+# status: acked, rejected (the device answered with an error), timeout or publish_failed
+CommandResult = namedtuple('CommandResult', ['device_id', 'command_id', 'status', 'attempts',
+                                             'latency_ms', 'demo_mode'])
+
+
+def device_control_topic(device_id):
+    return f"{MQTT_CONTROL_TOPIC}/{device_id}"
+
+
+def ack_subscription():
+    """Topic filter matching every device's acknowledgements."""
+    return f"{MQTT_ACK_TOPIC}/+"
+
+
+def is_ack_topic(topic):
+    return topic.startswith(MQTT_ACK_TOPIC + '/')
+
+
+class _Pending:
+    __slots__ = ('device_id', 'command_id', 'payload', 'attempts', 'first_sent', 'deadline', 'result')
+
+    def __init__(self, device_id, command_id, payload):
+        self.device_id = device_id
+        self.command_id = command_id
+        self.payload = payload
+        self.attempts = 0
+        self.first_sent = None
+        self.deadline = None
+        self.result = None
+
+
+class FleetCommander:
+    """Sends commands to many devices concurrently and collects their acks.
+
+    publish(topic, payload) -> bool sends one MQTT message (QoS 1). The
+    owner's MQTT client must be subscribed to ack_subscription() and pass
+    every message on an ack topic to handle_ack(). Safe to use from several
+    threads at once.
+    """
+
+    def __init__(self, publish):
+        self.publish = publish
+        self._pending = {}
+        self._cond = threading.Condition()
+
+    def handle_ack(self, payload):
+        """Record an acknowledgement; returns the CommandResult, or None if it matched nothing waiting."""
+        command_id = payload.get('command_id')
+        with self._cond:
+            pending = self._pending.get(command_id)
+            if pending is None or payload.get('device_id', pending.device_id) != pending.device_id:
+                return None
+            del self._pending[command_id]
+            ok = payload.get('status', 'ok') == 'ok'
+            pending.result = CommandResult(
+                pending.device_id, command_id, 'acked' if ok else 'rejected', pending.attempts,
+                round((time.monotonic() - pending.first_sent) * 1000, 1), payload.get('demo_mode'))
+            self._cond.notify_all()
+            return pending.result
+
+    def _send(self, batch, timeout):
+        """Publish (or re-publish) commands outside the lock; returns those the client refused."""
+        refused = []
+        for pending in batch:
+            # Stamped before publishing: the ack can arrive before publish() returns
+            now = time.monotonic()
+            with self._cond:
+                pending.attempts += 1
+                pending.first_sent = pending.first_sent or now
+                pending.deadline = now + timeout
+            try:
+                sent = self.publish(device_control_topic(pending.device_id), json.dumps(pending.payload))
+            except Exception:
+                sent = False
+            if not sent:
+                refused.append(pending)
+        return refused
+
+    def send(self, device_ids, command, timeout=COMMAND_TIMEOUT_SECONDS, retries=COMMAND_RETRIES):
+        """Send command (a dict, e.g. {"demo_mode": True}) to every device; returns
+        {device_id: CommandResult} once all have acknowledged or run out of retries."""
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        commands = []
+        with self._cond:
+            for device_id in dict.fromkeys(device_ids):
+                command_id = uuid.uuid4().hex
+                pending = _Pending(device_id, command_id,
+                                   {**command, 'command_id': command_id, 'timestamp': timestamp})
+                self._pending[command_id] = pending
+                commands.append(pending)
+
+        to_send = commands
+        while True:
+            for pending in self._send(to_send, timeout):
+                if pending.attempts > retries:
+                    with self._cond:
+                        if self._pending.pop(pending.command_id, None) is not None:
+                            pending.result = CommandResult(pending.device_id, pending.command_id,
+                                                           'publish_failed', pending.attempts, None, None)
+            with self._cond:
+                while True:
+                    waiting = [p for p in commands if p.result is None]
+                    if not waiting:
+                        break
+                    now = time.monotonic()
+                    expired = [p for p in waiting if p.deadline <= now]
+                    if expired:
+                        break
+                    self._cond.wait(min(p.deadline for p in waiting) - now)
+
+                to_send = []
+                for pending in waiting:
+                    if pending.deadline > time.monotonic():
+                        continue
+                    if pending.attempts > retries:
+                        del self._pending[pending.command_id]
+                        pending.result = CommandResult(pending.device_id, pending.command_id, 'timeout',
+                                                       pending.attempts, None, None)
+                    else:
+                        to_send.append(pending)
+            if not to_send and all(p.result is not None for p in commands):
+                break
+
+        return {pending.device_id: pending.result for pending in commands}
+
+    def set_mode(self, device_ids, demo_mode, timeout=COMMAND_TIMEOUT_SECONDS, retries=COMMAND_RETRIES):
+        """Switch devices between demo and production mode; see send()."""
+        return self.send(device_ids, {'demo_mode': bool(demo_mode)}, timeout=timeout, retries=retries)
+
+
+def summarize(results):
+    """Counts per status, e.g. {'acked': 98, 'timeout': 2}."""
+    counts = {}
+    for result in results.values():
+        counts[result.status] = counts.get(result.status, 0) + 1
+    return counts
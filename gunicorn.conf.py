@@ -0,0 +1,49 @@
+"""
+Gunicorn configuration for the BoilerStat dashboard API.
+
+Run with:
+    gunicorn -c gunicorn.conf.py
+
+Workers are threaded (gthread) because every request spends most of its time
+waiting on PostgreSQL. The MQTT subscriber runs once, in its own supervised
+process started before any worker, and shares mode and latest reading with
+the workers through mqtt_state.py. The master stays single-threaded, so
+forking workers cannot inherit a lock held by another thread, nor the
+subscriber's broker connection.
+"""
+
+import multiprocessing
+import os
+import subprocess
+import sys
+
+wsgi_app = "app:create_app(mqtt_subscriber=False)"
+
+bind = f"{os.getenv('FLASK_HOST', '0.0.0.0')}:{os.getenv('FLASK_PORT', '5000')}"
+workers = int(os.getenv("GUNICORN_WORKERS", str(min(multiprocessing.cpu_count() * 2 + 1, 8))))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = 10
+keepalive = 5
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+
+_subscriber = None
+
+
+def on_starting(server):
+    """Start the single MQTT state subscriber, under its supervisor, before the workers."""
+    global _subscriber
+    _subscriber = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                 "mqtt_state.py"), "--supervise"])
+    server.log.info("MQTT state subscriber supervisor started (PID %s)", _subscriber.pid)
+
+
+def on_exit(server):
+    if _subscriber is not None:
+        _subscriber.terminate()
+        try:
+            _subscriber.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            _subscriber.kill()
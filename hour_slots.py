@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Hour-packed minute aggregates for BoilerStat.
+
+With MINUTE_LAYOUT=hour the storage backends keep minute aggregates in
+hourly_utilization, one row per device and UTC hour, instead of one
+minute_utilization row per minute. A row holds 60 slots per channel
+(slot i = minute i of the hour):
+
+    burner_bp       burner utilization per minute, in basis points
+    zone_bp         one 60-slot array per zone
+    sample_counts   readings aggregated per minute
+    demo_mask       bit i set when minute i was aggregated from demo data
+
+Basis points (0-10000) keep the two decimals of minute_utilization's
+DECIMAL(5,2) in a 2-byte integer. An empty slot is NULL in PostgreSQL's
+smallint arrays and EMPTY in SQLite's packed little-endian int16 BLOBs.
+"""
+
+import sys
+from array import array
+
+from data_coverage import MINUTE
+
+PER_MINUTE = 'minute'
+PER_HOUR = 'hour'
+LAYOUTS = (PER_MINUTE, PER_HOUR)
+
+SLOTS = 60
+EMPTY = -1
+SLOT_BYTES = SLOTS * array('h').itemsize
+
+
+def hour_floor(minute):
+    return minute.replace(minute=0, second=0, microsecond=0)
+
+
+def to_basis_points(percent):
+    return int(round(percent * 100))
+
+
+def from_basis_points(value):
+    return None if value is None else value / 100
+
+
+def pack(slots):
+    """int16 BLOB of a slot list, EMPTY for None."""
+    packed = array('h', [EMPTY if value is None else value for value in slots])
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack(blob):
+    """Slot list of an int16 BLOB, None for EMPTY."""
+    values = array('h', blob)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return [None if value == EMPTY else value for value in values]
+
+
+class HourRow:
+    """The minute aggregates of one device and hour as 60-slot lists.
+
+    zones is as wide as the most zones any minute of the hour reported;
+    minutes with fewer zones have None in the extra arrays.
+    """
+
+    __slots__ = ('burner', 'zones', 'counts', 'demo_mask')
+
+    def __init__(self, burner=None, zones=(), counts=None, demo_mask=0):
+        self.burner = list(burner) if burner is not None else [None] * SLOTS
+        self.zones = [list(zone) for zone in zones]
+        self.counts = list(counts) if counts is not None else [None] * SLOTS
+        self.demo_mask = demo_mask
+
+    def get(self, slot):
+        """(burner %, zone %s, sample count, is_demo) of one minute, or None if it has no aggregate."""
+        if self.counts[slot] is None:
+            return None
+        zones = [zone[slot] for zone in self.zones]
+        while zones and zones[-1] is None:
+            zones.pop()
+        return (from_basis_points(self.burner[slot]), [from_basis_points(z) for z in zones],
+                self.counts[slot], (self.demo_mask >> slot) & 1)
+
+    def set(self, slot, burner, zones, sample_count, is_demo):
+        while len(self.zones) < len(zones):
+            self.zones.append([None] * SLOTS)
+        self.burner[slot] = to_basis_points(burner)
+        for z, zone in enumerate(self.zones):
+            zone[slot] = to_basis_points(zones[z]) if z < len(zones) else None
+        self.counts[slot] = sample_count
+        if is_demo:
+            self.demo_mask |= 1 << slot
+        else:
+            self.demo_mask &= ~(1 << slot)
+
+    def minutes(self, hour_start):
+        """(minute, burner %, zone %s, sample count, is_demo) of every filled slot, in order."""
+        for slot in range(SLOTS):
+            minute = self.get(slot)
+            if minute is not None:
+                yield (hour_start + slot * MINUTE, *minute)
+
+    def last_slot(self):
+        """Latest filled slot, or None."""
+        return max((slot for slot, count in enumerate(self.counts) if count is not None), default=None)
@@ -1,14 +1,16 @@
 #!/usr/bin/env python3
 """
-Initialize aggregation database schema for BoilerStat.
-Run this to create the minute_utilization table.
+Initialize aggregation database schema for BoilerStat (SQLite backend).
+Run this to create the minute_utilization table in an existing database file.
 """
 
 import sqlite3
 import os
 import sys
 
-DB_FILE = os.getenv("DB_FILE", "data/boilerstat.db")
+from storage import SQLiteBackend
+
+DB_FILE = os.getenv("SQLITE_PATH", os.getenv("DB_FILE", "data/boilerstat.db"))
 
 def init_aggregation_schema():
     """Create aggregation tables in the database."""
@@ -19,43 +21,9 @@ def init_aggregation_schema():
         return False
     
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
         print("Creating minute_utilization table...")
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS minute_utilization (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                minute_timestamp TEXT NOT NULL UNIQUE,
-                boiler_utilization REAL NOT NULL,
-                zone_1_utilization REAL NOT NULL,
-                zone_2_utilization REAL NOT NULL,
-                zone_3_utilization REAL NOT NULL,
-                zone_4_utilization REAL NOT NULL,
-                zone_5_utilization REAL NOT NULL,
-                zone_6_utilization REAL NOT NULL,
-                sample_count INTEGER NOT NULL,
-                is_demo INTEGER DEFAULT 0,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Add is_demo column to existing tables (migration)
-        try:
-            cursor.execute('ALTER TABLE minute_utilization ADD COLUMN is_demo INTEGER DEFAULT 0')
-            print("Added is_demo column to existing minute_utilization table")
-        except sqlite3.OperationalError:
-            # Column already exists
-            pass
-        
-        print("Creating index on minute_timestamp...")
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_minute_timestamp
-            ON minute_utilization(minute_timestamp)
-        ''')
-        
-        conn.commit()
-        conn.close()
+        backend = SQLiteBackend(DB_FILE)
+        backend.close()
         
         print("✅ Aggregation database schema initialized successfully!")
         return True
@@ -69,4 +37,4 @@ def init_aggregation_schema():
 
 if __name__ == "__main__":
     success = init_aggregation_schema()
-    sys.exit(0 if success else 1)
\ No newline at end of file
+    sys.exit(0 if success else 1)
@@ -1,64 +1,36 @@
 #!/usr/bin/env python3
 """
-Initialize the BoilerStat SQLite database with the required schema.
+Initialize the BoilerStat SQLite database (STORAGE_BACKEND=sqlite) with the
+required schema. The schema itself lives in storage.SQLiteBackend; this also
+migrates files created with the old boiler_state column.
 """
 
-import sqlite3
 import os
 
+from storage import SQLiteBackend
+
 # Configuration from environment variable with default
-DB_FILE = os.getenv("DB_FILE", "boilerstat.db")
+DB_FILE = os.getenv("SQLITE_PATH", os.getenv("DB_FILE", "boilerstat.db"))
 
 
 def init_database():
     """Create the database and tables if they don't exist."""
 
-    # Connect to database (creates file if it doesn't exist)
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-
-    # Create readings table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS boiler_readings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            boiler_state INTEGER NOT NULL,
-            zone_1 INTEGER NOT NULL,
-            zone_2 INTEGER NOT NULL,
-            zone_3 INTEGER NOT NULL,
-            zone_4 INTEGER NOT NULL,
-            zone_5 INTEGER NOT NULL,
-            zone_6 INTEGER NOT NULL,
-            is_demo INTEGER DEFAULT 0,
-            received_at TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # Add is_demo column to existing tables (migration)
-    try:
-        cursor.execute('ALTER TABLE boiler_readings ADD COLUMN is_demo INTEGER DEFAULT 0')
-        print("Added is_demo column to existing boiler_readings table")
-    except sqlite3.OperationalError:
-        # Column already exists
-        pass
-
-    # Create index on timestamp for faster queries
-    cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_timestamp
-        ON boiler_readings(timestamp)
-    ''')
-
-    conn.commit()
-    conn.close()
+    # Opening the backend creates the file, tables and indexes, and enables WAL
+    backend = SQLiteBackend(DB_FILE)
+    backend.close()
 
     print(f"Database '{DB_FILE}' initialized successfully.")
     print("Table 'boiler_readings' created with columns:")
     print("  - id (auto-increment)")
-    print("  - timestamp (from ESP32)")
-    print("  - boiler_state (0/1)")
-    print("  - zone_1 through zone_6 (0/1)")
+    print("  - device_id (reporting device)")
+    print("  - timestamp (from ESP32, UTC)")
+    print("  - boiler (0/1)")
+    print("  - zone_mask (zone states, bit i = zone i+1)")
+    print("  - zone_count (zones reported by the device)")
     print("  - is_demo (0=production, 1=demo)")
     print("  - received_at (auto-generated)")
+    print("Table 'minute_utilization' created for aggregated data.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+End-to-end latency tracing for BoilerStat readings.
+
+A reading passes through these stages, each of which records its own time:
+
+    device publish   "sent_at" (and "seq") in the payload, from the ESP32 or simulator
+    logger receive   boiler_readings.logged_at
+    database commit  measured by the logger when its batch commits
+                     (boiler_readings.received_at is the insert transaction time)
+    aggregation      minute_utilization.aggregated_at
+    API receive      the dashboard's MQTT subscriber
+
+Each process keeps a LatencyTracker: fixed-bucket histograms per stage, a
+per-device clock offset estimate and per-device sequence gap counts, all
+O(1) per reading. Stages that start at the device clock ("device_to_*")
+include any ESP32 clock error, which the skew estimate exposes.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+# Histogram bucket upper bounds in seconds; larger values land in "+Inf"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# A device clock more than this many seconds off the server is reported as skewed
+CLOCK_SKEW_THRESHOLD_SECONDS = float(os.getenv("CLOCK_SKEW_THRESHOLD_SECONDS", "2.0"))
+# Arrivals per device used for the clock offset estimate
+CLOCK_SKEW_WINDOW = int(os.getenv("CLOCK_SKEW_WINDOW", "60"))
+# Skewed devices listed in a summary, worst first
+MAX_REPORTED_SKEWED_DEVICES = 50
+
+
+def parse_sent_at(payload):
+    """Device send time of a payload as naive UTC, or None.
+
+    Uses "sent_at" when present and falls back to the reading "timestamp",
+    which the firmware stamps immediately before publishing.
+    """
+    value = payload.get('sent_at') or payload.get('timestamp')
+    if not isinstance(value, str):
+        return None
+    try:
+        sent_at = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if sent_at.tzinfo is not None:
+        sent_at = sent_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return sent_at
+
+
+class LatencyHistogram:
+    """Counts of latencies per fixed bucket, plus count/sum/min/max."""
+
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, seconds):
+        index = 0
+        while index < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, q):
+        """Approximate q-th percentile (0-100), interpolated within its bucket."""
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = LATENCY_BUCKETS[index - 1] if index else min(self.min, 0.0)
+                upper = LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else self.max
+                value = lower + (upper - lower) * (rank - seen) / bucket_count
+                return max(self.min, min(self.max, value))
+            seen += bucket_count
+        return self.max
+
+    def to_dict(self):
+        buckets = [[str(bound), n] for bound, n in zip(LATENCY_BUCKETS, self.counts)]
+        buckets.append(['+Inf', self.counts[-1]])
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'buckets': buckets,
+        }
+
+
+class DeviceClock:
+    """Clock offset and sequence tracking for one device.
+
+    receive_time - sent_at is network delay plus (server clock - device clock).
+    The minimum over recent arrivals approaches the clock offset plus the
+    smallest delay, so a large or negative minimum means the device clock is
+    off; a negative value means the device clock is ahead of the server.
+    """
+
+    __slots__ = ('deltas', 'last_seq', 'gaps', 'out_of_order')
+
+    def __init__(self):
+        self.deltas = deque(maxlen=CLOCK_SKEW_WINDOW)
+        self.last_seq = None
+        self.gaps = 0
+        self.out_of_order = 0
+
+    def observe(self, seq, delta):
+        if delta is not None:
+            self.deltas.append(delta)
+        if seq is None:
+            return
+        if self.last_seq is not None:
+            if seq > self.last_seq + 1:
+                self.gaps += seq - self.last_seq - 1
+            elif seq <= self.last_seq:
+                # Duplicate, reordered, or the device restarted its counter
+                self.out_of_order += 1
+                if seq < self.last_seq:
+                    self.last_seq = seq
+                    return
+        self.last_seq = seq
+
+    @property
+    def offset(self):
+        return min(self.deltas) if self.deltas else None
+
+    @property
+    def skewed(self):
+        offset = self.offset
+        return offset is not None and (offset < -CLOCK_SKEW_THRESHOLD_SECONDS
+                                       or offset > CLOCK_SKEW_THRESHOLD_SECONDS)
+
+
+class LatencyTracker:
+    """Per-stage latency histograms and per-device clock tracking for one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._devices = {}
+        self.started_at = time.time()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def observe_arrival(self, stage, device_id, seq, sent_at, received_at):
+        """Record a reading arriving at a stage.
+
+        sent_at and received_at are naive UTC datetimes (sent_at may be None).
+        Returns True if this arrival changed the device's skew status.
+        """
+        delta = (received_at - sent_at).total_seconds() if sent_at is not None else None
+        with self._lock:
+            device = self._devices.get(device_id)
+            if device is None:
+                device = self._devices[device_id] = DeviceClock()
+            was_skewed = device.skewed
+            device.observe(seq, delta)
+            changed = device.skewed != was_skewed
+        if delta is not None:
+            self.observe(stage, max(delta, 0.0))
+        return changed
+
+    def device_offset(self, device_id):
+        with self._lock:
+            device = self._devices.get(device_id)
+            return device.offset if device else None
+
+    def summary(self):
+        """JSON-ready histograms, skewed devices and sequence gap totals."""
+        with self._lock:
+            devices = list(self._devices.items())
+            skewed = sorted(((device_id, d.offset) for device_id, d in devices if d.skewed),
+                            key=lambda item: -abs(item[1]))
+            return {
+                'since': datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(),
+                'stages': {name: h.to_dict() for name, h in self._stages.items()},
+                'clock_skew': {
+                    'threshold_seconds': CLOCK_SKEW_THRESHOLD_SECONDS,
+                    'skewed_count': len(skewed),
+                    'devices': {device_id: round(offset, 3)
+                                for device_id, offset in skewed[:MAX_REPORTED_SKEWED_DEVICES]},
+                },
+                'sequence': {
+                    'devices': len(devices),
+                    'gaps': sum(d.gaps for _, d in devices),
+                    'out_of_order': sum(d.out_of_order for _, d in devices),
+                },
+            }
+
+    def format_report(self):
+        """Human-readable summary lines for periodic logging."""
+        summary = self.summary()
+        lines = ["Latency (seconds):"]
+        for name, stage in sorted(summary['stages'].items()):
+            if stage['count']:
+                lines.append(f"  {name:<20} n={stage['count']:<7} p50={stage['p50']:.3f} "
+                             f"p95={stage['p95']:.3f} p99={stage['p99']:.3f} max={stage['max']:.3f}")
+        sequence = summary['sequence']
+        lines.append(f"  sequence gaps={sequence['gaps']} out_of_order={sequence['out_of_order']} "
+                     f"across {sequence['devices']} device(s)")
+        for device_id, offset in summary['clock_skew']['devices'].items():
+            lines.append(f"  clock skew: {device_id} is {abs(offset):.1f}s "
+                         f"{'behind' if offset > 0 else 'ahead of'} the server")
+        return lines
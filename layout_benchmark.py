@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Minute layout benchmark - compares per-minute rows (minute_utilization) with
+hour-packed rows (hourly_utilization, MINUTE_LAYOUT=hour): storage size,
+aggregator write cost and chart range reads.
+
+Synthetic minute aggregates for devices named "bench-N" in January 2000 are
+bulk loaded into minute_utilization and packed into hourly_utilization with
+the code the aggregator runs when a database switches layout. Both layouts
+are then read through the storage backend's utilization_columns(), and the
+results are checked to agree.
+
+PostgreSQL runs need a scratch database with the postgres-db/init schema
+(table sizes are measured whole); the benchmark refuses to run if it holds
+other minute aggregates, and deletes its data afterwards.
+
+Usage:
+    python3 layout_benchmark.py                          # SQLite (temp file)
+    POSTGRES_DB=boilerstat_scratch python3 layout_benchmark.py --backend postgres
+    python3 layout_benchmark.py --days 90 --devices 10 --queries 50
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from hour_slots import PER_HOUR, PER_MINUTE
+from storage import POSTGRES_DB, PostgresBackend, SQLiteBackend
+
+BENCH_START = datetime(2000, 1, 1)
+ZONES = 6
+# Chart windows read in each layout, ending at the end of the data
+WINDOWS = [('1 hour', timedelta(hours=1)), ('1 day', timedelta(days=1)),
+           ('7 days', timedelta(days=7)), ('30 days', timedelta(days=30)), ('90 days', timedelta(days=90))]
+TABLES = {PER_MINUTE: 'minute_utilization', PER_HOUR: 'hourly_utilization'}
+
+
+def generate_minutes(backend, devices, days):
+    """minute_utilization rows; values have two decimals, as stored by both layouts."""
+    for device in range(devices):
+        for i in range(days * 1440):
+            minute = BENCH_START + timedelta(minutes=i)
+            yield (f"bench-{device}", backend._db_time(minute), round(random.random() * 100, 2),
+                   backend._db_zones([round(random.random() * 100, 2) for _ in range(ZONES)]), 12, 0)
+
+
+def load_minutes(backend, devices, days):
+    sql = '''
+        INSERT INTO minute_utilization
+        (device_id, minute_timestamp, boiler_utilization, zone_utilization, sample_count, is_demo)
+        VALUES {values}
+    '''
+    rows = generate_minutes(backend, devices, days)
+    with backend._cursor() as cursor:
+        if backend.name == 'postgres':
+            from psycopg2.extras import execute_values
+
+            execute_values(cursor, sql.format(values='%s'), rows, page_size=5000)
+        else:
+            cursor.executemany(sql.format(values='(?, ?, ?, ?, ?, ?)'), rows)
+
+
+def table_bytes(backend):
+    """{layout: (table bytes, index bytes)}."""
+    sizes = {}
+    with backend._cursor() as cursor:
+        for layout, table in TABLES.items():
+            if backend.name == 'postgres':
+                cursor.execute('SELECT pg_table_size(%s), pg_indexes_size(%s)', (table, table))
+                sizes[layout] = cursor.fetchone()
+            else:
+                cursor.execute('''
+                    SELECT coalesce(sum(CASE WHEN d.name = ? THEN d.pgsize END), 0),
+                           coalesce(sum(CASE WHEN d.name != ? THEN d.pgsize END), 0)
+                    FROM dbstat d JOIN sqlite_master m ON m.name = d.name
+                    WHERE m.tbl_name = ?
+                ''', (table, table, table))
+                sizes[layout] = cursor.fetchone()
+    return sizes
+
+
+def timed_median(func, repeat):
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def columns_agree(a, b):
+    (times_a, series_a), (times_b, series_b) = a, b
+    if times_a != times_b or series_a.keys() != series_b.keys():
+        return False
+    # PostgreSQL's minute layout stores zones as real (float32)
+    return all(x is None and y is None or abs(float(x) - float(y)) < 0.01
+               for name in series_a for x, y in zip(series_a[name], series_b[name]))
+
+
+def benchmark(backends, devices, days, queries, writes):
+    minute_backend, hour_backend = backends[PER_MINUTE], backends[PER_HOUR]
+    name = minute_backend.name
+    print(f"\n{name}: {devices} devices x {days} days ({devices * days * 1440:,} minutes, {ZONES} zones)")
+
+    start = time.perf_counter()
+    load_minutes(minute_backend, devices, days)
+    loaded = time.perf_counter() - start
+    start = time.perf_counter()
+    hours = hour_backend.pack_minute_rows()
+    print(f"  loaded minute rows in {loaded:.1f}s, packed {hours:,} hour rows in "
+          f"{time.perf_counter() - start:.1f}s")
+    if name == 'postgres':
+        with minute_backend._cursor() as cursor:
+            cursor.execute('ANALYZE minute_utilization')
+            cursor.execute('ANALYZE hourly_utilization')
+
+    print(f"\n  {'storage':<24} {'table':>10} {'indexes':>10} {'bytes/minute':>13}")
+    for layout, (table, indexes) in table_bytes(minute_backend).items():
+        print(f"  {TABLES[layout]:<24} {table / 1e6:>8.2f}MB {indexes / 1e6:>8.2f}MB "
+              f"{(table + indexes) / (devices * days * 1440):>13.1f}")
+
+    # The aggregator's pattern: one upsert per minute, in order
+    print(f"\n  {'write':<24} {'per minute':>10}")
+    write_start = BENCH_START + timedelta(days=days)
+    for layout, backend in backends.items():
+        elapsed, _ = timed_median(lambda: [
+            backend.upsert_minute(f"bench-write-{layout}", write_start + timedelta(minutes=i), 50.0,
+                                  [25.0] * ZONES, 12, 0) for i in range(writes)], 1)
+        print(f"  {'upsert_minute ' + layout:<24} {elapsed / writes * 1000:>8.3f}ms")
+
+    end = BENCH_START + timedelta(days=days)
+    print(f"\n  {'range read (columns)':<24} {'minutes':>8} {'per minute':>12} {'per hour':>12} {'speedup':>8}")
+    mismatches = 0
+    for label, window in WINDOWS:
+        if window > timedelta(days=days):
+            break
+        since = end - window
+        results = {layout: timed_median(lambda: backend.utilization_columns(since, "bench-0"), queries)
+                   for layout, backend in backends.items()}
+        (minute_time, minute_result), (hour_time, hour_result) = results[PER_MINUTE], results[PER_HOUR]
+        agree = columns_agree(minute_result, hour_result)
+        mismatches += not agree
+        print(f"  {label:<24} {len(minute_result[0]):>8} {minute_time * 1000:>10.2f}ms "
+              f"{hour_time * 1000:>10.2f}ms {minute_time / hour_time:>7.1f}x"
+              f"{'' if agree else '  RESULTS DIFFER'}")
+    return mismatches
+
+
+def cleanup_postgres(backend):
+    with backend._cursor() as cursor:
+        for table in ('minute_utilization', 'hourly_utilization', 'utilization_profile', 'data_coverage'):
+            cursor.execute(f"DELETE FROM {table} WHERE device_id LIKE 'bench-%%'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the per-minute and hour-packed aggregate layouts")
+    parser.add_argument("--backend", choices=["sqlite", "postgres"], default="sqlite")
+    parser.add_argument("--days", type=int, default=30, help="Days of minute aggregates (default: 30)")
+    parser.add_argument("--devices", type=int, default=4, help="Number of devices (default: 4)")
+    parser.add_argument("--queries", type=int, default=20, help="Reads per window and layout (default: 20)")
+    parser.add_argument("--writes", type=int, default=1000, help="Minutes upserted per layout (default: 1000)")
+    args = parser.parse_args()
+
+    if args.backend == "sqlite":
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "layout_benchmark.db")
+            backends = {layout: SQLiteBackend(path, layout=layout) for layout in (PER_MINUTE, PER_HOUR)}
+            mismatches = benchmark(backends, args.devices, args.days, args.queries, args.writes)
+            for backend in backends.values():
+                backend.close()
+    else:
+        backends = {layout: PostgresBackend(layout=layout) for layout in (PER_MINUTE, PER_HOUR)}
+        with backends[PER_MINUTE]._cursor() as cursor:
+            cursor.execute("SELECT (SELECT count(*) FROM minute_utilization WHERE device_id NOT LIKE 'bench-%%')"
+                           " + (SELECT count(*) FROM hourly_utilization WHERE device_id NOT LIKE 'bench-%%')")
+            if cursor.fetchone()[0]:
+                print(f"{POSTGRES_DB} contains live aggregates; point POSTGRES_DB at a scratch database")
+                sys.exit(2)
+        try:
+            mismatches = benchmark(backends, args.devices, args.days, args.queries, args.writes)
+        finally:
+            cleanup_postgres(backends[PER_MINUTE])
+            for backend in backends.values():
+                backend.close()
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
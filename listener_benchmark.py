@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Listener sharding benchmark - ingest throughput of 1..N mqtt_database_logger
+processes splitting one reading stream with LISTENER_SHARDING=hash or shared.
+
+Each listener is a separate process running the logger's on_message() and
+batched writer against the configured database. Synthetic readings for
+devices named "bench-N" in January 2000 are sent through either:
+
+    --inject   no broker: every hash listener is handed the whole stream (as
+               an MQTT subscription would deliver it) and drops other shards'
+               devices; shared listeners are handed every Nth message, as the
+               broker's shared subscription would deliver them
+    --broker   a real MQTT broker (MQTT_BROKER/MQTT_PORT) with the listeners
+               subscribed and the readings published at QoS 1
+
+After each run the stored readings are checked: every reading exactly once
+(no duplicate device_id/seq, none missing). Bench readings are deleted before
+each run and afterwards.
+
+Usage:
+    python3 listener_benchmark.py --inject                     # SQLite (temp file)
+    python3 listener_benchmark.py --inject --listeners 1 2 4 8 --messages 40000
+    STORAGE_BACKEND=postgres POSTGRES_DB=boilerstat_scratch python3 listener_benchmark.py --broker
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+BENCH_START = datetime(2000, 1, 1)
+READING_INTERVAL = timedelta(seconds=5)
+ZONES = 6
+
+
+def generate_payloads(count, devices):
+    """MQTT message bodies round-robin across devices, with per-device seq numbers."""
+    payloads = []
+    for i in range(count):
+        seq = i // devices
+        timestamp = (BENCH_START + READING_INTERVAL * seq).strftime('%Y-%m-%d %H:%M:%S')
+        payloads.append(json.dumps({
+            'device_id': f"bench-{i % devices}",
+            'timestamp': timestamp,
+            'sent_at': timestamp,
+            'seq': seq,
+            'burner': i % 2,
+            'zones': [(i >> z) & 1 for z in range(ZONES)],
+        }).encode())
+    return payloads
+
+
+def run_listener(env, inject, args, ready, go, stop, results):
+    """One listener process: configure through the environment, then ingest."""
+    os.environ.update(env)
+    sys.stdout = open(os.devnull, 'w')
+    import mqtt_database_logger as logger
+    from sharding import Shard
+    from storage import get_backend
+
+    storage = get_backend()
+    logger.shard = Shard()
+    writer = logger.start_writer(storage)
+
+    if inject:
+        payloads = generate_payloads(args.messages, args.devices)
+        if logger.shard.mode == 'shared':
+            count = int(env['LISTENER_SHARD_COUNT'])
+            payloads = payloads[int(env['LISTENER_SHARD_INDEX'])::count]
+        messages = [SimpleNamespace(payload=payload) for payload in payloads]
+        ready.set()
+        go.wait()
+        for message in messages:
+            logger.on_message(None, None, message)
+    else:
+        import paho.mqtt.client as mqtt
+
+        client = mqtt.Client()
+        client.on_message = logger.on_message
+        client.on_connect = lambda c, userdata, flags, rc: c.subscribe(logger.shard.topic(args.topic), qos=1)
+        client.on_subscribe = lambda c, userdata, mid, granted_qos: ready.set()
+        client.connect(logger.MQTT_BROKER, logger.MQTT_PORT, 60)
+        client.loop_start()
+        stop.wait()
+        client.loop_stop()
+        client.disconnect()
+
+    writer.stop()
+    results.put((logger.shard.received, logger.shard.stored, logger.shard.skipped, logger.shard.errors))
+    storage.close()
+
+
+def publish(args, payloads):
+    import paho.mqtt.client as mqtt
+
+    from mqtt_database_logger import MQTT_BROKER, MQTT_PORT
+
+    client = mqtt.Client()
+    client.max_inflight_messages_set(1000)
+    client.connect(MQTT_BROKER, MQTT_PORT, 60)
+    client.loop_start()
+    infos = [client.publish(args.topic, payload, qos=1) for payload in payloads]
+    for info in infos:
+        info.wait_for_publish()
+    client.loop_stop()
+    client.disconnect()
+
+
+def stored_counts(storage):
+    """(distinct bench readings stored, readings stored more than once) by device_id and seq."""
+    with storage._cursor() as cursor:
+        cursor.execute(f'''
+            SELECT count(*), coalesce(sum(CASE WHEN copies > 1 THEN 1 ELSE 0 END), 0) FROM (
+                SELECT device_id, seq, count(*) AS copies FROM boiler_readings
+                WHERE device_id LIKE {storage.PARAM} GROUP BY device_id, seq
+            ) stored
+        ''', ('bench-%',))
+        return cursor.fetchone()
+
+
+def cleanup(storage):
+    p = storage.PARAM
+    with storage._cursor() as cursor:
+        cursor.execute(f"DELETE FROM boiler_readings WHERE device_id LIKE {p}", ('bench-%',))
+        cursor.execute(f"DELETE FROM data_coverage WHERE device_id LIKE {p}", ('bench-%',))
+        cursor.execute(f"DELETE FROM listener_shards WHERE listener LIKE {p}", ('bench-listener-%',))
+
+
+def run(storage, args, mode, listeners):
+    """Ingest args.messages readings with `listeners` processes; returns (seconds, problems)."""
+    cleanup(storage)
+    context = multiprocessing.get_context('spawn')
+    ready = [context.Event() for _ in range(listeners)]
+    go, stop, results = context.Event(), context.Event(), context.Queue()
+    processes = []
+    for index in range(listeners):
+        env = {
+            'LISTENER_SHARDING': mode,
+            'LISTENER_SHARD_COUNT': str(listeners),
+            'LISTENER_SHARD_INDEX': str(index),
+            'LISTENER_NAME': f"bench-listener-{index}",
+            'ANOMALY_DETECTION': 'false',
+            'LATENCY_REPORT_SECONDS': '0',
+        }
+        process = context.Process(target=run_listener,
+                                  args=(env, args.inject, args, ready[index], go, stop, results))
+        process.start()
+        processes.append(process)
+    for event in ready:
+        if not event.wait(60):
+            raise RuntimeError("a listener did not start within 60s")
+
+    start = time.perf_counter()
+    if args.inject:
+        go.set()
+        counters = [results.get() for _ in processes]
+    else:
+        publish(args, generate_payloads(args.messages, args.devices))
+        deadline = time.monotonic() + args.timeout
+        while stored_counts(storage)[0] < args.messages and time.monotonic() < deadline:
+            time.sleep(0.05)
+        stop.set()
+        counters = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.join()
+
+    stored, duplicates = stored_counts(storage)
+    problems = []
+    if stored < args.messages:
+        problems.append(f"{args.messages - stored} missing")
+    if duplicates:
+        problems.append(f"{duplicates} duplicated")
+    errors = sum(counter[3] for counter in counters)
+    if errors:
+        problems.append(f"{errors} errors")
+    return elapsed, problems
+
+
+def benchmark(storage, args):
+    print(f"{args.messages:,} readings from {args.devices} devices, "
+          f"{'injected' if args.inject else 'through MQTT'}")
+    failed = 0
+    for mode in args.sharding:
+        print(f"\n  {mode + ' listeners':<18} {'seconds':>8} {'msgs/s':>10} {'speedup':>8}")
+        baseline = None
+        for listeners in args.listeners:
+            elapsed, problems = run(storage, args, mode, listeners)
+            rate = args.messages / elapsed
+            baseline = baseline or rate
+            failed += bool(problems)
+            print(f"  {listeners:<18} {elapsed:>8.2f} {rate:>10,.0f} {rate / baseline:>7.2f}x"
+                  f"  {'; '.join(problems) if problems else 'ok'}")
+    cleanup(storage)
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sharded MQTT listeners")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--inject", action="store_true", help="Hand readings to the listeners directly")
+    source.add_argument("--broker", action="store_true", help="Publish readings through MQTT_BROKER")
+    parser.add_argument("--listeners", type=int, nargs="+", default=[1, 2, 4],
+                        help="Listener process counts to run (default: 1 2 4)")
+    parser.add_argument("--sharding", nargs="+", choices=["hash", "shared"], default=["hash", "shared"])
+    parser.add_argument("--messages", type=int, default=20000, help="Readings per run (default: 20000)")
+    parser.add_argument("--devices", type=int, default=64, help="Number of devices (default: 64)")
+    parser.add_argument("--topic", default="boilerstat/bench/reading",
+                        help="Topic for --broker runs (default: boilerstat/bench/reading)")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for --broker runs")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Listener processes inherit the backend settings from the environment
+        if os.getenv("STORAGE_BACKEND") != "postgres":
+            os.environ["STORAGE_BACKEND"] = "sqlite"
+            os.environ.setdefault("SQLITE_PATH", os.path.join(tmp, "listener_benchmark.db"))
+        from storage import describe_backend, get_backend
+
+        storage = get_backend()
+        storage.check()
+        print(f"Benchmarking against {describe_backend(storage)}")
+        try:
+            failed = benchmark(storage, args)
+        finally:
+            storage.close()
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Load test for the BoilerStat dashboard API.
+
+Hammers /api/status and /api/utilization from a pool of client threads and
+reports requests/sec and latency percentiles per endpoint.
+
+Usage:
+    python3 load_test.py --url http://localhost:5000 --duration 30 --concurrency 32
+"""
+
+import argparse
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+DEFAULT_ENDPOINTS = ["/api/status", "/api/utilization"]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def worker(base_url, endpoint, deadline, latencies, errors, lock):
+    """Issue requests to one endpoint back to back until the deadline."""
+    url = base_url.rstrip('/') + endpoint
+    local_latencies = []
+    local_errors = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=10) as response:
+                response.read()
+            local_latencies.append(time.perf_counter() - start)
+        except (urllib.error.URLError, OSError):
+            local_errors += 1
+    with lock:
+        latencies[endpoint].extend(local_latencies)
+        errors[endpoint] += local_errors
+
+
+def run(base_url, endpoints, duration, concurrency):
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    threads = []
+    for i in range(concurrency):
+        endpoint = endpoints[i % len(endpoints)]
+        t = threading.Thread(target=worker, args=(base_url, endpoint, deadline, latencies, errors, lock))
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+
+    print(f"{'Endpoint':<20} {'Requests':>9} {'Errors':>7} {'Req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for endpoint in endpoints:
+        values = sorted(latencies[endpoint])
+        print(f"{endpoint:<20} {len(values):>9} {errors[endpoint]:>7} {len(values) / duration:>9.1f} "
+              f"{percentile(values, 50) * 1000:>8.1f} {percentile(values, 95) * 1000:>8.1f} "
+              f"{percentile(values, 99) * 1000:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the BoilerStat dashboard API")
+    parser.add_argument("--url", default="http://localhost:5000", help="Base URL of the API")
+    parser.add_argument("--duration", type=float, default=30, help="Test duration in seconds (default: 30)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Number of client threads (default: 16)")
+    parser.add_argument("--endpoint", action="append", dest="endpoints",
+                        help="Endpoint to test; repeatable (default: /api/status and /api/utilization)")
+    args = parser.parse_args()
+
+    endpoints = args.endpoints or DEFAULT_ENDPOINTS
+    print(f"Load testing {args.url} for {args.duration:.0f}s with {args.concurrency} threads...")
+    run(args.url, endpoints, args.duration, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Bounded ring buffer of recent raw MQTT messages for the BoilerStat API.
+
+The API's MQTT subscriber appends every raw reading payload to a fixed-size
+memory-mapped file; /api/messages reads it from any worker process. Each
+device gets MESSAGE_BUFFER_SIZE preallocated slots of MESSAGE_SLOT_BYTES and
+its newest message overwrites its oldest, so memory use is fixed at start.
+
+Every message is numbered with a global sequence number, which clients pass
+back as ?since= to fetch only what is new. There is one writer and no lock:
+each slot is written as a seqlock (sequence zeroed, payload written, then
+the sequence set), and readers drop any slot whose sequence changed while
+they copied it, which only happens to a message that was being overwritten.
+
+Layout:
+    header   magic, slots per device, slot size, max devices, latest sequence,
+             oversize payloads dropped
+    devices  max devices x (device_id, latest sequence, latest overwritten
+             sequence, messages appended)
+    slots    max devices x slots per device x (sequence, received_at, length, payload)
+"""
+
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+_default_state_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+MESSAGE_BUFFER_FILE = os.getenv("MESSAGE_BUFFER_FILE", os.path.join(_default_state_dir, "boilerstat-messages"))
+# Messages kept per device
+MESSAGE_BUFFER_SIZE = int(os.getenv("MESSAGE_BUFFER_SIZE", "50"))
+# Largest payload kept; longer messages are counted and dropped
+MESSAGE_SLOT_BYTES = int(os.getenv("MESSAGE_SLOT_BYTES", "512"))
+# Devices with buffers; beyond this the least recently heard device's buffer is reused
+MESSAGE_MAX_DEVICES = int(os.getenv("MESSAGE_MAX_DEVICES", "64"))
+
+MAGIC = b'BSM1'
+HEADER = struct.Struct('<4sIIIQQ')    # magic, slots, slot payload bytes, max devices, seq, oversize
+DEVICE = struct.Struct('<64sQQQ')     # device_id, latest seq, latest overwritten seq, appended
+SLOT = struct.Struct('<QdH')          # seq (0 while being written), received_at (epoch), length
+DEVICE_ID_BYTES = 64
+
+
+class MessageBuffer:
+    """Per-device rings of raw payloads in a shared memory-mapped file.
+
+    The subscribing process calls create() and append(); any process may
+    call read(). Readers take the geometry from the file's header, so only
+    the writer's settings matter.
+    """
+
+    def __init__(self, path=MESSAGE_BUFFER_FILE, slots=MESSAGE_BUFFER_SIZE, slot_bytes=MESSAGE_SLOT_BYTES,
+                 max_devices=MESSAGE_MAX_DEVICES):
+        self.path = path
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.max_devices = max_devices
+        self._mm = None
+        self._lock = threading.Lock()
+        self._index = {}          # writer only: device_id -> device number
+
+    def _layout(self):
+        devices_at = HEADER.size
+        slots_at = devices_at + self.max_devices * DEVICE.size
+        return devices_at, slots_at, SLOT.size + self.slot_bytes
+
+    def _slot_offset(self, device, slot):
+        _, slots_at, stride = self._layout()
+        return slots_at + (device * self.slots + slot) * stride
+
+    def create(self):
+        """Create (or reset) the backing file. Called by the owning process."""
+        _, slots_at, stride = self._layout()
+        size = slots_at + self.max_devices * self.slots * stride
+        # Reset in place rather than truncated: workers keep the file mapped across subscriber restarts
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+            self._mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        magic, _, _, _, seq, _ = HEADER.unpack_from(self._mm, 0)
+        self._mm[HEADER.size:] = bytes(size - HEADER.size)
+        # Sequence numbers carry on, so clients polling with since= still see new messages
+        HEADER.pack_into(self._mm, 0, MAGIC, self.slots, self.slot_bytes, self.max_devices,
+                         seq if magic == MAGIC else 0, 0)
+        self._index = {}
+
+    def _open(self):
+        if self._mm is not None:
+            return True
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        try:
+            if os.fstat(fd).st_size < HEADER.size:
+                return False
+            mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        magic, self.slots, self.slot_bytes, self.max_devices, _, _ = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC:
+            mm.close()
+            return False
+        self._mm = mm
+        return True
+
+    def _device_number(self, device_id, encoded):
+        """Device number for device_id, taking over the least recently heard device when full."""
+        number = self._index.get(device_id)
+        if number is not None:
+            return number
+        devices_at, _, _ = self._layout()
+        if len(self._index) < self.max_devices:
+            number = len(self._index)
+        else:
+            number = min(self._index.values(),
+                         key=lambda n: DEVICE.unpack_from(self._mm, devices_at + n * DEVICE.size)[1])
+            del self._index[next(d for d, n in self._index.items() if n == number)]
+            # Hide the old device before its slots are cleared and the entry renamed
+            DEVICE.pack_into(self._mm, devices_at + number * DEVICE.size, b'', 0, 0, 0)
+            for slot in range(self.slots):
+                SLOT.pack_into(self._mm, self._slot_offset(number, slot), 0, 0.0, 0)
+        DEVICE.pack_into(self._mm, devices_at + number * DEVICE.size, encoded, 0, 0, 0)
+        self._index[device_id] = number
+        return number
+
+    def append(self, device_id, payload, received_at):
+        """Store one raw payload (bytes); received_at is a Unix timestamp. Returns its sequence number,
+        or None if the payload or device ID is too long to keep."""
+        encoded = device_id.encode()
+        with self._lock:
+            _, slots, slot_bytes, max_devices, seq, oversize = HEADER.unpack_from(self._mm, 0)
+            if len(payload) > self.slot_bytes or len(encoded) > DEVICE_ID_BYTES:
+                HEADER.pack_into(self._mm, 0, MAGIC, slots, slot_bytes, max_devices, seq, oversize + 1)
+                return None
+            number = self._device_number(device_id, encoded)
+            entry_at = self._layout()[0] + number * DEVICE.size
+            _, _, overwritten, appended = DEVICE.unpack_from(self._mm, entry_at)
+
+            seq += 1
+            offset = self._slot_offset(number, appended % self.slots)
+            if appended >= self.slots:
+                overwritten = SLOT.unpack_from(self._mm, offset)[0]
+            SLOT.pack_into(self._mm, offset, 0, 0.0, 0)
+            self._mm[offset + SLOT.size:offset + SLOT.size + len(payload)] = payload
+            SLOT.pack_into(self._mm, offset, seq, received_at, len(payload))
+
+            DEVICE.pack_into(self._mm, entry_at, encoded, seq, overwritten, appended + 1)
+            HEADER.pack_into(self._mm, 0, MAGIC, slots, slot_bytes, max_devices, seq, oversize)
+            return seq
+
+    def read(self, since=0, device_id=None):
+        """Messages newer than sequence number since, oldest first.
+
+        Returns (messages, latest, truncated): messages are (seq, device_id,
+        received_at, payload bytes); latest is the newest sequence number in
+        the buffer; truncated is True when messages after since were already
+        overwritten.
+        """
+        if not self._open():
+            return [], 0, False
+        mm = self._mm
+        latest = HEADER.unpack_from(mm, 0)[4]
+        if latest <= since:
+            return [], latest, False
+
+        devices_at, _, _ = self._layout()
+        messages = []
+        truncated = False
+        for number in range(self.max_devices):
+            entry_at = devices_at + number * DEVICE.size
+            raw_id, device_latest, overwritten, _ = DEVICE.unpack_from(mm, entry_at)
+            if device_latest <= since:
+                continue
+            name = raw_id.rstrip(b'\0').decode(errors='replace')
+            if device_id is not None and name != device_id:
+                continue
+            found = []
+            for slot in range(self.slots):
+                offset = self._slot_offset(number, slot)
+                seq, received_at, length = SLOT.unpack_from(mm, offset)
+                if seq <= since:
+                    continue
+                payload = mm[offset + SLOT.size:offset + SLOT.size + length]
+                # Overwritten while copying: the message is gone, skip it
+                if SLOT.unpack_from(mm, offset)[0] == seq:
+                    found.append((seq, name, received_at, payload))
+            # The device's buffer was handed to another device meanwhile
+            if DEVICE.unpack_from(mm, entry_at)[0] != raw_id:
+                continue
+            messages.extend(found)
+            truncated = truncated or overwritten > since
+        messages.sort()
+        return messages, latest, truncated
+
+    def oversize_count(self):
+        return HEADER.unpack_from(self._mm, 0)[5] if self._open() else 0
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
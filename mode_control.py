@@ -1,16 +1,26 @@
 #!/usr/bin/env python3
 """
 BoilerStat Mode Control Script
-Sends MQTT control messages to switch ESP32 between demo and production modes.
+Sends MQTT control messages to switch ESP32 between demo and production modes,
+either broadcast to all devices or addressed to specific devices with
+acknowledgements (--device).
+
+paho is imported only once a command needs the broker, after a quick
+reachability check, so --help and an unreachable broker return immediately.
 """
 
-import paho.mqtt.client as mqtt
 import json
 import sys
+import threading
 import time
 import argparse
 import os
 
+from fleet_control import (COMMAND_RETRIES, COMMAND_TIMEOUT_SECONDS, FleetCommander, ack_subscription,
+                           is_ack_topic, summarize)
+from startup import STARTUP_PROBE_TIMEOUT, format_result, mqtt_probe, run_probes
+from zones import zones_from_payload
+
 # MQTT Configuration
 MQTT_BROKER = os.getenv("MQTT_BROKER", "192.168.1.245")
 MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
@@ -19,34 +29,46 @@ MQTT_DATA_TOPIC = os.getenv("MQTT_DATA_TOPIC", "boilerstat/reading")
 
 class ModeController:
     def __init__(self):
+        import paho.mqtt.client as mqtt
+
         self.client = mqtt.Client()
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
         self.client.on_disconnect = self.on_disconnect
         self.connected = False
+        self._connected = threading.Event()
+        self.fleet = FleetCommander(self._publish_command)
         
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             self.connected = True
+            self._connected.set()
             print(f"✅ Connected to MQTT broker at {MQTT_BROKER}")
             # Subscribe to data topic to monitor mode changes
             client.subscribe(MQTT_DATA_TOPIC)
+            client.subscribe(ack_subscription(), qos=1)
         else:
             print(f"❌ Failed to connect to MQTT broker. Return code: {rc}")
             
     def on_disconnect(self, client, userdata, rc):
         self.connected = False
+        self._connected.clear()
         print(f"🔌 Disconnected from MQTT broker")
         
     def on_message(self, client, userdata, msg):
         """Monitor incoming data messages to see mode changes"""
-        if msg.topic == MQTT_DATA_TOPIC:
+        if is_ack_topic(msg.topic):
+            try:
+                self.fleet.handle_ack(json.loads(msg.payload.decode()))
+            except ValueError:
+                pass  # Ignore malformed acks
+        elif msg.topic == MQTT_DATA_TOPIC:
             try:
                 data = json.loads(msg.payload.decode())
                 # Print a simple status line showing current data
                 timestamp = data.get('timestamp', 'Unknown')
                 burner = data.get('burner', 0)
-                zones = [data.get(f'zone_{i}', 0) for i in range(1, 7)]
+                zones = zones_from_payload(data)
                 zone_str = ' '.join(map(str, zones))
                 print(f"📊 [{timestamp}] Burner:{burner} Zones:{zone_str}")
             except:
@@ -58,13 +80,8 @@ class ModeController:
             self.client.connect(MQTT_BROKER, MQTT_PORT, 60)
             self.client.loop_start()
             
-            # Wait for connection
-            timeout = 10
-            while not self.connected and timeout > 0:
-                time.sleep(0.1)
-                timeout -= 0.1
-                
-            return self.connected
+            # Wait for the CONNACK
+            return self._connected.wait(STARTUP_PROBE_TIMEOUT)
         except Exception as e:
             print(f"❌ Connection error: {e}")
             return False
@@ -76,6 +93,8 @@ class ModeController:
     
     def set_demo_mode(self, enable_demo=True):
         """Send control message to enable/disable demo mode"""
+        import paho.mqtt.client as mqtt
+
         if not self.connected:
             print("❌ Not connected to MQTT broker")
             return False
@@ -103,6 +122,31 @@ class ModeController:
             print(f"❌ Error publishing message: {e}")
             return False
     
+    def _publish_command(self, topic, payload):
+        import paho.mqtt.client as mqtt
+
+        return self.connected and self.client.publish(topic, payload, qos=1).rc == mqtt.MQTT_ERR_SUCCESS
+
+    def set_fleet_mode(self, device_ids, enable_demo=True, timeout=COMMAND_TIMEOUT_SECONDS,
+                       retries=COMMAND_RETRIES):
+        """Send the mode to each device's own control topic and wait for acknowledgements"""
+        if not self.connected:
+            print("❌ Not connected to MQTT broker")
+            return False
+
+        mode_text = "DEMO" if enable_demo else "PRODUCTION"
+        print(f"📤 Sending {mode_text} to {len(device_ids)} device(s), "
+              f"timeout {timeout:g}s, {retries} retr{'y' if retries == 1 else 'ies'}...")
+        results = self.fleet.set_mode(device_ids, enable_demo, timeout=timeout, retries=retries)
+        for device_id, result in results.items():
+            if result.status == 'acked':
+                print(f"  ✅ {device_id}: acknowledged in {result.latency_ms:.0f} ms "
+                      f"(attempt {result.attempts})")
+            else:
+                print(f"  ❌ {device_id}: {result.status} after {result.attempts} attempt(s)")
+        print(f"Summary: {', '.join(f'{n} {status}' for status, n in sorted(summarize(results).items()))}")
+        return all(result.status == 'acked' for result in results.values())
+
     def monitor_mode(self, duration=30):
         """Monitor ESP32 messages for specified duration"""
         print(f"🔍 Monitoring ESP32 messages for {duration} seconds...")
@@ -121,19 +165,35 @@ def main():
                        help="Command: 'demo' for demo mode, 'production' for production mode, 'monitor' to watch messages")
     parser.add_argument("--duration", type=int, default=30,
                        help="Duration for monitoring in seconds (default: 30)")
+    parser.add_argument("--device", action="append",
+                       help="Address this device and wait for its acknowledgement (repeatable); "
+                            "without --device the command is broadcast unconfirmed")
+    parser.add_argument("--timeout", type=float, default=COMMAND_TIMEOUT_SECONDS,
+                       help=f"Seconds to wait for each acknowledgement (default: {COMMAND_TIMEOUT_SECONDS:g})")
+    parser.add_argument("--retries", type=int, default=COMMAND_RETRIES,
+                       help=f"Resends to devices that have not acknowledged (default: {COMMAND_RETRIES})")
     
     args = parser.parse_args()
     
-    controller = ModeController()
-    
-    # Connect to MQTT broker
+    # Fail fast if the broker is unreachable, before loading the MQTT client
     print(f"🔌 Connecting to MQTT broker at {MQTT_BROKER}...")
+    broker, = run_probes({'mqtt': mqtt_probe(MQTT_BROKER, MQTT_PORT)})
+    if not broker.ok:
+        print(f"❌ MQTT broker unreachable: {format_result(broker)}. Exiting.")
+        sys.exit(1)
+
+    controller = ModeController()
     if not controller.connect():
         print("❌ Failed to connect to MQTT broker. Exiting.")
         sys.exit(1)
     
     try:
-        if args.command == "demo":
+        if args.device and args.command in ("demo", "production"):
+            if not controller.set_fleet_mode(args.device, args.command == "demo",
+                                             timeout=args.timeout, retries=args.retries):
+                sys.exit(1)
+
+        elif args.command == "demo":
             print("🎭 Switching to DEMO mode...")
             if controller.set_demo_mode(True):
                 print("✅ Demo mode command sent successfully")
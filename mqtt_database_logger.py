@@ -1,115 +1,266 @@
 #!/usr/bin/env python3
 """
-MQTT Listener that subscribes to BoilerStat data and logs it to PostgreSQL database.
+MQTT Listener that subscribes to BoilerStat data and logs it to the database
+(PostgreSQL, or SQLite with STORAGE_BACKEND=sqlite).
 """
 
 import json
-import psycopg2
-from psycopg2.extras import RealDictCursor
 import os
-import paho.mqtt.client as mqtt
+import signal
+import threading
+import time
 from datetime import datetime, timezone, timedelta
 
+from anomaly_detection import SEVERITY, AnomalyDetector
+from latency import CLOCK_SKEW_THRESHOLD_SECONDS, LatencyTracker, parse_sent_at
+from mqtt_session import MQTT_MAX_INFLIGHT, MQTT_QOS, AckTracker, create_client, describe_session
+from profiling import PROFILE_DIR, PROFILE_SIGNAL, install_signal_handler, measure, timings
+from readings import Reading
+from sharding import LISTENER_HEARTBEAT_SECONDS, Shard
+from startup import database_probe, format_result, mqtt_probe, run_probes
+from storage import DEFAULT_DEVICE_ID, BatchWriter, describe_backend, get_backend
+
 # Configuration from environment variables with defaults
 MQTT_BROKER = os.getenv("MQTT_BROKER", "192.168.1.245")
 MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
 MQTT_TOPIC = os.getenv("MQTT_TOPIC", "boilerstat/reading")
+# Readings are written in batches of up to INGEST_BATCH_SIZE, at least every INGEST_FLUSH_SECONDS
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "50"))
+INGEST_FLUSH_SECONDS = float(os.getenv("INGEST_FLUSH_SECONDS", "1.0"))
+# Readings still unwritten after this many seconds of database errors are dead-lettered
+# and acknowledged, so a failing batch cannot hold the MQTT in-flight window (0 = retry for ever)
+INGEST_RETRY_SECONDS = float(os.getenv("INGEST_RETRY_SECONDS", "300"))
+# Seconds between latency summaries (0 disables them)
+LATENCY_REPORT_SECONDS = float(os.getenv("LATENCY_REPORT_SECONDS", "60"))
+# Raised and resolved anomaly alerts are published here ("false" disables detection)
+ALERT_TOPIC = os.getenv("ALERT_TOPIC", "boilerstat/alerts")
+ANOMALY_DETECTION = os.getenv("ANOMALY_DETECTION", "true").lower() == "true"
+# Readings the database refuses are appended here as NDJSON, replayable with
+# replay.py --file ("" = only log them)
+REJECTED_READINGS_FILE = os.getenv("REJECTED_READINGS_FILE", "/data/rejected_readings.ndjson")
+
+# Created in main()
+writer = None
+detector = None
+shard = None
+acks = None
+latency = LatencyTracker()
+last_latency_report = time.monotonic()
+
+
+def on_flush(batch):
+    """Called after a batch of readings has been committed."""
+    global last_latency_report
+    if acks is not None:
+        acks.committed(batch)
+    print(f"  -> Stored {len(batch)} reading(s) in database")
+    if shard is not None:
+        shard.count_stored(len(batch))
+
+    committed_at = datetime.utcnow()
+    for reading in batch:
+        latency.observe('logger_to_commit', (committed_at - reading.logged_at).total_seconds())
+        if reading.sent_at is not None:
+            latency.observe('device_to_commit', max((committed_at - reading.sent_at).total_seconds(), 0.0))
+
+    if LATENCY_REPORT_SECONDS and time.monotonic() - last_latency_report >= LATENCY_REPORT_SECONDS:
+        last_latency_report = time.monotonic()
+        print("\n".join(latency.format_report()))
+        print("\n".join(timings.format_report()))
+        if acks is not None:
+            print(acks.format_report())
+
+
+def on_reject(rejected):
+    """Called with (reading, error) pairs the writer gave up on; they are not retried."""
+    if shard is not None:
+        shard.count_rejected(len(rejected))
+    if REJECTED_READINGS_FILE:
+        try:
+            with open(REJECTED_READINGS_FILE, 'a') as f:
+                for reading, error in rejected:
+                    f.write(json.dumps({**reading.to_dict(), 'error': str(error)}) + "\n")
+            print(f"  -> Wrote {len(rejected)} rejected reading(s) to {REJECTED_READINGS_FILE}")
+        except OSError as e:
+            print(f"Error writing rejected readings to {REJECTED_READINGS_FILE}: {e}")
+    # Settled either way: acknowledge them so they stop counting against the in-flight window
+    if acks is not None:
+        acks.rejected([reading for reading, _ in rejected])
+
+
+def start_writer(storage, batch_size=INGEST_BATCH_SIZE):
+    """Create and start the batched database writer used by handle_payload()."""
+    global writer
+    writer = BatchWriter(storage, batch_size=batch_size, flush_interval=INGEST_FLUSH_SECONDS,
+                         on_flush=on_flush, on_reject=on_reject, retry_seconds=INGEST_RETRY_SECONDS or None)
+    writer.start()
+    return writer
+
+
+def start_anomaly_detection(storage, client):
+    """Create the streaming anomaly detector fed by handle_payload().
 
-# PostgreSQL configuration
-POSTGRES_HOST = os.getenv("POSTGRES_HOST", "localhost")
-POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
-POSTGRES_DB = os.getenv("POSTGRES_DB")
-POSTGRES_USER = os.getenv("POSTGRES_USER")
-POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
+    Alerts are recorded in device_alerts and published to ALERT_TOPIC.
+    Alerts left open by a previous run are restored so they resolve normally.
+    """
+    global detector
 
+    def on_alert(alert):
+        severity = SEVERITY[alert.kind]
+        if alert.raised:
+            print(f"ALERT [{severity}] {alert.device_id}: {alert.message}")
+        else:
+            print(f"Resolved: {alert.kind} on {alert.device_id}"
+                  + (f" channel {alert.channel}" if alert.channel is not None else ""))
+        try:
+            if alert.raised:
+                storage.record_alert(alert.device_id, alert.kind, alert.channel, severity,
+                                     alert.timestamp, alert.message)
+            else:
+                storage.resolve_alert(alert.device_id, alert.kind, alert.channel, alert.timestamp)
+        except Exception as e:
+            print(f"Database error recording alert: {e}")
+        client.publish(ALERT_TOPIC, json.dumps({
+            'device_id': alert.device_id,
+            'kind': alert.kind,
+            'channel': alert.channel,
+            'severity': severity,
+            'state': 'raised' if alert.raised else 'resolved',
+            'timestamp': alert.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+            'message': alert.message,
+        }), qos=1)
+
+    detector = AnomalyDetector(on_alert)
+    try:
+        open_alerts = storage.open_alerts()
+        detector.restore(open_alerts)
+        if open_alerts:
+            print(f"Restored {len(open_alerts)} open alert(s)")
+    except Exception as e:
+        print(f"Database error loading open alerts: {e}")
+    detector.start()
+    return detector
+
+
+def start_heartbeat(storage):
+    """Write this listener's listener_shards row every LISTENER_HEARTBEAT_SECONDS.
+
+    Returns a function that stops the heartbeat and removes the row.
+    """
+    stopping = threading.Event()
+
+    def beat():
+        queued, lag = writer.backlog()
+        commit = latency.summary()['stages'].get('logger_to_commit')
+        status = shard.status(queued, round(lag, 3), commit['p95'] if commit and commit['count'] else None)
+        try:
+            storage.record_listener(shard.name, status)
+        except Exception as e:
+            print(f"Database error recording listener heartbeat: {e}")
+        return status
+
+    def run():
+        while not stopping.wait(LISTENER_HEARTBEAT_SECONDS):
+            status = beat()
+            print(f"Listener {shard.name}: received={status['received']} stored={status['stored']} "
+                  f"skipped={status['skipped']} errors={status['errors']} queued={status['queued']} "
+                  f"lag={status['lag_seconds']:.1f}s")
+
+    def stop():
+        stopping.set()
+        thread.join(timeout=5)
+        try:
+            storage.remove_listener(shard.name)
+        except Exception as e:
+            print(f"Database error removing listener heartbeat: {e}")
 
-def get_db_connection():
-    """Get PostgreSQL database connection."""
-    return psycopg2.connect(
-        host=POSTGRES_HOST,
-        port=POSTGRES_PORT,
-        database=POSTGRES_DB,
-        user=POSTGRES_USER,
-        password=POSTGRES_PASSWORD
-    )
+    beat()
+    thread = threading.Thread(target=run, name="listener-heartbeat", daemon=True)
+    thread.start()
+    return stop
 
 
 def on_connect(client, userdata, flags, rc):
     """Callback for when the client connects to the broker."""
     if rc == 0:
-        print(f"Connected to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}")
-        client.subscribe(MQTT_TOPIC)
-        print(f"Subscribed to topic: {MQTT_TOPIC}")
+        if acks is not None:
+            acks.connected()
+        resumed = " (session resumed)" if flags.get('session present') else ""
+        print(f"Connected to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}{resumed}")
+        topic = shard.topic(MQTT_TOPIC) if shard is not None else MQTT_TOPIC
+        client.subscribe(topic, qos=MQTT_QOS)
+        print(f"Subscribed to topic: {topic}")
     else:
         print(f"Connection failed with code {rc}")
 
 
+def handle_payload(payload, verbose=True, delivery=None):
+    """Normalize one decoded reading payload and queue it for the database.
+
+    Used for MQTT messages and by replay.py to inject readings directly.
+    delivery is the QoS 1 message to acknowledge once the reading is
+    committed. Raises KeyError or ValueError for malformed payloads.
+    """
+    logged_at = datetime.utcnow()
+    sent_at = parse_sent_at(payload)
+    # One normalized record from here to the database row (see readings.py)
+    reading = Reading.from_payload(payload, logged_at, sent_at)
+    device_id = reading.device_id
+    # Redeliveries after a reconnect are acknowledged without storing them twice
+    if delivery is not None and not acks.receive(delivery, reading):
+        return
+
+    # Trace the device -> logger hop and watch for ESP32 clock skew; sequence
+    # gaps are only meaningful when this listener sees the device's whole stream
+    whole_stream = shard is None or shard.whole_device_streams
+    if latency.observe_arrival('device_to_logger', device_id, reading.seq if whole_stream else None,
+                               sent_at, logged_at):
+        offset = latency.device_offset(device_id)
+        if abs(offset) > CLOCK_SKEW_THRESHOLD_SECONDS:
+            print(f"Clock skew: device {device_id} clock is {abs(offset):.1f}s "
+                  f"{'behind' if offset > 0 else 'ahead of'} the server")
+        else:
+            print(f"Clock skew: device {device_id} clock is back within "
+                  f"{CLOCK_SKEW_THRESHOLD_SECONDS:.0f}s of the server")
+    
+    if verbose:
+        print(f"\n[{datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} UTC] Received data:")
+        print(f"  Device: {device_id}")
+        print(f"  Original Timestamp: {payload['timestamp']}")
+        print(f"  UTC Timestamp: {reading.timestamp}")
+        print(f"  Burner: {reading.burner}")
+        print(f"  Zones: {', '.join(map(str, reading.zones))}")
+        print(f"  Mode: {'DEMO' if reading.is_demo else 'PRODUCTION'}")
+
+    # Queue for the next batched database write; the Reading is the row
+    writer.add(reading)
+
+    # Demo data is random per sample, so only production readings are watched
+    if detector is not None and not reading.is_demo:
+        detector.feed(device_id, reading.time, reading.burner, reading.zones)
+
+
 def on_message(client, userdata, msg):
     """Callback for when a message is received from the broker."""
     try:
-        # Parse JSON payload
         payload = json.loads(msg.payload.decode())
-
-        # Handle timestamp from ESP32 (already in UTC)
-        try:
-            # Parse the incoming timestamp (ESP32 now sends UTC directly)
-            incoming_timestamp = datetime.fromisoformat(payload['timestamp'].replace('Z', ''))
-            if incoming_timestamp.tzinfo is None:
-                # ESP32 sends UTC timestamps, use them directly
-                utc_timestamp = payload['timestamp']
-            else:
-                utc_timestamp = incoming_timestamp.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
-        except (ValueError, AttributeError):
-            # Fallback to current UTC time if parsing fails
-            utc_timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
-
-        # Handle both old "boiler_state" and new "burner" field names
-        boiler_value = payload.get('burner', payload.get('boiler_state', 0))
-        
-        # Handle is_demo flag (default to production mode if not present)
-        is_demo = payload.get('is_demo', False)
-        is_demo_int = 1 if is_demo else 0
-        
-        print(f"\n[{datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} UTC] Received data:")
-        print(f"  Original Timestamp: {payload['timestamp']}")
-        print(f"  UTC Timestamp: {utc_timestamp}")
-        print(f"  Burner: {boiler_value}")
-        print(f"  Zones: {payload['zone_1']}, {payload['zone_2']}, {payload['zone_3']}, "
-              f"{payload['zone_4']}, {payload['zone_5']}, {payload['zone_6']}")
-        print(f"  Mode: {'DEMO' if is_demo else 'PRODUCTION'}")
-
-        # Store in database
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            INSERT INTO boiler_readings
-            (timestamp, boiler, zone_1, zone_2, zone_3, zone_4, zone_5, zone_6, is_demo)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ''', (
-            utc_timestamp,
-            boiler_value,
-            payload['zone_1'],
-            payload['zone_2'],
-            payload['zone_3'],
-            payload['zone_4'],
-            payload['zone_5'],
-            payload['zone_6'],
-            is_demo_int
-        ))
-
-        conn.commit()
-        conn.close()
-
-        print("  -> Data stored in database")
+        # Other hash shards store the readings of devices outside this one
+        if shard is not None and not shard.accept(payload.get('device_id', DEFAULT_DEVICE_ID)):
+            return
+        with measure('message'):
+            handle_payload(payload, delivery=msg if acks is not None and msg.qos else None)
 
     except json.JSONDecodeError as e:
+        shard.count_error()
         print(f"Error decoding JSON: {e}")
     except KeyError as e:
+        shard.count_error()
         print(f"Missing key in payload: {e}")
-    except sqlite3.Error as e:
-        print(f"Database error: {e}")
+    except ValueError as e:
+        shard.count_error()
+        print(f"Invalid payload: {e}")
     except Exception as e:
+        shard.count_error()
         print(f"Unexpected error: {e}")
 
 
@@ -121,37 +272,90 @@ def on_disconnect(client, userdata, rc):
 
 def main():
     """Main function to start the MQTT listener."""
-
-    # Verify database connection
+    global shard, acks
+    try:
+        shard = Shard()
+    except ValueError as e:
+        print(f"Listener sharding error: {e}")
+        return
+    print(f"Listener {shard.name}: {shard.describe()}")
     try:
-        conn = get_db_connection()
-        conn.close()
-        print(f"Connected to PostgreSQL database: {POSTGRES_DB}@{POSTGRES_HOST}:{POSTGRES_PORT}")
-    except psycopg2.Error as e:
-        print(f"Database connection error: {e}")
-        print("Please ensure PostgreSQL is running and credentials are correct.")
+        client = create_client()
+    except ValueError as e:
+        print(f"MQTT session error: {e}")
         return
+    print(f"MQTT ingest: {describe_session()}")
+    install_signal_handler('logger')
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        print(f"\nReceived signal {signum}, stopping listener...")
+        stopping.set()
+
+    # docker stop sends SIGTERM: leave the loop so the buffered readings are written below
+    signal.signal(signal.SIGTERM, stop)
+    print(f"Profiling: send {PROFILE_SIGNAL.name} to PID {os.getpid()} to write a profile to {PROFILE_DIR}")
+
+    # Verify the database and the broker concurrently
+    storage = get_backend()
+    database, broker = run_probes({
+        'database': database_probe(storage),
+        'mqtt': mqtt_probe(MQTT_BROKER, MQTT_PORT),
+    })
+    print(f"Startup checks: {format_result(database)}, {format_result(broker)}")
+    if not database.ok:
+        print(f"Database connection error: {database.error}")
+        print("Please ensure the database is available and credentials are correct.")
+        return
+    print(f"Connected to {describe_backend(storage)}")
+    if not broker.ok:
+        print(f"MQTT broker {MQTT_BROKER}:{MQTT_PORT} is unreachable: {broker.error}")
+        return
+
+    # Unacknowledged readings stop arriving at the in-flight window, so a batch never waits for more
+    start_writer(storage, min(INGEST_BATCH_SIZE, MQTT_MAX_INFLIGHT) if MQTT_QOS else INGEST_BATCH_SIZE)
+    stop_heartbeat = start_heartbeat(storage)
 
-    # Create MQTT client
-    client = mqtt.Client()
     client.on_connect = on_connect
     client.on_message = on_message
     client.on_disconnect = on_disconnect
+    if MQTT_QOS:
+        acks = AckTracker(client)
+
+    if ANOMALY_DETECTION and not shard.whole_device_streams:
+        print("Anomaly detection disabled: shared subscriptions split each device's readings across listeners")
+    elif ANOMALY_DETECTION:
+        start_anomaly_detection(storage, client)
 
     try:
         # Connect to broker
         print(f"Connecting to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}...")
         client.connect(MQTT_BROKER, MQTT_PORT, 60)
 
-        # Start listening loop
+        # Start listening loop; on its own thread, which also sends the writer thread's acks
         print("Starting listener... (Press Ctrl+C to stop)")
-        client.loop_forever()
+        client.loop_start()
+        while not stopping.wait(1):
+            pass
 
     except KeyboardInterrupt:
         print("\nStopping listener...")
-        client.disconnect()
     except Exception as e:
         print(f"Error: {e}")
+    finally:
+        if detector is not None:
+            detector.stop()
+        # Commit and acknowledge what is buffered before disconnecting
+        writer.stop()
+        client.disconnect()
+        client.loop_stop()
+        if acks is None:
+            # Readings that arrived during that flush. At QoS 1 they are unacknowledged
+            # and the persistent session redelivers them, so writing them would duplicate.
+            writer.flush()
+        stop_heartbeat()
+        storage.close()
+        print("Listener stopped")
 
 
 if __name__ == "__main__":
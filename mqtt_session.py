@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Persistent-session QoS 1 ingest for mqtt_database_logger.
+
+With MQTT_PERSISTENT_SESSION=true the logger connects with a fixed client id
+(MQTT_CLIENT_ID, default "boilerstat-logger-<LISTENER_NAME>") and
+clean_session=False. It subscribes at MQTT_QOS, so the broker keeps the
+subscription and queues readings while the logger is away: a restart, a
+network blip, or a broker restart with persistence enabled. When the logger
+reconnects, the broker delivers what it queued. Reconnects back off from
+MQTT_RECONNECT_MIN_SECONDS to MQTT_RECONNECT_MAX_SECONDS.
+
+At QoS 1 a reading is acknowledged (PUBACK) only after the batch holding it
+has been committed. A reading the logger received but had not written when
+it died is therefore redelivered, not lost. The broker stops sending once a
+client has its in-flight limit of unacknowledged messages (mosquitto
+max_inflight_messages, default 20). The logger therefore caps its write
+batches at MQTT_MAX_INFLIGHT readings, so a batch is written as soon as a
+window's worth has arrived; set MQTT_MAX_INFLIGHT to the broker's limit. A
+larger window means larger batches and fewer round trips.
+
+Delivery is at least once. A redelivery (flagged DUP) of a reading still
+waiting for its commit, or among the last REDELIVERY_MEMORY committed, is
+recognised by device_id, timestamp and seq. It is acknowledged without being
+stored again; an ack can be lost with the connection it was sent on. Only a
+listener restart between a commit and its acks can store up to
+MQTT_MAX_INFLIGHT readings twice.
+
+Readings the writer gives up on (rejected by the database, or still failing
+after INGEST_RETRY_SECONDS) are acknowledged once they are dead-lettered, so
+they never hold the in-flight window. A redelivery of one is acknowledged
+without being queued again.
+
+paho 1.6 sends the PUBACK itself as soon as on_message returns.
+DeferredAckClient holds back the PUBACKs of readings handed to the writer
+until ack() sends them; paho 2's manual_ack does the same.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import paho.mqtt.client as mqtt
+
+from sharding import LISTENER_NAME
+
+MQTT_PERSISTENT_SESSION = os.getenv("MQTT_PERSISTENT_SESSION", "true").lower() == "true"
+# Subscription QoS: 1 = acknowledged after commit, 0 = fire and forget
+MQTT_QOS = int(os.getenv("MQTT_QOS", "1"))
+# Must be stable across restarts for the broker to resume the session
+MQTT_CLIENT_ID = os.getenv("MQTT_CLIENT_ID") or f"boilerstat-logger-{LISTENER_NAME}"
+# Unacknowledged readings the broker sends before waiting; match its max_inflight_messages
+MQTT_MAX_INFLIGHT = int(os.getenv("MQTT_MAX_INFLIGHT", "20"))
+MQTT_RECONNECT_MIN_SECONDS = float(os.getenv("MQTT_RECONNECT_MIN_SECONDS", "1"))
+MQTT_RECONNECT_MAX_SECONDS = float(os.getenv("MQTT_RECONNECT_MAX_SECONDS", "30"))
+# Committed readings remembered to recognise redeliveries
+REDELIVERY_MEMORY = 10000
+
+
+class DeferredAckClient(mqtt.Client):
+    """paho client whose QoS 1 PUBACKs can be held back with defer() and sent later with ack().
+
+    Run it with loop_start(): ack() is called from the batch writer's thread
+    and only queues the packet for the network thread.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._deferred = set()
+
+    def defer(self, mid):
+        """Hold back the PUBACK paho sends when on_message for mid returns."""
+        self._deferred.add(mid)
+
+    def ack(self, mid):
+        return super()._send_puback(mid)
+
+    def _send_puback(self, mid):
+        if mid in self._deferred:
+            self._deferred.discard(mid)
+            return mqtt.MQTT_ERR_SUCCESS
+        return super()._send_puback(mid)
+
+
+def create_client():
+    """The logger's MQTT client for the configured session mode."""
+    if MQTT_QOS not in (0, 1):
+        raise ValueError(f"MQTT_QOS {MQTT_QOS} is not supported; use 0 or 1")
+    if MQTT_PERSISTENT_SESSION:
+        client = DeferredAckClient(client_id=MQTT_CLIENT_ID, clean_session=False)
+    else:
+        client = DeferredAckClient()
+    client.reconnect_delay_set(MQTT_RECONNECT_MIN_SECONDS, MQTT_RECONNECT_MAX_SECONDS)
+    return client
+
+
+def describe_session():
+    if MQTT_PERSISTENT_SESSION:
+        mode = f"persistent session {MQTT_CLIENT_ID!r}"
+    else:
+        mode = "clean session"
+    acks = f", acks after commit (window {MQTT_MAX_INFLIGHT})" if MQTT_QOS else ""
+    return f"{mode}, QoS {MQTT_QOS}{acks}"
+
+
+def reading_key(reading):
+    return reading.device_id, reading.timestamp, reading.seq
+
+
+class AckTracker:
+    """Deliveries of readings waiting for their batch to commit, acknowledged by committed()."""
+
+    def __init__(self, client):
+        self.client = client
+        self._lock = threading.Lock()
+        self._connection = 0
+        # key -> [(connection, mid), ...], one per queued reading, oldest first
+        self._pending = {}
+        # Keys of settled readings (committed or rejected), to recognise redeliveries
+        self._committed = OrderedDict()
+        self.acked = 0
+        self.redelivered = 0
+        self.dropped_duplicates = 0
+        self.rejected_count = 0
+
+    def connected(self):
+        """A new connection: deliveries of earlier ones can no longer be acknowledged."""
+        with self._lock:
+            self._connection += 1
+
+    def receive(self, msg, reading):
+        """Whether reading (delivered by msg at QoS 1) should be queued for the database.
+
+        False for a redelivery of a reading that is already queued (its commit
+        acknowledges this delivery) or recently committed (acknowledged now).
+        """
+        key = reading_key(reading)
+        with self._lock:
+            if msg.dup:
+                self.redelivered += 1
+                entries = self._pending.get(key, ())
+                for i, (connection, mid) in enumerate(entries):
+                    if connection != self._connection:
+                        entries[i] = (self._connection, msg.mid)
+                        self.client.defer(msg.mid)
+                        self.dropped_duplicates += 1
+                        return False
+                if key in self._committed:
+                    # paho acknowledges it when on_message returns
+                    self.dropped_duplicates += 1
+                    return False
+            self._pending.setdefault(key, []).append((self._connection, msg.mid))
+            self.client.defer(msg.mid)
+            return True
+
+    def committed(self, readings):
+        """Acknowledge the deliveries of a committed batch."""
+        self._settle(readings)
+
+    def rejected(self, readings):
+        """Acknowledge the deliveries of readings the writer gave up on (dead-lettered, not stored).
+
+        Left unacknowledged they would hold the in-flight window, and the
+        broker would stop sending to this listener.
+        """
+        self.rejected_count += self._settle(readings)
+
+    def _settle(self, readings):
+        acks = []
+        with self._lock:
+            for reading in readings:
+                key = reading_key(reading)
+                entries = self._pending.get(key)
+                if not entries:
+                    # Not delivered at QoS 1 (e.g. injected by replay.py)
+                    continue
+                connection, mid = entries.pop(0)
+                if not entries:
+                    del self._pending[key]
+                # Deliveries of a lost connection are redelivered by the broker instead
+                if connection == self._connection:
+                    acks.append(mid)
+                self._committed[key] = True
+                if len(self._committed) > REDELIVERY_MEMORY:
+                    self._committed.popitem(last=False)
+        for mid in acks:
+            self.client.ack(mid)
+        self.acked += len(acks)
+        return len(acks)
+
+    def format_report(self):
+        with self._lock:
+            waiting = sum(len(entries) for entries in self._pending.values())
+        return (f"Acks: {self.acked} sent ({self.rejected_count} for rejected readings), {waiting} waiting "
+                f"for commit, {self.redelivered} redelivered, {self.dropped_duplicates} duplicate(s) not stored")
@@ -1,32 +1,43 @@
 #!/usr/bin/env python3
 """
 ESP32 Simulator - Publishes test boiler and zone data to MQTT broker.
+
+Like the firmware, it follows mode commands: broadcasts on MQTT_CONTROL_TOPIC
+and commands addressed to DEVICE_ID on MQTT_CONTROL_TOPIC/<DEVICE_ID>, and
+acknowledges every command carrying a "command_id" on MQTT_ACK_TOPIC/<DEVICE_ID>
+(see fleet_control.py). The mode is sent with each reading as is_demo.
 """
 
 import json
 import time
 import random
 import paho.mqtt.client as mqtt
-from datetime import datetime
+from datetime import datetime, timezone
 import os
 
+from fleet_control import MQTT_ACK_TOPIC, MQTT_CONTROL_TOPIC, device_control_topic
+
 # Configuration
 MQTT_BROKER = os.getenv("MQTT_BROKER", "192.168.1.245")
 MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
 MQTT_TOPIC = os.getenv("MQTT_TOPIC", "boilerstat/reading")
 PUBLISH_INTERVAL = 5  # seconds
+# Device name sent with each reading; mode commands can be addressed to it
+DEVICE_ID = os.getenv("DEVICE_ID", "default")
+# Number of heating zones to simulate
+ZONE_COUNT = int(os.getenv("ZONE_COUNT", "6"))
 
 
 def generate_reading():
     """Generate a boiler reading with targeted utilization rates."""
-    # Target utilization rates: Zone N = N * 10% (Zone 1=10%, Zone 2=20%, etc.)
-    # Burner target: 50% utilization
-    zone_target_utilization = [0.10, 0.20, 0.30, 0.40, 0.50, 0.60]
+    # Target utilization rates: Zone N = N * 10% (Zone 1=10%, Zone 2=20%, etc.),
+    # wrapping after Zone 9. Burner target: 50% utilization
+    zone_target_utilization = [((i % 9) + 1) / 10 for i in range(ZONE_COUNT)]
     burner_target_utilization = 0.50
     
     # Generate zone states based on target utilization with ±20% variation
     zones = []
-    for i in range(6):
+    for i in range(ZONE_COUNT):
         target_rate = zone_target_utilization[i]
         
         # Add ±20% variation (of the target rate itself)
@@ -54,15 +65,12 @@ def generate_reading():
         burner = 1
     
     reading = {
+        "device_id": DEVICE_ID,
         "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         "boiler_state": burner,
-        "zone_1": zones[0],
-        "zone_2": zones[1],
-        "zone_3": zones[2],
-        "zone_4": zones[3],
-        "zone_5": zones[4],
-        "zone_6": zones[5]
     }
+    for i, zone in enumerate(zones, start=1):
+        reading[f"zone_{i}"] = zone
     return reading
 
 
@@ -70,10 +78,38 @@ def on_connect(client, userdata, flags, rc):
     """Callback for when the client connects to the broker."""
     if rc == 0:
         print(f"Connected to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}")
+        client.subscribe(MQTT_CONTROL_TOPIC, qos=0)
+        # Addressed commands at QoS 1, as the firmware subscribes to them
+        client.subscribe(device_control_topic(DEVICE_ID), qos=1)
     else:
         print(f"Connection failed with code {rc}")
 
 
+def on_message(client, userdata, msg):
+    """Apply a mode command and acknowledge it if it carries a command_id."""
+    try:
+        command = json.loads(msg.payload.decode())
+    except ValueError:
+        print(f"Ignoring control message that is not JSON: {msg.payload[:100]!r}")
+        return
+    if not isinstance(command, dict):
+        return
+    demo_mode = command.get('demo_mode')
+    applied = isinstance(demo_mode, bool)
+    if applied and demo_mode != userdata['demo_mode']:
+        userdata['demo_mode'] = demo_mode
+        print(f"Mode changed to: {'DEMO' if demo_mode else 'PRODUCTION'}")
+    command_id = command.get('command_id')
+    if isinstance(command_id, str):
+        # Repeats of a retried command are acknowledged again
+        client.publish(f"{MQTT_ACK_TOPIC}/{DEVICE_ID}", json.dumps({
+            'command_id': command_id,
+            'device_id': DEVICE_ID,
+            'status': 'ok' if applied else 'error',
+            'demo_mode': userdata['demo_mode'],
+        }), qos=1)
+
+
 def on_publish(client, userdata, mid):
     """Callback for when a message is published."""
     pass
@@ -83,9 +119,12 @@ def main():
     """Main function to simulate ESP32 publishing data."""
 
     # Create MQTT client
-    client = mqtt.Client()
+    # Mode set by control commands (on_message, on the network thread)
+    state = {'demo_mode': False}
+    client = mqtt.Client(userdata=state)
     client.on_connect = on_connect
     client.on_publish = on_publish
+    client.on_message = on_message
 
     try:
         # Connect to broker
@@ -93,7 +132,7 @@ def main():
         client.connect(MQTT_BROKER, MQTT_PORT, 60)
         client.loop_start()
 
-        print(f"Publishing to topic: {MQTT_TOPIC}")
+        print(f"Publishing to topic: {MQTT_TOPIC} as device {DEVICE_ID}")
         print(f"Interval: {PUBLISH_INTERVAL} seconds")
         print("Press Ctrl+C to stop\n")
 
@@ -101,15 +140,18 @@ def main():
         count = 1
         while True:
             reading = generate_reading()
+            # Latency tracing: per-device sequence number and UTC send time
+            reading["is_demo"] = state['demo_mode']
+            reading["seq"] = count
+            reading["sent_at"] = datetime.now(timezone.utc).isoformat(timespec='milliseconds')
             payload = json.dumps(reading)
 
             result = client.publish(MQTT_TOPIC, payload)
 
             if result.rc == mqtt.MQTT_ERR_SUCCESS:
                 print(f"[{count}] Published at {reading['timestamp']}")
-                print(f"    Boiler: {reading['boiler_state']} | Zones: "
-                      f"{reading['zone_1']} {reading['zone_2']} {reading['zone_3']} "
-                      f"{reading['zone_4']} {reading['zone_5']} {reading['zone_6']}")
+                zones = ' '.join(str(reading[f'zone_{i}']) for i in range(1, ZONE_COUNT + 1))
+                print(f"    Boiler: {reading['boiler_state']} | Zones: {zones}")
             else:
                 print(f"[{count}] Publish failed with code {result.rc}")
 
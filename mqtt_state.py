@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+Shared MQTT-backed state for the BoilerStat dashboard API.
+
+Exactly one MqttState per deployment subscribes to the data topic and keeps
+the current ESP32 mode (overall and per device) and the latest reading. It
+writes that state into a small memory-mapped file so every API worker
+process can read it without opening its own MQTT subscription. The raw
+payloads of recent readings go to a per-device ring buffer in a second
+shared file (see message_buffer.py), and every reading is counted into the
+live rolling utilization windows published to a third (see rolling.py).
+Per-device modes go to a fourth on the same timer, so the per-reading
+state write stays small however many devices report. Every instance also
+listens for control acknowledgements so it can send
+device-addressed commands (see fleet_control.py).
+
+Under gunicorn the subscribing instance runs in a dedicated process
+(python3 mqtt_state.py --supervise, started by gunicorn.conf.py), which
+restarts it whenever it exits.
+"""
+
+import argparse
+import fcntl
+import json
+import mmap
+import os
+import signal
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import paho.mqtt.client as mqtt
+
+from fleet_control import FleetCommander, ack_subscription, is_ack_topic
+from latency import LatencyTracker, parse_sent_at
+from message_buffer import MessageBuffer
+from readings import Reading
+from rolling import ROLLING_PUBLISH_SECONDS, ROLLING_STATE_FILE, ROLLING_STATE_SIZE, RollingUtilization
+from storage import DEFAULT_DEVICE_ID
+from zones import zone_dict, zones_from_payload
+
+MQTT_BROKER = os.getenv("MQTT_BROKER", "192.168.1.245")
+MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
+MQTT_CONTROL_TOPIC = os.getenv("MQTT_CONTROL_TOPIC", "boilerstat/control")
+MQTT_DATA_TOPIC = os.getenv("MQTT_DATA_TOPIC", "boilerstat/reading")
+
+# /dev/shm keeps the state file in RAM on Linux; fall back to the temp dir elsewhere
+_default_state_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+STATE_FILE = os.getenv("BOILERSTAT_STATE_FILE", os.path.join(_default_state_dir, "boilerstat-state"))
+STATE_SIZE = int(os.getenv("BOILERSTAT_STATE_SIZE", "65536"))
+# Minimum seconds between latency summaries written to the shared state
+LATENCY_SNAPSHOT_SECONDS = float(os.getenv("LATENCY_SNAPSHOT_SECONDS", "1.0"))
+# Per-device modes, published with the rolling windows every ROLLING_PUBLISH_SECONDS;
+# beyond MODE_MAX_DEVICES the least recently heard device is dropped
+MODE_MAX_DEVICES = int(os.getenv("MODE_MAX_DEVICES", "1000"))
+MODE_STATE_FILE = os.getenv("MODE_STATE_FILE", os.path.join(_default_state_dir, "boilerstat-modes"))
+MODE_STATE_SIZE = int(os.getenv("MODE_STATE_SIZE", str(256 * 1024)))
+# Seconds before a supervised subscriber process that exited is started again
+SUBSCRIBER_RESTART_SECONDS = float(os.getenv("SUBSCRIBER_RESTART_SECONDS", "5"))
+
+
+class SharedSnapshot:
+    """A single JSON document in a fixed-size memory-mapped file.
+
+    One process writes, any number of processes read. The header holds a
+    version counter so readers only re-parse the document when it changes.
+    """
+
+    HEADER = struct.Struct('<QI')  # version, payload length
+
+    def __init__(self, path=STATE_FILE, size=STATE_SIZE):
+        self.path = path
+        self.size = size
+        self._mm = None
+        self._fd = None
+        self._cached_version = None
+        self._cached = {}
+
+    def _open(self, create):
+        if self._mm is not None:
+            return True
+        if not create and not os.path.exists(self.path):
+            return False
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if create:
+            os.ftruncate(fd, self.size)
+        elif os.fstat(fd).st_size < self.HEADER.size:
+            os.close(fd)
+            return False
+        self._fd = fd
+        self._mm = mmap.mmap(fd, os.fstat(fd).st_size)
+        return True
+
+    def create(self):
+        """Create (or reset) the backing file. Called by the owning process."""
+        self._open(create=True)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            # The version carries on, so readers of a restarted subscriber's file do not keep a stale cache
+            version, _ = self.HEADER.unpack_from(self._mm, 0)
+            self.HEADER.pack_into(self._mm, 0, version + 1, 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def write(self, document):
+        """Replace the stored document."""
+        payload = json.dumps(document, default=str).encode()
+        if self.HEADER.size + len(payload) > len(self._mm):
+            raise ValueError(f"State document of {len(payload)} bytes exceeds {self.path}")
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            version, _ = self.HEADER.unpack_from(self._mm, 0)
+            self._mm[self.HEADER.size:self.HEADER.size + len(payload)] = payload
+            self.HEADER.pack_into(self._mm, 0, version + 1, len(payload))
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def read(self):
+        """Return the stored document, or {} if nothing has been written yet."""
+        if not self._open(create=False):
+            return {}
+        fcntl.flock(self._fd, fcntl.LOCK_SH)
+        try:
+            version, length = self.HEADER.unpack_from(self._mm, 0)
+            if version != self._cached_version:
+                raw = self._mm[self.HEADER.size:self.HEADER.size + length]
+                self._cached = json.loads(raw) if length else {}
+                self._cached_version = version
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return self._cached
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            os.close(self._fd)
+            self._mm = None
+            self._fd = None
+
+
+def reading_to_status(payload):
+    """Normalize an ESP32 reading payload to the /api/status response shape."""
+    status = {
+        'timestamp': payload.get('timestamp'),
+        # Handle both old "boiler_state" and new "burner" field names
+        'burner': payload.get('burner', payload.get('boiler_state', 0)),
+    }
+    try:
+        status.update(zone_dict(zones_from_payload(payload)))
+    except (KeyError, ValueError):
+        pass
+    return status
+
+
+class MqttState:
+    """MQTT client plus the shared mode/latest-reading state.
+
+    With subscribe=True this instance owns the state: it subscribes to the
+    data topic and writes every update to the shared snapshot. With
+    subscribe=False it only reads the snapshot and publishes control
+    messages, so adding API workers does not add MQTT subscriptions.
+    """
+
+    def __init__(self, snapshot=None, subscribe=True, messages=None):
+        self.snapshot = snapshot or SharedSnapshot()
+        self.messages = messages or MessageBuffer()
+        self.subscribe = subscribe
+        self.client = None
+        self._lock = threading.Lock()
+        self._state = {'mode': 'unknown', 'reading': None, 'updated_at': None, 'latency': None}
+        # {device_id: mode}, least recently heard first; published by _publish_shared()
+        self._device_modes = OrderedDict()
+        self._modes_changed = False
+        self.modes_snapshot = SharedSnapshot(MODE_STATE_FILE, MODE_STATE_SIZE)
+        # Device -> API receive latency, seen by the subscribing instance
+        self.latency = LatencyTracker()
+        self._latency_summary_at = 0.0
+        # Device-addressed commands sent from this process
+        self.fleet = FleetCommander(self._publish_command)
+        # Live sliding windows, counted by the subscribing instance and published for every worker
+        self.rolling = RollingUtilization()
+        self.rolling_snapshot = SharedSnapshot(ROLLING_STATE_FILE, ROLLING_STATE_SIZE)
+        self._stopping = threading.Event()
+
+    def start(self):
+        """Connect to the broker and start the network loop in a background thread."""
+        self._prepare()
+        try:
+            self.client.connect(MQTT_BROKER, MQTT_PORT, 60)
+            self.client.loop_start()
+            return True
+        except Exception as e:
+            print(f"Failed to connect to MQTT broker: {e}")
+            return False
+
+    def run(self):
+        """Run the network loop in the calling thread until stop() (the dedicated subscriber process).
+
+        Connecting, including the first time, is retried until the broker
+        answers. An exception escaping a callback ends the loop, and with
+        it the process, so the supervisor starts a fresh one.
+        """
+        self._prepare()
+        self.client.connect_async(MQTT_BROKER, MQTT_PORT, 60)
+        self.client.loop_forever(retry_first_connection=True)
+
+    def _prepare(self):
+        if self.subscribe:
+            self.snapshot.create()
+            self.snapshot.write(self._state)
+            self.messages.create()
+            self.rolling_snapshot.create()
+            self.rolling_snapshot.write(self.rolling.snapshot(time.time()))
+            self.modes_snapshot.create()
+            self.modes_snapshot.write({})
+            threading.Thread(target=self._publish_shared, name="state-publisher", daemon=True).start()
+
+        self.client = mqtt.Client()
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+
+    def stop(self):
+        self._stopping.set()
+        if self.client is not None:
+            self.client.loop_stop()
+            self.client.disconnect()
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            print("✅ Connected to MQTT broker for web interface")
+            if self.subscribe:
+                client.subscribe(MQTT_DATA_TOPIC)
+            client.subscribe(ack_subscription(), qos=1)
+        else:
+            print(f"❌ Failed to connect to MQTT broker. Return code: {rc}")
+
+    def on_message(self, client, userdata, msg):
+        # paho 1.6 re-raises callback exceptions, which would end the network
+        # thread and leave every worker reading stale state
+        try:
+            if is_ack_topic(msg.topic):
+                self.on_ack(msg)
+            elif msg.topic == MQTT_DATA_TOPIC:
+                self.on_reading(msg)
+        except Exception as e:
+            print(f"Error processing MQTT message on {msg.topic}: {e}")
+
+    def on_reading(self, msg):
+        """Data topic message: record the raw payload, latency, live windows and the shared state."""
+        data = json.loads(msg.payload.decode())
+        if not isinstance(data, dict):
+            print(f"Ignoring MQTT reading that is not a JSON object: {msg.payload[:100]!r}")
+            return
+        received_at = datetime.now(timezone.utc)
+        self.messages.append(str(data.get('device_id', DEFAULT_DEVICE_ID)), msg.payload,
+                             received_at.timestamp())
+        self.latency.observe_arrival('device_to_api', data.get('device_id', DEFAULT_DEVICE_ID),
+                                     data.get('seq'), parse_sent_at(data),
+                                     received_at.replace(tzinfo=None))
+        # Malformed readings (no timestamp or zones) are not counted, as the logger rejects them
+        try:
+            reading = Reading.from_payload(data)
+        except (KeyError, ValueError):
+            reading = None
+        if reading is not None:
+            self.rolling.add(str(reading.device_id), reading.burner, reading.zones, received_at.timestamp())
+
+        with self._lock:
+            # The latency summary is rebuilt at most every LATENCY_SNAPSHOT_SECONDS
+            latency = self._state.get('latency')
+            now = time.monotonic()
+            if now - self._latency_summary_at >= LATENCY_SNAPSHOT_SECONDS:
+                latency = self.latency.summary()
+                self._latency_summary_at = now
+
+            # Update current mode based on ESP32 flag
+            mode = "demo" if data.get('is_demo', False) else "production"
+            self._set_device_mode(str(data.get('device_id', DEFAULT_DEVICE_ID)), mode)
+            self._state = {
+                'mode': mode,
+                'reading': reading.to_status() if reading is not None else reading_to_status(data),
+                'updated_at': received_at.isoformat(),
+                'latency': latency,
+            }
+            self.snapshot.write(self._state)
+
+    def _set_device_mode(self, device_id, mode):
+        """Record a device's mode (caller holds _lock); the least recently heard beyond MODE_MAX_DEVICES is dropped."""
+        self._device_modes[device_id] = mode
+        self._device_modes.move_to_end(device_id)
+        while len(self._device_modes) > MODE_MAX_DEVICES:
+            self._device_modes.popitem(last=False)
+        self._modes_changed = True
+
+    def _publish_shared(self):
+        """Write the rolling windows and device modes for the workers every ROLLING_PUBLISH_SECONDS.
+
+        Publishing on a timer rather than per reading also expires the
+        windows of devices that went quiet, and keeps the cost of a reading
+        independent of the number of devices.
+        """
+        while not self._stopping.wait(ROLLING_PUBLISH_SECONDS):
+            try:
+                self.rolling_snapshot.write(self.rolling.snapshot(time.time()))
+            except Exception as e:
+                print(f"Error publishing rolling utilization: {e}")
+            with self._lock:
+                modes = dict(self._device_modes) if self._modes_changed else None
+                self._modes_changed = False
+            if modes is not None:
+                try:
+                    self.modes_snapshot.write(modes)
+                except Exception as e:
+                    print(f"Error publishing device modes: {e}")
+
+    def on_ack(self, msg):
+        """Control acknowledgement: complete a waiting command and record the device's new mode."""
+        data = json.loads(msg.payload.decode())
+        if not isinstance(data, dict):
+            print(f"Ignoring MQTT ack that is not a JSON object: {msg.payload[:100]!r}")
+            return
+        self.fleet.handle_ack(data)
+
+        if self.subscribe and data.get('status', 'ok') == 'ok' and 'demo_mode' in data:
+            device_id = data.get('device_id') or msg.topic.rsplit('/', 1)[-1]
+            with self._lock:
+                self._set_device_mode(device_id, "demo" if data['demo_mode'] else "production")
+
+    @property
+    def mode(self):
+        return self.snapshot.read().get('mode', 'unknown')
+
+    @property
+    def device_modes(self):
+        """{device_id: mode} from each device's latest reading or acknowledged command.
+
+        Published every ROLLING_PUBLISH_SECONDS, for up to MODE_MAX_DEVICES devices.
+        """
+        return self.modes_snapshot.read()
+
+    @property
+    def latest_reading(self):
+        return self.snapshot.read().get('reading')
+
+    @property
+    def latency_summary(self):
+        """LatencyTracker.summary() of the subscribing instance, or None."""
+        return self.snapshot.read().get('latency')
+
+    @property
+    def rolling_utilization(self):
+        """RollingUtilization.snapshot() last published by the subscribing instance, or {}."""
+        return self.rolling_snapshot.read()
+
+    def is_connected(self):
+        return self.client is not None and self.client.is_connected()
+
+    def publish_control(self, message):
+        """Publish a control message. Returns True if the client accepted it."""
+        if not self.is_connected():
+            return False
+        result = self.client.publish(MQTT_CONTROL_TOPIC, json.dumps(message))
+        return result.rc == mqtt.MQTT_ERR_SUCCESS
+
+    def _publish_command(self, topic, payload):
+        if not self.is_connected():
+            return False
+        return self.client.publish(topic, payload, qos=1).rc == mqtt.MQTT_ERR_SUCCESS
+
+
+def run_subscriber():
+    """Own the shared state in this process until SIGTERM."""
+    state = MqttState(subscribe=True)
+    signal.signal(signal.SIGTERM, lambda signum, frame: state.stop())
+    print(f"MQTT state subscriber running (PID {os.getpid()})")
+    state.run()
+
+
+def supervise():
+    """Run the subscriber as a child process, starting it again whenever it exits.
+
+    Exits, stopping the child, on SIGTERM or when the parent (the gunicorn
+    master) has gone.
+    """
+    parent = os.getppid()
+    stopping = False
+    child = None
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while not stopping and os.getppid() == parent:
+        if child is None:
+            child = subprocess.Popen([sys.executable, os.path.abspath(__file__)])
+        try:
+            code = child.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            continue
+        child = None
+        if not stopping:
+            print(f"MQTT state subscriber exited with code {code}; "
+                  f"restarting in {SUBSCRIBER_RESTART_SECONDS:.0f}s")
+            time.sleep(SUBSCRIBER_RESTART_SECONDS)
+    if child is not None:
+        child.terminate()
+        try:
+            child.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            child.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the dashboard API's shared MQTT state subscriber")
+    parser.add_argument("--supervise", action="store_true",
+                        help="Run the subscriber in a child process and restart it when it exits")
+    if parser.parse_args().supervise:
+        supervise()
+    else:
+        run_subscriber()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+-- BoilerStat change feed
+-- Publishes new raw readings and finished minute aggregations with NOTIFY so
+-- clients can LISTEN instead of polling the tables (see change_feed.py).
+-- Safe to re-run against an existing database: psql -f 02-change-feed.sql
+
+-- New raw reading: the full row as JSON on channel boilerstat_readings
+CREATE OR REPLACE FUNCTION notify_boiler_reading() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('boilerstat_readings', row_to_json(NEW)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS boiler_readings_notify ON boiler_readings;
+CREATE TRIGGER boiler_readings_notify
+    AFTER INSERT ON boiler_readings
+    FOR EACH ROW EXECUTE FUNCTION notify_boiler_reading();
+
+-- Minute aggregated (insert or re-aggregation) on channel boilerstat_aggregates
+CREATE OR REPLACE FUNCTION notify_minute_utilization() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('boilerstat_aggregates', json_build_object(
+        'minute_timestamp', NEW.minute_timestamp,
+        'sample_count', NEW.sample_count,
+        'is_demo', NEW.is_demo
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS minute_utilization_notify ON minute_utilization;
+CREATE TRIGGER minute_utilization_notify
+    AFTER INSERT OR UPDATE ON minute_utilization
+    FOR EACH ROW EXECUTE FUNCTION notify_minute_utilization();
+
+SELECT 'BoilerStat change feed triggers created successfully!' AS status;
@@ -0,0 +1,65 @@
+-- BoilerStat burner cycle analytics
+-- Tables maintained incrementally by the aggregator's cycle analytics stage
+-- (cycle_analytics.py). Safe to re-run against an existing database.
+
+-- Readings are tracked per device so several boilers can share one database
+ALTER TABLE boiler_readings ADD COLUMN IF NOT EXISTS device_id TEXT NOT NULL DEFAULT 'default';
+COMMENT ON COLUMN boiler_readings.device_id IS 'Identifier of the reporting device';
+
+-- One row per completed burner on-run or off-run
+CREATE TABLE IF NOT EXISTS burner_cycles (
+    id BIGSERIAL PRIMARY KEY,
+    device_id TEXT NOT NULL,
+    burner_on BOOLEAN NOT NULL,
+    started_at TIMESTAMP NOT NULL,
+    ended_at TIMESTAMP NOT NULL,
+    duration_seconds REAL NOT NULL CHECK (duration_seconds >= 0),
+    sample_count INTEGER NOT NULL,
+    trigger_zones SMALLINT[] NOT NULL DEFAULT '{}',
+    short_cycle BOOLEAN NOT NULL DEFAULT FALSE,
+    interrupted BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE INDEX IF NOT EXISTS idx_burner_cycles_device_started
+    ON burner_cycles (device_id, started_at);
+
+COMMENT ON TABLE burner_cycles IS 'Completed burner runs detected from state transitions in boiler_readings';
+COMMENT ON COLUMN burner_cycles.burner_on IS 'TRUE for a burner on-run, FALSE for an off-run';
+COMMENT ON COLUMN burner_cycles.trigger_zones IS 'Zones calling for heat when the burner turned on';
+COMMENT ON COLUMN burner_cycles.short_cycle IS 'On-run shorter than SHORT_CYCLE_SECONDS';
+COMMENT ON COLUMN burner_cycles.interrupted IS 'Run boundary not observed (reading gap or service start); excluded from statistics';
+
+-- Per-device, per-hour cycle statistics (runs attributed to the hour they started)
+CREATE TABLE IF NOT EXISTS burner_cycle_hourly (
+    device_id TEXT NOT NULL,
+    hour_timestamp TIMESTAMP NOT NULL,
+    cycle_count INTEGER NOT NULL,
+    short_cycle_count INTEGER NOT NULL,
+    on_seconds REAL NOT NULL,
+    mean_on_seconds REAL,
+    p95_on_seconds REAL,
+    mean_off_seconds REAL,
+    updated_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (device_id, hour_timestamp)
+);
+
+COMMENT ON TABLE burner_cycle_hourly IS 'Hourly burner cycle count and run-length statistics';
+
+-- Open run per device, so detection resumes where it left off
+CREATE TABLE IF NOT EXISTS burner_cycle_state (
+    device_id TEXT PRIMARY KEY,
+    burner_on BOOLEAN NOT NULL,
+    started_at TIMESTAMP NOT NULL,
+    last_timestamp TIMESTAMP NOT NULL,
+    sample_count INTEGER NOT NULL,
+    trigger_zones SMALLINT[] NOT NULL DEFAULT '{}',
+    start_observed BOOLEAN NOT NULL
+);
+
+-- Highest boiler_readings.id processed by each incremental stage
+CREATE TABLE IF NOT EXISTS analytics_watermark (
+    stage TEXT PRIMARY KEY,
+    last_reading_id BIGINT NOT NULL
+);
+
+SELECT 'BoilerStat burner cycle tables created successfully!' AS status;
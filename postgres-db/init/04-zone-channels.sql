@@ -0,0 +1,67 @@
+-- BoilerStat zone-count-agnostic schema
+-- Replaces the fixed zone_1..zone_6 columns with a zone bitmask on raw
+-- readings and a per-zone utilization array on minute aggregates, and keys
+-- minute aggregates by device. After this migration a device may report any
+-- number of zones (up to 63) without further schema changes.
+-- Safe to re-run against an existing database.
+
+-- Raw readings: bit i of zone_mask is zone i+1
+ALTER TABLE boiler_readings ADD COLUMN IF NOT EXISTS zone_mask BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE boiler_readings ADD COLUMN IF NOT EXISTS zone_count SMALLINT NOT NULL DEFAULT 6
+    CHECK (zone_count BETWEEN 0 AND 63);
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_name = 'boiler_readings' AND column_name = 'zone_1') THEN
+        UPDATE boiler_readings SET zone_mask =
+            zone_1 | (zone_2 << 1) | (zone_3 << 2) | (zone_4 << 3) | (zone_5 << 4) | (zone_6 << 5);
+        ALTER TABLE boiler_readings
+            DROP COLUMN zone_1, DROP COLUMN zone_2, DROP COLUMN zone_3,
+            DROP COLUMN zone_4, DROP COLUMN zone_5, DROP COLUMN zone_6;
+    END IF;
+END $$;
+
+COMMENT ON COLUMN boiler_readings.zone_mask IS 'Zone heating calls as a bitmask: bit i = zone i+1 (1=on)';
+COMMENT ON COLUMN boiler_readings.zone_count IS 'Number of zones reported by the device';
+
+-- Minute aggregates: per-device, one utilization value per zone
+ALTER TABLE minute_utilization ADD COLUMN IF NOT EXISTS device_id TEXT NOT NULL DEFAULT 'default';
+ALTER TABLE minute_utilization ADD COLUMN IF NOT EXISTS zone_utilization REAL[] NOT NULL DEFAULT '{}';
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_name = 'minute_utilization' AND column_name = 'zone_1_utilization') THEN
+        UPDATE minute_utilization SET zone_utilization = ARRAY[
+            zone_1_utilization, zone_2_utilization, zone_3_utilization,
+            zone_4_utilization, zone_5_utilization, zone_6_utilization]::real[];
+        ALTER TABLE minute_utilization
+            DROP COLUMN zone_1_utilization, DROP COLUMN zone_2_utilization, DROP COLUMN zone_3_utilization,
+            DROP COLUMN zone_4_utilization, DROP COLUMN zone_5_utilization, DROP COLUMN zone_6_utilization;
+    END IF;
+END $$;
+
+ALTER TABLE minute_utilization DROP CONSTRAINT IF EXISTS minute_utilization_minute_timestamp_key;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_minute_utilization_device_minute
+    ON minute_utilization (device_id, minute_timestamp);
+CREATE INDEX IF NOT EXISTS idx_minute_utilization_minute
+    ON minute_utilization (minute_timestamp);
+
+COMMENT ON COLUMN minute_utilization.device_id IS 'Identifier of the reporting device';
+COMMENT ON COLUMN minute_utilization.zone_utilization IS 'Utilization percentage (0-100) per zone; element i is zone i';
+
+-- Include the device in aggregate notifications
+CREATE OR REPLACE FUNCTION notify_minute_utilization() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('boilerstat_aggregates', json_build_object(
+        'device_id', NEW.device_id,
+        'minute_timestamp', NEW.minute_timestamp,
+        'sample_count', NEW.sample_count,
+        'is_demo', NEW.is_demo
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT 'BoilerStat zone channel schema applied successfully!' AS status;
@@ -0,0 +1,19 @@
+-- BoilerStat latency tracing
+-- Stage timestamps for measuring the ingest-to-dashboard path: the device
+-- sequence number and send time from the payload, the time the logger
+-- received the reading, and the time each minute aggregate was written.
+-- Safe to re-run against an existing database.
+
+ALTER TABLE boiler_readings ADD COLUMN IF NOT EXISTS seq BIGINT;
+ALTER TABLE boiler_readings ADD COLUMN IF NOT EXISTS sent_at TIMESTAMP(3);
+ALTER TABLE boiler_readings ADD COLUMN IF NOT EXISTS logged_at TIMESTAMP(3);
+
+COMMENT ON COLUMN boiler_readings.seq IS 'Per-device message sequence number from the payload (NULL if not sent)';
+COMMENT ON COLUMN boiler_readings.sent_at IS 'UTC time the device published the reading (device clock)';
+COMMENT ON COLUMN boiler_readings.logged_at IS 'UTC time the MQTT logger received the reading';
+
+ALTER TABLE minute_utilization ADD COLUMN IF NOT EXISTS aggregated_at TIMESTAMP(3) DEFAULT NOW();
+
+COMMENT ON COLUMN minute_utilization.aggregated_at IS 'UTC time the aggregate was last written';
+
+SELECT 'BoilerStat latency tracing schema applied successfully!' AS status;
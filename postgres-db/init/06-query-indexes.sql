@@ -0,0 +1,21 @@
+-- BoilerStat indexes for long retention and many devices
+-- Found by query_plan_check.py against months of synthetic data: without
+-- these, minute aggregation, backfill, retention cleanup, /api/status and
+-- /api/cycles fall back to sequential scans once the tables grow.
+-- Safe to re-run against an existing database.
+
+-- Minute aggregation, backfill and cleanup filter raw readings by time
+CREATE INDEX IF NOT EXISTS idx_boiler_readings_timestamp
+    ON boiler_readings (timestamp);
+
+-- Latest reading per device, per-device export
+CREATE INDEX IF NOT EXISTS idx_boiler_readings_device_timestamp
+    ON boiler_readings (device_id, timestamp);
+
+-- /api/cycles and cycle export without a device filter
+CREATE INDEX IF NOT EXISTS idx_burner_cycles_started
+    ON burner_cycles (started_at);
+CREATE INDEX IF NOT EXISTS idx_burner_cycle_hourly_hour
+    ON burner_cycle_hourly (hour_timestamp);
+
+SELECT 'BoilerStat query indexes applied successfully!' AS status;
@@ -0,0 +1,28 @@
+-- BoilerStat time-of-day utilization profiles
+-- Sample-weighted utilization per device, local date, local hour and channel
+-- (0 = burner, i = zone i) in each configured time zone (PROFILE_TIMEZONES).
+-- Maintained incrementally by the aggregator as minutes are upserted, and
+-- rebuilt from minute_utilization when a time zone has no buckets yet.
+-- /api/profile and /api/heatmap sum at most days x 24 rows per channel.
+-- Safe to re-run against an existing database.
+
+CREATE TABLE IF NOT EXISTS utilization_profile (
+    timezone TEXT NOT NULL,
+    device_id TEXT NOT NULL,
+    local_date DATE NOT NULL,
+    hour SMALLINT NOT NULL CHECK (hour BETWEEN 0 AND 23),
+    channel SMALLINT NOT NULL CHECK (channel BETWEEN 0 AND 63),
+    utilization_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    sample_weight BIGINT NOT NULL DEFAULT 0,
+    minute_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (timezone, device_id, local_date, hour, channel)
+);
+
+COMMENT ON TABLE utilization_profile IS 'Hour-of-day utilization buckets per device and local date, for profiles and heatmaps';
+COMMENT ON COLUMN utilization_profile.timezone IS 'IANA time zone the local date and hour are in';
+COMMENT ON COLUMN utilization_profile.channel IS '0 = burner, i = zone i';
+COMMENT ON COLUMN utilization_profile.utilization_sum IS 'Sum of minute utilization (0-100) x minute sample_count';
+COMMENT ON COLUMN utilization_profile.sample_weight IS 'Sum of minute sample_count; utilization = utilization_sum / sample_weight';
+COMMENT ON COLUMN utilization_profile.minute_count IS 'Production minutes folded into the bucket';
+
+SELECT 'BoilerStat utilization profile schema applied successfully!' AS status;
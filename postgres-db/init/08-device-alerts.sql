@@ -0,0 +1,30 @@
+-- BoilerStat device alerts
+-- Written by the logger's streaming anomaly detector (anomaly_detection.py):
+-- one row per alert, resolved_at set when the condition ends.
+-- Safe to re-run against an existing database.
+
+CREATE TABLE IF NOT EXISTS device_alerts (
+    id SERIAL PRIMARY KEY,
+    device_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    channel SMALLINT,
+    severity TEXT NOT NULL,
+    message TEXT,
+    raised_at TIMESTAMP NOT NULL,
+    resolved_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Open alerts are looked up on resolve and at logger startup
+CREATE INDEX IF NOT EXISTS idx_device_alerts_open
+    ON device_alerts (device_id, kind) WHERE resolved_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_device_alerts_raised
+    ON device_alerts (raised_at);
+
+COMMENT ON TABLE device_alerts IS 'Anomalies detected on the live reading stream';
+COMMENT ON COLUMN device_alerts.kind IS 'burner_stuck_on, long_zone_call, burner_without_call, relay_chatter or device_silent';
+COMMENT ON COLUMN device_alerts.channel IS '0 = burner, i = zone i; NULL for device-level alerts';
+COMMENT ON COLUMN device_alerts.raised_at IS 'UTC reading time at which the condition was detected';
+COMMENT ON COLUMN device_alerts.resolved_at IS 'UTC reading time at which the condition ended; NULL while open';
+
+SELECT 'BoilerStat device alert schema applied successfully!' AS status;
@@ -0,0 +1,24 @@
+-- BoilerStat data coverage index
+-- Per device, the minutes with raw readings (kind 'raw') and the minutes with a
+-- minute aggregate (kind 'aggregated'), stored as merged [start_minute, end_minute)
+-- intervals. Extended in the same transaction as every reading insert and minute
+-- upsert, trimmed by raw data retention, and rebuilt by the aggregator when empty.
+-- Gap queries, the backfill work list and /api/coverage read O(gaps) rows.
+-- Safe to re-run against an existing database.
+
+CREATE TABLE IF NOT EXISTS data_coverage (
+    device_id TEXT NOT NULL,
+    kind TEXT NOT NULL CHECK (kind IN ('raw', 'aggregated')),
+    start_minute TIMESTAMP NOT NULL,
+    end_minute TIMESTAMP NOT NULL CHECK (end_minute > start_minute),
+    PRIMARY KEY (device_id, kind, start_minute)
+);
+
+-- Backfill scans: intervals of a kind ending after a point in time
+CREATE INDEX IF NOT EXISTS idx_data_coverage_end ON data_coverage(kind, end_minute);
+
+COMMENT ON TABLE data_coverage IS 'Merged per-device intervals of minutes with raw readings and with minute aggregates';
+COMMENT ON COLUMN data_coverage.kind IS 'raw = boiler_readings present, aggregated = minute_utilization row present';
+COMMENT ON COLUMN data_coverage.end_minute IS 'Exclusive end: the minute after the last covered minute';
+
+SELECT 'BoilerStat data coverage schema applied successfully!' AS status;
@@ -0,0 +1,55 @@
+-- BoilerStat hour-packed minute aggregates (MINUTE_LAYOUT=hour)
+-- One row per device and UTC hour holding 60-slot arrays (slot i = minute i
+-- of the hour) of utilization in basis points (0-10000, i.e. percent to two
+-- decimals) for the burner and each zone, plus per-minute sample counts and
+-- a demo-data bit mask. Empty slots are NULL. Replaces minute_utilization's
+-- row per minute, with its tuple header, id, created_at and index entries,
+-- when the hour layout is selected; the aggregator packs existing
+-- minute_utilization rows into it on first start.
+-- Safe to re-run against an existing database.
+
+-- Every aggregated minute rewrites its hour row; free space keeps those
+-- updates on the same page (HOT) since no indexed column changes
+CREATE TABLE IF NOT EXISTS hourly_utilization (
+    device_id TEXT NOT NULL,
+    hour_start TIMESTAMP NOT NULL CHECK (hour_start = date_trunc('hour', hour_start)),
+    burner_bp SMALLINT[] NOT NULL CHECK (cardinality(burner_bp) = 60),
+    zone_bp SMALLINT[] NOT NULL DEFAULT '{}'
+        CHECK (array_ndims(zone_bp) IS NULL OR (array_ndims(zone_bp) = 2 AND array_length(zone_bp, 2) = 60)),
+    sample_counts SMALLINT[] NOT NULL CHECK (cardinality(sample_counts) = 60),
+    demo_mask BIGINT NOT NULL DEFAULT 0,
+    aggregated_at TIMESTAMP(3) DEFAULT NOW(),
+    PRIMARY KEY (device_id, hour_start)
+) WITH (fillfactor = 50);
+
+CREATE INDEX IF NOT EXISTS idx_hourly_utilization_hour ON hourly_utilization(hour_start);
+
+COMMENT ON TABLE hourly_utilization IS 'Minute aggregates packed per device and hour (MINUTE_LAYOUT=hour)';
+COMMENT ON COLUMN hourly_utilization.hour_start IS 'Start of the UTC hour; slot i is minute i of the hour';
+COMMENT ON COLUMN hourly_utilization.burner_bp IS 'Burner utilization per minute in basis points (0-10000), NULL = no aggregate';
+COMMENT ON COLUMN hourly_utilization.zone_bp IS 'zones x 60 array of zone utilization in basis points; element [i][m] is zone i, minute m';
+COMMENT ON COLUMN hourly_utilization.sample_counts IS 'Raw readings aggregated per minute, NULL = no aggregate';
+COMMENT ON COLUMN hourly_utilization.demo_mask IS 'Bit m set when minute m was aggregated from demo data';
+COMMENT ON COLUMN hourly_utilization.aggregated_at IS 'UTC time the row was last written';
+
+-- The minutes of hour rows touching [range_start, range_end) in the shape of
+-- minute_utilization, for /api/export with the hour layout
+CREATE OR REPLACE FUNCTION hourly_utilization_minutes(range_start TIMESTAMP, range_end TIMESTAMP)
+RETURNS TABLE (device_id TEXT, minute_timestamp TIMESTAMP, boiler_utilization NUMERIC(5,2),
+               zone_utilization REAL[], sample_count INTEGER, is_demo INTEGER) AS $$
+    SELECT h.device_id,
+           h.hour_start + (s.slot - 1) * interval '1 minute',
+           (h.burner_bp[s.slot] / 100.0)::numeric(5,2),
+           ARRAY(SELECT (h.zone_bp[z][s.slot] / 100.0)::real
+                 FROM generate_series(1, coalesce(array_length(h.zone_bp, 1), 0)) AS z
+                 WHERE h.zone_bp[z][s.slot] IS NOT NULL
+                 ORDER BY z),
+           h.sample_counts[s.slot]::integer,
+           ((h.demo_mask >> (s.slot - 1)) & 1)::integer
+    FROM hourly_utilization h
+    CROSS JOIN generate_series(1, 60) AS s(slot)
+    WHERE h.hour_start >= date_trunc('hour', range_start) AND h.hour_start < range_end
+      AND h.sample_counts[s.slot] IS NOT NULL
+$$ LANGUAGE sql STABLE;
+
+SELECT 'BoilerStat hourly utilization schema applied successfully!' AS status;
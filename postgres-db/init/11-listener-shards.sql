@@ -0,0 +1,37 @@
+-- BoilerStat listener heartbeats
+-- One row per mqtt_database_logger process, upserted every
+-- LISTENER_HEARTBEAT_SECONDS with its sharding role (LISTENER_SHARDING),
+-- message counters, write backlog and lag. Deleted on clean shutdown, so a
+-- row with an old heartbeat_at is a listener that died. Read by /api/listeners.
+-- Safe to re-run against an existing database.
+
+CREATE TABLE IF NOT EXISTS listener_shards (
+    listener TEXT PRIMARY KEY,
+    mode TEXT NOT NULL CHECK (mode IN ('none', 'hash', 'shared')),
+    shard_index INTEGER,
+    shard_count INTEGER,
+    started_at TIMESTAMP NOT NULL,
+    heartbeat_at TIMESTAMP NOT NULL,
+    heartbeat_seconds REAL NOT NULL,
+    received BIGINT NOT NULL DEFAULT 0,
+    stored BIGINT NOT NULL DEFAULT 0,
+    skipped BIGINT NOT NULL DEFAULT 0,
+    errors BIGINT NOT NULL DEFAULT 0,
+    devices INTEGER NOT NULL DEFAULT 0,
+    queued INTEGER NOT NULL DEFAULT 0,
+    lag_seconds REAL NOT NULL DEFAULT 0,
+    commit_p95_seconds REAL,
+    CHECK (mode <> 'hash' OR (shard_index >= 0 AND shard_index < shard_count))
+);
+
+COMMENT ON TABLE listener_shards IS 'Heartbeat of each MQTT listener process, for /api/listeners';
+COMMENT ON COLUMN listener_shards.listener IS 'LISTENER_NAME (default: container hostname)';
+COMMENT ON COLUMN listener_shards.mode IS 'none = all readings, hash = device-hash shard, shared = MQTT shared subscription';
+COMMENT ON COLUMN listener_shards.received IS 'Messages received since start, including other shards'' devices';
+COMMENT ON COLUMN listener_shards.skipped IS 'Messages for devices of other hash shards';
+COMMENT ON COLUMN listener_shards.stored IS 'Readings committed to boiler_readings';
+COMMENT ON COLUMN listener_shards.queued IS 'Readings received but not yet committed';
+COMMENT ON COLUMN listener_shards.lag_seconds IS 'Age of the oldest uncommitted reading (0 = caught up)';
+COMMENT ON COLUMN listener_shards.commit_p95_seconds IS '95th percentile of receive-to-commit time since start';
+
+SELECT 'BoilerStat listener shard schema applied successfully!' AS status;
@@ -0,0 +1,27 @@
+-- BoilerStat running utilization totals (prefix sums)
+-- One row per device and aggregated production minute holding totals over
+-- every production minute of the device up to and including it, per channel
+-- (array element 1 = burner, element i + 1 = zone i). Totals over any range
+-- are the last row before its end minus the last row before its start, so
+-- /api/totals costs two index lookups however long the range.
+-- Maintained by the aggregator as minutes are upserted, and rebuilt from the
+-- minute aggregates when the table is empty.
+-- Safe to re-run against an existing database.
+
+CREATE TABLE IF NOT EXISTS utilization_totals (
+    device_id TEXT NOT NULL,
+    minute_timestamp TIMESTAMP NOT NULL,
+    minute_count BIGINT NOT NULL,
+    on_minutes DOUBLE PRECISION[] NOT NULL,
+    on_samples DOUBLE PRECISION[] NOT NULL,
+    samples DOUBLE PRECISION[] NOT NULL,
+    PRIMARY KEY (device_id, minute_timestamp)
+);
+
+COMMENT ON TABLE utilization_totals IS 'Running per-channel utilization totals per device and minute, for O(1) range totals';
+COMMENT ON COLUMN utilization_totals.minute_count IS 'Production minutes aggregated up to and including minute_timestamp';
+COMMENT ON COLUMN utilization_totals.on_minutes IS 'Per channel: sum of minute utilization / 100 (minutes on)';
+COMMENT ON COLUMN utilization_totals.on_samples IS 'Per channel: sum of minute utilization / 100 x sample_count';
+COMMENT ON COLUMN utilization_totals.samples IS 'Per channel: sum of sample_count of minutes reporting the channel';
+
+SELECT 'BoilerStat utilization totals schema applied successfully!' AS status;
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Time-of-day utilization profiles for BoilerStat.
+
+Minute aggregates are folded into utilization_profile buckets keyed by
+(device, time zone, local date, local hour, channel), where channel 0 is
+the burner and channel i is zone i. Each bucket holds the sample-weighted
+utilization sum, the sample weight and the number of minutes, so buckets
+add up exactly across days and weekdays. The storage backend applies the
+change of every upserted minute to its bucket in the same transaction, so
+the profile stays current at O(1) cost per minute.
+
+Local dates and hours are computed with zoneinfo for every zone in
+PROFILE_TIMEZONES. Across a DST change the repeated local hour collects the
+samples of both UTC hours and the skipped hour has no samples; weighted
+means stay correct either way. An /api/profile or /api/heatmap request
+reads at most days x 24 buckets per channel, however many readings the
+window contains.
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+# Time zones profiles are maintained in; the first is the API default
+PROFILE_TIMEZONES = [tz.strip() for tz in os.getenv("PROFILE_TIMEZONES", "UTC").split(",") if tz.strip()]
+PROFILE_DEFAULT_DAYS = int(os.getenv("PROFILE_DEFAULT_DAYS", "30"))
+PROFILE_MAX_DAYS = int(os.getenv("PROFILE_MAX_DAYS", "366"))
+
+BURNER_CHANNEL = 0
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+
+def channel_name(channel):
+    return 'burner' if channel == BURNER_CHANNEL else f'zone_{channel}'
+
+
+def local_hour(minute_timestamp, tz):
+    """(local date, local hour) of a naive UTC minute in time zone tz."""
+    local = minute_timestamp.replace(tzinfo=timezone.utc).astimezone(ZoneInfo(tz))
+    return local.date(), local.hour
+
+
+def profile_since(tz, days):
+    """First local date of a window of days ending today (inclusive) in time zone tz."""
+    return datetime.now(ZoneInfo(tz)).date() - timedelta(days=days - 1)
+
+
+def minute_contributions(boiler_utilization, zone_utilizations, sample_count, is_demo, sign=1):
+    """(channel, utilization sum, sample weight, minutes) a minute adds to its bucket.
+
+    Demo minutes contribute nothing: demo data is random per sample.
+    sign=-1 gives the amounts to subtract when a minute is replaced.
+    Utilizations may be Decimal (PostgreSQL's DECIMAL boiler_utilization)
+    and are summed as floats.
+    """
+    if is_demo or not sample_count:
+        return []
+    values = [boiler_utilization, *zone_utilizations]
+    return [(channel, sign * float(value) * sample_count, sign * sample_count, sign)
+            for channel, value in enumerate(values) if value is not None]
+
+
+def merge_contributions(old, new):
+    """Net change per channel from removing old and adding new contributions."""
+    net = {}
+    for channel, total, weight, minutes in old + new:
+        current = net.get(channel, (0.0, 0, 0))
+        net[channel] = (current[0] + total, current[1] + weight, current[2] + minutes)
+    return [(channel, *amounts) for channel, amounts in sorted(net.items()) if any(amounts)]
+
+
+def _mean(total, weight):
+    # PostgreSQL returns sum(bigint) as Decimal
+    return round(float(total) / float(weight), 2) if weight else None
+
+
+def build_profile(rows):
+    """{'burner': {'utilization': [24], 'samples': [24]}, 'zone_1': ...} from
+    (hour, channel, utilization sum, sample weight) rows."""
+    channels = {}
+    for hour, channel, total, weight in rows:
+        entry = channels.setdefault(channel, {'utilization': [None] * 24, 'samples': [0] * 24})
+        entry['utilization'][hour] = _mean(total, weight)
+        entry['samples'][hour] = int(weight)
+    return {channel_name(channel): channels[channel] for channel in sorted(channels)}
+
+
+def build_heatmap(rows):
+    """Per-channel 7x24 matrices (Monday first) from
+    (weekday, hour, channel, utilization sum, sample weight) rows."""
+    channels = {}
+    for weekday, hour, channel, total, weight in rows:
+        entry = channels.setdefault(channel, {
+            'utilization': [[None] * 24 for _ in WEEKDAYS],
+            'samples': [[0] * 24 for _ in WEEKDAYS],
+        })
+        entry['utilization'][weekday][hour] = _mean(total, weight)
+        entry['samples'][weekday][hour] = int(weight)
+    return {channel_name(channel): channels[channel] for channel in sorted(channels)}
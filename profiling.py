@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+On-demand profiling for the BoilerStat services.
+
+Three tools, cheap enough to leave built in:
+
+    timings      per-route (API), per-job (aggregator) and per-stage (logger)
+                 tables of wall time split into database time and Python time.
+                 Database time is measured by wrapping storage cursors in
+                 TimedCursor, which times execute/executemany/fetch* per thread.
+    slow queries with SLOW_QUERY_MS > 0, statements slower than that are
+                 printed with their parameters (SLOW_QUERY_PARAMS=false hides them)
+    captures     a wall-clock stack sampler over every thread of the process
+                 for N seconds, written to PROFILE_DIR in the folded-stack format
+                 flamegraph.pl, speedscope and inferno read, together with a
+                 snapshot of the timings table
+
+The aggregator and the logger start a capture on PROFILE_SIGNAL (SIGUSR2) for
+PROFILE_SIGNAL_SECONDS; the API serves /api/debug/timings and
+/api/debug/profile when PROFILING_ENABLED=true.
+"""
+
+import json
+import os
+import re
+import signal
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "boilerstat-profiles"))
+# Seconds between stack samples (200 Hz)
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+PROFILE_SIGNAL_SECONDS = float(os.getenv("PROFILE_SIGNAL_SECONDS", "30"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
+# Statements at least this slow are printed (0 disables the slow query log)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+SLOW_QUERY_PARAMS = os.getenv("SLOW_QUERY_PARAMS", "true").lower() == "true"
+# Longest SQL / parameter text printed per slow query
+SLOW_QUERY_MAX_CHARS = 2000
+PROFILE_SIGNAL = signal.SIGUSR2
+
+_db = threading.local()
+_capture_lock = threading.Lock()
+
+
+def db_stats():
+    """(database seconds, statements) spent by the calling thread so far."""
+    return getattr(_db, 'seconds', 0.0), getattr(_db, 'queries', 0)
+
+
+def _account(start, sql=None, params=None, many=False):
+    elapsed = time.perf_counter() - start
+    _db.seconds = getattr(_db, 'seconds', 0.0) + elapsed
+    if sql is not None:
+        _db.queries = getattr(_db, 'queries', 0) + 1
+        if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+            log_slow_query(elapsed, sql, params, many)
+
+
+def _clip(text):
+    return text if len(text) <= SLOW_QUERY_MAX_CHARS else text[:SLOW_QUERY_MAX_CHARS] + '...'
+
+
+def log_slow_query(elapsed, sql, params, many=False):
+    if isinstance(sql, bytes):
+        sql = sql.decode(errors='replace')
+    sql = re.sub(r'\s+', ' ', str(sql)).strip()
+    line = f"Slow query ({elapsed * 1000:.1f} ms): {_clip(sql)}"
+    if SLOW_QUERY_PARAMS and params is not None:
+        if many:
+            params = list(params)
+            line += f" -- {len(params)} parameter sets, first: {_clip(repr(params[0] if params else None))}"
+        else:
+            line += f" -- params: {_clip(repr(params))}"
+    print(line)
+
+
+class TimedCursor:
+    """DB-API cursor wrapper adding statement and fetch time to the thread's database time."""
+
+    __slots__ = ('_cursor',)
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=None):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(sql) if params is None else self._cursor.execute(sql, params)
+        finally:
+            _account(start, sql, params)
+
+    def executemany(self, sql, params):
+        # Parameter sets may be a generator; keep a list for the slow query log
+        if SLOW_QUERY_MS and SLOW_QUERY_PARAMS and not isinstance(params, (list, tuple)):
+            params = list(params)
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(sql, params)
+        finally:
+            _account(start, sql, params, many=True)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return self._cursor.fetchone()
+        finally:
+            _account(start)
+
+    def fetchmany(self, *args):
+        start = time.perf_counter()
+        try:
+            return self._cursor.fetchmany(*args)
+        finally:
+            _account(start)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return self._cursor.fetchall()
+        finally:
+            _account(start)
+
+    def __iter__(self):
+        rows = iter(self._cursor)
+        while True:
+            start = time.perf_counter()
+            try:
+                row = next(rows)
+            except StopIteration:
+                return
+            finally:
+                _account(start)
+            yield row
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class Timing:
+    """Result of one measure() block."""
+
+    __slots__ = ('elapsed', 'db', 'queries')
+
+    @property
+    def python(self):
+        return max(self.elapsed - self.db, 0.0)
+
+    def describe(self):
+        return (f"{self.elapsed:.3f}s (db {self.db:.3f}s in {self.queries} queries, "
+                f"python {self.python:.3f}s)")
+
+
+class TimingTable:
+    """Thread-safe totals per name: calls, wall time, database time, statements, slowest call."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}
+        self.since = datetime.utcnow()
+
+    def record(self, name, timing):
+        with self._lock:
+            row = self._rows.get(name)
+            if row is None:
+                row = self._rows[name] = [0, 0.0, 0.0, 0, 0.0]
+            row[0] += 1
+            row[1] += timing.elapsed
+            row[2] += timing.db
+            row[3] += timing.queries
+            row[4] = max(row[4], timing.elapsed)
+
+    def snapshot(self):
+        """JSON-ready rows, slowest total first."""
+        with self._lock:
+            rows = sorted(((name, tuple(row)) for name, row in self._rows.items()), key=lambda item: -item[1][1])
+            since = self.since
+        return {
+            'since': since.isoformat(),
+            'pid': os.getpid(),
+            'timings': {name: {
+                'count': count,
+                'total_seconds': round(total, 6),
+                'db_seconds': round(db, 6),
+                'python_seconds': round(max(total - db, 0.0), 6),
+                'db_percent': round(db * 100 / total, 1) if total else None,
+                'queries': queries,
+                'mean_ms': round(total * 1000 / count, 3),
+                'max_ms': round(slowest * 1000, 3),
+            } for name, (count, total, db, queries, slowest) in rows},
+        }
+
+    def format_report(self):
+        """Human-readable lines for periodic logging."""
+        lines = ["Timings (db vs python):"]
+        for name, row in self.snapshot()['timings'].items():
+            lines.append(f"  {name:<28} n={row['count']:<7} total={row['total_seconds']:.3f}s "
+                         f"db={row['db_seconds']:.3f}s python={row['python_seconds']:.3f}s "
+                         f"queries={row['queries']} max={row['max_ms']:.1f}ms")
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+            self.since = datetime.utcnow()
+
+
+# Per-process table shared by measure() callers
+timings = TimingTable()
+
+
+def start_timing():
+    """Token for finish_timing(), taken on the thread that does the work."""
+    return (time.perf_counter(), *db_stats())
+
+
+def finish_timing(name, started, table=timings, timing=None):
+    """Record the time since start_timing() in table under name; returns the Timing."""
+    timing = timing or Timing()
+    start, db_start, queries_start = started
+    timing.elapsed = time.perf_counter() - start
+    db_end, queries_end = db_stats()
+    timing.db = db_end - db_start
+    timing.queries = queries_end - queries_start
+    table.record(name, timing)
+    return timing
+
+
+@contextmanager
+def measure(name, table=timings):
+    """Time a block on the calling thread and record it in table under name.
+
+    Yields a Timing whose fields are filled in when the block exits.
+    """
+    timing = Timing()
+    started = start_timing()
+    try:
+        yield timing
+    finally:
+        finish_timing(name, started, table, timing)
+
+
+def _frame_name(code):
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ':')
+
+
+def sample_stacks(seconds, interval=PROFILE_SAMPLE_INTERVAL):
+    """Sample every other thread's stack for seconds; returns (Counter of folded stacks, samples)."""
+    own = threading.get_ident()
+    stacks = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            frames.append(names.get(ident, f"thread-{ident}").replace(';', ':'))
+            stacks[';'.join(reversed(frames))] += 1
+        samples += 1
+        time.sleep(interval)
+    return stacks, samples
+
+
+def top_frames(stacks, limit=10):
+    """[(leaf frame, percent of thread samples)], most frequent first."""
+    leaves = Counter()
+    for stack, count in stacks.items():
+        leaves[stack.rsplit(';', 1)[-1]] += count
+    total = sum(leaves.values()) or 1
+    return [(frame, round(count * 100 / total, 1)) for frame, count in leaves.most_common(limit)]
+
+
+def write_profile(base, stacks):
+    """Write folded stacks to base.folded and the timings table to base-timings.json."""
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    with open(base + '.folded', 'w') as f:
+        for stack, count in sorted(stacks.items()):
+            f.write(f"{stack} {count}\n")
+    with open(base + '-timings.json', 'w') as f:
+        json.dump(timings.snapshot(), f, indent=2)
+
+
+def start_capture(service, seconds, on_done=print):
+    """Sample this process for seconds on a background thread, then write_profile().
+
+    Returns the folded stacks path; on_done receives a one-line result when
+    the capture ends. Raises RuntimeError if a capture is already running.
+    """
+    if not _capture_lock.acquire(blocking=False):
+        raise RuntimeError("a profile capture is already running")
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+    base = os.path.join(PROFILE_DIR, f"{service}-{os.getpid()}-{stamp}")
+    seconds = min(seconds, PROFILE_MAX_SECONDS)
+
+    def run():
+        try:
+            stacks, samples = sample_stacks(seconds)
+            write_profile(base, stacks)
+            hottest = ', '.join(f"{frame} {percent}%" for frame, percent in top_frames(stacks, 3))
+            on_done(f"Profile written to {base}.folded ({samples} samples; hottest: {hottest})")
+        except Exception as e:
+            on_done(f"Profile capture failed: {e}")
+        finally:
+            _capture_lock.release()
+
+    threading.Thread(target=run, name="profile-capture", daemon=True).start()
+    return base + '.folded'
+
+
+def install_signal_handler(service, on_done=print):
+    """Start a PROFILE_SIGNAL_SECONDS capture whenever the process receives PROFILE_SIGNAL."""
+    def handler(signum, frame):
+        try:
+            start_capture(service, PROFILE_SIGNAL_SECONDS, on_done)
+            on_done(f"Received signal {signum}: profiling for {PROFILE_SIGNAL_SECONDS:g}s")
+        except RuntimeError as e:
+            on_done(f"Received signal {signum}: {e}")
+
+    signal.signal(PROFILE_SIGNAL, handler)
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Query plan regression check - runs every production query against months of
+synthetic data and fails if one falls back to a full table scan or exceeds
+its time budget.
+
+The storage backend methods, the cycle analytics stage and the /api/cycles
+and /api/export queries are executed for real while their SQL is recorded;
+each recorded statement is then explained (PostgreSQL: EXPLAIN (ANALYZE,
+BUFFERS); SQLite: EXPLAIN QUERY PLAN plus a timed run) and checked.
+
+PostgreSQL runs need a scratch database with the postgres-db/init schema:
+the check loads its data for devices named "plan-N" ending at the current
+time, refuses to run if other devices' readings are present, and deletes
+its data afterwards.
+
+Usage:
+    python3 query_plan_check.py                          # SQLite (temp file)
+    POSTGRES_DB=boilerstat_scratch python3 query_plan_check.py --backend postgres
+    python3 query_plan_check.py --days 180 --devices 50 --budget-ms 100
+    python3 query_plan_check.py --layout hour            # hour-packed minute aggregates
+
+Exits with status 1 if any check fails.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import psycopg2
+import psycopg2.extensions
+
+from hour_slots import LAYOUTS, PER_HOUR
+from profiles import PROFILE_TIMEZONES, merge_contributions, minute_contributions, profile_since
+from storage import (POSTGRES_DB, POSTGRES_HOST, POSTGRES_PASSWORD, POSTGRES_PORT, POSTGRES_USER,
+                     PostgresBackend, SQLiteBackend)
+
+DEVICE_PREFIX = "plan-"
+# Tables that grow with retention and device count; a full scan of one is a regression
+LARGE_TABLES = {'boiler_readings', 'minute_utilization', 'burner_cycles', 'burner_cycle_hourly',
+                'utilization_profile', 'data_coverage', 'hourly_utilization', 'utilization_totals'}
+# Recorded statements that are not worth explaining
+SKIP_PREFIXES = ('SELECT 1', 'PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK', 'INSERT INTO BOILER_READINGS')
+
+
+def statement_shape(sql):
+    """Statement text with literals removed, to explain each query shape once."""
+    sql = re.sub(r"'[^']*'", "?", sql)
+    sql = re.sub(r"\b\d+(\.\d+)?\b", "?", sql)
+    return ' '.join(sql.split())
+
+
+class Recorder:
+    """Collects (check name, SQL) pairs while production code runs."""
+
+    def __init__(self):
+        self.current = None
+        self.statements = []
+        self._shapes = set()
+
+    def record(self, sql):
+        if self.current is None:
+            return
+        sql = sql.strip()
+        if sql.upper().startswith(SKIP_PREFIXES):
+            return
+        shape = statement_shape(sql)
+        if shape not in self._shapes:
+            self._shapes.add(shape)
+            self.statements.append((self.current, sql))
+
+    def run(self, name, func):
+        self.current = name
+        try:
+            func()
+        finally:
+            self.current = None
+
+
+RECORDER = Recorder()
+
+
+class RecordingCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        statement = self.mogrify(query, vars)
+        RECORDER.record(statement.decode() if isinstance(statement, bytes) else statement)
+        return super().execute(query, vars)
+
+
+class RecordingPostgresBackend(PostgresBackend):
+    def connect(self):
+        return psycopg2.connect(
+            host=POSTGRES_HOST,
+            port=POSTGRES_PORT,
+            database=POSTGRES_DB,
+            user=POSTGRES_USER,
+            password=POSTGRES_PASSWORD,
+            cursor_factory=RecordingCursor
+        )
+
+
+class RecordingSQLiteBackend(SQLiteBackend):
+    def connect(self):
+        conn = super().connect()
+        conn.set_trace_callback(RECORDER.record)
+        return conn
+
+
+# Synthetic data
+
+def load_sqlite(backend, start, end, devices, interval):
+    conn = backend.connect()
+    step = timedelta(seconds=interval)
+    with conn:
+        for device in range(devices):
+            device_id = f"{DEVICE_PREFIX}{device}"
+            readings, minutes = [], []
+            t, seq = start, 0
+            while t < end:
+                seq += 1
+                stamp = t.strftime('%Y-%m-%d %H:%M:%S')
+                readings.append((device_id, stamp, random.randint(0, 1), random.getrandbits(6), 6, 0,
+                                 seq, stamp, stamp))
+                if t.second < interval and t < end - timedelta(minutes=5):
+                    minutes.append((device_id, t.strftime('%Y-%m-%d %H:%M:00'), random.random() * 100,
+                                    json.dumps([round(random.random() * 100, 1) for _ in range(6)]),
+                                    60 // interval or 1, 0, stamp))
+                t += step
+            conn.executemany('''
+                INSERT INTO boiler_readings
+                (device_id, timestamp, boiler, zone_mask, zone_count, is_demo, seq, sent_at, logged_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', readings)
+            conn.executemany('''
+                INSERT OR IGNORE INTO minute_utilization
+                (device_id, minute_timestamp, boiler_utilization, zone_utilization, sample_count, is_demo,
+                 aggregated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', minutes)
+    if backend.layout == PER_HOUR:
+        backend.pack_minute_rows()
+    backend.rebuild_profile(PROFILE_TIMEZONES[0])
+    backend.rebuild_coverage()
+    backend.rebuild_totals()
+    conn.execute('ANALYZE')
+    conn.close()
+
+
+def load_postgres(conn, start, end, devices, interval):
+    params = {'prefix': DEVICE_PREFIX, 'devices': devices, 'start': start, 'end': end,
+              'interval': interval, 'recent': end - timedelta(minutes=5)}
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            INSERT INTO boiler_readings
+            (device_id, timestamp, boiler, zone_mask, zone_count, is_demo, seq, sent_at, logged_at, received_at)
+            SELECT %(prefix)s || d, t, (random() < 0.5)::int, floor(random() * 64)::bigint, 6, 0,
+                   row_number() OVER (PARTITION BY d ORDER BY t),
+                   t, t + interval '50 milliseconds', t + interval '300 milliseconds'
+            FROM generate_series(1, %(devices)s) d,
+                 generate_series(%(start)s::timestamp, %(end)s::timestamp - interval '1 second',
+                                 make_interval(secs => %(interval)s)) t
+        ''', params)
+        # Leave the last few minutes unaggregated so the backfill query has work to find
+        cursor.execute('''
+            INSERT INTO minute_utilization
+            (device_id, minute_timestamp, boiler_utilization, zone_utilization, sample_count, is_demo,
+             aggregated_at)
+            SELECT %(prefix)s || d, m, round((random() * 100)::numeric, 2),
+                   ARRAY(SELECT round((random() * 100)::numeric, 1)::real FROM generate_series(1, 6)),
+                   12, 0, m + interval '65 seconds'
+            FROM generate_series(1, %(devices)s) d,
+                 generate_series(date_trunc('minute', %(start)s::timestamp), %(recent)s::timestamp,
+                                 interval '1 minute') m
+        ''', params)
+        # Alternating 10-minute burner runs
+        cursor.execute('''
+            INSERT INTO burner_cycles
+            (device_id, burner_on, started_at, ended_at, duration_seconds, sample_count,
+             trigger_zones, short_cycle, interrupted)
+            SELECT %(prefix)s || d, (extract(epoch FROM s)::bigint / 600) %% 2 = 0, s,
+                   s + interval '10 minutes', 600, 120, '{1}', false, false
+            FROM generate_series(1, %(devices)s) d,
+                 generate_series(%(start)s::timestamp, %(recent)s::timestamp, interval '10 minutes') s
+        ''', params)
+        cursor.execute('''
+            INSERT INTO burner_cycle_hourly
+            (device_id, hour_timestamp, cycle_count, short_cycle_count, on_seconds,
+             mean_on_seconds, p95_on_seconds, mean_off_seconds)
+            SELECT %(prefix)s || d, h, 3, 0, 1800, 600, 600, 600
+            FROM generate_series(1, %(devices)s) d,
+                 generate_series(date_trunc('hour', %(start)s::timestamp), %(recent)s::timestamp,
+                                 interval '1 hour') h
+        ''', params)
+        # Cycle analytics resumes near the end of the data
+        cursor.execute('''
+            INSERT INTO analytics_watermark (stage, last_reading_id)
+            SELECT 'burner_cycles', max(id) - 2000 FROM boiler_readings
+            ON CONFLICT (stage) DO UPDATE SET last_reading_id = EXCLUDED.last_reading_id
+        ''')
+    conn.commit()
+
+
+def analyze_postgres(conn):
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        for table in sorted(LARGE_TABLES):
+            cursor.execute(f'ANALYZE {table}')
+    conn.autocommit = False
+
+
+def cleanup_postgres(conn):
+    conn.rollback()
+    with conn.cursor() as cursor:
+        for table in ('boiler_readings', 'minute_utilization', 'burner_cycles', 'burner_cycle_hourly',
+                      'burner_cycle_state', 'utilization_profile', 'device_alerts', 'data_coverage',
+                      'hourly_utilization', 'utilization_totals'):
+            cursor.execute(f"DELETE FROM {table} WHERE device_id LIKE %s", (DEVICE_PREFIX + '%',))
+        cursor.execute("DELETE FROM analytics_watermark WHERE stage = 'burner_cycles'")
+    conn.commit()
+
+
+def check_decimal_minutes():
+    """Replacing a minute read back from PostgreSQL (DECIMAL boiler_utilization) nets out as floats."""
+    old = minute_contributions(Decimal('50.00'), [10.0], 12, 0, sign=-1)
+    net = merge_contributions(old, minute_contributions(60.0, [10.0], 12, 0))
+    assert net == [(0, 120.0, 0, 0)], net
+    assert all(isinstance(total, float) for _, total, _, _ in net), net
+
+
+# Production queries
+
+def run_storage_queries(backend, start, end):
+    since_hour = end - timedelta(hours=1)
+    device = f"{DEVICE_PREFIX}1"
+    minute = (end - timedelta(minutes=30)).replace(second=0, microsecond=0)
+    tz = PROFILE_TIMEZONES[0]
+
+    RECORDER.run('latest_reading', lambda: backend.latest_reading())
+    RECORDER.run('latest_reading(device)', lambda: backend.latest_reading(device))
+    RECORDER.run('aggregate_minute', lambda: backend.aggregate_minute(minute, minute + timedelta(minutes=1)))
+    RECORDER.run('upsert_minute', lambda: backend.upsert_minute(device, minute, 50.0, [10.0] * 6, 12, 0))
+    # Replaces the minute just written, so its stored (PostgreSQL: Decimal) values are subtracted
+    RECORDER.run('upsert_minute(replace)', lambda: backend.upsert_minute(device, minute, 60.0, [10.0] * 6, 12, 0))
+    RECORDER.run('insert_readings', lambda: backend.insert_readings([
+        (device, end - timedelta(seconds=5), 1, 3, 6, 0, None, None, None)]))
+    RECORDER.run('coverage', lambda: backend.coverage(device, end - timedelta(days=1), end))
+    RECORDER.run('unaggregated_minutes',
+                 lambda: backend.unaggregated_minutes((end - timedelta(hours=24)).strftime('%Y-%m-%d %H:%M:00')))
+    RECORDER.run('utilization_rows', lambda: backend.utilization_rows(since_hour, device))
+    RECORDER.run('utilization_columns', lambda: backend.utilization_columns(since_hour, device))
+    RECORDER.run('utilization_profile',
+                 lambda: backend.utilization_profile(device, tz, profile_since(tz, 30)))
+    RECORDER.run('utilization_profile(weekday)',
+                 lambda: backend.utilization_profile(device, tz, profile_since(tz, 30), by_weekday=True))
+    RECORDER.run('utilization_totals', lambda: backend.utilization_totals(device, start, end))
+    RECORDER.run('fleet_totals', lambda: backend.fleet_totals(end - timedelta(days=7), end))
+    RECORDER.run('record_alert', lambda: backend.record_alert(device, 'device_silent', None, 'warning',
+                                                              end, 'No readings'))
+    RECORDER.run('resolve_alert', lambda: backend.resolve_alert(device, 'device_silent', None, end))
+    RECORDER.run('open_alerts', lambda: backend.open_alerts())
+    RECORDER.run('latency_samples', lambda: backend.latency_samples(1000))
+    RECORDER.run('aggregation_samples', lambda: backend.aggregation_samples(1000))
+    # Routine retention cleanup removes the oldest slice of data
+    RECORDER.run('delete_readings_before', lambda: backend.delete_readings_before(start + timedelta(hours=1)))
+
+
+def run_postgres_queries(backend, end):
+    # Imported here so SQLite-only runs do not need the API's dependencies
+    from app import CYCLE_HOURLY_QUERY, EXPORT_QUERIES, RECENT_CYCLES_QUERY, export_query
+    from cycle_analytics import CycleAnalytics
+
+    class Connections:
+        get_connection = staticmethod(backend.connect)
+
+    RECORDER.run('cycle_analytics', lambda: CycleAnalytics(Connections()).run())
+
+    conn = backend.connect()
+    try:
+        def query(sql, params):
+            with conn.cursor() as cursor:
+                cursor.execute(sql, params)
+                cursor.fetchall()
+            conn.rollback()
+
+        device = f"{DEVICE_PREFIX}1"
+        RECORDER.run('/api/cycles hourly', lambda: query(CYCLE_HOURLY_QUERY, (24, None, None)))
+        RECORDER.run('/api/cycles recent', lambda: query(RECENT_CYCLES_QUERY, (24, None, None, 100)))
+        RECORDER.run('/api/cycles recent(device)', lambda: query(RECENT_CYCLES_QUERY, (24, device, device, 100)))
+        window = {'start': end - timedelta(days=1), 'end': end}
+        for dataset in EXPORT_QUERIES:
+            sql = export_query(dataset, backend.layout)
+            RECORDER.run(f'/api/export {dataset}', lambda: query(sql, {**window, 'device': None}))
+            RECORDER.run(f'/api/export {dataset}(device)', lambda: query(sql, {**window, 'device': device}))
+    finally:
+        conn.close()
+
+
+# Plan checks
+
+def plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def check_postgres(conn, sql):
+    """(full scans of large tables, execution ms, buffers read) for one statement."""
+    with conn.cursor() as cursor:
+        cursor.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + sql)
+        result = cursor.fetchone()[0]
+    conn.rollback()  # EXPLAIN ANALYZE executes writes; undo them
+    plan = result[0]
+    scans = [node['Relation Name'] for node in plan_nodes(plan['Plan'])
+             if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') in LARGE_TABLES]
+    buffers = plan['Plan'].get('Shared Hit Blocks', 0) + plan['Plan'].get('Shared Read Blocks', 0)
+    return scans, plan['Execution Time'], buffers
+
+
+def check_sqlite(conn, sql):
+    """(full scans of large tables, execution ms, None) for one statement."""
+    scans = []
+    for row in conn.execute('EXPLAIN QUERY PLAN ' + sql):
+        detail = row[-1]
+        match = re.match(r'SCAN (\w+)', detail)
+        # "SCAN t USING INDEX" walks an index in order (e.g. ORDER BY ... LIMIT); a bare SCAN reads the table
+        if match and match.group(1) in LARGE_TABLES and 'USING' not in detail:
+            scans.append(match.group(1))
+    conn.execute('SAVEPOINT plan_check')
+    start = time.perf_counter()
+    conn.execute(sql).fetchall()
+    elapsed = (time.perf_counter() - start) * 1000
+    conn.execute('ROLLBACK TO plan_check')
+    conn.execute('RELEASE plan_check')
+    return scans, elapsed, None
+
+
+def report(checker, conn, budget_ms):
+    failures = 0
+    for name, sql in RECORDER.statements:
+        try:
+            scans, elapsed, buffers = checker(conn, sql)
+        except (psycopg2.Error, sqlite3.Error) as e:
+            print(f"  ERROR {name}: {e}")
+            failures += 1
+            continue
+        problems = [f"full scan of {table}" for table in scans]
+        if elapsed > budget_ms:
+            problems.append(f"{elapsed:.1f} ms over the {budget_ms:.0f} ms budget")
+        status = "FAIL " if problems else "ok   "
+        detail = f"{elapsed:8.1f} ms" + (f" {buffers:>8} buffers" if buffers is not None else "")
+        print(f"  {status}{name:<36} {detail}  {'; '.join(problems)}")
+        if problems:
+            failures += 1
+            print("        " + ' '.join(sql.split())[:300])
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check BoilerStat query plans against a large dataset")
+    parser.add_argument("--backend", choices=["sqlite", "postgres"], default="sqlite")
+    parser.add_argument("--days", type=int, default=60, help="Days of history to generate (default: 60)")
+    parser.add_argument("--devices", type=int, default=10, help="Number of devices (default: 10)")
+    parser.add_argument("--interval", type=int, default=30, help="Seconds between readings (default: 30)")
+    parser.add_argument("--layout", choices=LAYOUTS, default="minute",
+                        help="Minute aggregate table layout (default: minute)")
+    parser.add_argument("--budget-ms", type=float, default=250.0,
+                        help="Maximum execution time per statement (default: 250)")
+    args = parser.parse_args()
+
+    check_decimal_minutes()
+    end = datetime.utcnow().replace(microsecond=0)
+    start = end - timedelta(days=args.days)
+    rows = args.days * 86400 // args.interval * args.devices
+    print(f"Loading {rows:,} readings: {args.devices} devices x {args.days} days "
+          f"every {args.interval}s ({args.backend}, {args.layout} layout)")
+
+    if args.backend == "sqlite":
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = RecordingSQLiteBackend(os.path.join(tmp, "plan_check.db"), layout=args.layout)
+            load_sqlite(backend, start, end, args.devices, args.interval)
+            run_storage_queries(backend, start, end)
+            conn = SQLiteBackend.connect(backend)
+            print(f"\n{len(RECORDER.statements)} statements:")
+            failures = report(check_sqlite, conn, args.budget_ms)
+            conn.close()
+            backend.close()
+    else:
+        backend = RecordingPostgresBackend(layout=args.layout)
+        conn = PostgresBackend.connect(backend)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT count(*) FROM boiler_readings WHERE device_id NOT LIKE %s",
+                               (DEVICE_PREFIX + '%',))
+                if cursor.fetchone()[0]:
+                    print(f"{POSTGRES_DB} contains live readings; point POSTGRES_DB at a scratch database")
+                    sys.exit(2)
+            conn.rollback()
+            load_postgres(conn, start, end, args.devices, args.interval)
+            if backend.layout == PER_HOUR:
+                backend.pack_minute_rows()
+            backend.rebuild_profile(PROFILE_TIMEZONES[0])
+            backend.rebuild_coverage()
+            backend.rebuild_totals()
+            analyze_postgres(conn)
+            run_storage_queries(backend, start, end)
+            run_postgres_queries(backend, end)
+            print(f"\n{len(RECORDER.statements)} statements:")
+            failures = report(check_postgres, conn, args.budget_ms)
+        finally:
+            cleanup_postgres(conn)
+            conn.close()
+            backend.close()
+
+    print(f"\n{failures} failing statement(s)" if failures else "\nAll query plans OK")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Reading record benchmark - CPU time and memory per reading of the record
+forms in readings.py against the dicts and loose tuples they replace.
+
+Synthetic readings (devices "bench-N", January 2000) are run through:
+
+    ingest      decoded MQTT payload -> database row: the logger's former
+                inline normalization vs Reading.from_payload()
+    retained    memory held by N readings kept as dicts, plain tuples,
+                Readings, or one ReadingBatch
+    fetch       database rows (iter_readings() order) -> dicts, Readings,
+                or a ReadingBatch
+    json        per-reading dicts vs one ReadingBatch.to_dict() document
+    numpy       a burner mean over ReadingBatch.to_numpy() (the burner column
+                alone, and every column), against the same mean in Python
+                (skipped when numpy is not installed)
+
+Time is the best of --repeat runs in nanoseconds per reading; allocated is
+the tracemalloc peak of one run in bytes per reading, retained what is
+still held afterwards. No database or broker is needed.
+
+Usage:
+    python3 reading_benchmark.py
+    python3 reading_benchmark.py --readings 200000 --zones 8
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from readings import Reading, ReadingBatch
+from storage import DEFAULT_DEVICE_ID
+from zones import zone_mask, zones_from_mask, zones_from_payload
+
+BENCH_START = datetime(2000, 1, 1)
+READING_INTERVAL = timedelta(seconds=5)
+
+
+def generate_payloads(count, devices, zones):
+    """Decoded ESP32 payloads round-robin across devices."""
+    payloads = []
+    for i in range(count):
+        seq = i // devices
+        payload = {
+            'device_id': f"bench-{i % devices}",
+            'timestamp': (BENCH_START + READING_INTERVAL * seq).strftime('%Y-%m-%dT%H:%M:%S'),
+            'burner': i % 2,
+            'is_demo': False,
+            'seq': seq,
+        }
+        payload.update({f'zone_{z + 1}': (i >> z) & 1 for z in range(zones)})
+        payloads.append(payload)
+    return payloads
+
+
+def legacy_row(payload, logged_at, sent_at):
+    """The row the logger built inline before readings.py."""
+    try:
+        incoming_timestamp = datetime.fromisoformat(payload['timestamp'].replace('Z', ''))
+        if incoming_timestamp.tzinfo is None:
+            utc_timestamp = payload['timestamp']
+        else:
+            utc_timestamp = incoming_timestamp.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    except (ValueError, AttributeError):
+        utc_timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    boiler_value = payload.get('burner', payload.get('boiler_state', 0))
+    is_demo_int = 1 if payload.get('is_demo', False) else 0
+    device_id = payload.get('device_id', DEFAULT_DEVICE_ID)
+    zones = zones_from_payload(payload)
+    return (device_id, utc_timestamp, boiler_value, zone_mask(zones), len(zones), is_demo_int,
+            payload.get('seq'), sent_at, logged_at)
+
+
+def row_dict(row):
+    device_id, timestamp, burner, mask, count, is_demo = row[:6]
+    return {'device_id': device_id, 'timestamp': timestamp, 'burner': burner,
+            'zones': zones_from_mask(mask, count), 'is_demo': is_demo}
+
+
+def measure(func, count, repeat):
+    """(ns per reading, allocated bytes per reading, retained bytes per reading) of func()."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    result = func()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return best * 1e9 / count, peak / count, retained / count
+
+
+def report(title, count, repeat, cases):
+    print(f"\n  {title:<34} {'ns/reading':>11} {'allocated':>10} {'retained':>9}")
+    baseline = None
+    for name, func in cases:
+        ns, allocated, retained = measure(func, count, repeat)
+        baseline = baseline or ns
+        print(f"  {name:<34} {ns:>11,.0f} {allocated:>9,.0f}B {retained:>8,.0f}B  {baseline / ns:>5.2f}x")
+
+
+def run(args):
+    count = args.readings
+    payloads = generate_payloads(count, args.devices, args.zones)
+    logged_at = datetime.utcnow()
+    readings = [Reading.from_payload(payload, logged_at) for payload in payloads]
+    rows = [(r.device_id, r.time, r.burner, r.zone_mask, r.zone_count, r.is_demo) for r in readings]
+    batch = ReadingBatch.from_rows(rows)
+    assert [reading[:6] for reading in batch] == rows
+    print(f"{count:,} readings from {args.devices} devices with {args.zones} zones, best of {args.repeat}")
+
+    report("ingest (payload -> row)", count, args.repeat, [
+        ("inline normalization (before)", lambda: [legacy_row(p, logged_at, None) for p in payloads]),
+        ("Reading.from_payload", lambda: [Reading.from_payload(p, logged_at) for p in payloads]),
+    ])
+    report("retained (N readings held)", count, args.repeat, [
+        ("list of dicts", lambda: [row_dict(row) for row in rows]),
+        ("list of tuples", lambda: [(*row,) for row in rows]),
+        ("list of Readings", lambda: [Reading(*row) for row in rows]),
+        ("ReadingBatch", lambda: ReadingBatch.from_rows(rows)),
+    ])
+    report("fetch (database rows -> records)", count, args.repeat, [
+        ("dict per row", lambda: [row_dict(row) for row in rows]),
+        ("Reading(*row)", lambda: [Reading(*row) for row in rows]),
+        ("ReadingBatch.from_rows", lambda: ReadingBatch.from_rows(rows)),
+    ])
+    report("json (records -> response text)", count, args.repeat, [
+        ("dict per reading", lambda: json.dumps([reading.to_dict() for reading in readings])),
+        ("ReadingBatch.to_dict", lambda: json.dumps(batch.to_dict())),
+    ])
+    per_row = len(json.dumps([reading.to_dict() for reading in readings]))
+    columnar = len(json.dumps(batch.to_dict()))
+    print(f"  response size: {per_row / count:,.0f} B/reading per row, {columnar / count:,.0f} B/reading columnar")
+
+    try:
+        import numpy
+    except ImportError:
+        print("\n  numpy is not installed; skipping to_numpy()")
+        return
+    report("numpy (burner mean)", count, args.repeat, [
+        ("Python sum over Readings", lambda: sum(reading.burner for reading in readings) / count),
+        ("ReadingBatch.to_numpy (burner)", lambda: batch.to_numpy(['burner'])['burner'].mean()),
+        ("ReadingBatch.to_numpy (all)", lambda: batch.to_numpy()['burner'].mean()),
+    ])
+    arrays = batch.to_numpy(['zone_mask'])
+    shared = numpy.shares_memory(arrays['zone_mask'], numpy.frombuffer(batch.zone_mask, dtype=numpy.int64))
+    print(f"  integer columns share the batch's buffers: {shared}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the reading record types")
+    parser.add_argument("--readings", type=int, default=50000, help="Readings per run (default: 50000)")
+    parser.add_argument("--devices", type=int, default=64, help="Number of devices (default: 64)")
+    parser.add_argument("--zones", type=int, default=6, help="Zones per device (default: 6)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case (default: 3)")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
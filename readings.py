@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+The reading record shared by the BoilerStat logger, aggregator and API.
+
+Reading is a slotted tuple in storage.READING_COLUMNS order, so it is a
+boiler_readings row as it is: insert_readings() and the database drivers
+take it without conversion, and a fetched row becomes one with
+Reading(*row). The burner state is always ``burner`` (the firmware's
+"burner"/"boiler_state" keys and the "boiler" column are mapped once, in
+from_payload() and by position), and zones are kept packed as zone_mask and
+zone_count; ``zones`` unpacks them on demand.
+
+ReadingBatch holds many readings column by column: the small integer
+columns (burner, zone_mask, zone_count, is_demo) in array.array buffers
+and the rest in lists. Rows go in and out with one transpose (zip), JSON as
+one list per column (to_dict/from_dict), and NumPy arrays share the integer
+buffers without copying (numpy is optional and only imported by to_numpy();
+a batch cannot grow while arrays from it are alive). /api/export's
+columnar readings format is one to_dict() document per chunk of rows.
+"""
+
+from array import array
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from storage import DEFAULT_DEVICE_ID, READING_COLUMNS
+from zones import zone_dict, zone_mask, zones_from_mask, zones_from_payload
+
+# READING_COLUMNS with the "boiler" column under its payload name
+READING_FIELDS = tuple('burner' if column == 'boiler' else column for column in READING_COLUMNS)
+# Array typecodes of the integer columns; zone_mask holds up to MAX_ZONES (63) bits
+ARRAY_COLUMNS = {'burner': 'b', 'zone_mask': 'q', 'zone_count': 'b', 'is_demo': 'b'}
+# Columns that may be missing from a row or payload (latency tracing fields)
+OPTIONAL_FIELDS = ('seq', 'sent_at', 'logged_at')
+
+
+def utc_timestamp(value):
+    """'YYYY-MM-DD HH:MM:SS' UTC text of a payload timestamp; the current time if it is unparseable."""
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', ''))
+        if parsed.tzinfo is None:
+            # ESP32 timestamps are UTC already and are stored as sent
+            return value
+        return parsed.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    except (ValueError, AttributeError):
+        return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+class Reading(namedtuple('Reading', READING_FIELDS, defaults=(None,) * len(OPTIONAL_FIELDS))):
+    """One boiler reading; a tuple in READING_COLUMNS order (timestamp as stored: text or naive UTC)."""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_payload(cls, payload, logged_at=None, sent_at=None):
+        """Normalize a decoded ESP32 payload. Raises KeyError or ValueError if it is malformed.
+
+        Values the boiler_readings columns would reject (a null or non-text
+        device_id, a burner other than 0/1, a non-integer seq) are refused
+        here, before the reading is queued with others for the database.
+        """
+        device_id = payload.get('device_id', DEFAULT_DEVICE_ID)
+        if not isinstance(device_id, str) or not device_id:
+            raise ValueError(f"device_id {device_id!r} is not a device name")
+        # Older firmware sends "boiler_state"
+        burner = payload.get('burner', payload.get('boiler_state', 0))
+        if not isinstance(burner, int) or burner not in (0, 1):
+            raise ValueError(f"burner {burner!r} is not 0 or 1")
+        seq = payload.get('seq')
+        if seq is not None and (not isinstance(seq, int) or isinstance(seq, bool)):
+            raise ValueError(f"seq {seq!r} is not an integer")
+        zones = zones_from_payload(payload)
+        # tuple.__new__ directly: the namedtuple constructor re-parses its arguments
+        return tuple.__new__(cls, (
+            device_id,
+            utc_timestamp(payload['timestamp']),
+            int(burner),
+            zone_mask(zones),
+            len(zones),
+            1 if payload.get('is_demo', False) else 0,
+            seq,
+            sent_at,
+            logged_at,
+        ))
+
+    @property
+    def zones(self):
+        """Zone states as a list of 0/1."""
+        return zones_from_mask(self.zone_mask, self.zone_count)
+
+    @property
+    def time(self):
+        """The reading's timestamp as a naive UTC datetime."""
+        timestamp = self.timestamp
+        return timestamp if isinstance(timestamp, datetime) else datetime.fromisoformat(timestamp.replace('Z', ''))
+
+    def to_dict(self):
+        """JSON-ready dict: the reading's fields with zones unpacked and times as ISO text."""
+        return {
+            'device_id': self.device_id,
+            'timestamp': _json_value(self.timestamp),
+            'burner': self.burner,
+            'zones': self.zones,
+            'is_demo': self.is_demo,
+            'seq': self.seq,
+            'sent_at': _json_value(self.sent_at),
+            'logged_at': _json_value(self.logged_at),
+        }
+
+    def to_status(self):
+        """The /api/status shape: device_id, timestamp, burner and one zone_N key per zone."""
+        return {'device_id': self.device_id, 'timestamp': _json_value(self.timestamp), 'burner': self.burner,
+                **zone_dict(self.zones)}
+
+
+class ReadingBatch:
+    """Columnar readings: one array or list per field of Reading."""
+
+    __slots__ = READING_FIELDS
+
+    def __init__(self):
+        for field in READING_FIELDS:
+            setattr(self, field, array(ARRAY_COLUMNS[field]) if field in ARRAY_COLUMNS else [])
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Batch from column sequences in READING_FIELDS order; missing trailing columns are None."""
+        columns = list(columns)
+        length = len(columns[0]) if columns else 0
+        batch = cls.__new__(cls)
+        for index, field in enumerate(READING_FIELDS):
+            values = columns[index] if index < len(columns) else [None] * length
+            setattr(batch, field, array(ARRAY_COLUMNS[field], values) if field in ARRAY_COLUMNS else list(values))
+        return batch
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Batch from database rows or Readings (READING_COLUMNS order, optional columns may be left off)."""
+        return cls.from_columns(zip(*rows))
+
+    def append(self, reading):
+        for field, value in zip(READING_FIELDS, reading):
+            getattr(self, field).append(value)
+
+    def extend(self, readings):
+        other = readings if isinstance(readings, ReadingBatch) else ReadingBatch.from_rows(readings)
+        for field in READING_FIELDS:
+            getattr(self, field).extend(getattr(other, field))
+
+    def __len__(self):
+        return len(self.device_id)
+
+    def __iter__(self):
+        """Readings, one per row."""
+        return map(Reading._make, zip(*(getattr(self, field) for field in READING_FIELDS)))
+
+    def rows(self):
+        """Rows for insert_readings(): the Readings themselves."""
+        return list(self)
+
+    def to_dict(self):
+        """JSON-ready columns: {field: list}, times as ISO text."""
+        document = {}
+        for field in READING_FIELDS:
+            values = getattr(self, field)
+            if field in ARRAY_COLUMNS:
+                document[field] = values.tolist()
+            elif field in ('timestamp', 'sent_at', 'logged_at'):
+                document[field] = [_json_value(value) for value in values]
+            else:
+                document[field] = list(values)
+        return document
+
+    @classmethod
+    def from_dict(cls, document):
+        """Batch from to_dict() output (times stay ISO text, as the database accepts them)."""
+        length = len(document['device_id'])
+        return cls.from_columns([document.get(field, [None] * length) for field in READING_FIELDS])
+
+    def to_numpy(self, fields=READING_FIELDS):
+        """{field: numpy array} of fields. Integer columns share this batch's buffers (no copy);
+        timestamps become datetime64[us]; text and nullable columns are object arrays.
+        """
+        import numpy
+
+        arrays = {}
+        for field in fields:
+            values = getattr(self, field)
+            if field in ARRAY_COLUMNS:
+                arrays[field] = numpy.frombuffer(values, dtype=numpy.dtype(values.typecode))
+            elif field == 'timestamp':
+                arrays[field] = numpy.array(values, dtype='datetime64[us]')
+            else:
+                arrays[field] = numpy.array(values, dtype=object)
+        return arrays
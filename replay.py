@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Historical replay - feeds stored readings back through the BoilerStat pipeline.
+
+Readings come from the database (STORAGE_BACKEND) or from archived files
+(an /api/export "readings" dump in any format, or captured MQTT payloads, as
+CSV or NDJSON, optionally gzipped). They are either published to MQTT like the ESP32 would,
+or injected straight into the logger's ingest handler.
+
+Original timing is preserved, scaled by --speed (e.g. 100 = a day in under
+15 minutes); --speed 0 replays as fast as possible. Each device is replayed
+by its own thread against a shared clock, so devices run in parallel and keep
+their relative ordering.
+
+Usage:
+    python3 replay.py --start 2025-11-20T00:00:00 --end 2025-11-21T00:00:00 --speed 100
+    python3 replay.py --file readings.csv.gz --speed 0 --target ingest --device-prefix replay-
+    python3 replay.py --file readings.ndjson --clones 20 --shift-to-now
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import os
+import queue
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+import paho.mqtt.client as mqtt
+
+from readings import Reading, ReadingBatch
+from storage import DEFAULT_DEVICE_ID, describe_backend, get_backend
+from zones import zone_dict, zone_mask, zones_from_payload
+
+MQTT_BROKER = os.getenv("MQTT_BROKER", "192.168.1.245")
+MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
+MQTT_TOPIC = os.getenv("MQTT_TOPIC", "boilerstat/reading")
+
+# Readings buffered per device between the reader and that device's thread
+DEVICE_QUEUE_SIZE = 1000
+PROGRESS_SECONDS = 5
+
+_END = object()
+
+
+def parse_time(value):
+    """Naive UTC datetime from an ISO string (offsets are converted)."""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def reading_from_record(record):
+    """Reading from an export row (zone_mask/zone_count) or an ESP32 payload (zone_N keys).
+
+    CSV values arrive as strings and are converted here.
+    """
+    if record.get('zone_mask') not in (None, ''):
+        mask, count = int(record['zone_mask']), int(record['zone_count'])
+    else:
+        zones = zones_from_payload({key: int(value) if isinstance(value, str) else value
+                                    for key, value in record.items()
+                                    if key == 'zones' or re.fullmatch(r'zone_\d+', key)})
+        mask, count = zone_mask(zones), len(zones)
+    burner = record.get('boiler', record.get('burner', record.get('boiler_state', 0)))
+    return Reading(record.get('device_id') or DEFAULT_DEVICE_ID, parse_time(str(record['timestamp'])),
+                   int(burner), mask, count, int(record.get('is_demo') or 0))
+
+
+def read_file(path):
+    """Yield Readings from a CSV or NDJSON file (".gz" files are decompressed).
+
+    NDJSON lines holding column lists (/api/export format=columnar) are ReadingBatch documents.
+    """
+    compressed = path.endswith('.gz')
+    name = path[:-3] if compressed else path
+    with (gzip.open if compressed else open)(path, 'rt', newline='') as f:
+        if name.endswith('.csv'):
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        for record in records:
+            if isinstance(record.get('device_id'), list):
+                for reading in ReadingBatch.from_dict(record):
+                    yield reading._replace(timestamp=reading.time)
+            else:
+                yield reading_from_record(record)
+
+
+def read_storage(start, end, device_id):
+    """Yield Readings from the configured storage backend."""
+    backend = get_backend()
+    for row in backend.iter_readings(start, end, device_id):
+        yield Reading(*row)
+
+
+class Replay:
+    """Paces readings per device against a shared, speed-scaled clock."""
+
+    def __init__(self, send, speed, shift_to_now=False, device_prefix='', clones=1, demo=False):
+        self.send = send
+        self.speed = speed
+        self.shift_to_now = shift_to_now
+        self.device_prefix = device_prefix
+        self.clones = clones
+        self.demo = demo
+        self.origin = None        # (first reading time, monotonic start, shift to now)
+        self.sent = 0
+        self.failed = 0
+        self.lag = 0.0            # seconds the slowest send ran behind schedule
+        self.position = None      # data time of the latest reading sent
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._threads = []
+        self._seq = {}
+
+    def _device_ids(self, device_id):
+        name = self.device_prefix + device_id
+        if self.clones == 1:
+            return [name]
+        return [f"{name}-c{i}" for i in range(1, self.clones + 1)]
+
+    def _payload(self, reading, device_id):
+        timestamp = reading.timestamp
+        if self.shift_to_now:
+            timestamp += self.origin[2]
+        seq = self._seq[device_id] = self._seq.get(device_id, 0) + 1
+        payload = {
+            'device_id': device_id,
+            'timestamp': timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+            'burner': reading.burner,
+            'is_demo': bool(self.demo or reading.is_demo),
+            'seq': seq,
+            'sent_at': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+        }
+        payload.update(zone_dict(reading.zones))
+        return payload
+
+    def _due(self, timestamp):
+        """Wall-clock time (time.monotonic) at which a reading should be sent."""
+        first, wall_start, _ = self.origin
+        if not self.speed:
+            return wall_start
+        return wall_start + (timestamp - first).total_seconds() / self.speed
+
+    def _run_device(self, device_id, readings):
+        device_ids = self._device_ids(device_id)
+        while True:
+            reading = readings.get()
+            if reading is _END:
+                return
+            due = self._due(reading.timestamp)
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            for replayed_id in device_ids:
+                try:
+                    self.send(self._payload(reading, replayed_id))
+                    ok = True
+                except Exception as e:
+                    print(f"Send failed for {replayed_id}: {e}")
+                    ok = False
+                with self._lock:
+                    if ok:
+                        self.sent += 1
+                    else:
+                        self.failed += 1
+                    self.lag = max(self.lag, time.monotonic() - due)
+                    if self.position is None or reading.timestamp > self.position:
+                        self.position = reading.timestamp
+
+    def run(self, readings):
+        """Replay an iterable of Readings ordered by timestamp; returns when all are sent."""
+        for reading in readings:
+            if self.origin is None:
+                wall_shift = datetime.utcnow() - reading.timestamp
+                self.origin = (reading.timestamp, time.monotonic(), wall_shift)
+            device_queue = self._queues.get(reading.device_id)
+            if device_queue is None:
+                device_queue = self._queues[reading.device_id] = queue.Queue(DEVICE_QUEUE_SIZE)
+                thread = threading.Thread(target=self._run_device, args=(reading.device_id, device_queue),
+                                          name=f"replay-{reading.device_id}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            # Blocks while this device is far ahead of its schedule
+            device_queue.put(reading)
+        for device_queue in self._queues.values():
+            device_queue.put(_END)
+        for thread in self._threads:
+            thread.join()
+
+    @property
+    def device_count(self):
+        return len(self._queues) * self.clones
+
+    def progress(self):
+        with self._lock:
+            return self.sent, self.failed, self.lag, self.position
+
+
+def report_progress(replay, stop):
+    started = time.monotonic()
+    while not stop.wait(PROGRESS_SECONDS):
+        sent, failed, lag, position = replay.progress()
+        if replay.origin is None or position is None:
+            continue
+        elapsed = time.monotonic() - started
+        data_seconds = (position - replay.origin[0]).total_seconds()
+        print(f"  {sent} sent ({failed} failed) across {replay.device_count} device(s), "
+              f"data time {position}, effective speed {data_seconds / elapsed:.0f}x, "
+              f"max lag {lag:.2f}s")
+
+
+def mqtt_sender():
+    client = mqtt.Client()
+    print(f"Connecting to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}...")
+    client.connect(MQTT_BROKER, MQTT_PORT, 60)
+    client.loop_start()
+
+    def send(payload):
+        result = client.publish(MQTT_TOPIC, json.dumps(payload))
+        if result.rc != mqtt.MQTT_ERR_SUCCESS:
+            raise RuntimeError(f"publish failed with code {result.rc}")
+
+    def close():
+        client.loop_stop()
+        client.disconnect()
+
+    return send, close
+
+
+def ingest_sender():
+    """Inject readings into the logger's ingest handler, skipping MQTT."""
+    import mqtt_database_logger as ingest
+
+    storage = get_backend()
+    storage.check()
+    print(f"Injecting into {describe_backend(storage)}")
+    writer = ingest.start_writer(storage)
+
+    def send(payload):
+        ingest.handle_payload(payload, verbose=False)
+
+    return send, writer.stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay stored BoilerStat readings")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--file", action="append",
+                        help="Archived CSV/NDJSON file (optionally .gz); repeatable, replayed in order")
+    parser.add_argument("--start", help="Database replay: UTC start time (ISO)")
+    parser.add_argument("--end", help="Database replay: UTC end time (ISO, default: now)")
+    parser.add_argument("--device", help="Only replay this device")
+    parser.add_argument("--target", choices=["mqtt", "ingest"], default="mqtt",
+                        help="Publish to MQTT_TOPIC (default) or write through the logger's ingest handler")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Time scale factor, e.g. 100; 0 = as fast as possible (default: 1)")
+    parser.add_argument("--shift-to-now", action="store_true",
+                        help="Shift timestamps so the first reading is stamped with the current time "
+                             "(with --speed 1 the replay looks like live data)")
+    parser.add_argument("--device-prefix", default="",
+                        help="Prefix replayed device IDs, e.g. 'replay-', to keep them apart from live data")
+    parser.add_argument("--clones", type=int, default=1,
+                        help="Replay each device N times in parallel as <device>-c1..cN (default: 1)")
+    parser.add_argument("--demo", action="store_true", help="Mark replayed readings as demo data")
+    args = parser.parse_args()
+
+    if args.file:
+        readings = (reading for path in args.file for reading in read_file(path))
+        if args.device:
+            readings = (r for r in readings if r.device_id == args.device)
+        source_name = ', '.join(args.file)
+    elif args.start:
+        end = parse_time(args.end) if args.end else datetime.utcnow()
+        readings = read_storage(parse_time(args.start), end, args.device)
+        source_name = f"database {args.start} .. {end.isoformat()}"
+    else:
+        parser.error("give --file or --start")
+
+    send, close = mqtt_sender() if args.target == "mqtt" else ingest_sender()
+    replay = Replay(send, args.speed, shift_to_now=args.shift_to_now, device_prefix=args.device_prefix,
+                    clones=args.clones, demo=args.demo)
+
+    print(f"Replaying {source_name} to {args.target} at "
+          f"{'maximum speed' if not args.speed else f'{args.speed:g}x'}")
+    stop = threading.Event()
+    threading.Thread(target=report_progress, args=(replay, stop), daemon=True).start()
+    started = time.monotonic()
+    try:
+        replay.run(readings)
+    except KeyboardInterrupt:
+        print("\nStopping replay...")
+    finally:
+        stop.set()
+        close()
+
+    sent, failed, lag, _ = replay.progress()
+    elapsed = time.monotonic() - started
+    print(f"Replayed {sent} readings ({failed} failed) in {elapsed:.1f}s "
+          f"({sent / elapsed if elapsed else 0:.0f}/s), max lag {lag:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Live rolling utilization for the BoilerStat dashboard API.
+
+The API's MQTT subscriber counts every reading into per-device sliding
+windows (ROLLING_WINDOWS, default 1, 5 and 15 minutes) so /api/live can say
+what the burner and zones are doing right now without waiting for the
+minute aggregates or touching the database.
+
+Each device has a ring of ROLLING_BUCKET_SECONDS buckets (samples and on
+counts per channel) spanning the longest window, plus a running sum per
+window. A reading adds to its bucket and to every window sum; when a new
+bucket starts, the bucket that just fell out of each window is subtracted.
+Both are O(windows x channels) per reading, independent of the window
+length. Windows are in API receive time, so device clock skew does not
+shift them; utilization is sample-weighted like the minute aggregates.
+
+The subscriber publishes the window sums every ROLLING_PUBLISH_SECONDS to a
+memory-mapped file (mqtt_state.SharedSnapshot) that every worker reads.
+"""
+
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from profiles import channel_name
+
+# Window lengths in seconds
+ROLLING_WINDOWS = tuple(int(s) for s in os.getenv("ROLLING_WINDOWS", "60,300,900").split(',') if s.strip())
+# Window resolution: a window covers whole buckets, so it trails by up to this much
+ROLLING_BUCKET_SECONDS = float(os.getenv("ROLLING_BUCKET_SECONDS", "5"))
+ROLLING_PUBLISH_SECONDS = float(os.getenv("ROLLING_PUBLISH_SECONDS", "1"))
+# Devices tracked; beyond this the least recently heard device is dropped
+ROLLING_MAX_DEVICES = int(os.getenv("ROLLING_MAX_DEVICES", "1000"))
+
+_default_state_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+ROLLING_STATE_FILE = os.getenv("ROLLING_STATE_FILE", os.path.join(_default_state_dir, "boilerstat-rolling"))
+ROLLING_STATE_SIZE = int(os.getenv("ROLLING_STATE_SIZE", str(1024 * 1024)))
+
+
+def window_label(seconds):
+    return f"{seconds // 60}m" if seconds % 60 == 0 else f"{seconds}s"
+
+
+def _add_into(totals, counts, sign=1):
+    """totals += sign x counts, element-wise; totals grows to fit."""
+    if len(totals) < len(counts):
+        totals.extend([0] * (len(counts) - len(totals)))
+    for i, value in enumerate(counts):
+        totals[i] += sign * value
+
+
+class DeviceWindows:
+    """Bucket ring and per-window sums of one device; counts are [samples, on per channel...]."""
+
+    __slots__ = ('sizes', 'ring', 'bucket', 'sums', 'last_seen')
+
+    def __init__(self, sizes):
+        self.sizes = sizes
+        # One bucket more than the longest window, so a bucket is still here when it expires
+        self.ring = [None] * (max(sizes) + 1)
+        self.bucket = None
+        self.sums = [[0] for _ in sizes]
+        self.last_seen = None
+
+    def advance(self, bucket):
+        """Move the windows forward to end at bucket, expiring what falls out."""
+        if self.bucket is None or bucket - self.bucket >= len(self.ring):
+            # First reading, or silent for longer than every window
+            self.ring = [None] * len(self.ring)
+            self.sums = [[0] for _ in self.sizes]
+            self.bucket = bucket
+            return
+        # Late readings (clock stepped back) count into the current bucket
+        for entering in range(self.bucket + 1, bucket + 1):
+            for window, size in enumerate(self.sizes):
+                expired = self.ring[(entering - size) % len(self.ring)]
+                if expired is not None:
+                    _add_into(self.sums[window], expired, -1)
+            self.ring[entering % len(self.ring)] = None
+        self.bucket = max(self.bucket, bucket)
+
+    def add(self, bucket, states):
+        """Count one reading: states is [burner, zone_1, ...] as 0/1."""
+        self.advance(bucket)
+        slot = self.bucket % len(self.ring)
+        counts = [1, *states]
+        if self.ring[slot] is None:
+            self.ring[slot] = [0] * len(counts)
+        _add_into(self.ring[slot], counts)
+        for window_sums in self.sums:
+            _add_into(window_sums, counts)
+
+
+class RollingUtilization:
+    """Per-device sliding-window utilization, fed one reading at a time."""
+
+    def __init__(self, windows=ROLLING_WINDOWS, bucket_seconds=ROLLING_BUCKET_SECONDS,
+                 max_devices=ROLLING_MAX_DEVICES):
+        self.windows = tuple(sorted(windows))
+        self.bucket_seconds = bucket_seconds
+        self.sizes = [max(1, round(seconds / bucket_seconds)) for seconds in self.windows]
+        self.max_devices = max_devices
+        self._devices = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, device_id, burner, zones, received_at):
+        """Count a reading received at epoch seconds received_at."""
+        bucket = int(received_at // self.bucket_seconds)
+        with self._lock:
+            device = self._devices.get(device_id)
+            if device is None:
+                device = self._devices[device_id] = DeviceWindows(self.sizes)
+                if len(self._devices) > self.max_devices:
+                    self._devices.popitem(last=False)
+            else:
+                self._devices.move_to_end(device_id)
+            device.add(bucket, [1 if burner else 0, *zones])
+            device.last_seen = received_at
+
+    def snapshot(self, now):
+        """JSON-ready window utilizations of every device as of epoch seconds now."""
+        bucket = int(now // self.bucket_seconds)
+        devices = {}
+        with self._lock:
+            for device_id, device in self._devices.items():
+                device.advance(bucket)
+                windows = {}
+                for seconds, sums in zip(self.windows, device.sums):
+                    samples = sums[0]
+                    window = {'samples': samples}
+                    for channel, on in enumerate(sums[1:]):
+                        window[channel_name(channel)] = round(on * 100 / samples, 1) if samples else None
+                    windows[window_label(seconds)] = window
+                devices[device_id] = {
+                    'last_reading_at': datetime.fromtimestamp(device.last_seen, timezone.utc).isoformat(),
+                    'windows': windows,
+                }
+        return {
+            'as_of': datetime.fromtimestamp(now, timezone.utc).isoformat(),
+            'windows': {window_label(seconds): seconds for seconds in self.windows},
+            'bucket_seconds': self.bucket_seconds,
+            'devices': devices,
+        }
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+MQTT session benchmark - ingest throughput and reading loss of
+mqtt_database_logger with a clean QoS 0 session versus a persistent QoS 1
+session (acks after commit) at several in-flight windows, across broker and
+listener restarts.
+
+No broker needs to be installed. The benchmark runs a stand-in MQTT 3.1.1
+broker in-process (StandInBroker). It supports QoS 0 and 1, clean and
+persistent sessions, a per-client in-flight limit like mosquitto's
+max_inflight_messages, and a queue limit for offline sessions like
+max_queued_messages. A broker restart drops every connection and, with
+--no-persistence, every session.
+
+Each configuration runs the logger as a subprocess against a temporary
+SQLite database, in two phases:
+
+    throughput  --messages readings published as fast as possible, no
+                restarts: readings stored per second
+    restarts    --messages readings published at --rate per second, with
+                --broker-restarts broker restarts (--downtime seconds each)
+                and --listener-restarts listener restarts (SIGTERM, as
+                docker stop sends) evenly spread over the run: readings
+                missing and stored twice, by device_id and seq
+
+The publisher uses QoS 1 and resends what a broker restart interrupted, so
+every reading reaches the broker; what goes missing is lost on the way to the
+database.
+
+Usage:
+    python3 session_benchmark.py
+    python3 session_benchmark.py --windows 20 100 500 --messages 20000 --rate 2000
+    python3 session_benchmark.py --no-persistence        # broker loses sessions on restart
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sqlite3
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+
+import paho.mqtt.client as mqtt
+
+BENCH_START = datetime(2000, 1, 1)
+READING_INTERVAL = timedelta(seconds=5)
+TOPIC = "boilerstat/bench/reading"
+CLIENT_ID = "bench-session-logger"
+ZONES = 6
+
+CONNECT, CONNACK, PUBLISH, PUBACK, SUBSCRIBE, SUBACK = 1, 2, 3, 4, 8, 9
+UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 10, 11, 12, 13, 14
+
+
+def _length(value):
+    encoded = bytearray()
+    while True:
+        value, byte = divmod(value, 128)
+        encoded.append(byte | (128 if value else 0))
+        if not value:
+            return bytes(encoded)
+
+
+def _string(body, offset):
+    size, = struct.unpack_from('!H', body, offset)
+    return body[offset + 2:offset + 2 + size].decode(), offset + 2 + size
+
+
+def _publish_packet(topic, payload, qos, mid=None, dup=False):
+    topic = topic.encode()
+    body = struct.pack('!H', len(topic)) + topic + (struct.pack('!H', mid) if qos else b'') + payload
+    return bytes([PUBLISH << 4 | (8 if dup else 0) | qos << 1]) + _length(len(body)) + body
+
+
+class Session:
+    __slots__ = ('client_id', 'clean', 'subscriptions', 'queue', 'inflight', 'next_mid', 'connection')
+
+    def __init__(self, client_id, clean):
+        self.client_id = client_id
+        self.clean = clean
+        self.subscriptions = {}
+        self.queue = deque()
+        self.inflight = OrderedDict()
+        self.next_mid = 0
+        self.connection = None
+
+    @property
+    def online(self):
+        return self.connection is not None and not self.connection.is_closing()
+
+
+class StandInBroker:
+    """Minimal in-process MQTT 3.1.1 broker: QoS 0/1, clean and persistent sessions."""
+
+    def __init__(self, port=0, max_inflight=20, max_queued=1000, persistence=True):
+        self.port = port
+        self.max_inflight = max_inflight
+        self.max_queued = max_queued
+        self.persistence = persistence
+        self.sessions = {}
+        self.dropped = 0
+        self._connections = set()
+        self._server = None
+        self._loop = asyncio.new_event_loop()
+
+    def start(self):
+        threading.Thread(target=self._loop.run_forever, name="stand-in-broker", daemon=True).start()
+        self._call(self._listen())
+        return self
+
+    def restart(self, downtime):
+        """Drop every connection, stay down for downtime seconds, listen again."""
+        self._call(self._restart(downtime))
+
+    def stop(self):
+        self._call(self._close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def subscribed(self, topic):
+        return any(topic in session.subscriptions and session.connection is not None
+                   for session in list(self.sessions.values()))
+
+    def _call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def _listen(self):
+        self._server = await asyncio.start_server(self._serve, '127.0.0.1', self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def _close(self):
+        self._server.close()
+        for writer in list(self._connections):
+            writer.close()
+        await self._server.wait_closed()
+        for session in self.sessions.values():
+            session.connection = None
+        # Clean sessions end with their connection; persistent ones survive only with persistence
+        self.sessions = {client_id: session for client_id, session in self.sessions.items()
+                         if self.persistence and not session.clean}
+
+    async def _restart(self, downtime):
+        await self._close()
+        await asyncio.sleep(downtime)
+        await self._listen()
+
+    async def _serve(self, reader, writer):
+        self._connections.add(writer)
+        session = None
+        try:
+            while True:
+                header = (await reader.readexactly(1))[0]
+                length, shift = 0, 0
+                while True:
+                    byte = (await reader.readexactly(1))[0]
+                    length |= (byte & 127) << shift
+                    shift += 7
+                    if not byte & 128:
+                        break
+                body = await reader.readexactly(length)
+                kind = header >> 4
+                if kind == CONNECT:
+                    session = self._connect(body, writer)
+                elif kind == PUBLISH:
+                    self._publish(header, body, writer)
+                elif kind == PUBACK and session is not None:
+                    session.inflight.pop(struct.unpack('!H', body[:2])[0], None)
+                    self._deliver(session)
+                elif kind == SUBSCRIBE and session is not None:
+                    offset, granted = 2, []
+                    while offset < len(body):
+                        topic, offset = _string(body, offset)
+                        session.subscriptions[topic] = min(body[offset], 1)
+                        granted.append(session.subscriptions[topic])
+                        offset += 1
+                    writer.write(bytes([SUBACK << 4, 2 + len(granted)]) + body[:2] + bytes(granted))
+                elif kind == UNSUBSCRIBE and session is not None:
+                    offset = 2
+                    while offset < len(body):
+                        topic, offset = _string(body, offset)
+                        session.subscriptions.pop(topic, None)
+                    writer.write(bytes([UNSUBACK << 4, 2]) + body[:2])
+                elif kind == PINGREQ:
+                    writer.write(bytes([PINGRESP << 4, 0]))
+                elif kind == DISCONNECT:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            if session is not None and session.connection is writer:
+                session.connection = None
+                if session.clean:
+                    self.sessions.pop(session.client_id, None)
+            writer.close()
+
+    def _connect(self, body, writer):
+        _, offset = _string(body, 0)
+        flags = body[offset + 1]
+        client_id, _ = _string(body, offset + 4)
+        clean = bool(flags & 2)
+        client_id = client_id or f"anonymous-{id(writer)}"
+        session = self.sessions.get(client_id)
+        if session is not None and session.connection is not None:
+            # Session takeover: the newer connection wins
+            session.connection.close()
+        present = session is not None and not clean
+        if not present:
+            session = self.sessions[client_id] = Session(client_id, clean)
+        session.connection = writer
+        writer.write(bytes([CONNACK << 4, 2, 1 if present else 0, 0]))
+        # Unacknowledged messages are redelivered first, flagged DUP
+        for mid, (topic, payload) in session.inflight.items():
+            writer.write(_publish_packet(topic, payload, 1, mid, dup=True))
+        self._deliver(session)
+        return session
+
+    def _publish(self, header, body, writer):
+        topic, offset = _string(body, 0)
+        qos = (header >> 1) & 3
+        if qos:
+            writer.write(bytes([PUBACK << 4, 2]) + body[offset:offset + 2])
+            offset += 2
+        payload = body[offset:]
+        for session in self.sessions.values():
+            granted = max((sub_qos for sub, sub_qos in session.subscriptions.items()
+                           if mqtt.topic_matches_sub(sub, topic)), default=None)
+            if granted is None:
+                continue
+            if min(qos, granted) == 0:
+                if session.online:
+                    session.connection.write(_publish_packet(topic, payload, 0))
+                else:
+                    self.dropped += 1
+            elif len(session.queue) >= self.max_queued:
+                self.dropped += 1
+            else:
+                session.queue.append((topic, payload))
+                self._deliver(session)
+
+    def _deliver(self, session):
+        while session.online and session.queue and len(session.inflight) < self.max_inflight:
+            session.next_mid = session.next_mid % 65535 + 1
+            if session.next_mid in session.inflight:
+                continue
+            topic, payload = session.queue.popleft()
+            session.inflight[session.next_mid] = (topic, payload)
+            session.connection.write(_publish_packet(topic, payload, 1, session.next_mid))
+
+
+def generate_payloads(count, devices):
+    """MQTT message bodies round-robin across devices, with per-device seq numbers."""
+    payloads = []
+    for i in range(count):
+        seq = i // devices
+        timestamp = (BENCH_START + READING_INTERVAL * seq).strftime('%Y-%m-%d %H:%M:%S')
+        payloads.append(json.dumps({
+            'device_id': f"bench-{i % devices}",
+            'timestamp': timestamp,
+            'sent_at': timestamp,
+            'seq': seq,
+            'burner': i % 2,
+            'zones': [(i >> z) & 1 for z in range(ZONES)],
+        }).encode())
+    return payloads
+
+
+def stored_counts(database):
+    """(distinct readings stored, readings stored more than once) by device_id and seq."""
+    with sqlite3.connect(database) as conn:
+        return conn.execute('''
+            SELECT count(*), coalesce(sum(CASE WHEN copies > 1 THEN 1 ELSE 0 END), 0) FROM (
+                SELECT device_id, seq, count(*) AS copies FROM boiler_readings
+                WHERE device_id LIKE 'bench-%' GROUP BY device_id, seq
+            ) stored
+        ''').fetchone()
+
+
+class Listener:
+    """The logger as a subprocess, started again whenever it exits (restart: unless-stopped)."""
+
+    def __init__(self, env):
+        self.env = env
+        self.process = self._start()
+
+    def _start(self):
+        return subprocess.Popen([sys.executable, 'mqtt_database_logger.py'], env=self.env,
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def supervise(self):
+        # The logger exits when the broker is unreachable at startup
+        if self.process.poll() is not None:
+            self.process = self._start()
+
+    def restart(self):
+        self.process.terminate()
+        self.process.wait()
+        self.process = self._start()
+
+    def stop(self):
+        self.process.send_signal(signal.SIGINT)
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def wait_for(condition, timeout, what):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"timed out waiting for {what}")
+        time.sleep(0.02)
+
+
+def run(args, name, persistent, window, rate, broker_restarts, listener_restarts):
+    """Publish args.messages readings through the stand-in broker to a logger;
+    returns (seconds until the last reading was stored, stored, duplicated, dropped by the broker)."""
+    database = os.path.join(tempfile.mkdtemp(prefix='session-bench-'), 'bench.db')
+    broker = StandInBroker(max_inflight=window or 20, max_queued=args.max_queued,
+                           persistence=not args.no_persistence).start()
+    env = dict(os.environ, STORAGE_BACKEND='sqlite', SQLITE_PATH=database, MQTT_BROKER='127.0.0.1',
+               MQTT_PORT=str(broker.port), MQTT_TOPIC=TOPIC, ANOMALY_DETECTION='false',
+               LATENCY_REPORT_SECONDS='0', LISTENER_NAME=name, LISTENER_HEARTBEAT_SECONDS='3600',
+               MQTT_PERSISTENT_SESSION='true' if persistent else 'false', MQTT_CLIENT_ID=CLIENT_ID,
+               MQTT_QOS='1' if persistent else '0', MQTT_MAX_INFLIGHT=str(window or 20),
+               MQTT_RECONNECT_MIN_SECONDS='0.2', MQTT_RECONNECT_MAX_SECONDS='2',
+               INGEST_BATCH_SIZE=str(max(window or 0, 50)))
+    listener = Listener(env)
+    wait_for(lambda: broker.subscribed(TOPIC), 60, "the listener to subscribe")
+
+    acknowledged = []
+    publisher = mqtt.Client()
+    publisher.on_publish = lambda client, userdata, mid: acknowledged.append(mid)
+    publisher.max_inflight_messages_set(1000)
+    publisher.max_queued_messages_set(0)
+    publisher.reconnect_delay_set(0.1, 1)
+    publisher.connect('127.0.0.1', broker.port, 60)
+    publisher.loop_start()
+
+    payloads = generate_payloads(args.messages, args.devices)
+    # Restarts spread evenly over the run: broker restarts at thirds, a listener restart half way, ...
+    events = sorted([((i + 1) / (broker_restarts + 1), 'broker') for i in range(broker_restarts)] +
+                    [((i + 0.5) / listener_restarts, 'listener') for i in range(listener_restarts)])
+    events = deque((round(fraction * len(payloads)), kind) for fraction, kind in events)
+    start = time.perf_counter()
+    for i, payload in enumerate(payloads):
+        while events and i >= events[0][0]:
+            if events.popleft()[1] == 'broker':
+                broker.restart(args.downtime)
+            else:
+                listener.restart()
+        publisher.publish(TOPIC, payload, qos=1)
+        listener.supervise()
+        if rate:
+            delay = start + (i + 1) / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    # Messages published while disconnected are resent by paho after it reconnects
+    wait_for(lambda: listener.supervise() or len(acknowledged) >= len(payloads), args.timeout, "the publisher")
+
+    # Wait for every reading, or until nothing more is stored for --settle seconds
+    last, changed = None, time.monotonic()
+    finished = start
+    while time.monotonic() - changed < args.settle:
+        listener.supervise()
+        stored, _ = stored_counts(database)
+        if stored != last:
+            last, changed, finished = stored, time.monotonic(), time.perf_counter()
+        if stored >= args.messages:
+            break
+        time.sleep(0.05)
+
+    publisher.loop_stop()
+    publisher.disconnect()
+    listener.stop()
+    stored, duplicated = stored_counts(database)
+    broker.stop()
+    return finished - start, stored, duplicated, broker.dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark clean vs persistent MQTT ingest sessions")
+    parser.add_argument("--messages", type=int, default=5000, help="Readings per run (default: 5000)")
+    parser.add_argument("--devices", type=int, default=16, help="Number of devices (default: 16)")
+    parser.add_argument("--windows", type=int, nargs="+", default=[20, 100, 500],
+                        help="In-flight windows of the persistent runs (default: 20 100 500)")
+    parser.add_argument("--rate", type=float, default=500,
+                        help="Readings per second in the restart phase (default: 500)")
+    parser.add_argument("--broker-restarts", type=int, default=2, help="Broker restarts (default: 2)")
+    parser.add_argument("--listener-restarts", type=int, default=1, help="Listener restarts (default: 1)")
+    parser.add_argument("--downtime", type=float, default=1.0, help="Seconds the broker stays down (default: 1)")
+    parser.add_argument("--max-queued", type=int, default=1000,
+                        help="Broker queue limit per offline session (default: 1000, as mosquitto)")
+    parser.add_argument("--no-persistence", action="store_true", help="Broker loses sessions when restarted")
+    parser.add_argument("--settle", type=float, default=10,
+                        help="Seconds without a new stored reading that end a run (default: 10)")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for the publisher")
+    args = parser.parse_args()
+
+    configurations = [("clean session, QoS 0", False, None)]
+    configurations += [("persistent, QoS 1", True, window) for window in args.windows]
+    print(f"{args.messages:,} readings from {args.devices} devices; restarts: {args.broker_restarts} broker "
+          f"({args.downtime:g}s down, persistence {'off' if args.no_persistence else 'on'}), "
+          f"{args.listener_restarts} listener, at {args.rate:g} readings/s")
+    print(f"\n  {'session':<22} {'window':>6} {'readings/s':>11} {'missing':>9} {'(broker queue full)':>20} "
+          f"{'duplicated':>11}")
+    for index, (label, persistent, window) in enumerate(configurations):
+        name = f"bench-listener-{index}"
+        seconds, stored, _, _ = run(args, name, persistent, window, 0, 0, 0)
+        throughput = stored / seconds if seconds else 0.0
+        _, stored, duplicated, dropped = run(args, name, persistent, window, args.rate,
+                                             args.broker_restarts, args.listener_restarts)
+        print(f"  {label:<22} {window or '-':>6} {throughput:>11,.0f} {args.messages - stored:>9,} "
+              f"{dropped:>20,} {duplicated:>11,}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Listener sharding for BoilerStat.
+
+By default a single mqtt_database_logger ingests every reading; a second
+one would store each reading twice. LISTENER_SHARDING lets N listener
+processes split the stream with no duplicates:
+
+    hash     every listener subscribes to MQTT_TOPIC and stores only the
+             devices with crc32(device_id) % LISTENER_SHARD_COUNT equal to its
+             LISTENER_SHARD_INDEX. A device always lands on the same listener,
+             so anomaly detection and sequence-gap tracking still see its
+             whole stream; each listener receives and parses all traffic.
+    shared   listeners join the MQTT shared subscription
+             $share/LISTENER_SHARE_GROUP/MQTT_TOPIC and the broker delivers
+             each message to one of them. Listeners can be added without
+             renumbering, but a device's readings are spread across them, so
+             anomaly detection and sequence-gap tracking are switched off.
+
+Each listener writes a heartbeat row to listener_shards every
+LISTENER_HEARTBEAT_SECONDS with its counters, write backlog and lag;
+/api/listeners reports them together with missing or duplicated hash shards.
+"""
+
+import os
+import socket
+import threading
+import zlib
+from datetime import datetime
+
+SHARDING_MODES = ('none', 'hash', 'shared')
+LISTENER_SHARDING = os.getenv("LISTENER_SHARDING", "none")
+LISTENER_SHARD_COUNT = int(os.getenv("LISTENER_SHARD_COUNT", "1"))
+LISTENER_SHARD_INDEX = int(os.getenv("LISTENER_SHARD_INDEX", "0"))
+LISTENER_SHARE_GROUP = os.getenv("LISTENER_SHARE_GROUP", "boilerstat-listeners")
+# Heartbeat row key; must be unique per listener process
+LISTENER_NAME = os.getenv("LISTENER_NAME") or socket.gethostname()
+LISTENER_HEARTBEAT_SECONDS = float(os.getenv("LISTENER_HEARTBEAT_SECONDS", "15"))
+# A listener whose last heartbeat is older than this many intervals is reported down
+LISTENER_STALE_HEARTBEATS = 3
+
+
+def shard_of(device_id, count):
+    """Hash shard of a device; stable across processes and Python versions."""
+    return zlib.crc32(device_id.encode()) % count
+
+
+class Shard:
+    """Which readings this listener stores, and its counters for the heartbeat."""
+
+    def __init__(self, mode=LISTENER_SHARDING, index=LISTENER_SHARD_INDEX, count=LISTENER_SHARD_COUNT,
+                 group=LISTENER_SHARE_GROUP, name=LISTENER_NAME):
+        if mode not in SHARDING_MODES:
+            raise ValueError(f"Unknown LISTENER_SHARDING {mode!r}; use 'none', 'hash' or 'shared'")
+        if mode == 'hash' and not 0 <= index < count:
+            raise ValueError(f"LISTENER_SHARD_INDEX {index} is outside 0..{count - 1}")
+        self.mode = mode
+        self.index = index if mode == 'hash' else None
+        self.count = count if mode == 'hash' else None
+        self.group = group
+        self.name = name
+        self.started_at = datetime.utcnow()
+        self._lock = threading.Lock()
+        self._devices = set()
+        self.received = 0
+        self.skipped = 0
+        self.stored = 0
+        self.errors = 0
+
+    @property
+    def whole_device_streams(self):
+        """True if every reading of a device reaches this listener (per-device state is valid)."""
+        return self.mode != 'shared'
+
+    def topic(self, topic):
+        """Subscription topic for MQTT_TOPIC."""
+        return f"$share/{self.group}/{topic}" if self.mode == 'shared' else topic
+
+    def describe(self):
+        if self.mode == 'hash':
+            return f"hash shard {self.index} of {self.count}"
+        if self.mode == 'shared':
+            return f"shared subscription group {self.group}"
+        return "all readings (no sharding)"
+
+    def accept(self, device_id):
+        """Count a received reading; True if this listener stores it."""
+        with self._lock:
+            self.received += 1
+            if self.mode == 'hash' and shard_of(device_id, self.count) != self.index:
+                self.skipped += 1
+                return False
+            self._devices.add(device_id)
+            return True
+
+    def count_error(self):
+        with self._lock:
+            self.received += 1
+            self.errors += 1
+
+    def count_rejected(self, readings):
+        """Readings accepted earlier that the database refused."""
+        with self._lock:
+            self.errors += readings
+
+    def count_stored(self, readings):
+        with self._lock:
+            self.stored += readings
+
+    def status(self, queued, lag_seconds, commit_p95):
+        """Heartbeat fields (listener_shards columns other than listener and heartbeat_at)."""
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'shard_index': self.index,
+                'shard_count': self.count,
+                'started_at': self.started_at,
+                'heartbeat_seconds': LISTENER_HEARTBEAT_SECONDS,
+                'received': self.received,
+                'stored': self.stored,
+                'skipped': self.skipped,
+                'errors': self.errors,
+                'devices': len(self._devices),
+                'queued': queued,
+                'lag_seconds': lag_seconds,
+                'commit_p95_seconds': commit_p95,
+            }
+
+
+def shard_report(listeners, now):
+    """Health summary of listener_shards rows (dicts, times as naive UTC datetimes).
+
+    Flags listeners that stopped heartbeating, hash shards nobody serves,
+    shards served twice and listeners whose modes would store readings twice.
+    """
+    for listener in listeners:
+        age = (now - listener['heartbeat_at']).total_seconds()
+        listener['heartbeat_age_seconds'] = round(age, 1)
+        listener['healthy'] = age <= LISTENER_STALE_HEARTBEATS * listener['heartbeat_seconds']
+    live = [listener for listener in listeners if listener['healthy']]
+
+    modes = sorted({listener['mode'] for listener in live})
+    problems = []
+    if len(modes) > 1:
+        problems.append(f"listeners run different sharding modes ({', '.join(modes)}); readings are stored twice")
+    if 'none' in modes and len(live) > 1:
+        problems.append("more than one unsharded listener; readings are stored twice")
+
+    missing, duplicated = [], []
+    hashed = [listener for listener in live if listener['mode'] == 'hash']
+    counts = sorted({listener['shard_count'] for listener in hashed})
+    if len(counts) > 1:
+        problems.append(f"hash listeners disagree on LISTENER_SHARD_COUNT ({', '.join(map(str, counts))})")
+    if counts:
+        served = [listener['shard_index'] for listener in hashed]
+        missing = [index for index in range(max(counts)) if index not in served]
+        duplicated = sorted({index for index in served if served.count(index) > 1})
+        if missing:
+            problems.append(f"no live listener for hash shard(s) {', '.join(map(str, missing))}")
+        if duplicated:
+            problems.append(f"hash shard(s) {', '.join(map(str, duplicated))} served twice")
+
+    return {
+        'listeners': listeners,
+        'live': len(live),
+        'healthy': not problems and len(live) == len(listeners) and bool(live),
+        'missing_shards': missing,
+        'duplicated_shards': duplicated,
+        'problems': problems,
+    }
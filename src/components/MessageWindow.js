@@ -6,22 +6,20 @@ const MessageWindow = () => {
   const [isPaused, setIsPaused] = useState(false);
   const [showDetails, setShowDetails] = useState(true);
   const messagesEndRef = useRef(null);
-  const eventSourceRef = useRef(null);
+  const cursorRef = useRef(null);
+  const pausedRef = useRef(false);
 
   useEffect(() => {
-    // Load initial messages
-    fetchRecentMessages();
-    
-    // Set up Server-Sent Events for real-time updates
-    connectEventSource();
-    
-    return () => {
-      if (eventSourceRef.current) {
-        eventSourceRef.current.close();
-      }
-    };
+    // Load recent messages, then poll for new ones with the returned cursor
+    fetchMessages();
+    const interval = setInterval(fetchMessages, 2000);
+    return () => clearInterval(interval);
   }, []);
 
+  useEffect(() => {
+    pausedRef.current = isPaused;
+  }, [isPaused]);
+
   useEffect(() => {
     // Auto-scroll to bottom when new messages arrive (if not paused)
     if (!isPaused && messagesEndRef.current) {
@@ -29,45 +27,22 @@ const MessageWindow = () => {
     }
   }, [messages, isPaused]);
 
-  const fetchRecentMessages = async () => {
+  const fetchMessages = async () => {
+    if (pausedRef.current) return;
     try {
-      const response = await fetch('/api/messages');
+      const query = cursorRef.current === null ? '' : `?since=${cursorRef.current}`;
+      const response = await fetch(`/api/messages${query}`);
       const data = await response.json();
-      setMessages(data);
-    } catch (error) {
-      console.error('Failed to fetch recent messages:', error);
-    }
-  };
-
-  const connectEventSource = () => {
-    try {
-      eventSourceRef.current = new EventSource('/api/stream');
-      
-      eventSourceRef.current.onopen = () => {
-        setIsConnected(true);
-        console.log('Connected to ESP32 message stream');
-      };
-      
-      eventSourceRef.current.onmessage = (event) => {
-        if (!isPaused) {
-          try {
-            const newMessage = JSON.parse(event.data);
-            setMessages(prev => [...prev.slice(-49), newMessage]); // Keep last 50 messages
-          } catch (error) {
-            console.error('Failed to parse message:', error);
-          }
-        }
-      };
-      
-      eventSourceRef.current.onerror = () => {
-        setIsConnected(false);
-        console.error('Lost connection to ESP32 message stream');
-        // Attempt to reconnect after 5 seconds
-        setTimeout(connectEventSource, 5000);
-      };
+      setIsConnected(true);
+      if (cursorRef.current === null || data.reset) {
+        setMessages(data.messages);
+      } else if (data.messages.length > 0) {
+        setMessages(prev => [...prev, ...data.messages].slice(-50)); // Keep last 50 messages
+      }
+      cursorRef.current = data.cursor;
     } catch (error) {
-      console.error('Failed to connect to message stream:', error);
       setIsConnected(false);
+      console.error('Failed to fetch messages:', error);
     }
   };
 
@@ -141,7 +116,7 @@ const MessageWindow = () => {
           <div className="message-list">
             {messages.map((msg, index) => (
               <div 
-                key={index} 
+                key={msg.seq} 
                 className={`message-item ${msg.mode || 'unknown'}-mode`}
               >
                 <div className="message-main">
@@ -178,7 +153,7 @@ const MessageWindow = () => {
                     </div>
                     <div className="detail-row">
                       <span>Active Zones: </span>
-                      <span>{msg.zones.filter(z => z).length}/6</span>
+                      <span>{msg.zones.filter(z => z).length}/{msg.zones.length}</span>
                     </div>
                   </div>
                 )}
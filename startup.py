@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Startup checks for BoilerStat services and CLI tools.
+
+Entry points verify the database and the MQTT broker before doing any work.
+run_probes() runs those checks concurrently, each bounded by
+STARTUP_PROBE_TIMEOUT, so a start takes as long as the slowest check rather
+than the sum of them, and an unreachable host fails in seconds instead of
+after the operating system's TCP timeout.
+
+The broker check is a plain TCP connect, so it costs neither the paho import
+nor an MQTT session.
+"""
+
+import os
+import socket
+import threading
+import time
+from collections import namedtuple
+
+STARTUP_PROBE_TIMEOUT = float(os.getenv("STARTUP_PROBE_TIMEOUT", "5"))
+
+# error is None when the probe succeeded; seconds is None when it timed out
+ProbeResult = namedtuple('ProbeResult', ['name', 'ok', 'seconds', 'error'])
+
+
+def database_probe(storage):
+    """Probe opening a connection on a storage backend (also imports its driver)."""
+    return storage.check
+
+
+def mqtt_probe(host, port, timeout=STARTUP_PROBE_TIMEOUT):
+    """Probe opening a TCP connection to the MQTT broker."""
+    def probe():
+        socket.create_connection((host, port), timeout=timeout).close()
+    return probe
+
+
+def run_probes(probes, timeout=STARTUP_PROBE_TIMEOUT):
+    """Run {name: callable} concurrently; returns a ProbeResult per name, in order.
+
+    A probe still running after timeout seconds is reported as failed and
+    left to finish in its daemon thread.
+    """
+    results = {}
+    lock = threading.Lock()
+
+    def run(name, probe):
+        started = time.monotonic()
+        try:
+            probe()
+            result = ProbeResult(name, True, time.monotonic() - started, None)
+        except Exception as e:
+            result = ProbeResult(name, False, time.monotonic() - started, str(e) or type(e).__name__)
+        with lock:
+            results[name] = result
+
+    threads = [threading.Thread(target=run, args=item, name=f"probe-{item[0]}", daemon=True)
+               for item in probes.items()]
+    deadline = time.monotonic() + timeout
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(max(deadline - time.monotonic(), 0))
+
+    with lock:
+        return [results.get(name) or ProbeResult(name, False, None, f"no answer within {timeout:g}s")
+                for name in probes]
+
+
+def format_result(result):
+    if result.ok:
+        return f"{result.name} ok ({result.seconds * 1000:.0f} ms)"
+    return f"{result.name} failed: {result.error.strip().splitlines()[0]}"
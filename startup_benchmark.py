@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark - measures the import cost of every BoilerStat entry point.
+
+Each entry point is imported in a fresh interpreter with `python -X importtime`
+--runs times; the median cumulative import time and the heaviest direct
+imports are reported, together with the wall time of the CLI tools' --help
+(interpreter start-up included). No database or broker is contacted.
+
+Save a run with --save and compare later runs against it with --baseline to
+catch an entry point that starts importing something heavy again:
+
+    python3 startup_benchmark.py --save startup_baseline.json
+    python3 startup_benchmark.py --baseline startup_baseline.json --tolerance 0.25
+
+Exits with status 1 if an entry point is slower than its baseline by more
+than the tolerance (and by more than --slack-ms).
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+# Entry points: services started by the containers, then CLI tools
+ENTRY_POINTS = [
+    'mqtt_database_logger',
+    'data_aggregator',
+    'app',
+    'mode_control',
+    'verify_data',
+    'replay',
+    'mqtt_simulator',
+]
+# CLI tools whose --help is timed end to end
+HELP_COMMANDS = ['mode_control.py', 'replay.py']
+
+IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_profile(module):
+    """(cumulative microseconds of module, {direct import: cumulative microseconds}) from one run."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"], cwd=ROOT,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr.strip().splitlines()[-1]}")
+
+    # -X importtime lists a module's imports before the module itself, indented
+    # one level deeper; depth 0 also covers the interpreter's own start-up imports
+    children = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative, depth, name = int(match.group(2)), len(match.group(3)) // 2, match.group(4)
+        if depth == 0:
+            if name == module:
+                return cumulative, children
+            children = {}
+        elif depth == 1:
+            children[name] = cumulative
+    raise RuntimeError(f"no import time reported for {module}")
+
+
+def wall_time(command):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, command, '--help'], cwd=ROOT, capture_output=True, check=True)
+    return time.perf_counter() - started
+
+
+def measure(runs):
+    results = {}
+    for module in ENTRY_POINTS:
+        totals = []
+        heaviest = {}
+        for _ in range(runs):
+            total, children = import_profile(module)
+            totals.append(total)
+            for name, micros in children.items():
+                heaviest.setdefault(name, []).append(micros)
+        results[module] = {
+            'import_ms': round(statistics.median(totals) / 1000, 1),
+            'heaviest': {name: round(statistics.median(values) / 1000, 1)
+                         for name, values in sorted(heaviest.items(),
+                                                    key=lambda item: -statistics.median(item[1]))[:3]},
+        }
+    for command in HELP_COMMANDS:
+        times = [wall_time(command) for _ in range(runs)]
+        results[f'{command} --help'] = {'wall_ms': round(statistics.median(times) * 1000, 1)}
+    return results
+
+
+def report(results, baseline, tolerance, slack_ms):
+    """Print the results; returns the names that regressed against baseline."""
+    regressions = []
+    print(f"{'entry point':<28} {'time':>10} {'baseline':>10}  heaviest imports")
+    for name, result in results.items():
+        key = 'import_ms' if 'import_ms' in result else 'wall_ms'
+        value = result[key]
+        previous = (baseline.get(name) or {}).get(key)
+        flag = ''
+        if previous is not None and value > previous * (1 + tolerance) and value - previous > slack_ms:
+            regressions.append(name)
+            flag = '  SLOWER'
+        heaviest = ', '.join(f"{module} {ms:.0f}" for module, ms in result.get('heaviest', {}).items())
+        print(f"{name:<28} {value:>8.1f}ms "
+              f"{f'{previous:.1f}ms' if previous is not None else '-':>10}  {heaviest}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure BoilerStat entry point startup cost")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per entry point (default: 5)")
+    parser.add_argument("--save", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown against the baseline as a fraction (default: 0.25)")
+    parser.add_argument("--slack-ms", type=float, default=10.0,
+                        help="Slowdowns smaller than this are never reported (default: 10)")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    # Compile bytecode first so the first run is not slower than the rest
+    subprocess.run([sys.executable, '-m', 'compileall', '-q', ROOT], capture_output=True)
+    print(f"Measuring {len(ENTRY_POINTS)} entry points, median of {args.runs} runs (Python {sys.version.split()[0]})")
+    results = measure(args.runs)
+    regressions = report(results, baseline, args.tolerance, args.slack_ms)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {args.save}")
+    if regressions:
+        print(f"Startup regressions: {', '.join(regressions)}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
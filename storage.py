@@ -0,0 +1,1528 @@
+#!/usr/bin/env python3
+"""
+Storage backends for BoilerStat.
+
+The logger, the aggregator and the dashboard API read and write readings and
+minute aggregates through a StorageBackend, selected with STORAGE_BACKEND:
+
+    postgres  (default) the PostgreSQL server configured by POSTGRES_*
+    sqlite    an embedded SQLite file (SQLITE_PATH) for single-board edge
+              deployments where a PostgreSQL container is too heavy
+
+Minute aggregates are stored per MINUTE_LAYOUT:
+
+    minute    (default) one minute_utilization row per device and minute
+    hour      one hourly_utilization row per device and hour, holding
+              60-slot basis point arrays (see hour_slots.py)
+
+Features built on PostgreSQL-specific SQL (the change feed, cycle analytics
+and /api/export) still require the postgres backend.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date, datetime
+
+from data_coverage import AGGREGATED, MINUTE, RAW, merge, minute_floor, minute_runs, minutes_in, subtract
+from hour_slots import LAYOUTS, PER_HOUR, SLOT_BYTES, SLOTS, HourRow, hour_floor, pack, unpack
+from profiles import PROFILE_TIMEZONES, local_hour, merge_contributions, minute_contributions
+from profiling import TimedCursor, measure
+from totals import Totals
+from zones import DEFAULT_ZONE_COUNT, zone_dict, zone_sum_columns
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "postgres")
+# Device ID used for payloads and API requests that do not name a device
+DEFAULT_DEVICE_ID = os.getenv("DEFAULT_DEVICE_ID", "default")
+# Table layout of minute aggregates: 'minute' (row per minute) or 'hour' (row per hour)
+MINUTE_LAYOUT = os.getenv("MINUTE_LAYOUT", "minute")
+
+# PostgreSQL configuration
+POSTGRES_HOST = os.getenv("POSTGRES_HOST", "localhost")
+POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
+POSTGRES_DB = os.getenv("POSTGRES_DB")
+POSTGRES_USER = os.getenv("POSTGRES_USER")
+POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
+# Seconds to wait for the server when opening a connection
+POSTGRES_CONNECT_TIMEOUT = int(os.getenv("POSTGRES_CONNECT_TIMEOUT", "10"))
+
+# SQLite configuration
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.getenv("DB_FILE", "/data/boilerstat.db"))
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "16384"))
+SQLITE_MMAP_BYTES = int(os.getenv("SQLITE_MMAP_BYTES", str(64 * 1024 * 1024)))
+
+# Column order of a reading tuple passed to insert_readings()
+READING_COLUMNS = ('device_id', 'timestamp', 'boiler', 'zone_mask', 'zone_count', 'is_demo',
+                   'seq', 'sent_at', 'logged_at')
+
+# Heartbeat columns of listener_shards besides listener and heartbeat_at (sharding.Shard.status())
+LISTENER_COLUMNS = ('mode', 'shard_index', 'shard_count', 'started_at', 'heartbeat_seconds', 'received',
+                    'stored', 'skipped', 'errors', 'devices', 'queued', 'lag_seconds', 'commit_p95_seconds')
+
+# Sample counts for one device and minute, from StorageBackend.aggregate_minute()
+MinuteCounts = namedtuple('MinuteCounts', [
+    'device_id', 'is_demo', 'sample_count', 'boiler_on', 'zone_on',
+])
+
+# Per-device sample counts for one minute. Production data takes priority:
+# demo samples are only used for a device with no production samples.
+_AGGREGATE_MINUTE_SQL = '''
+    SELECT r.device_id, r.is_demo, count(*), sum(r.boiler), max(r.zone_count), {zone_sums}
+    FROM boiler_readings r
+    JOIN (SELECT device_id, min(is_demo) AS is_demo
+          FROM boiler_readings
+          WHERE timestamp >= {p} AND timestamp < {p}
+          GROUP BY device_id) pick
+      ON pick.device_id = r.device_id AND pick.is_demo = r.is_demo
+    WHERE r.timestamp >= {p} AND r.timestamp < {p}
+    GROUP BY r.device_id, r.is_demo
+'''
+
+_UPSERT_MINUTE_SQL = '''
+    INSERT INTO minute_utilization
+    (device_id, minute_timestamp, boiler_utilization, zone_utilization, sample_count, is_demo,
+     aggregated_at)
+    VALUES ({p}, {p}, {p}, {p}, {p}, {p}, {p})
+    ON CONFLICT (device_id, minute_timestamp)
+    DO UPDATE SET
+        boiler_utilization = EXCLUDED.boiler_utilization,
+        zone_utilization = EXCLUDED.zone_utilization,
+        sample_count = EXCLUDED.sample_count,
+        is_demo = EXCLUDED.is_demo,
+        aggregated_at = EXCLUDED.aggregated_at
+'''
+
+_MINUTE_FOR_PROFILE_SQL = '''
+    SELECT boiler_utilization, zone_utilization, sample_count, is_demo
+    FROM minute_utilization
+    WHERE device_id = {p} AND minute_timestamp = {p}
+'''
+
+# Every minute aggregate (optionally production only), by device and minute
+_ITER_MINUTES_SQL = '''
+    SELECT device_id, minute_timestamp, boiler_utilization, zone_utilization, sample_count, is_demo
+    FROM minute_utilization
+    {where}
+    ORDER BY device_id, minute_timestamp
+'''
+
+# Hour layout: {slots} is the placeholder of a packed 60-slot array
+_HOUR_ROW_SQL = '''
+    SELECT burner_bp, zone_bp, sample_counts, demo_mask
+    FROM hourly_utilization
+    WHERE device_id = {p} AND hour_start = {p}
+'''
+
+_UPSERT_HOUR_SQL = '''
+    INSERT INTO hourly_utilization
+    (device_id, hour_start, burner_bp, zone_bp, sample_counts, demo_mask, aggregated_at)
+    VALUES ({p}, {p}, {slots}, {slots}, {slots}, {p}, {p})
+    ON CONFLICT (device_id, hour_start)
+    DO UPDATE SET
+        burner_bp = EXCLUDED.burner_bp,
+        zone_bp = EXCLUDED.zone_bp,
+        sample_counts = EXCLUDED.sample_counts,
+        demo_mask = EXCLUDED.demo_mask,
+        aggregated_at = EXCLUDED.aggregated_at
+'''
+
+# Hour rows of one device from an hour onwards; {where} is empty or a device filter
+_HOUR_RANGE_SQL = '''
+    SELECT device_id, hour_start, burner_bp, zone_bp, sample_counts, demo_mask
+    FROM hourly_utilization
+    {where}
+    ORDER BY device_id, hour_start
+'''
+
+# Adds to (or with negative amounts, subtracts from) a profile bucket
+_ADD_PROFILE_SQL = '''
+    INSERT INTO utilization_profile
+    (timezone, device_id, local_date, hour, channel, utilization_sum, sample_weight, minute_count)
+    VALUES ({p}, {p}, {p}, {p}, {p}, {p}, {p}, {p})
+    ON CONFLICT (timezone, device_id, local_date, hour, channel)
+    DO UPDATE SET
+        utilization_sum = utilization_profile.utilization_sum + EXCLUDED.utilization_sum,
+        sample_weight = utilization_profile.sample_weight + EXCLUDED.sample_weight,
+        minute_count = utilization_profile.minute_count + EXCLUDED.minute_count
+'''
+
+_PROFILE_SQL = '''
+    SELECT {group}, sum(utilization_sum), sum(sample_weight)
+    FROM utilization_profile
+    WHERE timezone = {p} AND device_id = {p} AND local_date >= {p}
+    GROUP BY {group}
+'''
+
+# Running totals rows of a device from the last one before a minute onwards
+_TOTALS_FROM_SQL = '''
+    SELECT minute_timestamp, minute_count, on_minutes, on_samples, samples
+    FROM utilization_totals
+    WHERE device_id = {p} AND minute_timestamp >= coalesce(
+        (SELECT max(minute_timestamp) FROM utilization_totals WHERE device_id = {p} AND minute_timestamp < {p}),
+        {p})
+    ORDER BY minute_timestamp
+'''
+
+_INSERT_TOTALS_SQL = '''
+    INSERT INTO utilization_totals (device_id, minute_timestamp, minute_count, on_minutes, on_samples, samples)
+    VALUES ({p}, {p}, {p}, {p}, {p}, {p})
+'''
+
+_UPDATE_TOTALS_SQL = '''
+    UPDATE utilization_totals SET minute_count = {p}, on_minutes = {p}, on_samples = {p}, samples = {p}
+    WHERE device_id = {p} AND minute_timestamp = {p}
+'''
+
+# The last running totals rows of a device before two times (0 = start, 1 = end)
+_TOTALS_AT_SQL = '''
+    SELECT 0, minute_count, on_minutes, on_samples, samples FROM (
+        SELECT minute_count, on_minutes, on_samples, samples FROM utilization_totals
+        WHERE device_id = {p} AND minute_timestamp < {p}
+        ORDER BY minute_timestamp DESC LIMIT 1) before_start
+    UNION ALL
+    SELECT 1, minute_count, on_minutes, on_samples, samples FROM (
+        SELECT minute_count, on_minutes, on_samples, samples FROM utilization_totals
+        WHERE device_id = {p} AND minute_timestamp < {p}
+        ORDER BY minute_timestamp DESC LIMIT 1) before_end
+'''
+
+# Every device with a minute aggregate in [start, end) (from data_coverage) and its last
+# running totals rows before start and before end, in one statement; a device with nothing
+# aggregated in the range gets the same row for both. {devices} is empty or a device filter
+_FLEET_TOTALS_SQL = '''
+    WITH bounds AS (
+        SELECT d.device_id,
+               (SELECT max(minute_timestamp) FROM utilization_totals t
+                WHERE t.device_id = d.device_id AND t.minute_timestamp < {p}) AS before_start,
+               (SELECT max(minute_timestamp) FROM utilization_totals t
+                WHERE t.device_id = d.device_id AND t.minute_timestamp < {p}) AS before_end
+        FROM (SELECT DISTINCT device_id FROM data_coverage
+              WHERE kind = {p} AND end_minute > {p} AND start_minute < {p} {devices}) d
+    )
+    SELECT b.device_id, b.before_start, b.before_end, t.minute_timestamp, t.minute_count, t.on_minutes, t.on_samples, t.samples
+    FROM bounds b
+    JOIN utilization_totals t
+      ON t.device_id = b.device_id AND t.minute_timestamp IN (b.before_start, b.before_end)
+'''
+
+# Coverage intervals of one device and kind that could touch [{p}, {p}]: the last
+# interval starting at or before the range start, and every one starting inside it
+_COVERAGE_SQL = '''
+    SELECT start_minute, end_minute
+    FROM data_coverage
+    WHERE device_id = {p} AND kind = {p} AND start_minute <= {p}
+      AND start_minute >= coalesce((SELECT max(start_minute) FROM data_coverage
+                                    WHERE device_id = {p} AND kind = {p} AND start_minute <= {p}), {p})
+    ORDER BY start_minute
+'''
+
+# Open alerts match on channel, which is NULL for device-level alerts
+_RESOLVE_ALERT_SQL = '''
+    UPDATE device_alerts SET resolved_at = {p}
+    WHERE device_id = {p} AND kind = {p} AND resolved_at IS NULL
+      AND (channel = {p} OR (channel IS NULL AND {p} IS NULL))
+'''
+
+# Raw readings in a time range, oldest first; {device} is empty or a device filter
+_ITER_READINGS_SQL = '''
+    SELECT device_id, timestamp, boiler, zone_mask, zone_count, is_demo
+    FROM boiler_readings
+    WHERE timestamp >= {p} AND timestamp < {p} {device}
+    ORDER BY timestamp, id
+'''
+
+_LATEST_READING_SQL = '''
+    SELECT device_id, timestamp, boiler, zone_mask, zone_count, is_demo, seq, sent_at, logged_at
+    FROM boiler_readings
+    WHERE {p} IS NULL OR device_id = {p}
+    ORDER BY timestamp DESC
+    LIMIT 1
+'''
+
+
+def _utilization_from_row(timestamp, burner, zones):
+    return {'timestamp': timestamp, 'burner': burner, **zone_dict(zones)}
+
+
+class StorageBackend:
+    """Operations the services need from the database.
+
+    Connections are kept per thread and reused, so each backend instance is
+    safe to share between the threads of one process. Timestamps passed in
+    and out are naive UTC datetimes or 'YYYY-MM-DD HH:MM:SS' strings.
+    """
+
+    name = None
+    PARAM = None  # DB-API placeholder
+    _SLOTS_PARAM = None  # placeholder of a packed 60-slot array
+
+    def __init__(self, layout=MINUTE_LAYOUT):
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown MINUTE_LAYOUT {layout!r}; use 'minute' or 'hour'")
+        self.layout = layout
+        self._local = threading.local()
+        # Zone sums generated into the aggregation SQL; grows if a device reports more zones
+        self._aggregate_zones = DEFAULT_ZONE_COUNT
+
+    def check(self):
+        """Open a connection, raising if the database is unreachable."""
+        with self._cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+    def aggregate_minute(self, start, end):
+        """MinuteCounts for every device with readings in [start, end).
+
+        Per-zone on counts are computed by the database in a single pass,
+        with one generated sum() per zone bit.
+        """
+        p = self.PARAM
+        params = (self._db_time(start), self._db_time(end)) * 2
+        while True:
+            zones = self._aggregate_zones
+            sql = _AGGREGATE_MINUTE_SQL.format(p=p, zone_sums=zone_sum_columns(max(zones, 1)))
+            with self._cursor() as cursor:
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
+            needed = max((row[4] for row in rows), default=0)
+            if needed <= zones:
+                break
+            self._aggregate_zones = needed
+        return [MinuteCounts(device_id, is_demo, count, int(boiler_on),
+                             [int(n) for n in zone_on[:zone_count]])
+                for device_id, is_demo, count, boiler_on, zone_count, *zone_on in rows]
+
+    def latest_reading(self, device_id=None):
+        """Most recent boiler_readings row (of one device, or of any) in READING_COLUMNS order, or None.
+
+        The timestamp is a naive UTC datetime; readings.Reading(*row) makes it a Reading.
+        """
+        with self._cursor() as cursor:
+            cursor.execute(_LATEST_READING_SQL.format(p=self.PARAM), (device_id, device_id))
+            row = cursor.fetchone()
+        if not row:
+            return None
+        return (row[0], self._py_time(row[1]), *row[2:])
+
+    def upsert_minute(self, device_id, minute_start, boiler_utilization, zone_utilizations,
+                      sample_count, is_demo):
+        """Insert or replace the aggregate for one device and minute.
+
+        The difference from any aggregate it replaces is applied to the
+        device's utilization_profile buckets and running utilization_totals
+        in the same transaction. Assumes
+        a single writer (the aggregator) per device and minute (with the hour
+        layout, per device and hour).
+        """
+        p = self.PARAM
+        if not isinstance(minute_start, datetime):
+            minute_start = datetime.fromisoformat(minute_start)
+        with self._cursor() as cursor:
+            write = self._write_hour_slot if self.layout == PER_HOUR else self._write_minute_row
+            old = write(cursor, device_id, minute_start, boiler_utilization, zone_utilizations,
+                        sample_count, is_demo)
+
+            removed = []
+            if old:
+                removed = minute_contributions(*old, sign=-1)
+            net = merge_contributions(removed, minute_contributions(
+                boiler_utilization, zone_utilizations, sample_count, is_demo))
+            if net:
+                buckets = []
+                for tz in PROFILE_TIMEZONES:
+                    local_date, hour = local_hour(minute_start, tz)
+                    buckets.extend((tz, device_id, self._db_date(local_date), hour, *change)
+                                   for change in net)
+                cursor.executemany(_ADD_PROFILE_SQL.format(p=p), buckets)
+            change = Totals.of_minute(boiler_utilization, zone_utilizations, sample_count, is_demo)
+            if old:
+                change = change - Totals.of_minute(*old)
+            if change:
+                self._shift_totals(cursor, device_id, minute_start, change,
+                                   keep=not is_demo and bool(sample_count))
+            if not old:
+                self._add_coverage(cursor, AGGREGATED, {device_id: [minute_start]})
+
+    def _write_minute_row(self, cursor, device_id, minute_start, boiler_utilization, zone_utilizations,
+                          sample_count, is_demo):
+        """Upsert a minute_utilization row; returns the (burner, zones, count, is_demo) it replaced."""
+        p = self.PARAM
+        cursor.execute(_MINUTE_FOR_PROFILE_SQL.format(p=p), (device_id, self._db_time(minute_start)))
+        old = cursor.fetchone()
+        cursor.execute(_UPSERT_MINUTE_SQL.format(p=p), (
+            device_id, self._db_time(minute_start), boiler_utilization,
+            self._db_zones(zone_utilizations), sample_count, is_demo,
+            self._db_precise_time(datetime.utcnow())))
+        if not old:
+            return None
+        old_burner, old_zones, old_count, old_demo = old
+        return old_burner, self._py_zones(old_zones), old_count, old_demo
+
+    def _write_hour_slot(self, cursor, device_id, minute_start, boiler_utilization, zone_utilizations,
+                         sample_count, is_demo):
+        """Set one minute's slot of its hourly_utilization row; returns the slot's previous aggregate."""
+        p = self.PARAM
+        hour_start = hour_floor(minute_start)
+        cursor.execute(_HOUR_ROW_SQL.format(p=p), (device_id, self._db_time(hour_start)))
+        found = cursor.fetchone()
+        row = self._py_hour(*found) if found else HourRow()
+        old = row.get(minute_start.minute)
+        row.set(minute_start.minute, boiler_utilization, zone_utilizations, sample_count, is_demo)
+        cursor.execute(_UPSERT_HOUR_SQL.format(p=p, slots=self._SLOTS_PARAM), (
+            device_id, self._db_time(hour_start), *self._db_hour(row),
+            self._db_precise_time(datetime.utcnow())))
+        self._notify_minute(cursor, device_id, minute_start, sample_count, is_demo)
+        return old
+
+    def _notify_minute(self, cursor, device_id, minute_start, sample_count, is_demo):
+        """Announce a minute written to hourly_utilization (which has no change feed trigger)."""
+
+    def _iter_minutes(self, cursor, production_only=False, batch_size=5000):
+        """Yield (device_id, minute, burner, zones, sample_count, is_demo) for every minute
+        aggregate of the current layout, by device and minute."""
+        if self.layout != PER_HOUR:
+            yield from self._iter_minute_rows(cursor, production_only, batch_size)
+            return
+        for device_id, hour_start, row in self._iter_hours(cursor, batch_size=batch_size):
+            for minute in row.minutes(hour_start):
+                if not (production_only and minute[4]):
+                    yield (device_id, *minute)
+
+    def _iter_minute_rows(self, cursor, production_only=False, batch_size=5000):
+        cursor.execute(_ITER_MINUTES_SQL.format(where='WHERE is_demo = 0' if production_only else ''))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for device_id, minute, burner, zones, count, is_demo in rows:
+                yield device_id, self._py_time(minute), burner, self._py_zones(zones), count, is_demo
+
+    def _iter_hours(self, cursor, device_id=None, since=None, batch_size=5000):
+        """Yield (device_id, hour_start, HourRow) of hourly_utilization, by device and hour."""
+        conditions, params = [], []
+        if device_id is not None:
+            conditions.append(f'device_id = {self.PARAM}')
+            params.append(device_id)
+        if since is not None:
+            conditions.append(f'hour_start >= {self.PARAM}')
+            params.append(self._db_time(hour_floor(since)))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        cursor.execute(_HOUR_RANGE_SQL.format(where=where), params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row_device, hour_start, *values in rows:
+                yield row_device, self._py_time(hour_start), self._py_hour(*values)
+
+    def has_hour_rows(self):
+        """True if hourly_utilization holds any aggregates."""
+        with self._cursor() as cursor:
+            cursor.execute('SELECT 1 FROM hourly_utilization LIMIT 1')
+            return cursor.fetchone() is not None
+
+    def pack_minute_rows(self, batch_size=5000):
+        """Copy every minute_utilization row into hourly_utilization.
+
+        Used once when an existing database switches to MINUTE_LAYOUT=hour;
+        minute_utilization is left as it was. Returns the number of hour
+        rows written.
+        """
+        p = self.PARAM
+        sql = _UPSERT_HOUR_SQL.format(p=p, slots=self._SLOTS_PARAM)
+        now = self._db_precise_time(datetime.utcnow())
+        written = 0
+        with self._cursor() as read, self._cursor() as write:
+            key, row, batch = None, None, []
+            for device_id, minute, *aggregate in self._iter_minute_rows(read, batch_size=batch_size):
+                if (device_id, hour_floor(minute)) != key:
+                    if row is not None:
+                        batch.append((key[0], self._db_time(key[1]), *self._db_hour(row), now))
+                    key, row = (device_id, hour_floor(minute)), HourRow()
+                row.set(minute.minute, *aggregate)
+                if len(batch) >= batch_size:
+                    write.executemany(sql, batch)
+                    written += len(batch)
+                    batch = []
+            if row is not None:
+                batch.append((key[0], self._db_time(key[1]), *self._db_hour(row), now))
+            write.executemany(sql, batch)
+            written += len(batch)
+        return written
+
+    def _coverage_rows(self, cursor, device_id, kind, start, end):
+        cursor.execute(_COVERAGE_SQL.format(p=self.PARAM), (
+            device_id, kind, self._db_time(end), device_id, kind, self._db_time(start), self._db_time(start)))
+        return [(self._py_time(s), self._py_time(e)) for s, e in cursor.fetchall()]
+
+    def _add_coverage(self, cursor, kind, device_minutes):
+        """Extend the kind coverage of each device by {device_id: minute starts}.
+
+        Each unbroken run of minutes costs one indexed lookup; the intervals
+        it touches are replaced by their union only when it adds anything.
+        The devices are locked first (_lock_coverage), so writers of the same
+        device (shared-subscription listeners, a replay next to live ingest)
+        merge one after the other instead of inserting the same interval.
+        """
+        p = self.PARAM
+        self._lock_coverage(cursor, device_minutes)
+        for device_id, minutes in device_minutes.items():
+            for start, end in minute_runs(minutes):
+                touching = [(s, e) for s, e in self._coverage_rows(cursor, device_id, kind, start, end)
+                            if e >= start]
+                if any(s <= start and e >= end for s, e in touching):
+                    continue
+                (new_start, new_end), = merge(touching + [(start, end)])
+                cursor.execute(f'''
+                    DELETE FROM data_coverage
+                    WHERE device_id = {p} AND kind = {p} AND start_minute >= {p} AND start_minute <= {p}
+                ''', (device_id, kind, self._db_time(new_start), self._db_time(end)))
+                cursor.execute(f'''
+                    INSERT INTO data_coverage (device_id, kind, start_minute, end_minute)
+                    VALUES ({p}, {p}, {p}, {p})
+                    ON CONFLICT (device_id, kind, start_minute) DO UPDATE SET
+                        end_minute = CASE WHEN EXCLUDED.end_minute > data_coverage.end_minute
+                                          THEN EXCLUDED.end_minute ELSE data_coverage.end_minute END
+                ''', (device_id, kind, self._db_time(new_start), self._db_time(new_end)))
+
+    def _lock_coverage(self, cursor, device_ids):
+        """Hold off other writers' coverage updates of device_ids until this transaction ends.
+
+        SQLite needs nothing: the readings insert before it already holds the database's write lock.
+        """
+
+    def _reading_minutes(self, readings):
+        """{device_id: minute starts} of reading tuples (READING_COLUMNS order)."""
+        device_minutes = {}
+        for reading in readings:
+            device_minutes.setdefault(reading[0], set()).add(minute_floor(reading[1]))
+        return device_minutes
+
+    def has_coverage(self):
+        """True if the coverage index has been built."""
+        with self._cursor() as cursor:
+            cursor.execute('SELECT 1 FROM data_coverage LIMIT 1')
+            return cursor.fetchone() is not None
+
+    def rebuild_coverage(self, batch_size=5000):
+        """Recompute every coverage interval from boiler_readings and the minute aggregates.
+
+        Used when the table is new; returns the number of intervals written.
+        """
+        p = self.PARAM
+
+        def raw_minutes(cursor):
+            cursor.execute(f'SELECT DISTINCT device_id, {self._MINUTE_SQL.format(column="timestamp")} '
+                           f'FROM boiler_readings ORDER BY 1, 2')
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for device_id, minute in rows:
+                    yield device_id, self._py_time(minute)
+
+        def aggregated_minutes(cursor):
+            for device_id, minute, *_ in self._iter_minutes(cursor, batch_size=batch_size):
+                yield device_id, minute
+
+        intervals = []
+        with self._cursor() as cursor:
+            for kind, minutes in ((RAW, raw_minutes), (AGGREGATED, aggregated_minutes)):
+                device_id, runs = None, []
+                for row_device, minute in minutes(cursor):
+                    if row_device != device_id:
+                        intervals.extend((device_id, kind, *run) for run in runs)
+                        device_id, runs = row_device, []
+                    if runs and runs[-1][1] == minute:
+                        runs[-1][1] = minute + MINUTE
+                    else:
+                        runs.append([minute, minute + MINUTE])
+                intervals.extend((device_id, kind, *run) for run in runs)
+
+            cursor.execute('DELETE FROM data_coverage')
+            cursor.executemany(f'''
+                INSERT INTO data_coverage (device_id, kind, start_minute, end_minute)
+                VALUES ({p}, {p}, {p}, {p})
+            ''', [(device_id, kind, self._db_time(start), self._db_time(end))
+                  for device_id, kind, start, end in intervals])
+        return len(intervals)
+
+    def coverage(self, device_id, start, end):
+        """{'raw': intervals, 'aggregated': intervals} of one device, clipped to [start, end)."""
+        with self._cursor() as cursor:
+            return {kind: [(max(s, start), min(e, end))
+                           for s, e in self._coverage_rows(cursor, device_id, kind, start, end)
+                           if s < end and e > start]
+                    for kind in (RAW, AGGREGATED)}
+
+    def coverage_gaps(self, since):
+        """{device_id: intervals from since onwards with raw data but no aggregate}."""
+        since = minute_floor(since)
+        intervals = {RAW: {}, AGGREGATED: {}}
+        with self._cursor() as cursor:
+            cursor.execute(f'''
+                SELECT device_id, kind, start_minute, end_minute
+                FROM data_coverage
+                WHERE kind IN ({self.PARAM}, {self.PARAM}) AND end_minute > {self.PARAM}
+            ''', (RAW, AGGREGATED, self._db_time(since)))
+            # Sorted here: an ORDER BY makes SQLite walk the whole table instead of the index
+            for device_id, kind, start, end in sorted(cursor.fetchall()):
+                intervals[kind].setdefault(device_id, []).append(
+                    (max(self._py_time(start), since), self._py_time(end)))
+        gaps = {}
+        for device_id, raw in intervals[RAW].items():
+            missing = subtract(raw, intervals[AGGREGATED].get(device_id, []))
+            if missing:
+                gaps[device_id] = missing
+        return gaps
+
+    def _shift_totals(self, cursor, device_id, minute_start, change, keep=True):
+        """Add change to the running totals of minute_start and every later minute of the device.
+
+        keep=False drops minute_start's own row (it no longer has a production aggregate).
+        """
+        p = self.PARAM
+        minute = self._db_time(minute_start)
+        cursor.execute(_TOTALS_FROM_SQL.format(p=p), (device_id, device_id, minute, minute))
+        rows = [(self._py_time(row[0]), self._py_totals(*row[1:])) for row in cursor.fetchall()]
+        previous = Totals()
+        if rows and rows[0][0] < minute_start:
+            previous = rows.pop(0)[1]
+        if rows and rows[0][0] == minute_start and not keep:
+            cursor.execute(f'DELETE FROM utilization_totals WHERE device_id = {p} AND minute_timestamp = {p}',
+                           (device_id, minute))
+            rows.pop(0)
+        elif keep and (not rows or rows[0][0] != minute_start):
+            cursor.execute(_INSERT_TOTALS_SQL.format(p=p),
+                           (device_id, minute, *self._db_totals(previous + change)))
+        cursor.executemany(_UPDATE_TOTALS_SQL.format(p=p), [
+            (*self._db_totals(totals + change), device_id, self._db_time(row_minute))
+            for row_minute, totals in rows])
+
+    def has_totals(self):
+        """True if any running utilization totals exist."""
+        with self._cursor() as cursor:
+            cursor.execute('SELECT 1 FROM utilization_totals LIMIT 1')
+            return cursor.fetchone() is not None
+
+    def rebuild_totals(self, batch_size=5000):
+        """Recompute every running utilization total from the minute aggregates.
+
+        Used when the table is new; returns the number of rows written.
+        """
+        p = self.PARAM
+        written = 0
+        with self._cursor() as read, self._cursor() as write:
+            write.execute('DELETE FROM utilization_totals')
+            device_id, running, rows = None, Totals(), []
+            for row_device, minute, burner, zones, count, is_demo in self._iter_minutes(
+                    read, production_only=True, batch_size=batch_size):
+                if row_device != device_id:
+                    device_id, running = row_device, Totals()
+                change = Totals.of_minute(burner, zones, count, is_demo)
+                if not change:
+                    continue
+                running += change
+                rows.append((device_id, self._db_time(minute), *self._db_totals(running)))
+                if len(rows) >= batch_size:
+                    write.executemany(_INSERT_TOTALS_SQL.format(p=p), rows)
+                    written += len(rows)
+                    rows = []
+            write.executemany(_INSERT_TOTALS_SQL.format(p=p), rows)
+        return written + len(rows)
+
+    def utilization_totals(self, device_id, start, end):
+        """Totals of the device's production minutes starting in [start, end), from two lookups."""
+        with self._cursor() as cursor:
+            cursor.execute(_TOTALS_AT_SQL.format(p=self.PARAM),
+                           (device_id, self._db_time(start), device_id, self._db_time(end)))
+            found = {which: self._py_totals(*values) for which, *values in cursor.fetchall()}
+        return found.get(1, Totals()) - found.get(0, Totals())
+
+    def fleet_totals(self, start, end, device_ids=None):
+        """{device_id: Totals} over [start, end) for every device aggregated in the range.
+
+        One grouped statement over data_coverage and two index lookups per
+        device, however long the range; device_ids restricts the devices.
+        """
+        p = self.PARAM
+        devices = ''
+        params = [self._db_time(start), self._db_time(end), AGGREGATED, self._db_time(start), self._db_time(end)]
+        if device_ids is not None:
+            if not device_ids:
+                return {}
+            devices = f"AND device_id IN ({', '.join([p] * len(device_ids))})"
+            params.extend(device_ids)
+        rows = {}
+        with self._cursor() as cursor:
+            cursor.execute(_FLEET_TOTALS_SQL.format(p=p, devices=devices), params)
+            for device_id, before_start, before_end, minute, *values in cursor.fetchall():
+                found = rows.setdefault(device_id, [Totals(), Totals()])
+                totals = self._py_totals(*values)
+                # One row is both bounds when nothing was aggregated in the range
+                if minute == before_start:
+                    found[0] = totals
+                if minute == before_end:
+                    found[1] = totals
+        return {device_id: end_totals - start_totals for device_id, (start_totals, end_totals) in rows.items()}
+
+    def _db_totals(self, totals):
+        return (totals.minutes, self._db_zones(totals.on_minutes), self._db_zones(totals.on_samples),
+                self._db_zones(totals.samples))
+
+    def _py_totals(self, minutes, on_minutes, on_samples, samples):
+        return Totals(minutes, self._py_zones(on_minutes), self._py_zones(on_samples), self._py_zones(samples))
+
+    def has_profile(self, tz):
+        """True if any profile buckets exist for time zone tz."""
+        with self._cursor() as cursor:
+            cursor.execute(f'SELECT 1 FROM utilization_profile WHERE timezone = {self.PARAM} LIMIT 1', (tz,))
+            return cursor.fetchone() is not None
+
+    def rebuild_profile(self, tz, batch_size=5000):
+        """Recompute every profile bucket of time zone tz from the minute aggregates.
+
+        Used when the table is new or a time zone is added to
+        PROFILE_TIMEZONES; returns the number of buckets written.
+        """
+        p = self.PARAM
+        buckets = {}
+        with self._cursor() as cursor:
+            for device_id, minute, burner, zones, count, is_demo in self._iter_minutes(
+                    cursor, production_only=True, batch_size=batch_size):
+                local_date, hour = local_hour(minute, tz)
+                for channel, total, weight, minutes in minute_contributions(burner, zones, count, is_demo):
+                    key = (device_id, local_date, hour, channel)
+                    current = buckets.get(key, (0.0, 0, 0))
+                    buckets[key] = (current[0] + total, current[1] + weight, current[2] + minutes)
+
+            cursor.execute(f'DELETE FROM utilization_profile WHERE timezone = {p}', (tz,))
+            cursor.executemany(_ADD_PROFILE_SQL.format(p=p), [
+                (tz, device_id, self._db_date(local_date), hour, channel, *amounts)
+                for (device_id, local_date, hour, channel), amounts in buckets.items()])
+        return len(buckets)
+
+    def utilization_profile(self, device_id, tz, since, by_weekday=False):
+        """Summed profile buckets for one device and time zone from local date since onwards.
+
+        Returns (hour, channel, utilization sum, sample weight) rows, or with
+        by_weekday (weekday, hour, channel, ...) rows with Monday = 0.
+        """
+        group = f'{self._WEEKDAY_SQL}, hour, channel' if by_weekday else 'hour, channel'
+        with self._cursor() as cursor:
+            cursor.execute(_PROFILE_SQL.format(p=self.PARAM, group=group),
+                           (tz, device_id, self._db_date(since)))
+            return cursor.fetchall()
+
+    def latency_samples(self, limit):
+        """(sent_at, logged_at, received_at) of the traced readings among the latest limit, newest first."""
+        # Bounded by id so untraced readings can never turn this into a full scan
+        with self._cursor() as cursor:
+            cursor.execute(f'''
+                SELECT sent_at, logged_at, received_at
+                FROM boiler_readings
+                WHERE id > (SELECT max(id) FROM boiler_readings) - {self.PARAM}
+                  AND sent_at IS NOT NULL AND logged_at IS NOT NULL
+                ORDER BY id DESC
+            ''', (limit,))
+            return [tuple(self._py_time(t) for t in row) for row in cursor.fetchall()]
+
+    def aggregation_samples(self, limit):
+        """(minute_timestamp, aggregated_at) of the latest minute aggregates, newest first.
+
+        With the hour layout, aggregated_at is kept per hour row, so each of
+        the latest limit hours gives one sample: its last filled minute.
+        """
+        if self.layout == PER_HOUR:
+            with self._cursor() as cursor:
+                cursor.execute(f'''
+                    SELECT hour_start, sample_counts, aggregated_at
+                    FROM hourly_utilization
+                    ORDER BY hour_start DESC
+                    LIMIT {self.PARAM}
+                ''', (limit,))
+                rows = cursor.fetchall()
+            samples = []
+            for hour_start, counts, aggregated_at in rows:
+                slot = HourRow(counts=self._py_slots(counts)).last_slot()
+                if slot is not None:
+                    samples.append((self._py_time(hour_start) + slot * MINUTE, self._py_time(aggregated_at)))
+            return samples
+        with self._cursor() as cursor:
+            cursor.execute(f'''
+                SELECT minute_timestamp, aggregated_at
+                FROM minute_utilization
+                ORDER BY minute_timestamp DESC
+                LIMIT {self.PARAM}
+            ''', (limit,))
+            return [tuple(self._py_time(t) for t in row) for row in cursor.fetchall()]
+
+    def record_alert(self, device_id, kind, channel, severity, raised_at, message):
+        """Insert a newly raised alert."""
+        p = self.PARAM
+        with self._cursor() as cursor:
+            cursor.execute(f'''
+                INSERT INTO device_alerts (device_id, kind, channel, severity, message, raised_at)
+                VALUES ({p}, {p}, {p}, {p}, {p}, {p})
+            ''', (device_id, kind, channel, severity, message, self._db_time(raised_at)))
+
+    def resolve_alert(self, device_id, kind, channel, resolved_at):
+        """Close the open alert of this kind for a device and channel."""
+        with self._cursor() as cursor:
+            cursor.execute(_RESOLVE_ALERT_SQL.format(p=self.PARAM),
+                           (self._db_time(resolved_at), device_id, kind, channel, channel))
+
+    def open_alerts(self):
+        """(device_id, kind, channel) of every unresolved alert."""
+        with self._cursor() as cursor:
+            cursor.execute('SELECT device_id, kind, channel FROM device_alerts WHERE resolved_at IS NULL')
+            return cursor.fetchall()
+
+    def record_listener(self, listener, status):
+        """Insert or replace the heartbeat row of one listener process."""
+        p = self.PARAM
+        values = [status[column] for column in LISTENER_COLUMNS]
+        values[LISTENER_COLUMNS.index('started_at')] = self._db_time(status['started_at'])
+        with self._cursor() as cursor:
+            cursor.execute(f'''
+                INSERT INTO listener_shards (listener, heartbeat_at, {", ".join(LISTENER_COLUMNS)})
+                VALUES ({", ".join([p] * (len(LISTENER_COLUMNS) + 2))})
+                ON CONFLICT (listener) DO UPDATE SET
+                    heartbeat_at = EXCLUDED.heartbeat_at,
+                    {", ".join(f"{column} = EXCLUDED.{column}" for column in LISTENER_COLUMNS)}
+            ''', (listener, self._db_time(datetime.utcnow()), *values))
+
+    def remove_listener(self, listener):
+        """Delete a listener's heartbeat row (on clean shutdown)."""
+        with self._cursor() as cursor:
+            cursor.execute(f'DELETE FROM listener_shards WHERE listener = {self.PARAM}', (listener,))
+
+    def listener_statuses(self):
+        """Every listener heartbeat row as a dict, oldest listener first."""
+        columns = ('listener', 'heartbeat_at', *LISTENER_COLUMNS)
+        with self._cursor() as cursor:
+            cursor.execute(f'SELECT {", ".join(columns)} FROM listener_shards ORDER BY started_at, listener')
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        for row in rows:
+            row['heartbeat_at'] = self._py_time(row['heartbeat_at'])
+            row['started_at'] = self._py_time(row['started_at'])
+        return rows
+
+    def delete_readings_before(self, cutoff):
+        """Delete raw readings older than cutoff and trim the raw coverage to match;
+        returns the number of readings deleted."""
+        p = self.PARAM
+        if not isinstance(cutoff, datetime):
+            cutoff = datetime.fromisoformat(cutoff)
+        # A partly deleted minute no longer counts as covered
+        minute = minute_floor(cutoff)
+        minute = self._db_time(minute if minute == cutoff else minute + MINUTE)
+        with self._cursor() as cursor:
+            cursor.execute(f'DELETE FROM boiler_readings WHERE timestamp < {p}', (self._db_time(cutoff),))
+            deleted = cursor.rowcount
+            cursor.execute(f'DELETE FROM data_coverage WHERE kind = {p} AND end_minute <= {p}', (RAW, minute))
+            cursor.execute(f'''
+                UPDATE data_coverage SET start_minute = {p}
+                WHERE kind = {p} AND end_minute > {p} AND start_minute < {p}
+            ''', (minute, RAW, minute, minute))
+            return deleted
+
+    def insert_readings(self, readings):
+        """Insert reading tuples (READING_COLUMNS order, e.g. readings.Reading) in one transaction."""
+        raise NotImplementedError
+
+    def is_data_error(self, error):
+        """Whether error from insert_readings() is caused by the rows themselves (a value
+        the column rejects), rather than by the database being unavailable."""
+        return isinstance(error, (TypeError, ValueError))
+
+    def iter_readings(self, start, end, device_id=None, batch_size=5000):
+        """Yield (device_id, timestamp, boiler, zone_mask, zone_count, is_demo) for
+        raw readings in [start, end), oldest first, fetching batch_size rows at a time
+        on a dedicated connection."""
+        raise NotImplementedError
+
+    def _iter_readings_sql(self, start, end, device_id):
+        params = [self._db_time(start), self._db_time(end)]
+        device = ''
+        if device_id is not None:
+            device = f'AND device_id = {self.PARAM}'
+            params.append(device_id)
+        return _ITER_READINGS_SQL.format(p=self.PARAM, device=device), params
+
+    def unaggregated_minutes(self, since):
+        """Minute marks ('YYYY-MM-DD HH:MM:00') where some device has raw data but no aggregate."""
+        minutes = {minute for gaps in self.coverage_gaps(since).values() for minute in minutes_in(gaps)}
+        return [minute.strftime('%Y-%m-%d %H:%M:00') for minute in sorted(minutes)]
+
+    def utilization_rows(self, since, device_id=DEFAULT_DEVICE_ID):
+        """Per-minute utilization dicts for one device from since onwards, oldest first."""
+        return [_utilization_from_row(*row) for row in self._utilization(since, device_id)]
+
+    def utilization_columns(self, since, device_id=DEFAULT_DEVICE_ID):
+        """(epoch-ms timestamps, {series: values}) for one device from since onwards."""
+        if self.layout == PER_HOUR:
+            return self._hour_columns(since, device_id)
+        return _utilization_columns(self._minute_utilization(since, device_id))
+
+    def _hour_columns(self, since, device_id):
+        """utilization_columns() of the hour layout, extended a whole hour row at a time."""
+        if not isinstance(since, datetime):
+            since = datetime.fromisoformat(since)
+        timestamps, burner, zones = [], [], []
+        with self._cursor() as cursor:
+            for _, hour_start, row in self._iter_hours(cursor, device_id, since):
+                first = max(0, -((hour_start - since) // MINUTE))
+                slots = [slot for slot in range(first, SLOTS) if row.counts[slot] is not None]
+                if not slots:
+                    continue
+                earlier = len(timestamps)
+                # Naive timestamps are UTC
+                start_ms = (hour_start - _EPOCH).total_seconds() * 1000
+                timestamps.extend(start_ms + slot * 60000 for slot in slots)
+                burner.extend(row.burner[slot] / 100 for slot in slots)
+                for z, zone in enumerate(row.zones):
+                    if z == len(zones):
+                        zones.append([None] * earlier)
+                    zones[z].extend(None if zone[slot] is None else zone[slot] / 100 for slot in slots)
+                for values in zones[len(row.zones):]:
+                    values.extend([None] * len(slots))
+        # A zone only some hours report, but no minute in the window
+        while zones and all(value is None for value in zones[-1]):
+            zones.pop()
+        series = {'burner': burner}
+        series.update((f'zone_{z + 1}', values) for z, values in enumerate(zones))
+        return timestamps, series
+
+    def _utilization(self, since, device_id):
+        """(minute, burner, zones) of one device from since onwards, oldest first."""
+        if self.layout != PER_HOUR:
+            return self._minute_utilization(since, device_id)
+        if not isinstance(since, datetime):
+            since = datetime.fromisoformat(since)
+        with self._cursor() as cursor:
+            return [(minute, burner, zones)
+                    for _, hour_start, row in self._iter_hours(cursor, device_id, since)
+                    for minute, burner, zones, _, _ in row.minutes(hour_start) if minute >= since]
+
+    def _minute_utilization(self, since, device_id):
+        raise NotImplementedError
+
+    def _db_time(self, value):
+        return value
+
+    def _py_time(self, value):
+        return value
+
+    def _db_precise_time(self, value):
+        return value
+
+    def _db_zones(self, zones):
+        return list(zones)
+
+    def _py_zones(self, value):
+        return list(value)
+
+    def _db_date(self, value):
+        return value
+
+    def _db_slots(self, slots):
+        return list(slots)
+
+    def _py_slots(self, value):
+        return list(value)
+
+    def _db_zone_slots(self, zones):
+        return [list(zone) for zone in zones]
+
+    def _py_zone_slots(self, value):
+        return [list(zone) for zone in value]
+
+    def _db_hour(self, row):
+        """(burner_bp, zone_bp, sample_counts, demo_mask) column values of a HourRow."""
+        return (self._db_slots(row.burner), self._db_zone_slots(row.zones), self._db_slots(row.counts),
+                row.demo_mask)
+
+    def _py_hour(self, burner, zones, counts, demo_mask):
+        return HourRow(self._py_slots(burner), self._py_zone_slots(zones), self._py_slots(counts), demo_mask)
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class PostgresBackend(StorageBackend):
+    """PostgreSQL storage (the server deployment).
+
+    psycopg2 is imported on first use, so SQLite deployments and CLI tools
+    that never connect do not pay for loading it.
+    """
+
+    name = 'postgres'
+    PARAM = '%s'
+    _SLOTS_PARAM = '%s::smallint[]'
+    _WEEKDAY_SQL = '(extract(isodow FROM local_date)::int - 1)'
+    _MINUTE_SQL = "date_trunc('minute', {column})"
+
+    def __init__(self, layout=MINUTE_LAYOUT, statement_timeout_ms=0):
+        super().__init__(layout)
+        # Server-side limit on every statement of this backend's connections (0 = none)
+        self.statement_timeout_ms = statement_timeout_ms
+
+    def connect(self):
+        """Open a new, unshared connection (used by LISTEN and named cursors)."""
+        import psycopg2
+
+        return psycopg2.connect(
+            host=POSTGRES_HOST,
+            port=POSTGRES_PORT,
+            database=POSTGRES_DB,
+            user=POSTGRES_USER,
+            password=POSTGRES_PASSWORD,
+            connect_timeout=POSTGRES_CONNECT_TIMEOUT,
+            options=f"-c statement_timeout={int(self.statement_timeout_ms)}" if self.statement_timeout_ms else None
+        )
+
+    @contextmanager
+    def _cursor(self):
+        import psycopg2
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or conn.closed:
+            conn = self._local.conn = self.connect()
+        try:
+            with conn:  # commit on success, rollback on error
+                with conn.cursor() as cursor:
+                    yield TimedCursor(cursor)
+        except psycopg2.extensions.QueryCanceledError:
+            # statement_timeout: the transaction was rolled back, the connection is fine
+            raise
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # Broken connection: drop it so the next call reconnects
+            conn.close()
+            self._local.conn = None
+            raise
+
+    def latest_reading(self, device_id=None):
+        # Typed parameter so PostgreSQL can plan "%s IS NULL"
+        with self._cursor() as cursor:
+            cursor.execute(_LATEST_READING_SQL.format(p='%s::text'), (device_id, device_id))
+            row = cursor.fetchone()
+        return tuple(row) if row else None
+
+    def insert_readings(self, readings):
+        from psycopg2.extras import execute_values
+
+        with self._cursor() as cursor:
+            execute_values(cursor, f'''
+                INSERT INTO boiler_readings ({", ".join(READING_COLUMNS)}) VALUES %s
+            ''', readings)
+            self._add_coverage(cursor, RAW, self._reading_minutes(readings))
+
+    def _lock_coverage(self, cursor, device_ids):
+        # Transaction-level advisory locks, taken in device order so two writers cannot deadlock
+        if device_ids:
+            cursor.execute('''
+                SELECT pg_advisory_xact_lock(hashtext('data_coverage:' || device_id))
+                FROM (SELECT DISTINCT device_id FROM unnest(%s::text[]) AS device_id ORDER BY 1) AS devices
+            ''', (list(device_ids),))
+
+    def is_data_error(self, error):
+        import psycopg2
+
+        # Errors without a SQLSTATE (e.g. "can't adapt type") are raised by the driver itself.
+        # A conflict in data_coverage is maintenance racing another writer, not a bad row.
+        return (super().is_data_error(error)
+                or isinstance(error, psycopg2.DataError)
+                or isinstance(error, psycopg2.IntegrityError) and error.diag.table_name != 'data_coverage'
+                or isinstance(error, psycopg2.ProgrammingError) and error.pgcode is None)
+
+    def iter_readings(self, start, end, device_id=None, batch_size=5000):
+        conn = self.connect()
+        try:
+            # Server-side cursor: memory stays flat however long the range is
+            with conn.cursor(name='boilerstat_iter_readings') as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(*self._iter_readings_sql(start, end, device_id))
+                yield from cursor
+        finally:
+            conn.close()
+
+    def _notify_minute(self, cursor, device_id, minute_start, sample_count, is_demo):
+        # Same payload as the minute_utilization trigger; delivered on commit
+        cursor.execute("SELECT pg_notify('boilerstat_aggregates', %s)", (json.dumps({
+            'device_id': device_id, 'minute_timestamp': minute_start.isoformat(),
+            'sample_count': sample_count, 'is_demo': is_demo}),))
+
+    def utilization_rows(self, since, device_id=DEFAULT_DEVICE_ID):
+        if self.layout == PER_HOUR:
+            return super().utilization_rows(since, device_id)
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT minute_timestamp, boiler_utilization, zone_utilization
+                FROM minute_utilization
+                WHERE device_id = %s AND minute_timestamp >= %s
+                ORDER BY minute_timestamp ASC
+            ''', (device_id, since))
+            return [_utilization_from_row(*row) for row in cursor.fetchall()]
+
+    def utilization_columns(self, since, device_id=DEFAULT_DEVICE_ID):
+        # PostgreSQL builds one float8 array per series with array_agg, so the
+        # driver hands back plain lists and no per-row Python work is needed.
+        if self.layout == PER_HOUR:
+            return super().utilization_columns(since, device_id)
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT
+                    array_agg((extract(epoch FROM minute_timestamp) * 1000)::float8 ORDER BY minute_timestamp),
+                    array_agg(boiler_utilization::float8 ORDER BY minute_timestamp),
+                    coalesce(max(cardinality(zone_utilization)), 0)
+                FROM minute_utilization
+                WHERE device_id = %s AND minute_timestamp >= %s
+            ''', (device_id, since))
+            timestamps, burner, zone_count = cursor.fetchone()
+
+            # One array per zone; minutes with fewer zones contribute NULL
+            cursor.execute('''
+                SELECT z, array_agg(m.zone_utilization[z]::float8 ORDER BY m.minute_timestamp)
+                FROM minute_utilization m, generate_series(1, %s) AS z
+                WHERE m.device_id = %s AND m.minute_timestamp >= %s
+                GROUP BY z
+                ORDER BY z
+            ''', (zone_count, device_id, since))
+            zones = cursor.fetchall()
+
+        # array_agg over zero rows yields NULL
+        series = {'burner': burner or []}
+        series.update((f'zone_{z}', values) for z, values in zones)
+        return timestamps or [], series
+
+
+class SQLiteBackend(StorageBackend):
+    """Embedded SQLite storage tuned for small single-board computers.
+
+    Uses WAL journaling so the API can read while the logger writes,
+    synchronous=NORMAL (durable at checkpoints, safe against corruption),
+    a memory-mapped database file and per-connection prepared statement
+    caching; readings are written in batched transactions by the logger.
+    Zone utilization arrays are stored as JSON text, hour layout slot
+    arrays as packed int16 BLOBs.
+    """
+
+    name = 'sqlite'
+    PARAM = '?'
+    _SLOTS_PARAM = '?'
+    _WEEKDAY_SQL = "((CAST(strftime('%w', local_date) AS INTEGER) + 6) % 7)"
+    _MINUTE_SQL = "substr({column}, 1, 16) || ':00'"
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS boiler_readings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT NOT NULL DEFAULT 'default',
+            timestamp TEXT NOT NULL,
+            boiler INTEGER NOT NULL,
+            zone_mask INTEGER NOT NULL DEFAULT 0,
+            zone_count INTEGER NOT NULL DEFAULT 6,
+            is_demo INTEGER DEFAULT 0,
+            seq INTEGER,
+            sent_at TEXT,
+            logged_at TEXT,
+            received_at TEXT DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_timestamp ON boiler_readings(timestamp);
+        CREATE INDEX IF NOT EXISTS idx_device_timestamp ON boiler_readings(device_id, timestamp);
+
+        CREATE TABLE IF NOT EXISTS minute_utilization (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT NOT NULL DEFAULT 'default',
+            minute_timestamp TEXT NOT NULL,
+            boiler_utilization REAL NOT NULL,
+            zone_utilization TEXT NOT NULL DEFAULT '[]',
+            sample_count INTEGER NOT NULL,
+            is_demo INTEGER DEFAULT 0,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            aggregated_at TEXT,
+            UNIQUE (device_id, minute_timestamp)
+        );
+        CREATE INDEX IF NOT EXISTS idx_minute_timestamp ON minute_utilization(minute_timestamp);
+
+        CREATE TABLE IF NOT EXISTS hourly_utilization (
+            device_id TEXT NOT NULL,
+            hour_start TEXT NOT NULL,
+            burner_bp BLOB NOT NULL,
+            zone_bp BLOB NOT NULL,
+            sample_counts BLOB NOT NULL,
+            demo_mask INTEGER NOT NULL DEFAULT 0,
+            aggregated_at TEXT,
+            UNIQUE (device_id, hour_start)
+        );
+        CREATE INDEX IF NOT EXISTS idx_hourly_utilization_hour ON hourly_utilization(hour_start);
+
+        CREATE TABLE IF NOT EXISTS utilization_profile (
+            timezone TEXT NOT NULL,
+            device_id TEXT NOT NULL,
+            local_date TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            channel INTEGER NOT NULL,
+            utilization_sum REAL NOT NULL DEFAULT 0,
+            sample_weight INTEGER NOT NULL DEFAULT 0,
+            minute_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (timezone, device_id, local_date, hour, channel)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS utilization_totals (
+            device_id TEXT NOT NULL,
+            minute_timestamp TEXT NOT NULL,
+            minute_count INTEGER NOT NULL,
+            on_minutes TEXT NOT NULL,
+            on_samples TEXT NOT NULL,
+            samples TEXT NOT NULL,
+            PRIMARY KEY (device_id, minute_timestamp)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS device_alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            channel INTEGER,
+            severity TEXT NOT NULL,
+            message TEXT,
+            raised_at TEXT NOT NULL,
+            resolved_at TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_device_alerts_open
+            ON device_alerts(device_id, kind) WHERE resolved_at IS NULL;
+        CREATE INDEX IF NOT EXISTS idx_device_alerts_raised ON device_alerts(raised_at);
+
+        CREATE TABLE IF NOT EXISTS data_coverage (
+            device_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            start_minute TEXT NOT NULL,
+            end_minute TEXT NOT NULL,
+            PRIMARY KEY (device_id, kind, start_minute)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_data_coverage_end ON data_coverage(kind, end_minute);
+
+        CREATE TABLE IF NOT EXISTS listener_shards (
+            listener TEXT PRIMARY KEY,
+            mode TEXT NOT NULL,
+            shard_index INTEGER,
+            shard_count INTEGER,
+            started_at TEXT NOT NULL,
+            heartbeat_at TEXT NOT NULL,
+            heartbeat_seconds REAL NOT NULL,
+            received INTEGER NOT NULL DEFAULT 0,
+            stored INTEGER NOT NULL DEFAULT 0,
+            skipped INTEGER NOT NULL DEFAULT 0,
+            errors INTEGER NOT NULL DEFAULT 0,
+            devices INTEGER NOT NULL DEFAULT 0,
+            queued INTEGER NOT NULL DEFAULT 0,
+            lag_seconds REAL NOT NULL DEFAULT 0,
+            commit_p95_seconds REAL
+        );
+    '''
+
+    def __init__(self, path=SQLITE_PATH, layout=MINUTE_LAYOUT):
+        super().__init__(layout)
+        self.path = path
+        self.create_schema()
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, cached_statements=256)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_KB}')
+        conn.execute(f'PRAGMA mmap_size={SQLITE_MMAP_BYTES}')
+        return conn
+
+    @contextmanager
+    def _cursor(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self.connect()
+        with conn:  # commit on success, rollback on error
+            cursor = conn.cursor()
+            try:
+                yield TimedCursor(cursor)
+            finally:
+                cursor.close()
+
+    def create_schema(self):
+        """Create tables and indexes, migrating files from older SQLite schemas."""
+        with self._cursor() as cursor:
+            cursor.execute("PRAGMA table_info(boiler_readings)")
+            columns = {row[1] for row in cursor.fetchall()}
+            if 'boiler_state' in columns:
+                cursor.execute('ALTER TABLE boiler_readings RENAME COLUMN boiler_state TO boiler')
+            if columns and 'device_id' not in columns:
+                cursor.execute("ALTER TABLE boiler_readings ADD COLUMN device_id TEXT NOT NULL DEFAULT 'default'")
+            if columns and 'is_demo' not in columns:
+                cursor.execute('ALTER TABLE boiler_readings ADD COLUMN is_demo INTEGER DEFAULT 0')
+            if columns and 'seq' not in columns:
+                cursor.execute('ALTER TABLE boiler_readings ADD COLUMN seq INTEGER')
+                cursor.execute('ALTER TABLE boiler_readings ADD COLUMN sent_at TEXT')
+                cursor.execute('ALTER TABLE boiler_readings ADD COLUMN logged_at TEXT')
+            if 'zone_1' in columns:
+                # Fixed zone_1..zone_6 columns -> zone bitmask
+                cursor.execute('ALTER TABLE boiler_readings ADD COLUMN zone_mask INTEGER NOT NULL DEFAULT 0')
+                cursor.execute('ALTER TABLE boiler_readings ADD COLUMN zone_count INTEGER NOT NULL DEFAULT 6')
+                cursor.execute('''
+                    UPDATE boiler_readings SET zone_mask =
+                        zone_1 | (zone_2 << 1) | (zone_3 << 2) | (zone_4 << 3) | (zone_5 << 4) | (zone_6 << 5)
+                ''')
+                for i in range(1, 7):
+                    cursor.execute(f'ALTER TABLE boiler_readings DROP COLUMN zone_{i}')
+
+            cursor.execute("PRAGMA table_info(minute_utilization)")
+            minute_columns = {row[1] for row in cursor.fetchall()}
+            if minute_columns and 'zone_1_utilization' not in minute_columns \
+                    and 'aggregated_at' not in minute_columns:
+                cursor.execute('ALTER TABLE minute_utilization ADD COLUMN aggregated_at TEXT')
+            if 'zone_1_utilization' in minute_columns:
+                # The unique key changes to (device_id, minute_timestamp), so rebuild the table
+                cursor.execute('DROP INDEX IF EXISTS idx_minute_timestamp')
+                cursor.execute('ALTER TABLE minute_utilization RENAME TO minute_utilization_old')
+        self._local.conn.executescript(self.SCHEMA)
+        with self._cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE name = 'minute_utilization_old'")
+            if cursor.fetchone():
+                cursor.execute('''
+                    INSERT INTO minute_utilization
+                    (minute_timestamp, boiler_utilization, zone_utilization, sample_count, is_demo, created_at)
+                    SELECT minute_timestamp, boiler_utilization,
+                           json_array(zone_1_utilization, zone_2_utilization, zone_3_utilization,
+                                      zone_4_utilization, zone_5_utilization, zone_6_utilization),
+                           sample_count, is_demo, created_at
+                    FROM minute_utilization_old
+                ''')
+                cursor.execute('DROP TABLE minute_utilization_old')
+
+    def _db_time(self, value):
+        return value.strftime('%Y-%m-%d %H:%M:%S') if isinstance(value, datetime) else value
+
+    def _py_time(self, value):
+        return datetime.fromisoformat(value) if value is not None else None
+
+    def _db_precise_time(self, value):
+        return value.isoformat(sep=' ', timespec='milliseconds') if isinstance(value, datetime) else value
+
+    def _db_zones(self, zones):
+        return json.dumps(list(zones))
+
+    def _py_zones(self, value):
+        return json.loads(value)
+
+    def _db_date(self, value):
+        return value.isoformat() if isinstance(value, date) else value
+
+    def insert_readings(self, readings):
+        with self._cursor() as cursor:
+            cursor.executemany(f'''
+                INSERT INTO boiler_readings ({", ".join(READING_COLUMNS)})
+                VALUES ({", ".join("?" * len(READING_COLUMNS))})
+            ''', [(r[0], self._db_time(r[1]), *r[2:7], self._db_precise_time(r[7]),
+                   self._db_precise_time(r[8])) for r in readings])
+            self._add_coverage(cursor, RAW, self._reading_minutes(readings))
+
+    def is_data_error(self, error):
+        # Binding an unsupported type raises InterfaceError or ProgrammingError, by Python version
+        return super().is_data_error(error) or isinstance(error, (
+            sqlite3.IntegrityError, sqlite3.DataError, sqlite3.InterfaceError, sqlite3.ProgrammingError))
+
+    def iter_readings(self, start, end, device_id=None, batch_size=5000):
+        conn = self.connect()
+        try:
+            cursor = conn.execute(*self._iter_readings_sql(start, end, device_id))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for device, timestamp, *values in rows:
+                    yield (device, self._py_time(timestamp), *values)
+        finally:
+            conn.close()
+
+    def _db_slots(self, slots):
+        return pack(slots)
+
+    def _py_slots(self, value):
+        return unpack(value)
+
+    def _db_zone_slots(self, zones):
+        return b''.join(pack(zone) for zone in zones)
+
+    def _py_zone_slots(self, value):
+        return [unpack(value[i:i + SLOT_BYTES]) for i in range(0, len(value), SLOT_BYTES)]
+
+    def _minute_utilization(self, since, device_id):
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT minute_timestamp, boiler_utilization, zone_utilization
+                FROM minute_utilization
+                WHERE device_id = ? AND minute_timestamp >= ?
+                ORDER BY minute_timestamp ASC
+            ''', (device_id, self._db_time(since)))
+            return [(datetime.fromisoformat(t), burner, json.loads(zones))
+                    for t, burner, zones in cursor.fetchall()]
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _utilization_columns(rows):
+    """(epoch-ms timestamps, {series: values}) of (minute, burner, zones) rows."""
+    zone_count = max((len(zones) for _, _, zones in rows), default=0)
+    series = {'burner': [burner for _, burner, _ in rows]}
+    for z in range(zone_count):
+        series[f'zone_{z + 1}'] = [zones[z] if z < len(zones) else None for _, _, zones in rows]
+    # Naive timestamps are UTC
+    timestamps = [(t - _EPOCH).total_seconds() * 1000 for t, _, _ in rows]
+    return timestamps, series
+
+
+def get_backend(name=STORAGE_BACKEND, statement_timeout_ms=0):
+    """Create the storage backend selected by STORAGE_BACKEND.
+
+    statement_timeout_ms bounds each PostgreSQL statement (the dashboard API's
+    query budget); SQLite has no server-side equivalent and ignores it.
+    """
+    if name == 'postgres':
+        return PostgresBackend(statement_timeout_ms=statement_timeout_ms)
+    if name == 'sqlite':
+        return SQLiteBackend()
+    raise ValueError(f"Unknown STORAGE_BACKEND {name!r}; use 'postgres' or 'sqlite'")
+
+
+def describe_backend(backend):
+    """Human-readable location of a backend, for startup logs."""
+    if backend.name == 'sqlite':
+        return f"SQLite database: {backend.path}"
+    return f"PostgreSQL database: {POSTGRES_DB}@{POSTGRES_HOST}:{POSTGRES_PORT}"
+
+
+class BatchWriter:
+    """Buffers readings and writes them in batched transactions.
+
+    A batch is flushed when it reaches batch_size readings or when the oldest
+    buffered reading is flush_interval seconds old. Readings from a failed
+    write stay buffered (up to max_buffered) and are retried on the next flush.
+    A batch the database rejects for its contents (backend.is_data_error) is
+    split in halves and retried until the readings at fault are isolated;
+    those are handed to on_reject with the error instead of being retried.
+    So are readings that still fail after retry_seconds of database errors
+    (None = retry for ever) and the oldest ones when max_buffered overflows,
+    so every reading ends in on_flush or on_reject.
+    """
+
+    def __init__(self, backend, batch_size=50, flush_interval=1.0, max_buffered=10000, on_flush=None,
+                 on_reject=None, retry_seconds=None):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.on_flush = on_flush
+        self.on_reject = on_reject
+        self.retry_seconds = retry_seconds
+        self._buffer = []
+        self._oldest = None
+        # monotonic time of the first failed write since the last successful one
+        self._failing_since = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def add(self, reading):
+        with self._lock:
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.append(reading)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of readings written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+                self._oldest = None
+            if not batch:
+                return 0
+            written, rejected, unwritten = self._write(batch)
+            now = time.monotonic()
+            if written or not unwritten:
+                self._failing_since = None
+            if unwritten:
+                self._failing_since = self._failing_since or now
+                if self.retry_seconds is not None and now - self._failing_since >= self.retry_seconds:
+                    print(f"Giving up on {len(unwritten)} reading(s) after {self.retry_seconds:.0f}s of database errors")
+                    rejected += [(reading, f"not written after {self.retry_seconds:.0f}s of database errors")
+                                 for reading in unwritten]
+                    unwritten = []
+            if unwritten:
+                with self._lock:
+                    buffered = unwritten + self._buffer
+                    self._buffer = buffered[-self.max_buffered:]
+                    self._oldest = self._oldest or now
+                overflow = buffered[:-self.max_buffered]
+                if overflow:
+                    print(f"Write buffer full: dropping the oldest {len(overflow)} reading(s)")
+                    rejected += [(reading, "write buffer full") for reading in overflow]
+        if rejected and self.on_reject:
+            self.on_reject(rejected)
+        if written and self.on_flush:
+            self.on_flush(written)
+        return len(written)
+
+    def _write(self, batch):
+        """(written readings, [(rejected reading, error)], readings to retry) of inserting batch."""
+        try:
+            with measure('batch_write'):
+                self.backend.insert_readings(batch)
+            return batch, [], []
+        except Exception as e:
+            if not self.backend.is_data_error(e):
+                print(f"Database error writing {len(batch)} readings: {e}")
+                return [], [], batch
+            if len(batch) == 1:
+                print(f"Rejected reading {tuple(batch[0])}: {e}")
+                return [], [(batch[0], e)], []
+        # Split until the readings at fault are alone; the rest are committed
+        half = len(batch) // 2
+        written, rejected, unwritten = self._write(batch[:half])
+        if unwritten:
+            return written, rejected, unwritten + batch[half:]
+        more_written, more_rejected, unwritten = self._write(batch[half:])
+        return written + more_written, rejected + more_rejected, unwritten
+
+    def backlog(self):
+        """(buffered readings, seconds the oldest of them has waited) - (0, 0) when caught up."""
+        with self._lock:
+            age = time.monotonic() - self._oldest if self._oldest is not None else 0.0
+            return len(self._buffer), age
+
+    def _run(self):
+        while not self._stopping.wait(self.flush_interval / 4):
+            with self._lock:
+                due = self._oldest is not None and time.monotonic() - self._oldest >= self.flush_interval
+            if due:
+                self.flush()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="batch-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flush timer and write whatever is still buffered."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
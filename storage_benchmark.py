@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Storage backend benchmark - compares ingest and query throughput of the
+SQLite and PostgreSQL backends in storage.py.
+
+Synthetic readings are written for devices named "bench-N" with timestamps
+in January 2000, so they never overlap live data, and are deleted afterwards.
+
+Usage:
+    python3 storage_benchmark.py                       # SQLite only (temp file)
+    python3 storage_benchmark.py --backend sqlite --backend postgres
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from storage import PostgresBackend, SQLiteBackend
+
+BENCH_START = datetime(2000, 1, 1)
+READING_INTERVAL = timedelta(seconds=5)
+
+
+def generate_readings(count, devices, zone_count):
+    """Yield reading tuples round-robin across devices, 5 seconds apart per device."""
+    for i in range(count):
+        device = i % devices
+        timestamp = BENCH_START + READING_INTERVAL * (i // devices)
+        yield (f"bench-{device}", timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+               random.randint(0, 1), random.getrandbits(zone_count), zone_count, 0, None, None, None)
+
+
+def timed(label, operations, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<32} {operations:>8} ops in {elapsed:7.3f}s  {operations / elapsed:>10.0f} ops/s")
+
+
+def benchmark(backend, readings, batch_size, devices, queries, zone_count):
+    print(f"\n{backend.name} backend")
+
+    data = list(generate_readings(readings, devices, zone_count))
+
+    def ingest():
+        for i in range(0, len(data), batch_size):
+            backend.insert_readings(data[i:i + batch_size])
+    timed(f"ingest (batches of {batch_size})", len(data), ingest)
+
+    minutes = int(readings / devices * READING_INTERVAL.total_seconds() // 60)
+    sample_minutes = [BENCH_START + timedelta(minutes=random.randrange(minutes)) for _ in range(queries)]
+
+    def minute_aggregates():
+        for minute in sample_minutes:
+            backend.aggregate_minute(minute, minute + timedelta(minutes=1))
+    timed(f"aggregate one minute ({zone_count} zones)", queries, minute_aggregates)
+
+    def minute_upserts():
+        for i in range(min(minutes, queries)):
+            minute = BENCH_START + timedelta(minutes=i)
+            backend.upsert_minute("bench-0", minute.strftime('%Y-%m-%d %H:%M:%S'), 50.0,
+                                  [10.0] * zone_count, 12, 0)
+    timed("upsert minute aggregate", min(minutes, queries), minute_upserts)
+
+    if backend.name == 'sqlite':
+        # Skipped on PostgreSQL, where "since" would also return the live data
+        def utilization_reads():
+            for minute in sample_minutes:
+                backend.utilization_rows(minute, "bench-0")
+        timed("read utilization since minute", queries, utilization_reads)
+
+    def latest():
+        for _ in range(queries):
+            backend.latest_reading()
+    timed("latest reading", queries, latest)
+
+
+def cleanup_postgres(backend):
+    conn = backend.connect()
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM boiler_readings WHERE device_id LIKE 'bench-%%'")
+            cursor.execute("DELETE FROM minute_utilization WHERE device_id LIKE 'bench-%%'")
+            cursor.execute("DELETE FROM hourly_utilization WHERE device_id LIKE 'bench-%%'")
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BoilerStat storage backends")
+    parser.add_argument("--backend", action="append", choices=["sqlite", "postgres"],
+                        help="Backend to benchmark; repeatable (default: sqlite)")
+    parser.add_argument("--readings", type=int, default=50000, help="Readings to ingest (default: 50000)")
+    parser.add_argument("--batch-size", type=int, default=50, help="Readings per transaction (default: 50)")
+    parser.add_argument("--devices", type=int, default=4, help="Number of simulated devices (default: 4)")
+    parser.add_argument("--queries", type=int, default=500, help="Queries per read benchmark (default: 500)")
+    parser.add_argument("--zones", type=int, default=6, help="Zones per simulated device (default: 6)")
+    args = parser.parse_args()
+
+    for name in args.backend or ["sqlite"]:
+        if name == "sqlite":
+            with tempfile.TemporaryDirectory() as tmp:
+                backend = SQLiteBackend(os.path.join(tmp, "benchmark.db"))
+                benchmark(backend, args.readings, args.batch_size, args.devices, args.queries, args.zones)
+                backend.close()
+        else:
+            backend = PostgresBackend()
+            try:
+                benchmark(backend, args.readings, args.batch_size, args.devices, args.queries, args.zones)
+            finally:
+                cleanup_postgres(backend)
+                backend.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Cumulative utilization totals for BoilerStat.
+
+utilization_totals holds one row per device and aggregated production
+minute with running totals over every production minute of the device up
+to and including that one:
+
+    minute_count    minutes aggregated
+    on_minutes      per channel (0 = burner, i = zone i): sum of utilization / 100,
+                    i.e. minutes the channel was on
+    on_samples      per channel: sum of utilization / 100 x sample_count
+    samples         per channel: sum of sample_count of the minutes reporting it
+
+Totals over [start, end) are the last row before end minus the last row
+before start: two index lookups however long the range. upsert_minute()
+keeps the rows current; rewriting an older minute shifts every later row of
+the device, so the cost of a backfill grows with how far back it reaches.
+
+Demo minutes contribute nothing, as in the utilization profiles.
+
+fleet_ranking() and fleet_summary() turn the per-device totals of
+StorageBackend.fleet_totals() into /api/fleet/ranking and /api/fleet/compare.
+"""
+
+import os
+
+from profiles import channel_name
+
+# Burner input rating for energy estimates in kWh (0 = not configured)
+BURNER_FIRING_RATE_KW = float(os.getenv("BURNER_FIRING_RATE_KW", "0"))
+# Fuel burned per firing hour, e.g. the oil nozzle rating in gal/h (0 = not configured)
+BURNER_FUEL_PER_HOUR = float(os.getenv("BURNER_FUEL_PER_HOUR", "0"))
+BURNER_FUEL_UNIT = os.getenv("BURNER_FUEL_UNIT", "gal")
+
+# Orderings for /api/fleet/ranking
+RANKING_METRICS = ('utilization_percent', 'on_hours')
+
+
+def _combine(a, b, sign):
+    width = max(len(a), len(b))
+    a = list(a) + [0.0] * (width - len(a))
+    b = list(b) + [0.0] * (width - len(b))
+    return [x + sign * y for x, y in zip(a, b)]
+
+
+class Totals:
+    """Running or range totals; supports + and - (channel lists are zero-padded)."""
+
+    __slots__ = ('minutes', 'on_minutes', 'on_samples', 'samples')
+
+    def __init__(self, minutes=0, on_minutes=(), on_samples=(), samples=()):
+        self.minutes = minutes
+        self.on_minutes = [float(v) for v in on_minutes]
+        self.on_samples = [float(v) for v in on_samples]
+        self.samples = [float(v) for v in samples]
+
+    @classmethod
+    def of_minute(cls, boiler_utilization, zone_utilizations, sample_count, is_demo):
+        """What one minute aggregate adds to the running totals."""
+        if is_demo or not sample_count:
+            return cls()
+        values = [boiler_utilization, *zone_utilizations]
+        on_minutes, on_samples, samples = [], [], []
+        for value in values:
+            fraction = float(value) / 100 if value is not None else 0.0
+            on_minutes.append(fraction)
+            on_samples.append(fraction * sample_count if value is not None else 0.0)
+            samples.append(sample_count if value is not None else 0)
+        return cls(1, on_minutes, on_samples, samples)
+
+    def _apply(self, other, sign):
+        return Totals(self.minutes + sign * other.minutes,
+                      _combine(self.on_minutes, other.on_minutes, sign),
+                      _combine(self.on_samples, other.on_samples, sign),
+                      _combine(self.samples, other.samples, sign))
+
+    def __add__(self, other):
+        return self._apply(other, 1)
+
+    def __sub__(self, other):
+        return self._apply(other, -1)
+
+    def __iadd__(self, other):
+        # In place, for rebuilding running totals minute by minute
+        self.minutes += other.minutes
+        for mine, theirs in ((self.on_minutes, other.on_minutes), (self.on_samples, other.on_samples),
+                             (self.samples, other.samples)):
+            mine.extend([0.0] * (len(theirs) - len(mine)))
+            for i, value in enumerate(theirs):
+                mine[i] += value
+        return self
+
+    def __bool__(self):
+        return bool(self.minutes or any(self.on_minutes) or any(self.on_samples) or any(self.samples))
+
+    def to_dict(self, range_minutes, firing_rate_kw=BURNER_FIRING_RATE_KW,
+                fuel_per_hour=BURNER_FUEL_PER_HOUR, fuel_unit=BURNER_FUEL_UNIT):
+        """JSON-ready range totals for a window of range_minutes minutes."""
+        channels = {}
+        for channel, on_minutes in enumerate(self.on_minutes):
+            samples = self.samples[channel]
+            if not samples:
+                continue
+            channels[channel_name(channel)] = {
+                'on_hours': round(on_minutes / 60, 4),
+                # Sample-weighted, like the minute aggregates and profiles
+                'utilization_percent': round(self.on_samples[channel] * 100 / samples, 2),
+                'samples': int(round(samples)),
+            }
+        burner_hours = self.on_minutes[0] / 60 if self.on_minutes else 0.0
+        result = {
+            'minutes': self.minutes,
+            'coverage_percent': round(self.minutes * 100 / range_minutes, 2) if range_minutes else None,
+            'channels': channels,
+        }
+        if firing_rate_kw:
+            result['energy'] = {'firing_rate_kw': firing_rate_kw, 'kwh': round(burner_hours * firing_rate_kw, 3)}
+        if fuel_per_hour:
+            result['fuel'] = {'per_hour': fuel_per_hour, 'unit': fuel_unit,
+                              'amount': round(burner_hours * fuel_per_hour, 3)}
+        return result
+
+
+def fleet_ranking(fleet, range_minutes, by='burner', metric='utilization_percent', limit=10,
+                  ascending=False, min_coverage=0.0):
+    """Ranked channel entries of {device_id: Totals}.
+
+    by is a channel name (burner, zone_N): one entry per device, or 'zones':
+    every zone of every device. metric is one of RANKING_METRICS; devices
+    below min_coverage percent of the range are left out.
+    """
+    entries = []
+    for device_id, totals in fleet.items():
+        result = totals.to_dict(range_minutes, firing_rate_kw=0, fuel_per_hour=0)
+        if not result['minutes'] or result['coverage_percent'] < min_coverage:
+            continue
+        for name, values in result['channels'].items():
+            if name == by or (by == 'zones' and name != 'burner'):
+                entries.append({'device_id': device_id, 'channel': name, **values,
+                                'minutes': result['minutes'], 'coverage_percent': result['coverage_percent']})
+    entries.sort(key=lambda entry: (entry[metric], entry['device_id']), reverse=not ascending)
+    return entries[:limit]
+
+
+def fleet_summary(fleet, range_minutes):
+    """Totals of a whole fleet, coverage relative to every device's range."""
+    combined = Totals()
+    for totals in fleet.values():
+        combined += totals
+    return {'devices': len(fleet), **combined.to_dict(range_minutes * len(fleet))}
@@ -1,106 +1,92 @@
 #!/usr/bin/env python3
 """
-Database Monitor - Watches for new data in the database and displays it.
+Database Monitor - Displays new readings and minute aggregations as they are
+written to the PostgreSQL database, using the LISTEN/NOTIFY change feed.
 """
 
-import sqlite3
-import time
-from datetime import datetime
+import os
+import psycopg2
 
-DB_FILE = "boilerstat.db"
-CHECK_INTERVAL = 2  # seconds
+from change_feed import ChangeFeedListener, READINGS_CHANNEL, AGGREGATES_CHANNEL
+from startup import run_probes
+from zones import zones_from_mask
 
+# PostgreSQL configuration
+POSTGRES_HOST = os.getenv("POSTGRES_HOST", "localhost")
+POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
+POSTGRES_DB = os.getenv("POSTGRES_DB")
+POSTGRES_USER = os.getenv("POSTGRES_USER")
+POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
+POSTGRES_CONNECT_TIMEOUT = int(os.getenv("POSTGRES_CONNECT_TIMEOUT", "10"))
 
-def get_last_id():
-    """Get the highest ID from the database."""
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute('SELECT MAX(id) FROM boiler_readings')
-        result = cursor.fetchone()
-        conn.close()
-        return result[0] if result[0] is not None else 0
-    except sqlite3.Error as e:
-        print(f"Database error: {e}")
-        return 0
-
-
-def get_new_readings(last_id):
-    """Get all readings with ID greater than last_id."""
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id, timestamp, boiler_state, zone_1, zone_2, zone_3,
-                   zone_4, zone_5, zone_6, received_at
-            FROM boiler_readings
-            WHERE id > ?
-            ORDER BY id ASC
-        ''', (last_id,))
-        results = cursor.fetchall()
-        conn.close()
-        return results
-    except sqlite3.Error as e:
-        print(f"Database error: {e}")
-        return []
 
+def get_db_connection():
+    """Get PostgreSQL database connection."""
+    return psycopg2.connect(
+        host=POSTGRES_HOST,
+        port=POSTGRES_PORT,
+        database=POSTGRES_DB,
+        user=POSTGRES_USER,
+        password=POSTGRES_PASSWORD,
+        connect_timeout=POSTGRES_CONNECT_TIMEOUT
+    )
 
-def format_reading(reading):
-    """Format a reading for display."""
-    (id, timestamp, boiler, z1, z2, z3, z4, z5, z6, received_at) = reading
 
+def format_reading(reading):
+    """Format a reading (boiler_readings row as a dict) for display."""
     output = []
     output.append(f"\n{'='*60}")
-    output.append(f"Record ID: {id}")
-    output.append(f"ESP32 Timestamp: {timestamp}")
-    output.append(f"Received At: {received_at}")
+    output.append(f"Record ID: {reading['id']}")
+    output.append(f"ESP32 Timestamp: {reading['timestamp']}")
+    output.append(f"Received At: {reading['received_at']}")
+    output.append(f"Mode: {'DEMO' if reading.get('is_demo') else 'PRODUCTION'}")
     output.append(f"{'-'*60}")
-    output.append(f"Boiler State: {'ON' if boiler else 'OFF'} ({boiler})")
+    output.append(f"Boiler State: {'ON' if reading['boiler'] else 'OFF'} ({reading['boiler']})")
     output.append(f"Zone States:")
-    output.append(f"  Zone 1: {'ON' if z1 else 'OFF'} ({z1})")
-    output.append(f"  Zone 2: {'ON' if z2 else 'OFF'} ({z2})")
-    output.append(f"  Zone 3: {'ON' if z3 else 'OFF'} ({z3})")
-    output.append(f"  Zone 4: {'ON' if z4 else 'OFF'} ({z4})")
-    output.append(f"  Zone 5: {'ON' if z5 else 'OFF'} ({z5})")
-    output.append(f"  Zone 6: {'ON' if z6 else 'OFF'} ({z6})")
+    for i, zone in enumerate(zones_from_mask(reading['zone_mask'], reading['zone_count']), start=1):
+        output.append(f"  Zone {i}: {'ON' if zone else 'OFF'} ({zone})")
     output.append(f"{'='*60}")
 
     return '\n'.join(output)
 
 
+def format_aggregate(aggregate):
+    """Format a finished minute aggregation for display."""
+    return (f"\n>>> Minute aggregated: {aggregate.get('device_id', 'default')} "
+            f"{aggregate['minute_timestamp']} "
+            f"({aggregate['sample_count']} samples, "
+            f"{'demo' if aggregate.get('is_demo') else 'production'})")
+
+
+def on_reconnect():
+    print("\nReconnected to database; readings written while disconnected were not shown.")
+
+
 def main():
-    """Main function to monitor database for new entries."""
+    """Main function to monitor the database for new entries."""
 
-    # Verify database exists
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        conn.close()
-    except sqlite3.Error as e:
-        print(f"Database error: {e}")
-        print("Please run init_database.py first to create the database.")
+    # Verify database connection
+    database, = run_probes({'database': lambda: get_db_connection().close()})
+    if not database.ok:
+        print(f"Database connection error: {database.error}")
+        print("Please ensure PostgreSQL is running and credentials are correct.")
         return
 
     print("BoilerStat Database Monitor")
-    print(f"Checking for new data every {CHECK_INTERVAL} seconds...")
+    print(f"Listening for new data on {POSTGRES_DB}@{POSTGRES_HOST}:{POSTGRES_PORT}...")
     print("Press Ctrl+C to stop\n")
 
-    # Get initial last ID
-    last_id = get_last_id()
-    print(f"Starting from record ID: {last_id}")
-
+    listener = ChangeFeedListener(get_db_connection, on_reconnect=on_reconnect)
     try:
-        while True:
-            new_readings = get_new_readings(last_id)
-
-            if new_readings:
-                for reading in new_readings:
-                    print(format_reading(reading))
-                    last_id = reading[0]  # Update last_id to current record ID
-
-            time.sleep(CHECK_INTERVAL)
+        for event in listener.events():
+            if event.channel == READINGS_CHANNEL:
+                print(format_reading(event.payload))
+            elif event.channel == AGGREGATES_CHANNEL:
+                print(format_aggregate(event.payload))
 
     except KeyboardInterrupt:
         print("\n\nStopping monitor...")
+        listener.stop()
     except Exception as e:
         print(f"Error: {e}")
 
@@ -6,7 +6,7 @@ import './App.css';
 
 function App() {
   const [currentStatus, setCurrentStatus] = useState(null);
-  const [utilizationData, setUtilizationData] = useState([]);
+  const [utilizationData, setUtilizationData] = useState(null);
   const [lastUpdate, setLastUpdate] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
@@ -29,10 +29,10 @@ function App() {
     }
   };
 
-  // Fetch utilization data
+  // Fetch utilization data as columns: { timestamps: [...], series: { burner: [...], ... } }
   const fetchUtilizationData = async () => {
     try {
-      const response = await fetch('/api/utilization');
+      const response = await fetch('/api/utilization?format=columnar');
       if (response.ok) {
         const data = await response.json();
         setUtilizationData(data);
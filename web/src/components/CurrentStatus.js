@@ -32,6 +32,11 @@ const CurrentStatus = ({ data }) => {
     return value ? 'ON' : 'OFF';
   };
 
+  // zone_1..zone_N, however many zones the device reports
+  const zoneKeys = Object.keys(data)
+    .filter((key) => /^zone_\d+$/.test(key))
+    .sort((a, b) => Number(a.slice(5)) - Number(b.slice(5)));
+
   return (
     <div className="current-status">
       <div className={`status-item ${getStatusClass(data.burner)}`}>
@@ -41,47 +46,14 @@ const CurrentStatus = ({ data }) => {
         </span>
       </div>
 
-      <div className={`status-item ${getStatusClass(data.zone_1)}`}>
-        <span className="status-label">🏠 Zone 1</span>
-        <span className={`status-value ${getValueClass(data.zone_1)}`}>
-          {getValueText(data.zone_1)}
-        </span>
-      </div>
-
-      <div className={`status-item ${getStatusClass(data.zone_2)}`}>
-        <span className="status-label">🏠 Zone 2</span>
-        <span className={`status-value ${getValueClass(data.zone_2)}`}>
-          {getValueText(data.zone_2)}
-        </span>
-      </div>
-
-      <div className={`status-item ${getStatusClass(data.zone_3)}`}>
-        <span className="status-label">🏠 Zone 3</span>
-        <span className={`status-value ${getValueClass(data.zone_3)}`}>
-          {getValueText(data.zone_3)}
-        </span>
-      </div>
-
-      <div className={`status-item ${getStatusClass(data.zone_4)}`}>
-        <span className="status-label">🏠 Zone 4</span>
-        <span className={`status-value ${getValueClass(data.zone_4)}`}>
-          {getValueText(data.zone_4)}
-        </span>
-      </div>
-
-      <div className={`status-item ${getStatusClass(data.zone_5)}`}>
-        <span className="status-label">🏠 Zone 5</span>
-        <span className={`status-value ${getValueClass(data.zone_5)}`}>
-          {getValueText(data.zone_5)}
-        </span>
-      </div>
-
-      <div className={`status-item ${getStatusClass(data.zone_6)}`}>
-        <span className="status-label">🏠 Zone 6</span>
-        <span className={`status-value ${getValueClass(data.zone_6)}`}>
-          {getValueText(data.zone_6)}
-        </span>
-      </div>
+      {zoneKeys.map((key) => (
+        <div key={key} className={`status-item ${getStatusClass(data[key])}`}>
+          <span className="status-label">🏠 Zone {key.slice(5)}</span>
+          <span className={`status-value ${getValueClass(data[key])}`}>
+            {getValueText(data[key])}
+          </span>
+        </div>
+      ))}
 
       <div className="timestamp">
         <strong>Last Reading:</strong> {formatTimestamp(data.timestamp)}
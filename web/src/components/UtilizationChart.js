@@ -21,19 +21,13 @@ ChartJS.register(
   Legend
 );
 
+// data is the columnar /api/utilization response:
+// { timestamps: [epoch ms, ...], series: { burner: [...], zone_1: [...], ... } }
 const UtilizationChart = ({ data }) => {
-  // State to track which data series are visible
-  const [visibleSeries, setVisibleSeries] = useState({
-    burner: true,
-    zone_1: true,
-    zone_2: true,
-    zone_3: true,
-    zone_4: true,
-    zone_5: true,
-    zone_6: true,
-  });
+  // Series hidden by the user; everything else (including zones that appear later) is shown
+  const [hiddenSeries, setHiddenSeries] = useState({});
 
-  if (!data || data.length === 0) {
+  if (!data || data.timestamps.length === 0) {
     return (
       <div className="chart-container">
         <div style={{ display: 'flex', justifyContent: 'center', alignItems: 'center', height: '100%' }}>
@@ -45,107 +39,70 @@ const UtilizationChart = ({ data }) => {
 
   // Function to toggle series visibility
   const toggleSeries = (seriesKey) => {
-    setVisibleSeries(prev => ({
+    setHiddenSeries(prev => ({
       ...prev,
       [seriesKey]: !prev[seriesKey]
     }));
   };
+  const isVisible = (seriesKey) => !hiddenSeries[seriesKey];
 
-  // Color scheme for different zones
-  const colors = {
-    burner: '#e74c3c',   // Red for burner
-    zone_1: '#3498db',   // Blue
-    zone_2: '#2ecc71',   // Green
-    zone_3: '#f39c12',   // Orange
-    zone_4: '#9b59b6',   // Purple
-    zone_5: '#1abc9c',   // Turquoise
-    zone_6: '#e67e22',   // Dark orange
-  };
+  // Color scheme: burner is red, zones cycle through the palette
+  const burnerColor = '#e74c3c';
+  const zonePalette = [
+    '#3498db',   // Blue
+    '#2ecc71',   // Green
+    '#f39c12',   // Orange
+    '#9b59b6',   // Purple
+    '#1abc9c',   // Turquoise
+    '#e67e22',   // Dark orange
+    '#34495e',   // Dark blue-grey
+    '#e84393',   // Pink
+    '#00b894',   // Mint
+    '#6c5ce7',   // Indigo
+  ];
 
   // Prepare labels (timestamps)
-  const labels = data.map(item => {
-    const date = new Date(item.timestamp);
+  const labels = data.timestamps.map(timestamp => {
+    const date = new Date(timestamp);
     return date.toLocaleDateString() === new Date().toLocaleDateString() 
       ? date.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' })
       : date.toLocaleString([], { month: 'short', day: 'numeric', hour: '2-digit', minute: '2-digit' });
   });
 
-  // Define all possible datasets
+  // zone_1..zone_N, however many zones the device reports
+  const zoneKeys = Object.keys(data.series)
+    .filter(key => /^zone_\d+$/.test(key))
+    .sort((a, b) => Number(a.slice(5)) - Number(b.slice(5)));
+
+  // Define all datasets
   const allDatasets = [
     {
       key: 'burner',
       label: 'Burner',
-      data: data.map(item => item.burner),
-      borderColor: colors.burner,
-      backgroundColor: colors.burner + '20',
+      data: data.series.burner,
+      borderColor: burnerColor,
+      backgroundColor: burnerColor + '20',
       borderWidth: 3,
       fill: false,
       tension: 0.1,
     },
-    {
-      key: 'zone_1',
-      label: 'Zone 1',
-      data: data.map(item => item.zone_1),
-      borderColor: colors.zone_1,
-      backgroundColor: colors.zone_1 + '20',
-      borderWidth: 2,
-      fill: false,
-      tension: 0.1,
-    },
-    {
-      key: 'zone_2',
-      label: 'Zone 2',
-      data: data.map(item => item.zone_2),
-      borderColor: colors.zone_2,
-      backgroundColor: colors.zone_2 + '20',
-      borderWidth: 2,
-      fill: false,
-      tension: 0.1,
-    },
-    {
-      key: 'zone_3',
-      label: 'Zone 3',
-      data: data.map(item => item.zone_3),
-      borderColor: colors.zone_3,
-      backgroundColor: colors.zone_3 + '20',
-      borderWidth: 2,
-      fill: false,
-      tension: 0.1,
-    },
-    {
-      key: 'zone_4',
-      label: 'Zone 4',
-      data: data.map(item => item.zone_4),
-      borderColor: colors.zone_4,
-      backgroundColor: colors.zone_4 + '20',
-      borderWidth: 2,
-      fill: false,
-      tension: 0.1,
-    },
-    {
-      key: 'zone_5',
-      label: 'Zone 5',
-      data: data.map(item => item.zone_5),
-      borderColor: colors.zone_5,
-      backgroundColor: colors.zone_5 + '20',
-      borderWidth: 2,
-      fill: false,
-      tension: 0.1,
-    },
-    {
-      key: 'zone_6',
-      label: 'Zone 6',
-      data: data.map(item => item.zone_6),
-      borderColor: colors.zone_6,
-      backgroundColor: colors.zone_6 + '20',
-      borderWidth: 2,
-      fill: false,
-      tension: 0.1,
-    },
+    ...zoneKeys.map((key, i) => {
+      const color = zonePalette[i % zonePalette.length];
+      return {
+        key,
+        label: `Zone ${key.slice(5)}`,
+        data: data.series[key],
+        borderColor: color,
+        backgroundColor: color + '20',
+        borderWidth: 2,
+        fill: false,
+        tension: 0.1,
+      };
+    }),
   ];
 
   // Filter datasets based on visibility
-  const datasets = allDatasets.filter(dataset => visibleSeries[dataset.key]);
+  const datasets = allDatasets.filter(dataset => isVisible(dataset.key));
 
   const chartData = {
     labels,
@@ -167,6 +124,10 @@ const UtilizationChart = ({ data }) => {
         intersect: false,
         callbacks: {
           label: function(context) {
+            // Zones a device did not report in a minute have no value
+            if (context.parsed.y == null) {
+              return `${context.dataset.label}: n/a`;
+            }
             return `${context.dataset.label}: ${context.parsed.y.toFixed(1)}%`;
           },
         },
@@ -229,13 +190,13 @@ const UtilizationChart = ({ data }) => {
           <label key={dataset.key} className="chart-toggle-item">
             <input
               type="checkbox"
-              checked={visibleSeries[dataset.key]}
+              checked={isVisible(dataset.key)}
               onChange={() => toggleSeries(dataset.key)}
               style={{ accentColor: dataset.borderColor }}
             />
             <span 
               className="chart-toggle-label"
-              style={{ color: visibleSeries[dataset.key] ? dataset.borderColor : '#999' }}
+              style={{ color: isVisible(dataset.key) ? dataset.borderColor : '#999' }}
             >
               {dataset.label}
             </span>
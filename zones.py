@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Zone (heating channel) helpers for BoilerStat.
+
+Readings store zone states as a bitmask (zone_mask, bit i = zone i+1) plus the
+number of zones the device reports (zone_count), so a boiler with 10 or more
+zones needs no schema change. Minute aggregates store one utilization value
+per zone in an array. API responses keep the zone_1..zone_N keys.
+"""
+
+import os
+from functools import lru_cache
+
+# zone_mask is a signed 64-bit column
+MAX_ZONES = 63
+# Zone count assumed when generating aggregation SQL before any reading says otherwise
+DEFAULT_ZONE_COUNT = int(os.getenv("ZONE_COUNT", "6"))
+
+
+def zones_from_payload(payload):
+    """Zone states (list of 0/1) from an ESP32 payload.
+
+    Accepts a "zones" array or the zone_1, zone_2, ... keys the firmware sends.
+    Raises KeyError if the payload carries no zone data.
+    """
+    if 'zones' in payload:
+        zones = [1 if z else 0 for z in payload['zones']]
+    else:
+        zones = []
+        while f'zone_{len(zones) + 1}' in payload:
+            zones.append(1 if payload[f'zone_{len(zones) + 1}'] else 0)
+        if not zones:
+            raise KeyError('zone_1')
+    if len(zones) > MAX_ZONES:
+        raise ValueError(f"{len(zones)} zones exceeds the maximum of {MAX_ZONES}")
+    return zones
+
+
+def zone_mask(zones):
+    """Pack zone states into a bitmask."""
+    mask = 0
+    for i, zone in enumerate(zones):
+        if zone:
+            mask |= 1 << i
+    return mask
+
+
+def zones_from_mask(mask, count):
+    """Unpack a bitmask into a list of count zone states."""
+    return [(mask >> i) & 1 for i in range(count)]
+
+
+def zone_keys(count):
+    return [f'zone_{i}' for i in range(1, count + 1)]
+
+
+def zone_dict(zones):
+    """{'zone_1': ..., 'zone_N': ...} for a list of per-zone values."""
+    return dict(zip(zone_keys(len(zones)), zones))
+
+
+@lru_cache(maxsize=None)
+def zone_sum_columns(count, column='zone_mask'):
+    """SQL select-list summing each zone bit over a group, e.g.
+    "sum((zone_mask >> 0) & 1), sum((zone_mask >> 1) & 1)".
+
+    The same expression works in PostgreSQL and SQLite; generated statements
+    are cached per zone count.
+    """
+    return ', '.join(f'sum(({column} >> {i}) & 1)' for i in range(count))